@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from api.endpoints import auth, users, energy_consumption, energy_generation, insights, projects
+from api.endpoints import auth, users, dashboard, energy_consumption, energy_generation, insights, jobs, projects, stream, system
 
 api_router = APIRouter()
 
@@ -9,4 +9,8 @@ api_router.include_router(users.router, prefix="/users", tags=["users"])
 api_router.include_router(projects.router, prefix="/projects", tags=["projects"])
 api_router.include_router(energy_consumption.router, prefix="/energy/consumption", tags=["energy consumption"])
 api_router.include_router(energy_generation.router, prefix="/energy/generation", tags=["energy generation"])
-api_router.include_router(insights.router, prefix="/insights", tags=["insights"])
\ No newline at end of file
+api_router.include_router(insights.router, prefix="/insights", tags=["insights"])
+api_router.include_router(dashboard.router, prefix="/dashboard", tags=["dashboard"])
+api_router.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+api_router.include_router(stream.router, prefix="/stream", tags=["stream"])
+api_router.include_router(system.router, prefix="/system", tags=["system"])
@@ -2,14 +2,17 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from sqlalchemy.orm import Session
-from typing import Generator, Optional
+from typing import Generator, Iterable, Optional
 import logging
 
 from database import get_db
+from core.admission import set_statement_timeout
+from core.replicas import mark_user_write, read_router
 from core.security import pwd_context
 from config import settings
 from schemas.token import TokenPayload
 from models.user import User
+from models.energy_data import Project
 
 logger = logging.getLogger(__name__)
 
@@ -49,6 +52,32 @@ def get_current_active_user(current_user: User = Depends(get_current_user)) -> U
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+def get_read_db(current_user: User = Depends(get_current_active_user)) -> Generator[Session, None, None]:
+    """
+    Session for analytics reads: a read replica that is recent enough and
+    has the user's last write, otherwise the primary. Its statements are
+    cancelled after ANALYTICS_STATEMENT_TIMEOUT_SECONDS.
+    """
+    db = read_router.session(current_user.last_write_at)
+    set_statement_timeout(db, settings.ANALYTICS_STATEMENT_TIMEOUT_SECONDS)
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_write_db(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+) -> Generator[Session, None, None]:
+    """
+    Session for routes that write the user's readings. Once the route has
+    returned without error, the user's last write is stamped, so their
+    next reads wait for a replica that has it (core.replicas). Write routes
+    take this instead of get_db, so none can skip the stamp.
+    """
+    yield db
+    mark_user_write(db, current_user)
+
 def get_current_active_admin(current_user: User = Depends(get_current_user)) -> User:
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
@@ -56,4 +85,22 @@ def get_current_active_admin(current_user: User = Depends(get_current_user)) ->
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions"
         )
-    return current_user
\ No newline at end of file
+    return current_user
+
+def verify_project_access(db: Session, user: User, project_ids: Iterable[int]) -> None:
+    """
+    Raise 404 unless every project id belongs to the user, using one query
+    """
+    requested = set(project_ids)
+    owned = {
+        p.id for p in db.query(Project.id).filter(
+            Project.id.in_(requested),
+            Project.user_id == user.id
+        ).all()
+    }
+    missing = requested - owned
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Projects not found or do not belong to the user: {sorted(missing)}",
+        )
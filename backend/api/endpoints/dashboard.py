@@ -0,0 +1,93 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from datetime import datetime
+import logging
+
+from api.deps import get_current_active_user, get_read_db
+from models.user import User
+from models.energy_data import Project
+from schemas.energy import Dashboard, DashboardRequest, EnergyCost, EnergySummary, EnvironmentalImpact, ProjectStats, ProjectWithStats
+from core.admission import admitted
+from core.coalesce import analytics_key, coalescer
+from core.dashboard import dashboard, dashboard_cost
+from core.energy_queries import project_stats
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Response models of the widgets whose endpoints declare one
+WIDGET_SCHEMAS = {
+    "summary": EnergySummary,
+    "environmental_impact": EnvironmentalImpact,
+    "cost": EnergyCost,
+}
+
+@router.post("/", response_model=Dashboard)
+def get_dashboard(
+    request: DashboardRequest,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Get several dashboard widgets in one request. Each widget names the
+    endpoint it stands for (summary, consumption_daily, consumption_weekly,
+    generation_daily, generation_weekly, environmental_impact, cost or
+    projects) with that endpoint's parameters, and its result has that
+    endpoint's response shape. The aggregates share one scan of the
+    readings per kind.
+    """
+    try:
+        # Resolved once for all widgets
+        projects = db.query(Project).filter(Project.user_id == current_user.id).order_by(Project.id).all()
+        project_ids = [project.id for project in projects]
+
+        widget_projects = {}
+        for widget in request.widgets:
+            if widget.project_id:
+                if widget.project_id not in project_ids:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail="Project not found or does not belong to the user",
+                    )
+                widget_projects[widget.id] = [widget.project_id]
+            else:
+                widget_projects[widget.id] = project_ids
+
+        results = {}
+        analytics = [widget for widget in request.widgets if widget.type != "projects"]
+        if analytics:
+            # Ownership is resolved, so identical concurrent requests can share one computation
+            now = datetime.utcnow()
+            key = analytics_key(
+                "dashboard", project_ids,
+                widgets=[widget.model_dump_json() for widget in analytics],
+            )
+            cost = dashboard_cost(analytics, widget_projects, now)
+            # Copied, as concurrent identical requests share the result
+            results = dict(coalescer.do(key, lambda: admitted(current_user.id, key, cost, lambda: dashboard(
+                db, analytics, widget_projects, now
+            ))))
+
+        for widget in request.widgets:
+            if widget.type in WIDGET_SCHEMAS:
+                results[widget.id] = WIDGET_SCHEMAS[widget.type].model_validate(results[widget.id])
+            if widget.type != "projects":
+                continue
+            stats = project_stats(db, project_ids) if widget.include_stats and project_ids else {}
+            results[widget.id] = [
+                ProjectWithStats.model_validate(project).model_copy(
+                    update={"stats": ProjectStats(**stats[project.id]) if project.id in stats else None}
+                )
+                for project in projects
+            ]
+
+        return {"widgets": results}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting dashboard: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error getting dashboard: {str(e)}"
+        )
@@ -1,11 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from collections import defaultdict
 from datetime import datetime, timedelta
-import pandas as pd
 import logging
 
-from api.deps import get_db, get_current_active_user
+from api.deps import get_current_active_user, get_read_db, get_write_db, verify_project_access
+from config import settings
+from core.ingest import normalize_timestamp, notify_ingested, upsert_readings
+from core.ingest_buffer import IngestBufferFull, get_ingest_buffer
+from core.admission import admitted, estimate_cost
+from core.coalesce import analytics_key, coalescer
+from core.archive import add_archived, archived_totals
+from core.calendar import ensure_project_calendars
+from core.concurrency import run_concurrently
+from core.data_quality import FILL_PATTERN, bucket_list, filled_buckets
+from core.hot_window import hot_window
+from core.energy_queries import (
+    changed_dates,
+    changed_since,
+    current_watermark,
+    efficiency_totals,
+    sum_by_day,
+    sum_by_project,
+    sum_by_source,
+    week_start,
+    weighted_efficiency,
+)
 from models.user import User
 from models.energy_data import EnergyGeneration, EnergySourceType, Project
 
@@ -13,6 +34,8 @@ logger = logging.getLogger(__name__)
 from schemas.energy import (
     EnergyGeneration as EnergyGenerationSchema,
     EnergyGenerationCreate,
+    EnergyGenerationBulkCreate,
+    EnergyIngestResult,
     EnergyGenerationUpdate,
     EnergyGenerationFilter,
 )
@@ -22,12 +45,12 @@ router = APIRouter()
 @router.post("/", response_model=EnergyGenerationSchema)
 def create_energy_generation(
     *,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_write_db),
     data_in: EnergyGenerationCreate,
     current_user: User = Depends(get_current_active_user),
 ):
     """
-    Create new energy generation record
+    Create or update an energy generation record
     """
     # Verify that the project belongs to the current user
     project = db.query(Project).filter(
@@ -41,31 +64,160 @@ def create_energy_generation(
             detail="Project not found or does not belong to the user",
         )
     
-    data = EnergyGeneration(
-        project_id=data_in.project_id,
-        timestamp=data_in.timestamp,
-        value_kwh=data_in.value_kwh,
-        source_type=data_in.source_type,
-        efficiency=data_in.efficiency,
-    )
-    db.add(data)
+    # Upsert on (project_id, source_type, timestamp) so a retried request
+    # updates the reading instead of inserting a duplicate
+    row = {
+        "project_id": data_in.project_id,
+        "timestamp": data_in.timestamp,
+        "value_kwh": data_in.value_kwh,
+        "source_type": data_in.source_type,
+        "efficiency": data_in.efficiency,
+    }
+    upsert_readings(db, EnergyGeneration, [row])
+    db.commit()
+    notify_ingested("generation", [row])
+
+    return db.query(EnergyGeneration).filter(
+        EnergyGeneration.project_id == data_in.project_id,
+        EnergyGeneration.source_type == data_in.source_type,
+        EnergyGeneration.timestamp == normalize_timestamp(data_in.timestamp)
+    ).one()
+
+@router.post("/bulk", response_model=EnergyIngestResult)
+def create_energy_generation_bulk(
+    *,
+    db: Session = Depends(get_write_db),
+    data_in: EnergyGenerationBulkCreate,
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Idempotently ingest a batch of energy generation readings.
+    Readings that already exist for the same project, source and timestamp are updated.
+    """
+    if len(data_in.readings) > settings.INGEST_MAX_BULK_READINGS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.INGEST_MAX_BULK_READINGS} readings can be ingested per request",
+        )
+    
+    verify_project_access(db, current_user, {reading.project_id for reading in data_in.readings})
+    
+    rows = [reading.model_dump() for reading in data_in.readings]
+    accepted = upsert_readings(db, EnergyGeneration, rows)
     db.commit()
-    db.refresh(data)
-    return data
+    notify_ingested("generation", rows)
+    
+    logger.info(f"Ingested {accepted} generation readings for user {current_user.id}")
+    return {"accepted": accepted}
+
+@router.post("/ingest", response_model=EnergyIngestResult, status_code=status.HTTP_202_ACCEPTED)
+def ingest_energy_generation(
+    *,
+    db: Session = Depends(get_write_db),
+    data_in: EnergyGenerationBulkCreate,
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Accept energy generation readings into the write-behind buffer.
+    Readings are acknowledged once spilled to local disk and written to the
+    database in batched commits shortly after.
+    """
+    buffer = get_ingest_buffer()
+    if buffer is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Buffered ingestion is disabled, use the bulk endpoint",
+        )
+    
+    if len(data_in.readings) > settings.INGEST_MAX_BULK_READINGS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.INGEST_MAX_BULK_READINGS} readings can be ingested per request",
+        )
+    
+    verify_project_access(db, current_user, {reading.project_id for reading in data_in.readings})
+    
+    try:
+        queue_depth = buffer.submit("generation", [reading.model_dump() for reading in data_in.readings])
+    except IngestBufferFull as e:
+        # Backpressure: ask the gateway to retry once the buffer has drained
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(max(1, int(settings.INGEST_BUFFER_FLUSH_INTERVAL)))},
+        )
+    
+    return {"accepted": len(data_in.readings), "queue_depth": queue_depth}
+
+@router.get("/forecast", response_model=dict)
+def get_generation_forecast(
+    db: Session = Depends(get_read_db),
+    project_id: Optional[int] = None,
+    source_type: Optional[List[EnergySourceType]] = Query(None),
+    horizon_hours: int = Query(48, ge=1, le=settings.FORECAST_MAX_HORIZON_HOURS),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Forecast hourly energy generation per project and source from seasonal
+    baselines fitted on the hourly rollups
+    """
+    try:
+        user_projects = db.query(Project.id).filter(Project.user_id == current_user.id).all()
+        project_ids = [p.id for p in user_projects]
+        
+        if not project_ids:
+            return {"start": None, "horizon_hours": horizon_hours, "series": [], "total_kwh": 0}
+        
+        # Apply specific project_id filter if provided
+        if project_id:
+            if project_id not in project_ids:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Project not found or does not belong to the user",
+                )
+            project_ids = [project_id]
+        
+        # numpy and the forecasting models are loaded on first use only
+        from core.forecasting import forecast_generation
+        
+        key = analytics_key(
+            "generation.forecast", project_ids,
+            source_type=source_type, horizon_hours=horizon_hours,
+        )
+        cost = estimate_cost(key, None, None, default_days=settings.FORECAST_HISTORY_DAYS)
+        return coalescer.do(key, lambda: admitted(current_user.id, key, cost, lambda: forecast_generation(
+            db, project_ids, source_type, horizon_hours
+        )))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error forecasting generation: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error forecasting generation: {str(e)}"
+        )
 
 @router.get("/", response_model=List[EnergyGenerationSchema])
 def read_energy_generation(
-    db: Session = Depends(get_db),
+    response: Response,
+    db: Session = Depends(get_read_db),
     skip: int = 0,
     limit: int = 1000,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     source_type: Optional[List[EnergySourceType]] = Query(None),
     project_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    max_points: Optional[int] = Query(None, ge=10, le=20000),
+    downsample: str = Query("lttb", pattern="^(lttb|minmax)$"),
     current_user: User = Depends(get_current_active_user),
 ):
     """
-    Retrieve energy generation records
+    Retrieve energy generation records.
+    With `since` (the X-Watermark of a previous response), only records
+    inserted or updated after it are returned.
+    With `max_points`, the whole matching range is downsampled for charting
+    to about that many records (`lttb` or `minmax`), ignoring skip/limit.
     """
     try:
         user_id = current_user.id if current_user else None
@@ -105,6 +257,18 @@ def read_energy_generation(
         if source_type:
             query = query.filter(EnergyGeneration.source_type.in_(source_type))
         
+        # Delta mode: only rows inserted or updated since the client's watermark.
+        # The watermark for the next request is returned in a header.
+        response.headers["X-Watermark"] = current_watermark(db).isoformat()
+        if since:
+            query = query.filter(changed_since(EnergyGeneration, since))
+        
+        if max_points:
+            # numpy is only loaded when a chart asks for downsampling
+            from core.downsampling import downsample_query
+
+            return downsample_query(query, EnergyGeneration, max_points, downsample)
+        
         return query.order_by(EnergyGeneration.timestamp).offset(skip).limit(limit).all()
     except Exception as e:
         logger.error(f"Error reading energy generation: {str(e)}")
@@ -115,106 +279,49 @@ def read_energy_generation(
 
 @router.get("/aggregate/daily", response_model=dict)
 def get_daily_generation(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     source_type: Optional[List[EnergySourceType]] = Query(None),
     project_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    fill: Optional[str] = Query(None, pattern=FILL_PATTERN),
     current_user:  User = Depends(get_current_active_user),
 ):
     """
-    Get daily aggregated energy generation data
+    Get daily aggregated energy generation data.
+    With `since` (the watermark of a previous response), only the buckets
+    that changed after it are returned, with totals for the whole range.
+    With `fill` (none, ffill, linear or profile), every bucket of the range
+    is returned with its coverage and an estimate of its missing readings.
     """
     try:
-        user_id = current_user.id if current_user else None
-        
-        if not start_date:
-            start_date = datetime.utcnow() - timedelta(days=30)
-        if not end_date:
-            end_date = datetime.utcnow()
-            
-        logger.info(f"Fetching daily generation data from {start_date} to {end_date}")
-        
-        if user_id:
-            # Get projects for the authenticated user
-            user_projects = db.query(Project.id).filter(Project.user_id == user_id).all()
-            project_ids = [p.id for p in user_projects]
-            
-            if not project_ids:
-                return {"daily_generation": [], "total_kwh": 0, "by_source": {}, "avg_efficiency": 0, "by_project": {}}
-                
-            # Base query filtering by the user's projects
-            query = db.query(EnergyGeneration).filter(
-                EnergyGeneration.project_id.in_(project_ids),
-                EnergyGeneration.timestamp >= start_date,
-                EnergyGeneration.timestamp <= end_date
-            )
-            
-            # Apply specific project_id filter if provided
-            if project_id:
-                if project_id not in project_ids:
-                    raise HTTPException(
-                        status_code=status.HTTP_404_NOT_FOUND,
-                        detail="Project not found or does not belong to the user",
-                    )
-                query = query.filter(EnergyGeneration.project_id == project_id)
-        else:
-            query = db.query(EnergyGeneration).filter(
-                EnergyGeneration.timestamp >= start_date,
-                EnergyGeneration.timestamp <= end_date
-            )
-            
-            if project_id:
-                query = query.filter(EnergyGeneration.project_id == project_id)
-        
-        # Apply source type filter
-        if source_type:
-            query = query.filter(EnergyGeneration.source_type.in_(source_type))
-        
-        generation_data = query.all()
-        
-        # Convert to pandas DataFrame for easier aggregation
-        df = pd.DataFrame([
-            {
-                "date": item.timestamp.date(),
-                "value_kwh": item.value_kwh,
-                "source_type": item.source_type.value,
-                "efficiency": item.efficiency or 0,
-                "project_id": item.project_id
-            }
-            for item in generation_data
-        ])
-        
-        if df.empty:
-            logger.warning("No generation data found")
-            return {"daily_generation": [], "total_kwh": 0, "by_source": {}, "avg_efficiency": 0, "by_project": {}}
-        
-        # Aggregate by date
-        daily = df.groupby("date")["value_kwh"].sum().reset_index()
-        daily_data = [{"date": row["date"].isoformat(), "value_kwh": float(row["value_kwh"])} for _, row in daily.iterrows()]
-        
-        # Aggregate by source type
-        by_source = df.groupby("source_type")["value_kwh"].sum().to_dict()
-        by_source = {k: float(v) for k, v in by_source.items()}
-        
-        # Aggregate by project
-        by_project = df.groupby("project_id")["value_kwh"].sum().to_dict()
-        by_project = {str(k): float(v) for k, v in by_project.items()}
-        
-        # Calculate average efficiency
-        avg_efficiency = float(df["efficiency"].mean()) if "efficiency" in df.columns else 0
+        user_projects = db.query(Project.id).filter(Project.user_id == current_user.id).all()
+        project_ids = [p.id for p in user_projects]
         
-        total_kwh = float(df["value_kwh"].sum())
+        if not project_ids:
+            return {"daily_generation": [], "total_kwh": 0, "by_source": {}, "avg_efficiency": None, "by_project": {}}
         
-        logger.info(f"Retrieved {len(daily_data)} days of generation data, total {total_kwh} kWh")
+        # Apply specific project_id filter if provided
+        if project_id:
+            if project_id not in project_ids:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Project not found or does not belong to the user",
+                )
+            project_ids = [project_id]
         
-        return {
-            "daily_generation": daily_data,
-            "total_kwh": total_kwh,
-            "by_source": by_source,
-            "avg_efficiency": avg_efficiency,
-            "by_project": by_project
-        }
+        # Ownership is resolved, so identical concurrent requests can share one computation
+        key = analytics_key(
+            "generation.daily", project_ids,
+            start_date=start_date, end_date=end_date, source_type=source_type, since=since, fill=fill,
+        )
+        cost = estimate_cost(key, start_date, end_date, default_days=30)
+        return coalescer.do(key, lambda: admitted(current_user.id, key, cost, lambda: _daily_generation(
+            db, project_ids, start_date, end_date, source_type, since, fill
+        )))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting daily generation: {str(e)}")
         raise HTTPException(
@@ -222,129 +329,240 @@ def get_daily_generation(
             detail=f"Error getting daily generation: {str(e)}"
         )
 
+def _daily_generation(
+    db: Session,
+    project_ids: List[int],
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    source_type: Optional[List[EnergySourceType]],
+    since: Optional[datetime],
+    fill: Optional[str] = None,
+) -> dict:
+    if not start_date:
+        start_date = datetime.utcnow() - timedelta(days=30)
+    if not end_date:
+        end_date = datetime.utcnow()
+    
+    logger.info(f"Fetching daily generation data for projects {project_ids} from {start_date} to {end_date}")
+    
+    # Base query filtering by the user's projects
+    query = db.query(EnergyGeneration).filter(
+        EnergyGeneration.project_id.in_(project_ids),
+        EnergyGeneration.timestamp >= start_date,
+        EnergyGeneration.timestamp <= end_date
+    )
+    
+    if source_type:
+        query = query.filter(EnergyGeneration.source_type.in_(source_type))
+    
+    # Days are the local dates of each project's timezone
+    ensure_project_calendars(db, project_ids, start_date, end_date)
+    
+    # Taken before reading, so changes committed while this request runs
+    # are included in the next delta
+    watermark = current_watermark(db)
+    
+    # Delta mode: only return the days that changed since the client's watermark
+    changed = None
+    if since and not fill:
+        changed = changed_dates(query, EnergyGeneration, since)
+    
+    # Ranges inside this worker's window of recent readings are answered from memory
+    results = None
+    if changed is None:
+        results = hot_window.aggregate(db, "generation", project_ids, start_date, end_date, source_type, by_day=not fill)
+    if results is None:
+        # The buckets and the range totals are independent, so they are queried side by side
+        tasks = {
+            "by_source": lambda s: sum_by_source(query.with_session(s), EnergyGeneration),
+            "by_project": lambda s: sum_by_project(query.with_session(s), EnergyGeneration),
+        }
+        tasks["efficiency"] = lambda s: efficiency_totals(query.with_session(s), EnergyGeneration)
+        from_day = None
+        if not fill and (changed is None or changed):
+            from_day = min(changed) if changed else None
+            tasks["by_day"] = lambda s: sum_by_day(query.with_session(s), EnergyGeneration, from_day)
+        # Readings moved to the cold-storage archive are added to the database's sums
+        archived = archived_totals(db, "generation", project_ids, start_date, end_date, source_type, from_day)
+        results = add_archived(run_concurrently(db, tasks), archived)
+        weighted_sum, efficiency_kwh = results["efficiency"]
+        if archived:
+            weighted_sum += archived["efficiency_weighted"]
+            efficiency_kwh += archived["efficiency_kwh"]
+        results["avg_efficiency"] = weighted_efficiency(weighted_sum, efficiency_kwh)
+    
+    by_day = results.get("by_day", {})
+    if changed is not None:
+        by_day = {day: value for day, value in by_day.items() if day in changed}
+    daily_data = [{"date": day.isoformat(), "value_kwh": value} for day, value in sorted(by_day.items())]
+    # Filled buckets come from the hourly rollups and cover the whole range
+    if fill:
+        buckets = filled_buckets(db, "generation", project_ids, start_date, end_date, source_type, fill)
+        daily_data = bucket_list(buckets, "date")
+    
+    by_source = results["by_source"]
+    total_kwh = float(sum(by_source.values()))
+    estimated_total_kwh = float(sum(bucket["value_kwh"] for bucket in daily_data)) if fill else total_kwh
+    
+    logger.info(f"Retrieved {len(daily_data)} days of generation data, total {total_kwh} kWh")
+    
+    return {
+        "daily_generation": daily_data,
+        "total_kwh": total_kwh,
+        "by_source": by_source,
+        "avg_efficiency": results["avg_efficiency"],
+        "by_project": results["by_project"],
+        "fill": fill,
+        "estimated_total_kwh": estimated_total_kwh,
+        "watermark": watermark
+    }
+
 @router.get("/aggregate/weekly", response_model=dict)
 def get_weekly_generation(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     source_type: Optional[List[EnergySourceType]] = Query(None),
     project_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    fill: Optional[str] = Query(None, pattern=FILL_PATTERN),
     current_user:  User = Depends(get_current_active_user),
 ):
     """
     Get weekly aggregated energy generation data.
     If start_date and end_date are not provided, defaults to the last 90 days.
+    With `since` (the watermark of a previous response), only the buckets
+    that changed after it are returned, with totals for the whole range.
+    With `fill` (none, ffill, linear or profile), every bucket of the range
+    is returned with its coverage and an estimate of its missing readings.
     """
     try:
-        user_id = current_user.id if current_user else None
-        
-        if not start_date:
-            start_date = datetime.utcnow() - timedelta(days=90)
-        if not end_date:
-            end_date = datetime.utcnow()
-            
-        logger.info(f"Fetching weekly generation data from {start_date} to {end_date}")
-        
-        if user_id:
-            # Get projects for the authenticated user
-            user_projects = db.query(Project.id).filter(Project.user_id == user_id).all()
-            project_ids = [p.id for p in user_projects]
-            
-            if not project_ids:
-                return {
-                    "weekly_generation": [],
-                    "total_kwh": 0,
-                    "by_source": {},
-                    "avg_efficiency": 0,
-                    "by_project": {}
-                }
-                
-            # Base query filtering by the user's projects
-            query = db.query(EnergyGeneration).filter(
-                EnergyGeneration.project_id.in_(project_ids),
-                EnergyGeneration.timestamp >= start_date,
-                EnergyGeneration.timestamp <= end_date
-            )
-            
-            # Apply specific project_id filter if provided
-            if project_id:
-                if project_id not in project_ids:
-                    raise HTTPException(
-                        status_code=status.HTTP_404_NOT_FOUND,
-                        detail="Project not found or does not belong to the user",
-                    )
-                query = query.filter(EnergyGeneration.project_id == project_id)
-        else:
-            query = db.query(EnergyGeneration).filter(
-                EnergyGeneration.timestamp >= start_date,
-                EnergyGeneration.timestamp <= end_date
-            )
-            
-            if project_id:
-                query = query.filter(EnergyGeneration.project_id == project_id)
-        
-        # Apply source type filter
-        if source_type:
-            query = query.filter(EnergyGeneration.source_type.in_(source_type))
+        user_projects = db.query(Project.id).filter(Project.user_id == current_user.id).all()
+        project_ids = [p.id for p in user_projects]
         
-        generation_data = query.all()
-        
-        # Convert the records to a DataFrame
-        df = pd.DataFrame([
-            {
-                "date": item.timestamp.date(),
-                "value_kwh": item.value_kwh,
-                "source_type": item.source_type.value,
-                "efficiency": item.efficiency or 0,
-                "project_id": item.project_id
-            }
-            for item in generation_data
-        ])
-        
-        if df.empty:
-            logger.warning("No generation data found")
+        if not project_ids:
             return {
                 "weekly_generation": [],
                 "total_kwh": 0,
                 "by_source": {},
-                "avg_efficiency": 0,
+                "avg_efficiency": None,
                 "by_project": {}
             }
         
-        # Compute the start of the week (Monday) for each date
-        df["week_start"] = df["date"].apply(lambda d: d - timedelta(days=d.weekday()))
-        
-        # Aggregate by week: sum energy generation per week
-        weekly = df.groupby("week_start")["value_kwh"].sum().reset_index()
-        weekly_data = [
-            {"week_start": row["week_start"].isoformat(), "value_kwh": float(row["value_kwh"])}
-            for _, row in weekly.iterrows()
-        ]
-        
-        # Overall aggregation by source type across the queried period
-        by_source = df.groupby("source_type")["value_kwh"].sum().to_dict()
-        by_source = {k: float(v) for k, v in by_source.items()}
+        # Apply specific project_id filter if provided
+        if project_id:
+            if project_id not in project_ids:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Project not found or does not belong to the user",
+                )
+            project_ids = [project_id]
         
-        # Aggregate by project
-        by_project = df.groupby("project_id")["value_kwh"].sum().to_dict()
-        by_project = {str(k): float(v) for k, v in by_project.items()}
-        
-        # Total kWh and average efficiency for the period
-        total_kwh = float(df["value_kwh"].sum())
-        avg_efficiency = float(df["efficiency"].mean()) if "efficiency" in df.columns else 0
-        
-        logger.info(f"Retrieved {len(weekly_data)} weeks of data, total {total_kwh} kWh")
-        
-        return {
-            "weekly_generation": weekly_data,
-            "total_kwh": total_kwh,
-            "by_source": by_source,
-            "avg_efficiency": avg_efficiency,
-            "by_project": by_project
-        }
+        # Ownership is resolved, so identical concurrent requests can share one computation
+        key = analytics_key(
+            "generation.weekly", project_ids,
+            start_date=start_date, end_date=end_date, source_type=source_type, since=since, fill=fill,
+        )
+        cost = estimate_cost(key, start_date, end_date, default_days=90)
+        return coalescer.do(key, lambda: admitted(current_user.id, key, cost, lambda: _weekly_generation(
+            db, project_ids, start_date, end_date, source_type, since, fill
+        )))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting weekly generation: {str(e)}", exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error getting weekly generation: {str(e)}"
         )
+
+def _weekly_generation(
+    db: Session,
+    project_ids: List[int],
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    source_type: Optional[List[EnergySourceType]],
+    since: Optional[datetime],
+    fill: Optional[str] = None,
+) -> dict:
+    if not start_date:
+        start_date = datetime.utcnow() - timedelta(days=90)
+    if not end_date:
+        end_date = datetime.utcnow()
+    
+    logger.info(f"Fetching weekly generation data for projects {project_ids} from {start_date} to {end_date}")
+    
+    # Base query filtering by the user's projects
+    query = db.query(EnergyGeneration).filter(
+        EnergyGeneration.project_id.in_(project_ids),
+        EnergyGeneration.timestamp >= start_date,
+        EnergyGeneration.timestamp <= end_date
+    )
+    
+    if source_type:
+        query = query.filter(EnergyGeneration.source_type.in_(source_type))
+    
+    # Days are the local dates of each project's timezone
+    ensure_project_calendars(db, project_ids, start_date, end_date)
+    
+    # Taken before reading, so changes committed while this request runs
+    # are included in the next delta
+    watermark = current_watermark(db)
+    
+    # Delta mode: only return the weeks that changed since the client's watermark
+    changed = None
+    if since and not fill:
+        changed = {week_start(day) for day in changed_dates(query, EnergyGeneration, since)}
+    
+    # Ranges inside this worker's window of recent readings are answered from memory
+    results = None
+    if changed is None:
+        results = hot_window.aggregate(db, "generation", project_ids, start_date, end_date, source_type, by_day=not fill)
+    if results is None:
+        # The buckets and the range totals are independent, so they are queried side by side
+        tasks = {
+            "by_source": lambda s: sum_by_source(query.with_session(s), EnergyGeneration),
+            "by_project": lambda s: sum_by_project(query.with_session(s), EnergyGeneration),
+        }
+        tasks["efficiency"] = lambda s: efficiency_totals(query.with_session(s), EnergyGeneration)
+        from_day = None
+        if not fill and (changed is None or changed):
+            from_day = min(changed) if changed else None
+            tasks["by_day"] = lambda s: sum_by_day(query.with_session(s), EnergyGeneration, from_day)
+        # Readings moved to the cold-storage archive are added to the database's sums
+        archived = archived_totals(db, "generation", project_ids, start_date, end_date, source_type, from_day)
+        results = add_archived(run_concurrently(db, tasks), archived)
+        weighted_sum, efficiency_kwh = results["efficiency"]
+        if archived:
+            weighted_sum += archived["efficiency_weighted"]
+            efficiency_kwh += archived["efficiency_kwh"]
+        results["avg_efficiency"] = weighted_efficiency(weighted_sum, efficiency_kwh)
+    
+    # Roll the daily sums up into weeks starting on Monday
+    by_week = defaultdict(float)
+    for day, value in results.get("by_day", {}).items():
+        by_week[week_start(day)] += value
+    if changed is not None:
+        by_week = {week: value for week, value in by_week.items() if week in changed}
+    weekly_data = [{"week_start": week.isoformat(), "value_kwh": value} for week, value in sorted(by_week.items())]
+    # Filled buckets come from the hourly rollups and cover the whole range
+    if fill:
+        buckets = filled_buckets(db, "generation", project_ids, start_date, end_date, source_type, fill)
+        weekly_data = bucket_list(buckets, "week_start", week_start)
+    
+    by_source = results["by_source"]
+    total_kwh = float(sum(by_source.values()))
+    estimated_total_kwh = float(sum(bucket["value_kwh"] for bucket in weekly_data)) if fill else total_kwh
+    
+    logger.info(f"Retrieved {len(weekly_data)} weeks of generation data, total {total_kwh} kWh")
+    
+    return {
+        "weekly_generation": weekly_data,
+        "total_kwh": total_kwh,
+        "by_source": by_source,
+        "avg_efficiency": results["avg_efficiency"],
+        "by_project": results["by_project"],
+        "fill": fill,
+        "estimated_total_kwh": estimated_total_kwh,
+        "watermark": watermark
+    }
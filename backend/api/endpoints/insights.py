@@ -1,15 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime, timedelta
-import pandas as pd
-import numpy as np
 import logging
 
-from api.deps import get_db, get_current_active_user
+from api.deps import get_current_active_user, get_read_db
 from models.user import User
+from models.anomaly import Anomaly
 from models.energy_data import EnergyConsumption, EnergyGeneration, EnergySourceType, Project
-from schemas.energy import EnergySummary
+from schemas.energy import Anomaly as AnomalySchema, DemandAnalytics, EfficiencyAnalytics, EnergyCost, EnergySummary, EnvironmentalImpact
+from core.archive import archived_totals
+from core.admission import admitted, estimate_cost
+from core.coalesce import analytics_key, coalescer
+from core.concurrency import run_concurrently
+from core.hot_window import hot_window
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +22,7 @@ router = APIRouter()
 
 @router.get("/summary", response_model=EnergySummary)
 def get_energy_summary(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     project_id: Optional[int] = None,
@@ -41,69 +46,333 @@ def get_energy_summary(
                 "project_id": project_id
             }
         
-        if not start_date:
-            start_date = datetime.utcnow() - timedelta(days=30)
-        
-        if not end_date:
-            end_date = datetime.utcnow()
-        
-        logger.info(f"Fetching energy summary for user {current_user.id} from {start_date} to {end_date}")
+        # Apply project filter if provided
+        if project_id:
+            if project_id not in project_ids:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Project not found or does not belong to the user",
+                )
+            project_ids = [project_id]
         
+        # Ownership is resolved, so identical concurrent requests can share one computation
+        key = analytics_key(
+            "insights.summary", project_ids,
+            start_date=start_date, end_date=end_date, project_id=project_id,
+        )
+        cost = estimate_cost(key, start_date, end_date, default_days=30)
+        return coalescer.do(key, lambda: admitted(current_user.id, key, cost, lambda: _energy_summary(
+            db, project_ids, start_date, end_date, project_id
+        )))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting energy summary: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error getting energy summary: {str(e)}"
+        )
+
+def _energy_summary(
+    db: Session,
+    project_ids: List[int],
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    project_id: Optional[int],
+) -> dict:
+    if not start_date:
+        start_date = datetime.utcnow() - timedelta(days=30)
+    
+    if not end_date:
+        end_date = datetime.utcnow()
+    
+    logger.info(f"Fetching energy summary for projects {project_ids} from {start_date} to {end_date}")
+    
+    # Ranges inside this worker's window of recent readings are answered from memory
+    recent_consumption = hot_window.aggregate(db, "consumption", project_ids, start_date, end_date, by_day=False)
+    recent_generation = hot_window.aggregate(db, "generation", project_ids, start_date, end_date, by_day=False)
+    if recent_consumption is not None and recent_generation is not None:
+        total_consumption = sum(recent_consumption["by_source"].values())
+        total_generation = sum(recent_generation["by_source"].values())
+    else:
         # Base query for consumption data
-        consumption_query = db.query(EnergyConsumption).filter(
+        consumption_query = db.query(func.sum(EnergyConsumption.value_kwh)).filter(
             EnergyConsumption.project_id.in_(project_ids),
             EnergyConsumption.timestamp >= start_date,
             EnergyConsumption.timestamp <= end_date
         )
-        
+    
         # Base query for generation data
-        generation_query = db.query(EnergyGeneration).filter(
+        generation_query = db.query(func.sum(EnergyGeneration.value_kwh)).filter(
             EnergyGeneration.project_id.in_(project_ids),
             EnergyGeneration.timestamp >= start_date,
             EnergyGeneration.timestamp <= end_date
         )
+    
+        # Calculate totals, both queries at the same time
+        results = run_concurrently(db, {
+            "consumption": lambda s: consumption_query.with_session(s).scalar(),
+            "generation": lambda s: generation_query.with_session(s).scalar(),
+        })
+        total_consumption = results["consumption"] or 0
+        total_generation = results["generation"] or 0
+    
+        # Add readings moved to the cold-storage archive
+        archived_consumption = archived_totals(db, "consumption", project_ids, start_date, end_date)
+        if archived_consumption:
+            total_consumption += sum(archived_consumption["by_source"].values())
+        archived_generation = archived_totals(db, "generation", project_ids, start_date, end_date)
+        if archived_generation:
+            total_generation += sum(archived_generation["by_source"].values())
+    
+    # Calculate renewable percentage
+    renewable_percentage = 0
+    if total_consumption > 0:
+        renewable_percentage = min(100, (total_generation / total_consumption) * 100)
+    
+    # Convert to floats to handle NumPy types
+    total_consumption = float(total_consumption)
+    total_generation = float(total_generation)
+    renewable_percentage = float(renewable_percentage)
+    
+    logger.info(f"Energy summary: consumption={total_consumption}, generation={total_generation}, renewable={renewable_percentage}%")
+    
+    return {
+        "total_consumption": total_consumption,
+        "total_generation": total_generation,
+        "renewable_percentage": renewable_percentage,
+        "start_date": start_date,
+        "end_date": end_date,
+        "project_id": project_id
+    }
+
+@router.get("/environmental-impact", response_model=EnvironmentalImpact)
+def get_environmental_impact(
+    db: Session = Depends(get_read_db),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    project_id: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Get CO2 avoided by renewable generation against the hourly grid carbon
+    intensity, the renewable share and CO2 equivalents
+    """
+    try:
+        user_projects = db.query(Project.id).filter(Project.user_id == current_user.id).all()
+        project_ids = [p.id for p in user_projects]
+        
+        if project_id:
+            if project_id not in project_ids:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Project not found or does not belong to the user",
+                )
+            project_ids = [project_id]
+        
+        # numpy and the emissions engine are loaded on first use only
+        from core.emissions import environmental_impact
+        
+        key = analytics_key(
+            "insights.environmental_impact", project_ids,
+            start_date=start_date, end_date=end_date, project_id=project_id,
+        )
+        cost = estimate_cost(key, start_date, end_date, default_days=30)
+        return coalescer.do(key, lambda: admitted(current_user.id, key, cost, lambda: environmental_impact(
+            db, project_ids, start_date, end_date, project_id
+        )))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting environmental impact: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error getting environmental impact: {str(e)}"
+        )
+
+@router.get("/cost", response_model=EnergyCost)
+def get_energy_cost(
+    db: Session = Depends(get_read_db),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    project_id: Optional[int] = None,
+    include_daily: bool = False,
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Get energy cost, export credit and savings from generation under each
+    project's tariff, over whole days (UTC)
+    """
+    try:
+        user_projects = db.query(Project.id).filter(Project.user_id == current_user.id).all()
+        project_ids = [p.id for p in user_projects]
         
-        # Apply project filter if provided
         if project_id:
             if project_id not in project_ids:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="Project not found or does not belong to the user",
                 )
-            consumption_query = consumption_query.filter(EnergyConsumption.project_id == project_id)
-            generation_query = generation_query.filter(EnergyGeneration.project_id == project_id)
+            project_ids = [project_id]
+        
+        # numpy and the cost engine are loaded on first use only
+        from core.tariffs import energy_cost
         
-        # Get data
-        consumption_data = consumption_query.all()
-        generation_data = generation_query.all()
+        key = analytics_key(
+            "insights.cost", project_ids,
+            start_date=start_date, end_date=end_date, project_id=project_id, include_daily=include_daily,
+        )
+        cost = estimate_cost(key, start_date, end_date, default_days=30)
+        return coalescer.do(key, lambda: admitted(current_user.id, key, cost, lambda: energy_cost(
+            db, project_ids, start_date, end_date, project_id, include_daily
+        )))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting energy cost: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error getting energy cost: {str(e)}"
+        )
+
+@router.get("/demand", response_model=DemandAnalytics)
+def get_demand_analytics(
+    db: Session = Depends(get_read_db),
+    kind: str = Query("consumption", pattern="^(consumption|generation)$"),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    project_id: Optional[int] = None,
+    source_type: Optional[List[EnergySourceType]] = Query(None),
+    curve_points: int = Query(21, ge=2, le=1001),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Get peak demand, p50-p99 demand percentiles and the load-duration curve
+    in kW, over whole days (UTC)
+    """
+    try:
+        user_projects = db.query(Project.id).filter(Project.user_id == current_user.id).all()
+        project_ids = [p.id for p in user_projects]
+        
+        if project_id:
+            if project_id not in project_ids:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Project not found or does not belong to the user",
+                )
+            project_ids = [project_id]
         
-        # Calculate totals
-        total_consumption = sum(item.value_kwh for item in consumption_data)
-        total_generation = sum(item.value_kwh for item in generation_data)
+        # numpy and the demand sketches are loaded on first use only
+        from core.demand import demand_analytics
         
-        # Calculate renewable percentage
-        renewable_percentage = 0
-        if total_consumption > 0:
-            renewable_percentage = min(100, (total_generation / total_consumption) * 100)
+        key = analytics_key(
+            "insights.demand", project_ids,
+            kind=kind, start_date=start_date, end_date=end_date, project_id=project_id,
+            source_type=source_type, curve_points=curve_points,
+        )
+        cost = estimate_cost(key, start_date, end_date, default_days=30)
+        return coalescer.do(key, lambda: admitted(current_user.id, key, cost, lambda: demand_analytics(
+            db, kind, project_ids, start_date, end_date, source_type, project_id, curve_points
+        )))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting demand analytics: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error getting demand analytics: {str(e)}"
+        )
+
+@router.get("/efficiency", response_model=EfficiencyAnalytics)
+def get_efficiency_analytics(
+    db: Session = Depends(get_read_db),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    project_id: Optional[int] = None,
+    source_type: Optional[List[EnergySourceType]] = Query(None),
+    resolution: str = Query("week", pattern="^(day|week|month)$"),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Get the energy-weighted generation efficiency per bucket, source and
+    project, with per-series trend and degradation slopes. Defaults to the
+    last 365 days.
+    """
+    try:
+        user_projects = db.query(Project.id).filter(Project.user_id == current_user.id).all()
+        project_ids = [p.id for p in user_projects]
         
-        # Convert to floats to handle NumPy types
-        total_consumption = float(total_consumption)
-        total_generation = float(total_generation)
-        renewable_percentage = float(renewable_percentage)
+        if project_id:
+            if project_id not in project_ids:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Project not found or does not belong to the user",
+                )
+            project_ids = [project_id]
         
-        logger.info(f"Energy summary: consumption={total_consumption}, generation={total_generation}, renewable={renewable_percentage}%")
+        # numpy and the efficiency analytics are loaded on first use only
+        from core.efficiency import efficiency_analytics
         
-        return {
-            "total_consumption": total_consumption,
-            "total_generation": total_generation,
-            "renewable_percentage": renewable_percentage,
-            "start_date": start_date,
-            "end_date": end_date,
-            "project_id": project_id
-        }
+        key = analytics_key(
+            "insights.efficiency", project_ids,
+            start_date=start_date, end_date=end_date, project_id=project_id,
+            source_type=source_type, resolution=resolution,
+        )
+        cost = estimate_cost(key, start_date, end_date, default_days=365)
+        return coalescer.do(key, lambda: admitted(current_user.id, key, cost, lambda: efficiency_analytics(
+            db, project_ids, start_date, end_date, source_type, project_id, resolution
+        )))
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error getting energy summary: {str(e)}")
+        logger.error(f"Error getting efficiency analytics: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error getting energy summary: {str(e)}"
+            detail=f"Error getting efficiency analytics: {str(e)}"
         )
+
+@router.get("/anomalies", response_model=List[AnomalySchema])
+def get_anomalies(
+    db: Session = Depends(get_read_db),
+    project_id: Optional[int] = None,
+    kind: Optional[str] = Query(None, pattern="^(consumption|generation)$"),
+    anomaly_type: Optional[List[str]] = Query(None),
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    skip: int = 0,
+    limit: int = Query(100, le=1000),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Get detected anomalies (spikes, drops, flatlines and gaps), newest first
+    """
+    user_projects = db.query(Project.id).filter(Project.user_id == current_user.id).all()
+    project_ids = [p.id for p in user_projects]
+    
+    if project_id:
+        if project_id not in project_ids:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Project not found or does not belong to the user",
+            )
+        project_ids = [project_id]
+    
+    if not project_ids:
+        return []
+    
+    query = db.query(Anomaly).filter(Anomaly.project_id.in_(project_ids))
+    
+    if kind:
+        query = query.filter(Anomaly.kind == kind)
+    
+    if anomaly_type:
+        query = query.filter(Anomaly.anomaly_type.in_(anomaly_type))
+    
+    # Anomalies overlapping the requested range
+    if start_date:
+        query = query.filter(Anomaly.end_time >= start_date)
+    
+    if end_date:
+        query = query.filter(Anomaly.start_time <= end_date)
+    
+    return query.order_by(Anomaly.start_time.desc()).offset(skip).limit(limit).all()
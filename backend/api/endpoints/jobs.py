@@ -0,0 +1,150 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.orm import Session
+from typing import List
+from datetime import datetime, timedelta, timezone
+import asyncio
+import logging
+import os
+
+from api.deps import get_db, get_current_active_user
+from config import settings
+from core.jobs import CONTENT_TYPES, FINISHED, SUCCEEDED, job_queue, submit_job
+from core.pubsub import format_sse
+from models.user import User
+from models.energy_data import Project
+from schemas.jobs import Job, JobCreate
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _as_response(job: dict, deduplicated: bool = False) -> Job:
+    result_url = None
+    if job["status"] == SUCCEEDED:
+        result_url = f"{settings.API_V1_STR}/jobs/{job['id']}/result"
+    return Job(**{name: job[name] for name in Job.model_fields if name in job}, result_url=result_url, deduplicated=deduplicated)
+
+def _get_job(job_id: str, user: User) -> dict:
+    job = job_queue.get(job_id)
+    if job is None or job["user_id"] != user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+@router.post("/", response_model=Job, status_code=status.HTTP_202_ACCEPTED)
+def create_job(
+    job_in: JobCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Queue a report or export. An identical job that is queued, running or
+    has an unexpired result is returned instead of queueing another.
+    """
+    project_query = db.query(Project.id).filter(Project.user_id == current_user.id)
+    if job_in.project_id is not None:
+        project_query = project_query.filter(Project.id == job_in.project_id)
+    project_ids = sorted(p.id for p in project_query.all())
+    db.close()
+    if job_in.project_id is not None and not project_ids:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
+
+    # Open ranges end at the current hour, so repeated submissions within it are deduplicated
+    end_date = _naive_utc(job_in.end_date) if job_in.end_date else datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    start_date = _naive_utc(job_in.start_date) if job_in.start_date else end_date - timedelta(days=30)
+    if start_date > end_date:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start_date must be before end_date")
+
+    params = {
+        "project_ids": project_ids,
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "format": job_in.format,
+    }
+    if job_in.type == "export":
+        params["kind"] = job_in.kind
+        params["source_types"] = [job_in.source_type.value] if job_in.source_type else []
+    else:
+        params["resolution"] = job_in.resolution
+
+    if job_queue.pending(current_user.id) >= settings.JOBS_MAX_PENDING_PER_USER:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"At most {settings.JOBS_MAX_PENDING_PER_USER} jobs can be queued or running per user",
+        )
+    job, created = submit_job(current_user.id, job_in.type, params)
+    logger.info(f"{'Queued' if created else 'Deduplicated'} {job_in.type} job {job['id']} for user {current_user.id}")
+    return _as_response(job, deduplicated=not created)
+
+@router.get("/", response_model=List[Job])
+def read_jobs(current_user: User = Depends(get_current_active_user)):
+    """
+    The user's jobs, newest first
+    """
+    return [_as_response(job) for job in job_queue.list(current_user.id)]
+
+@router.get("/{job_id}", response_model=Job)
+def read_job(job_id: str, current_user: User = Depends(get_current_active_user)):
+    """
+    Status and progress of a job
+    """
+    return _as_response(_get_job(job_id, current_user))
+
+@router.get("/{job_id}/events")
+def job_events(job_id: str, request: Request, current_user: User = Depends(get_current_active_user)):
+    """
+    Stream a job's progress as Server-Sent Events until it finishes
+    """
+    job = _get_job(job_id, current_user)
+
+    async def events():
+        last = None
+        idle = 0.0
+        yield "retry: 5000\n\n"
+        current = job
+        while not await request.is_disconnected():
+            state = (current["status"], current["progress"], current["message"])
+            if state != last:
+                last, idle = state, 0.0
+                event = current["status"] if current["status"] in FINISHED else "progress"
+                yield format_sse(event, _as_response(current).model_dump())
+                if current["status"] in FINISHED:
+                    return
+            elif idle >= settings.STREAM_HEARTBEAT_SECONDS:
+                idle = 0.0
+                yield ": keepalive\n\n"
+            await asyncio.sleep(settings.JOBS_POLL_SECONDS)
+            idle += settings.JOBS_POLL_SECONDS
+            current = await run_in_threadpool(job_queue.get, job_id)
+            if current is None:
+                return
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/{job_id}/result")
+def download_job_result(job_id: str, current_user: User = Depends(get_current_active_user)):
+    """
+    Download the result file of a finished job
+    """
+    job = _get_job(job_id, current_user)
+    if job["status"] != SUCCEEDED:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job is {job['status']}")
+    if not job["result_path"] or not os.path.exists(job["result_path"]):
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="The job's result has expired")
+
+    file_format = job["params"]["format"]
+    return FileResponse(
+        job["result_path"],
+        media_type=CONTENT_TYPES[file_format],
+        filename=f"{job['type']}-{job['id']}.{file_format}",
+    )
@@ -1,12 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import json
 import logging
 
 from api.deps import get_db, get_current_active_user
 from models.user import User
 from models.energy_data import Project
-from schemas.energy import Project as ProjectSchema, ProjectCreate, ProjectUpdate
+from models.tariff import Tariff
+from core.energy_queries import project_stats
+from schemas.energy import Project as ProjectSchema, ProjectCreate, ProjectStats, ProjectUpdate, ProjectWithStats
+from schemas.energy import Tariff as TariffSchema, TariffCreate
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +30,7 @@ def create_project(
         name=data_in.name,
         description=data_in.description,
         location=data_in.location,
+        timezone=data_in.timezone,
         user_id=current_user.id,
     )
     db.add(project)
@@ -33,22 +38,32 @@ def create_project(
     db.refresh(project)
     return project
 
-@router.get("/", response_model=List[ProjectSchema])
+@router.get("/", response_model=List[ProjectWithStats])
 def read_projects(
     db: Session = Depends(get_db),
     skip: int = 0,
     limit: int = 100,
+    include_stats: bool = False,
     current_user: User = Depends(get_current_active_user),
 ):
     """
-    Retrieve all projects for the authenticated user
+    Retrieve all projects for the authenticated user. With include_stats,
+    each project carries its last reading times, 24h/30d kWh per source and
+    average efficiency, computed for the whole page at once.
     """
     try:
         logger.info(f"Reading projects for user: {current_user.id} - {current_user.username}")
         
         projects = db.query(Project).filter(
             Project.user_id == current_user.id
-        ).offset(skip).limit(limit).all()
+        ).order_by(Project.id).offset(skip).limit(limit).all()
+        
+        if include_stats and projects:
+            stats = project_stats(db, [project.id for project in projects])
+            return [
+                ProjectWithStats.model_validate(project).model_copy(update={"stats": ProjectStats(**stats[project.id])})
+                for project in projects
+            ]
         
         return projects
     except Exception as e:
@@ -79,3 +94,84 @@ def read_project(
         )
     
     return project
+
+@router.put("/{project_id}", response_model=ProjectSchema)
+def update_project(
+    *,
+    project_id: int,
+    db: Session = Depends(get_db),
+    data_in: ProjectUpdate,
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Update a project. Changing its timezone re-buckets its daily and weekly
+    aggregates by the new local dates.
+    """
+    project = _get_own_project(db, project_id, current_user)
+    for field, value in data_in.model_dump(exclude_unset=True).items():
+        setattr(project, field, value)
+    db.commit()
+    db.refresh(project)
+    return project
+
+def _get_own_project(db: Session, project_id: int, user: User) -> Project:
+    project = db.query(Project).filter(
+        Project.id == project_id,
+        Project.user_id == user.id
+    ).first()
+    
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found",
+        )
+    
+    return project
+
+@router.get("/{project_id}/tariff", response_model=TariffSchema)
+def read_project_tariff(
+    project_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Get the tariff of a project
+    """
+    _get_own_project(db, project_id, current_user)
+    tariff = db.query(Tariff).filter(Tariff.project_id == project_id).first()
+    
+    if not tariff:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project has no tariff",
+        )
+    
+    return tariff
+
+@router.put("/{project_id}/tariff", response_model=TariffSchema)
+def set_project_tariff(
+    *,
+    project_id: int,
+    db: Session = Depends(get_db),
+    data_in: TariffCreate,
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Create or replace the tariff of a project
+    """
+    _get_own_project(db, project_id, current_user)
+    tariff = db.query(Tariff).filter(Tariff.project_id == project_id).first()
+    if not tariff:
+        tariff = Tariff(project_id=project_id)
+        db.add(tariff)
+    
+    tariff.name = data_in.name
+    tariff.currency = data_in.currency.upper()
+    tariff.base_rate = data_in.base_rate
+    tariff.export_rate = data_in.export_rate
+    tariff.daily_charge = data_in.daily_charge
+    tariff.tou_periods = json.dumps([period.model_dump() for period in data_in.tou_periods])
+    tariff.tiers = json.dumps([tier.model_dump() for tier in data_in.tiers])
+    db.commit()
+    db.refresh(tariff)
+    return tariff
@@ -0,0 +1,88 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import List
+import logging
+
+from api.deps import get_db, get_current_active_user
+from config import settings
+from core.pubsub import format_sse, get_broker, project_topic
+from models.user import User
+from models.energy_data import Project
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def _event_stream(request: Request, project_ids: List[int]):
+    broker = get_broker()
+    if broker is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Live streams are not available",
+        )
+
+    async def events():
+        subscription = broker.subscribe([project_topic(pid) for pid in project_ids])
+        logger.info(f"Stream opened for projects {project_ids}")
+        try:
+            yield "retry: 5000\n\n"
+            yield format_sse("ready", {"project_ids": project_ids})
+            while not await request.is_disconnected():
+                message = await subscription.get(timeout=settings.STREAM_HEARTBEAT_SECONDS)
+                # A comment line keeps proxies from closing an idle stream
+                yield message if message is not None else ": keepalive\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+            logger.info(f"Stream closed for projects {project_ids}")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/projects/{project_id}")
+def stream_project(
+    project_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Stream new readings and rolling bucket totals of a project as Server-Sent Events
+    """
+    project = db.query(Project.id).filter(
+        Project.id == project_id,
+        Project.user_id == current_user.id
+    ).first()
+    # Release the connection now, the stream may stay open for hours
+    db.close()
+
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found",
+        )
+
+    return _event_stream(request, [project_id])
+
+@router.get("/portfolio")
+def stream_portfolio(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    Stream new readings and rolling bucket totals of all the user's projects as Server-Sent Events
+    """
+    project_ids = [p.id for p in db.query(Project.id).filter(Project.user_id == current_user.id).all()]
+    db.close()
+
+    if not project_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No projects found",
+        )
+
+    return _event_stream(request, project_ids)
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends
+
+from api.deps import get_current_active_admin
+from core.hot_window import hot_window
+from core.metrics import metrics
+from models.user import User
+
+router = APIRouter()
+
+@router.get("/metrics", response_model=dict)
+def read_metrics(current_user: User = Depends(get_current_active_admin)):
+    """
+    Get the in-process metrics of the worker that served this request (admin only)
+    """
+    return metrics.snapshot()
+
+@router.get("/hot-window", response_model=dict)
+def read_hot_window(current_user: User = Depends(get_current_active_admin)):
+    """
+    Get the readings and memory held per series in the in-memory window of
+    recent readings of the worker that served this request (admin only)
+    """
+    return hot_window.stats()
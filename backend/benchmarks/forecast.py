@@ -0,0 +1,54 @@
+"""
+Benchmark of the generation forecasting models: fit and forecast many
+project/source series at once from synthetic hourly rollups.
+
+Usage (from backend/):
+    python -m benchmarks.forecast --projects 500 --sources 2 --horizon 168
+"""
+import argparse
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from config import settings
+from core.forecasting import fit_models, forecast
+
+def synthetic_rollups(n_series: int, history_days: int, profile_days: int, seed: int = 1):
+    rng = np.random.default_rng(seed)
+    days = np.arange(history_days)
+    # Yearly cycle, daily solar-like bell curve and noise
+    season = 1 + 0.4 * np.sin(2 * np.pi * days / 365.0)[None, :, None]
+    shape = np.clip(np.sin(np.pi * (np.arange(24) - 6) / 12), 0, None)[None, None, :]
+    capacity = rng.uniform(5, 50, size=(n_series, 1, 1))
+    hourly = capacity * season * shape * rng.uniform(0.6, 1.0, size=(n_series, history_days, 24))
+    # Some missing hours, as meters drop out
+    hourly[rng.random(hourly.shape) < 0.02] = np.nan
+    daily = np.nansum(hourly, axis=2)
+    return hourly[:, -profile_days:, :], daily
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=500)
+    parser.add_argument("--sources", type=int, default=2)
+    parser.add_argument("--horizon", type=int, default=168, help="Forecast hours")
+    args = parser.parse_args()
+
+    n_series = args.projects * args.sources
+    hourly, daily = synthetic_rollups(n_series, settings.FORECAST_HISTORY_DAYS, settings.FORECAST_PROFILE_DAYS)
+    fit_day = date.today() - timedelta(days=1)
+    start = datetime.combine(date.today(), datetime.min.time())
+
+    t0 = time.perf_counter()
+    models = fit_models(hourly, daily, fit_day)
+    t1 = time.perf_counter()
+    values = forecast(models, start, args.horizon)
+    t2 = time.perf_counter()
+
+    print(f"series:    {n_series} ({args.projects} projects x {args.sources} sources)")
+    print(f"history:   {settings.FORECAST_HISTORY_DAYS} days, profile from the last {settings.FORECAST_PROFILE_DAYS}")
+    print(f"fit:       {t1 - t0:.3f}s")
+    print(f"forecast:  {t2 - t1:.3f}s for {args.horizon} hours ({values.size:,} values)")
+
+if __name__ == "__main__":
+    main()
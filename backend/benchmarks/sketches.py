@@ -0,0 +1,56 @@
+"""
+Accuracy and speed of the demand quantile sketches: sketch synthetic demand
+per hourly bucket, merge all buckets, and compare the merged quantiles with
+exact ones from sorting the raw values. Exits non-zero if any quantile is
+outside the documented relative accuracy.
+
+Usage (from backend/):
+    python -m benchmarks.sketches --buckets 100000 --per-bucket 12
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from core.sketches import RELATIVE_ACCURACY, merge_flat, quantiles, sketch_groups
+
+QS = (0.01, 0.1, 0.5, 0.9, 0.95, 0.99, 0.999, 1.0)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buckets", type=int, default=100000)
+    parser.add_argument("--per-bucket", type=int, default=12, help="Readings per hourly bucket")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    n = args.buckets * args.per_bucket
+    # Heavy-tailed demand with some zero readings
+    values = rng.lognormal(mean=1.0, sigma=1.2, size=n)
+    values[rng.random(n) < 0.02] = 0.0
+    groups = np.repeat(np.arange(args.buckets), args.per_bucket)
+
+    t0 = time.perf_counter()
+    sketches = sketch_groups(groups, values, args.buckets)
+    t1 = time.perf_counter()
+    merged = merge_flat(np.concatenate([s[0] for s in sketches]), np.concatenate([s[1] for s in sketches]))
+    estimates = quantiles(merged, QS)
+    t2 = time.perf_counter()
+    exact = np.sort(values)[np.floor(np.array(QS) * (n - 1)).astype(np.int64)]
+    t3 = time.perf_counter()
+
+    print(f"values:    {n:,} in {args.buckets:,} buckets")
+    print(f"sketch:    {t1 - t0:.3f}s (once, at rollup time)")
+    print(f"merge:     {t2 - t1:.3f}s for all buckets ({len(merged[0])} bins)")
+    print(f"sort:      {t3 - t2:.3f}s exact quantiles, with the raw values already in memory")
+
+    failed = False
+    for q, estimate, value in zip(QS, estimates, exact):
+        error = abs(estimate - value) / value if value > 0 else abs(estimate)
+        failed |= error > RELATIVE_ACCURACY + 1e-12
+        print(f"q={q:<6} exact={value:10.4f} sketch={estimate:10.4f} error={error:.4%}")
+    print(f"bound:     {RELATIVE_ACCURACY:.2%} relative error, {'FAILED' if failed else 'ok'}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
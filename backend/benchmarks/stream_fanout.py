@@ -0,0 +1,84 @@
+"""
+Load test for the live stream broker: many subscribers on one event loop,
+readings published from another thread the way ingest requests do.
+
+Usage (from backend/):
+    python -m benchmarks.stream_fanout --subscribers 5000 --projects 50 --batches 20
+"""
+import argparse
+import asyncio
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta
+
+from core.pubsub import Broker, project_topic
+from models.energy_data import EnergySourceType
+
+async def run(subscribers: int, projects: int, batches: int, batch_size: int, queue_size: int):
+    broker = Broker(max_queue=queue_size, bucket_minutes=60)
+    subscriptions = [
+        broker.subscribe([project_topic(i % projects + 1)]) for i in range(subscribers)
+    ]
+    # Each reading produces a reading and a bucket event
+    expected = batches * batch_size * 2
+    latencies = []
+    received = 0
+    sent_at = {}
+
+    async def consume(subscription):
+        nonlocal received
+        for _ in range(expected):
+            message = await subscription.get(timeout=30)
+            if message is None:
+                return
+            received += 1
+            if message.startswith("event: reading"):
+                batch = int(message.split('"value_kwh": ')[1].split(".")[0])
+                latencies.append(time.perf_counter() - sent_at[batch])
+
+    def publish():
+        start = datetime(2024, 1, 1)
+        for batch in range(batches):
+            rows = [
+                {
+                    "project_id": project,
+                    "source_type": EnergySourceType.SOLAR,
+                    "timestamp": start + timedelta(minutes=batch * batch_size + i),
+                    "value_kwh": float(batch),
+                }
+                for project in range(1, projects + 1)
+                for i in range(batch_size)
+            ]
+            sent_at[batch] = time.perf_counter()
+            broker.publish_readings("generation", rows)
+            time.sleep(0.05)
+
+    started = time.perf_counter()
+    consumers = [asyncio.create_task(consume(s)) for s in subscriptions]
+    publisher = threading.Thread(target=publish)
+    publisher.start()
+    await asyncio.gather(*consumers)
+    publisher.join()
+    elapsed = time.perf_counter() - started
+
+    for subscription in subscriptions:
+        broker.unsubscribe(subscription)
+
+    latencies.sort()
+    print(f"subscribers:        {subscribers} over {projects} projects")
+    print(f"events delivered:   {received} in {elapsed:.2f}s ({received / elapsed:,.0f}/s)")
+    print(f"events dropped:     {sum(s.dropped for s in subscriptions)}")
+    if latencies:
+        print(f"latency p50/p99:    {statistics.median(latencies) * 1000:.1f} / "
+              f"{latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--projects", type=int, default=50)
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--queue-size", type=int, default=256)
+    args = parser.parse_args()
+    asyncio.run(run(args.subscribers, args.projects, args.batches, args.batch_size, args.queue_size))
@@ -0,0 +1,58 @@
+"""
+Benchmark of the tariff cost engine: build the daily cost series of many
+projects from a year of synthetic hourly rollups, then bill the whole year.
+
+Usage (from backend/):
+    python -m benchmarks.tariffs --projects 300 --days 365
+"""
+import argparse
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from core.tariffs import COLUMNS, build_cost_series
+
+TARIFF = {
+    "currency": "USD",
+    "base_rate": 0.15,
+    "export_rate": 0.05,
+    "daily_charge": 0.5,
+    "tou_periods": [
+        {"days": [0, 1, 2, 3, 4], "start_hour": 16, "end_hour": 21, "rate": 0.35},
+        {"start_hour": 23, "end_hour": 6, "rate": 0.08},
+    ],
+    "tiers": [{"up_to_kwh": 800, "rate": 0.0}, {"up_to_kwh": None, "rate": 0.03}],
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--projects", type=int, default=300)
+    parser.add_argument("--days", type=int, default=365)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    first = date.today() - timedelta(days=args.days)
+    start = (first - date(1970, 1, 1)).days * 86400
+    hours = start + np.arange(args.days * 24, dtype=np.int64) * 3600
+    solar = np.clip(np.sin(np.pi * ((hours // 3600) % 24 - 6) / 12), 0, None)
+
+    t0 = time.perf_counter()
+    series = []
+    for _ in range(args.projects):
+        consumption = rng.uniform(0.5, 3.0, len(hours))
+        generation = solar * rng.uniform(1.0, 5.0) * rng.uniform(0.6, 1.0, len(hours))
+        series.append(build_cost_series(TARIFF, hours, consumption, hours, generation))
+    t1 = time.perf_counter()
+    totals = np.zeros(len(COLUMNS))
+    for project in series:
+        totals += project.totals(first, date.today())
+    t2 = time.perf_counter()
+
+    print(f"projects:  {args.projects} x {args.days} days ({args.projects * len(hours):,} hourly buckets)")
+    print(f"build:     {t1 - t0:.3f}s (cold cache)")
+    print(f"bill:      {(t2 - t1) * 1000:.2f}ms for the whole range (cached)")
+    print(f"total:     { {column: round(float(value), 2) for column, value in zip(COLUMNS, totals)} }")
+
+if __name__ == "__main__":
+    main()
@@ -31,6 +31,118 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     
+    # Ingestion settings
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+    INGEST_MAX_BULK_READINGS: int = int(os.getenv("INGEST_MAX_BULK_READINGS", "10000"))
+    
+    # Write-behind ingest buffer (per worker)
+    INGEST_BUFFER_ENABLED: bool = os.getenv("INGEST_BUFFER_ENABLED", "true").lower() == "true"
+    INGEST_BUFFER_MAX_SIZE: int = int(os.getenv("INGEST_BUFFER_MAX_SIZE", "50000"))
+    INGEST_BUFFER_FLUSH_SIZE: int = int(os.getenv("INGEST_BUFFER_FLUSH_SIZE", "5000"))
+    INGEST_BUFFER_FLUSH_INTERVAL: float = float(os.getenv("INGEST_BUFFER_FLUSH_INTERVAL", "2.0"))
+    INGEST_SPILL_DIR: str = os.getenv("INGEST_SPILL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "var", "ingest_spill"))
+    INGEST_SPILL_FSYNC: bool = os.getenv("INGEST_SPILL_FSYNC", "true").lower() == "true"
+    
+    # Delta ("since last fetch") API: how far the returned watermark trails the
+    # database clock, to cover transactions still open when a request runs
+    DELTA_WATERMARK_LAG_SECONDS: int = int(os.getenv("DELTA_WATERMARK_LAG_SECONDS", "5"))
+    
+    # Live reading streams (Server-Sent Events)
+    STREAM_QUEUE_SIZE: int = int(os.getenv("STREAM_QUEUE_SIZE", "256"))
+    STREAM_HEARTBEAT_SECONDS: float = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+    STREAM_BUCKET_MINUTES: int = int(os.getenv("STREAM_BUCKET_MINUTES", "60"))
+    STREAM_CHANGE_FEED_INTERVAL: float = float(os.getenv("STREAM_CHANGE_FEED_INTERVAL", "2.0"))
+    # Readings of other workers older than this are left to `since` requests
+    STREAM_CHANGE_FEED_LOOKBACK_HOURS: float = float(os.getenv("STREAM_CHANGE_FEED_LOOKBACK_HOURS", "24"))
+    
+    # Share one computation between identical concurrent analytics requests
+    COALESCE_ANALYTICS: bool = os.getenv("COALESCE_ANALYTICS", "true").lower() == "true"
+    
+    # Concurrent sub-queries of composite endpoints: per request, and extra connections per worker
+    QUERY_MAX_FANOUT: int = int(os.getenv("QUERY_MAX_FANOUT", "3"))
+    QUERY_POOL_WORKERS: int = int(os.getenv("QUERY_POOL_WORKERS", "4"))
+    
+    # Hourly rollups, refreshed incrementally from the reading tables
+    ROLLUP_REFRESH_SECONDS: float = float(os.getenv("ROLLUP_REFRESH_SECONDS", "30"))
+    
+    # Generation forecasts
+    FORECAST_LEVEL_ALPHA: float = float(os.getenv("FORECAST_LEVEL_ALPHA", "0.1"))
+    FORECAST_PROFILE_ALPHA: float = float(os.getenv("FORECAST_PROFILE_ALPHA", "0.15"))
+    FORECAST_PROFILE_DAYS: int = int(os.getenv("FORECAST_PROFILE_DAYS", "28"))
+    FORECAST_HISTORY_DAYS: int = int(os.getenv("FORECAST_HISTORY_DAYS", "400"))
+    FORECAST_MAX_HORIZON_HOURS: int = int(os.getenv("FORECAST_MAX_HORIZON_HOURS", "336"))
+    
+    # Anomaly detection (python manage.py detect-anomalies)
+    ANOMALY_WINDOW: int = int(os.getenv("ANOMALY_WINDOW", "48"))
+    ANOMALY_Z_THRESHOLD: float = float(os.getenv("ANOMALY_Z_THRESHOLD", "6.0"))
+    ANOMALY_FLATLINE_HOURS: float = float(os.getenv("ANOMALY_FLATLINE_HOURS", "24"))
+    ANOMALY_GAP_FACTOR: float = float(os.getenv("ANOMALY_GAP_FACTOR", "3.0"))
+    ANOMALY_CHUNK_ROWS: int = int(os.getenv("ANOMALY_CHUNK_ROWS", "50000"))
+    
+    # Environmental impact: region of projects whose location has no grid
+    # intensity data, and the intensity (g CO2/kWh) used where none is loaded
+    GRID_REGION: str = os.getenv("GRID_REGION", "default")
+    GRID_INTENSITY_DEFAULT: float = float(os.getenv("GRID_INTENSITY_DEFAULT", "420"))
+    GRID_INTENSITY_MAX_GAP_HOURS: int = int(os.getenv("GRID_INTENSITY_MAX_GAP_HOURS", "24"))
+    
+    # Energy cost of projects without a tariff, per kWh
+    TARIFF_DEFAULT_RATE: float = float(os.getenv("TARIFF_DEFAULT_RATE", "0.12"))
+    TARIFF_DEFAULT_CURRENCY: str = os.getenv("TARIFF_DEFAULT_CURRENCY", "USD")
+    
+    # Cold-storage archive of old readings (python manage.py archive-readings):
+    # a local directory or a filesystem URI pyarrow supports (e.g. s3://bucket/prefix)
+    ARCHIVE_URI: str = os.getenv("ARCHIVE_URI", os.path.join(os.path.dirname(os.path.abspath(__file__)), "var", "archive"))
+    ARCHIVE_AFTER_DAYS: int = int(os.getenv("ARCHIVE_AFTER_DAYS", "730"))
+    ARCHIVE_ROW_GROUP_ROWS: int = int(os.getenv("ARCHIVE_ROW_GROUP_ROWS", "4096"))
+    
+    # Read replicas for analytics reads: comma-separated database URLs. Replicas
+    # more than REPLICA_MAX_LAG_SECONDS behind the primary are not used.
+    READ_REPLICA_URLS: str = os.getenv("READ_REPLICA_URLS", "")
+    REPLICA_MAX_LAG_SECONDS: float = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "10"))
+    REPLICA_CHECK_SECONDS: float = float(os.getenv("REPLICA_CHECK_SECONDS", "2"))
+    
+    # Admission control of analytics requests, per user and worker. Costs are
+    # project-days of readings read (core.admission).
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    ADMISSION_MAX_CONCURRENT_PER_USER: int = int(os.getenv("ADMISSION_MAX_CONCURRENT_PER_USER", "2"))
+    ADMISSION_MAX_REQUEST_COST: float = float(os.getenv("ADMISSION_MAX_REQUEST_COST", "200000"))
+    ADMISSION_COST_BURST: float = float(os.getenv("ADMISSION_COST_BURST", "400000"))
+    ADMISSION_COST_PER_SECOND: float = float(os.getenv("ADMISSION_COST_PER_SECOND", "20000"))
+    ADMISSION_QUEUE_SECONDS: float = float(os.getenv("ADMISSION_QUEUE_SECONDS", "2"))
+    # Statements of analytics reads running longer than this are cancelled (0 disables)
+    ANALYTICS_STATEMENT_TIMEOUT_SECONDS: float = float(os.getenv("ANALYTICS_STATEMENT_TIMEOUT_SECONDS", "30"))
+    
+    # Timezone of projects without one, and first year of the local calendars
+    # (core.calendar) used to bucket readings by local date
+    DEFAULT_TIMEZONE: str = os.getenv("DEFAULT_TIMEZONE", "UTC")
+    CALENDAR_FIRST_YEAR: int = int(os.getenv("CALENDAR_FIRST_YEAR", "2015"))
+    
+    # Per-worker in-memory window of recent readings (core.hot_window), which
+    # answers aggregates over ranges inside it
+    HOT_WINDOW_ENABLED: bool = os.getenv("HOT_WINDOW_ENABLED", "true").lower() == "true"
+    HOT_WINDOW_HOURS: float = float(os.getenv("HOT_WINDOW_HOURS", "72"))
+    HOT_WINDOW_SYNC_SECONDS: float = float(os.getenv("HOT_WINDOW_SYNC_SECONDS", "2.0"))
+    HOT_WINDOW_LOAD_CHUNK_ROWS: int = int(os.getenv("HOT_WINDOW_LOAD_CHUNK_ROWS", "50000"))
+    
+    # Track each series' reading cadence on ingest and record gaps as they
+    # arrive (core.data_quality)
+    DATA_QUALITY_TRACKING_ENABLED: bool = os.getenv("DATA_QUALITY_TRACKING_ENABLED", "true").lower() == "true"
+    
+    # Background jobs (reports and exports): a local SQLite queue shared by the
+    # processes of a host, run by JOBS_WORKERS processes per runner
+    JOBS_DB_PATH: str = os.getenv("JOBS_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "var", "jobs.sqlite3"))
+    JOBS_RESULT_DIR: str = os.getenv("JOBS_RESULT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "var", "jobs"))
+    JOBS_RUNNER_ENABLED: bool = os.getenv("JOBS_RUNNER_ENABLED", "true").lower() == "true"
+    JOBS_WORKERS: int = int(os.getenv("JOBS_WORKERS", "2"))
+    JOBS_POLL_SECONDS: float = float(os.getenv("JOBS_POLL_SECONDS", "1"))
+    JOBS_RESULT_TTL_SECONDS: float = float(os.getenv("JOBS_RESULT_TTL_SECONDS", "86400"))
+    JOBS_EVICT_INTERVAL_SECONDS: float = float(os.getenv("JOBS_EVICT_INTERVAL_SECONDS", "300"))
+    JOBS_MAX_PENDING_PER_USER: int = int(os.getenv("JOBS_MAX_PENDING_PER_USER", "5"))
+    JOBS_EXPORT_CHUNK_ROWS: int = int(os.getenv("JOBS_EXPORT_CHUNK_ROWS", "50000"))
+    
+    # Demo and benchmark data (python manage.py seed)
+    SEED_BATCH_ROWS: int = int(os.getenv("SEED_BATCH_ROWS", "50000"))
+    
     # CORS settings
     CORS_ORIGINS: list = [
         "http://localhost:3000", 
@@ -0,0 +1,219 @@
+"""
+Admission control and statement timeouts for the analytics routes.
+
+Each request's cost is estimated before it runs as project-days of readings
+scanned: the number of projects x the days in its range x a weight per
+route (1 for the aggregates over raw readings, less for the routes served
+from cached rollup series). Every user has
+
+- at most ADMISSION_MAX_CONCURRENT_PER_USER analytics requests running, and
+- a token bucket of ADMISSION_COST_BURST project-days, refilled at
+  ADMISSION_COST_PER_SECOND, that each request's cost is taken from.
+
+A request that does not fit waits up to ADMISSION_QUEUE_SECONDS, then is
+rejected with 429 and a Retry-After of when its budget will allow it. A
+request estimated above ADMISSION_MAX_REQUEST_COST is rejected outright.
+
+Sessions of analytics reads carry a statement timeout
+(ANALYTICS_STATEMENT_TIMEOUT_SECONDS), applied to every statement they run:
+a MAX_EXECUTION_TIME hint on MySQL, SET LOCAL statement_timeout on
+PostgreSQL and a progress handler on SQLite. A cancelled statement fails
+the request with 503.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+import logging
+import math
+import threading
+import time
+
+from fastapi import HTTPException, status
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from config import settings
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Project-days of raw readings a request of each route reads, per project-day
+# of its range. Routes answered from per-worker rollup caches cost a fraction.
+ROUTE_WEIGHTS = {
+    "consumption.daily": 1.0,
+    "consumption.weekly": 1.0,
+    "generation.daily": 1.0,
+    "generation.weekly": 1.0,
+    "insights.summary": 1.0,
+    "insights.environmental_impact": 0.05,
+    "insights.cost": 0.05,
+    "insights.demand": 0.1,
+    "generation.forecast": 0.05,
+}
+
+class AdmissionRejected(HTTPException):
+    pass
+
+def estimate_cost(key: Tuple, start_date: Optional[datetime], end_date: Optional[datetime], default_days: int) -> float:
+    """
+    Project-days an analytics request (by its coalescing key) will read
+    """
+    route, project_ids = key[0], key[1]
+    days = default_days
+    if start_date and end_date:
+        days = max(1.0, (end_date - start_date).total_seconds() / 86400)
+    elif start_date:
+        days = max(1.0, (datetime.now(start_date.tzinfo) - start_date).total_seconds() / 86400)
+    return ROUTE_WEIGHTS.get(route, 1.0) * max(1, len(project_ids)) * days
+
+class _Budget:
+    def __init__(self):
+        self.running = 0
+        self.tokens = settings.ADMISSION_COST_BURST
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(settings.ADMISSION_COST_BURST, self.tokens + (now - self.updated) * settings.ADMISSION_COST_PER_SECOND)
+        self.updated = now
+
+class AdmissionController:
+    """
+    Per-user concurrency slots and cost budgets, per worker
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._condition = threading.Condition()
+        self._budgets: Dict[int, _Budget] = {}
+
+    def _reject(self, route: str, reason: str, retry_after: float, detail: str):
+        metrics.increment("admission.rejected", labels={"route": route, "reason": reason})
+        raise AdmissionRejected(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    def acquire(self, user_id: int, route: str, cost: float):
+        """
+        Take a slot and `cost` from the user's budget, waiting up to
+        ADMISSION_QUEUE_SECONDS for them
+        """
+        if cost > settings.ADMISSION_MAX_REQUEST_COST:
+            metrics.increment("admission.rejected", labels={"route": route, "reason": "too_large"})
+            raise AdmissionRejected(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=(
+                    f"This request would read about {cost:.0f} project-days, more than the limit of "
+                    f"{settings.ADMISSION_MAX_REQUEST_COST:.0f}. Narrow the date range or select fewer projects."
+                ),
+            )
+
+        start = time.monotonic()
+        deadline = start + settings.ADMISSION_QUEUE_SECONDS
+        with self._condition:
+            budget = self._budgets.setdefault(user_id, _Budget())
+            while True:
+                now = time.monotonic()
+                budget.refill(now)
+                # A request never needs more than a full bucket
+                needed = min(cost, settings.ADMISSION_COST_BURST)
+                if budget.running < settings.ADMISSION_MAX_CONCURRENT_PER_USER and budget.tokens >= needed:
+                    budget.running += 1
+                    budget.tokens -= needed
+                    break
+
+                if budget.running >= settings.ADMISSION_MAX_CONCURRENT_PER_USER:
+                    wait, reason = deadline - now, "concurrency"
+                    retry_after = settings.ADMISSION_QUEUE_SECONDS
+                    detail = "Too many analytics requests running for this user, retry shortly"
+                else:
+                    retry_after = (needed - budget.tokens) / settings.ADMISSION_COST_PER_SECOND
+                    wait, reason = retry_after, "budget"
+                    detail = "Analytics query budget exhausted for this user, retry after the Retry-After delay"
+                if now + wait > deadline or wait <= 0:
+                    self._reject(route, reason, retry_after, detail)
+                self._condition.wait(wait)
+
+        metrics.increment("admission.admitted", labels={"route": route})
+        metrics.observe("admission.queued_seconds", time.monotonic() - start, labels={"route": route})
+
+    def release(self, user_id: int):
+        with self._condition:
+            self._budgets[user_id].running -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, user_id: int, route: str, cost: float):
+        if not self.enabled:
+            yield
+            return
+        self.acquire(user_id, route, cost)
+        try:
+            yield
+        finally:
+            self.release(user_id)
+
+admission = AdmissionController(enabled=settings.ADMISSION_ENABLED)
+
+def _is_statement_timeout(error: DBAPIError) -> bool:
+    orig = error.orig
+    code = orig.args[0] if getattr(orig, "args", None) else None
+    # MySQL 3024: maximum statement execution time exceeded, PostgreSQL 57014: query_canceled
+    return code == 3024 or getattr(orig, "pgcode", None) == "57014" or "interrupted" in str(orig)
+
+def admitted(user_id: int, key: Tuple, cost: float, compute: Callable[[], Any]) -> Any:
+    """
+    Run an analytics computation within the user's admission budget
+    """
+    with admission.slot(user_id, key[0], cost):
+        try:
+            return compute()
+        except DBAPIError as e:
+            if not _is_statement_timeout(e):
+                raise
+            metrics.increment("admission.statement_timeouts", labels={"route": key[0]})
+            logger.warning(f"Statement timeout in {key[0]} for user {user_id}: {e.orig}")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=(
+                    f"The query was cancelled after {settings.ANALYTICS_STATEMENT_TIMEOUT_SECONDS:g}s. "
+                    f"Narrow the date range or select fewer projects."
+                ),
+            )
+
+def set_statement_timeout(db: Session, seconds: float):
+    """
+    Cancel any statement of this session (and of the sessions
+    run_concurrently derives from it) running longer than `seconds`
+    """
+    if seconds > 0:
+        db.info["statement_timeout"] = seconds
+
+@event.listens_for(Session, "do_orm_execute")
+def _pass_statement_timeout(state):
+    seconds = state.session.info.get("statement_timeout")
+    if seconds:
+        state.update_execution_options(statement_timeout=seconds)
+
+@event.listens_for(Engine, "before_cursor_execute", retval=True)
+def _apply_statement_timeout(conn, cursor, statement, parameters, context, executemany):
+    seconds = context.execution_options.get("statement_timeout") if context is not None else None
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        # Set or cleared before every statement, so a pooled connection never keeps a stale deadline
+        dbapi_connection = conn.connection.dbapi_connection
+        if seconds:
+            deadline = time.monotonic() + seconds
+            dbapi_connection.set_progress_handler(lambda: int(time.monotonic() > deadline), 10000)
+        else:
+            dbapi_connection.set_progress_handler(None, 0)
+    elif seconds and dialect == "mysql":
+        stripped = statement.lstrip()
+        if stripped[:6].upper() == "SELECT":
+            statement = f"SELECT /*+ MAX_EXECUTION_TIME({int(seconds * 1000)}) */{stripped[6:]}"
+    elif seconds and dialect == "postgresql":
+        cursor.execute(f"SET LOCAL statement_timeout = {int(seconds * 1000)}")
+    return statement, parameters
@@ -0,0 +1,222 @@
+"""
+Batch anomaly detection over the consumption and generation series.
+
+Each (kind, project, source) series keeps running state in
+anomaly_series_state, so a run only reads the readings after the last one it
+processed. New readings are scanned in chunks with NumPy:
+
+- spike / drop: robust z-score against the median and MAD of the previous
+  ANOMALY_WINDOW readings
+- flatline: the same value repeated for at least ANOMALY_FLATLINE_HOURS
+- gap: an interval longer than ANOMALY_GAP_FACTOR times the series' cadence
+
+Results are upserted into the anomalies table, so re-running over the same
+readings is harmless. Readings backfilled with timestamps before a series'
+last processed reading are not rescanned.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import json
+import logging
+import time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from sqlalchemy.orm import Session
+
+from config import settings
+from core.ingest import READING_MODELS, upsert_statement
+from core.metrics import metrics
+from models.anomaly import Anomaly, AnomalySeriesState, AnomalyType
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_KEY = ("kind", "project_id", "source_type", "anomaly_type", "start_time")
+ANOMALY_COLUMNS = ("end_time", "value_kwh", "score", "detail")
+
+# Scales the MAD to the standard deviation of normally distributed data
+MAD_SCALE = 0.6745
+FLAT_TOLERANCE = 1e-9
+
+def _to_datetime(seconds) -> datetime:
+    return np.datetime64(int(seconds), "s").astype(datetime)
+
+def detect_spikes(baseline: np.ndarray, values: np.ndarray, window: int, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Robust z-scores of `values`, each against the `window` readings before
+    it (taken from `baseline` for the first ones). Returns the indices of
+    values whose |z| exceeds the threshold, and their z-scores.
+    """
+    combined = np.concatenate([baseline, values])
+    first = len(baseline)
+    if len(combined) <= window:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    # windows[j] holds the readings before combined[j + window]
+    windows = sliding_window_view(combined[:-1], window)
+    start = max(0, first - window)
+    windows = windows[start:]
+    targets = combined[start + window:]
+
+    median = np.median(windows, axis=1)
+    mad = np.median(np.abs(windows - median[:, None]), axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = MAD_SCALE * (targets - median) / mad
+    # A constant baseline has no spread to compare against
+    z = np.where(mad > 0, z, 0.0)
+
+    hits = np.flatnonzero(np.abs(z) > threshold)
+    return hits + (start + window - first), z[hits]
+
+def detect_flatlines(
+    seconds: np.ndarray,
+    values: np.ndarray,
+    run_start: Optional[float],
+    run_value: Optional[float],
+    min_seconds: float,
+) -> Tuple[List[Tuple[float, float, float]], float, float]:
+    """
+    Runs of one repeated value lasting at least min_seconds, as
+    (start, end, value). A run still open from the previous chunk continues
+    from run_start. Also returns the start and value of the last run.
+    """
+    changed = np.r_[True, np.abs(np.diff(values)) > FLAT_TOLERANCE]
+    continues = run_value is not None and abs(values[0] - run_value) <= FLAT_TOLERANCE
+    if continues:
+        changed[0] = False
+
+    starts = np.flatnonzero(changed)
+    if continues:
+        starts = np.r_[0, starts]
+    ends = np.r_[starts[1:], len(values)] - 1
+    start_seconds = seconds[starts].astype(np.float64)
+    if continues:
+        start_seconds[0] = run_start
+
+    durations = seconds[ends] - start_seconds
+    flat = np.flatnonzero(durations >= min_seconds)
+    runs = [(start_seconds[i], float(seconds[ends[i]]), float(values[starts[i]])) for i in flat]
+    return runs, float(start_seconds[-1]), float(values[-1])
+
+def detect_gaps(
+    seconds: np.ndarray,
+    previous: Optional[float],
+    cadence: Optional[float],
+    factor: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Optional[float]]:
+    """
+    Intervals longer than factor x the expected cadence. Returns the interval
+    start and end seconds, their length in cadences, and the updated cadence.
+    """
+    points = seconds if previous is None else np.r_[previous, seconds]
+    intervals = np.diff(points)
+    if len(intervals) == 0:
+        return np.empty(0), np.empty(0), np.empty(0), cadence
+
+    chunk_cadence = float(np.median(intervals))
+    expected = cadence or chunk_cadence
+    gaps = np.flatnonzero(intervals > factor * expected) if expected > 0 else np.empty(0, dtype=np.int64)
+
+    # Follow cadence changes slowly, so a burst of gaps does not become the norm
+    cadence = chunk_cadence if cadence is None else 0.8 * cadence + 0.2 * chunk_cadence
+    return points[gaps], points[gaps + 1], intervals[gaps] / expected, cadence
+
+def _scan_chunk(kind: str, state: AnomalySeriesState, timestamps: List[datetime], values: np.ndarray) -> List[dict]:
+    seconds = np.array(timestamps, dtype="datetime64[s]").astype(np.int64)
+    baseline = np.array(json.loads(state.recent_values), dtype=np.float64) if state.recent_values else np.empty(0)
+    found = []
+
+    def add(anomaly_type: str, start: datetime, end: datetime, value: Optional[float], score: Optional[float], detail: str):
+        found.append({
+            "kind": kind,
+            "project_id": state.project_id,
+            "source_type": state.source_type,
+            "anomaly_type": anomaly_type,
+            "start_time": start,
+            "end_time": end,
+            "value_kwh": value,
+            "score": score,
+            "detail": detail,
+        })
+
+    hits, scores = detect_spikes(baseline, values, settings.ANOMALY_WINDOW, settings.ANOMALY_Z_THRESHOLD)
+    for i, z in zip(hits, scores):
+        anomaly_type = AnomalyType.SPIKE if z > 0 else AnomalyType.DROP
+        add(anomaly_type, timestamps[i], timestamps[i], float(values[i]), float(z), f"robust z-score {z:.1f}")
+
+    run_start = None
+    if state.flat_run_start is not None:
+        run_start = float(np.datetime64(state.flat_run_start, "s").astype(np.int64))
+    runs, run_start, run_value = detect_flatlines(
+        seconds, values, run_start, state.flat_run_value, settings.ANOMALY_FLATLINE_HOURS * 3600
+    )
+    for start, end, value in runs:
+        hours = (end - start) / 3600
+        add(AnomalyType.FLATLINE, _to_datetime(start), _to_datetime(end), value, hours, f"value unchanged for {hours:.1f} h")
+
+    previous = None
+    if state.last_timestamp is not None:
+        previous = float(np.datetime64(state.last_timestamp, "s").astype(np.int64))
+    gap_starts, gap_ends, lengths, cadence = detect_gaps(seconds, previous, state.cadence_seconds, settings.ANOMALY_GAP_FACTOR)
+    for start, end, length in zip(gap_starts, gap_ends, lengths):
+        add(AnomalyType.GAP, _to_datetime(start), _to_datetime(end), None, float(length), f"no readings for {length:.1f} intervals")
+
+    state.recent_values = json.dumps(np.r_[baseline, values][-settings.ANOMALY_WINDOW:].tolist())
+    state.last_timestamp = timestamps[-1]
+    state.cadence_seconds = cadence
+    state.flat_run_start = _to_datetime(run_start)
+    state.flat_run_value = run_value
+    state.updated_at = datetime.utcnow()
+    return found
+
+def detect_anomalies(db: Session, kinds: Optional[List[str]] = None, chunk_rows: Optional[int] = None) -> Dict[str, int]:
+    """
+    Scan the readings added since the previous run of every series and
+    store what was found. Commits per chunk. Returns anomalies found per kind.
+    """
+    chunk_rows = chunk_rows or settings.ANOMALY_CHUNK_ROWS
+    dialect = db.get_bind().dialect.name
+    stmt = upsert_statement(Anomaly.__table__, ANOMALY_KEY, ANOMALY_COLUMNS, dialect)
+    found: Dict[str, int] = {}
+
+    for kind in kinds or list(READING_MODELS):
+        model = READING_MODELS[kind]
+        start = time.perf_counter()
+        found[kind] = 0
+        states = {
+            (state.project_id, state.source_type): state
+            for state in db.query(AnomalySeriesState).filter(AnomalySeriesState.kind == kind).all()
+        }
+
+        for project_id, source_type in db.query(model.project_id, model.source_type).distinct().all():
+            state = states.get((project_id, source_type))
+            if state is None:
+                state = AnomalySeriesState(kind=kind, project_id=project_id, source_type=source_type)
+                db.add(state)
+
+            while True:
+                query = db.query(model.timestamp, model.value_kwh).filter(
+                    model.project_id == project_id,
+                    model.source_type == source_type,
+                )
+                if state.last_timestamp is not None:
+                    query = query.filter(model.timestamp > state.last_timestamp)
+                rows = query.order_by(model.timestamp).limit(chunk_rows).all()
+                if not rows:
+                    break
+
+                anomalies = _scan_chunk(
+                    kind, state, [row.timestamp for row in rows], np.array([row.value_kwh for row in rows], dtype=np.float64)
+                )
+                if anomalies:
+                    db.execute(stmt, anomalies)
+                # The state and the anomalies of a chunk are committed together
+                db.commit()
+                found[kind] += len(anomalies)
+                if len(rows) < chunk_rows:
+                    break
+
+        metrics.observe("anomalies.run_seconds", time.perf_counter() - start, labels={"kind": kind})
+        metrics.increment("anomalies.found", found[kind], labels={"kind": kind})
+        logger.info(f"Anomaly detection over {kind} found {found[kind]} anomalies in {time.perf_counter() - start:.2f}s")
+    return found
@@ -0,0 +1,437 @@
+"""
+Cold-storage archive of old readings.
+
+`python manage.py archive-readings` moves readings older than
+ARCHIVE_AFTER_DAYS out of energy_consumption and energy_generation into
+Parquet files under ARCHIVE_URI, one per project and calendar month:
+
+    {kind}/project_id={id}/month={YYYY-MM}/part-{version}.parquet
+
+Rows are sorted by source and timestamp and written in row groups of
+ARCHIVE_ROW_GROUP_ROWS, so the row-group statistics let a scan skip the
+sources and times it does not need. Every file is listed in the
+archived_partitions catalog. A partition's catalog row is committed in the
+same transaction that deletes its readings from the database, and a
+partition archived again is written to a new file before its catalog row
+is switched over, so a scan sees each partition's file exactly once.
+
+A reading written for a month after it was archived (a late or corrected
+reading) is stored in the database again. Scans drop the archived copy of
+every reading that has a row in the database, so the database row wins
+and no reading is counted twice. Archiving the month again merges the
+two, newer rows winning.
+
+Read paths federate: the aggregate endpoints add the totals of the archived
+partitions overlapping their range to the database's, and rollup refreshes
+merge the archived readings of the hours they recompute. Local files are
+memory-mapped, and scans read only the columns they aggregate.
+"""
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional, Sequence
+import logging
+import time
+import uuid
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from config import settings
+from core.calendar import local_dates, project_timezones
+from core.ingest import READING_MODELS
+from core.metrics import metrics
+from models.archive import ArchivedPartition
+from models.energy_data import EnergySourceType
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+def _schema(kind: str) -> "pa.Schema":
+    # PyArrow is imported on first use only: most requests never touch the archive
+    import pyarrow as pa
+
+    fields = [
+        ("id", pa.int64()),
+        ("project_id", pa.int64()),
+        ("source_type", pa.string()),
+        ("timestamp", pa.timestamp("us")),
+        ("value_kwh", pa.float64()),
+    ]
+    if kind == "generation":
+        fields.append(("efficiency", pa.float64()))
+    fields += [("created_at", pa.timestamp("us")), ("updated_at", pa.timestamp("us"))]
+    return pa.schema(fields)
+
+@lru_cache()
+def _filesystem():
+    """
+    The archive's filesystem and root path. Local directories are read
+    through memory maps.
+    """
+    import pyarrow.fs as pafs
+
+    uri = settings.ARCHIVE_URI
+    if "://" not in uri:
+        return pafs.LocalFileSystem(use_mmap=True), uri.rstrip("/")
+    filesystem, root = pafs.FileSystem.from_uri(uri)
+    if isinstance(filesystem, pafs.LocalFileSystem):
+        filesystem = pafs.LocalFileSystem(use_mmap=True)
+    return filesystem, root.rstrip("/")
+
+def _full_path(path: str) -> str:
+    return f"{_filesystem()[1]}/{path}"
+
+def _naive_utc(value: datetime) -> datetime:
+    # Readings are stored as naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+def _next_month(value: datetime) -> datetime:
+    return datetime(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+def archive_cutoff(older_than_days: Optional[int] = None, now: Optional[datetime] = None) -> datetime:
+    """
+    Start of the month containing the archive horizon: only whole months
+    before it are archived
+    """
+    days = settings.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    return month_start((now or datetime.utcnow()) - timedelta(days=days))
+
+def archived_partitions(
+    db: Session,
+    kind: str,
+    project_ids: Sequence[int],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> List[ArchivedPartition]:
+    """
+    Catalog entries of the projects' archived partitions with readings
+    between start and end (inclusive)
+    """
+    query = db.query(ArchivedPartition).filter(
+        ArchivedPartition.kind == kind,
+        ArchivedPartition.project_id.in_(project_ids),
+    )
+    if start is not None:
+        query = query.filter(ArchivedPartition.last_timestamp >= _naive_utc(start))
+    if end is not None:
+        query = query.filter(ArchivedPartition.first_timestamp <= _naive_utc(end))
+    return query.all()
+
+# A reading's key, in the database and in the archive
+READING_KEY = ["project_id", "source_type", "timestamp"]
+
+def _database_keys(db: Session, kind: str, partitions: Sequence[ArchivedPartition]) -> Optional["pa.Table"]:
+    """
+    Keys of the readings in the database for the partitions' months, which
+    replace their archived copies. None when there are none.
+    """
+    import pyarrow as pa
+
+    model = READING_MODELS[kind]
+    months = {}
+    for partition in partitions:
+        months.setdefault(partition.project_id, []).append(partition.month)
+    rows = db.query(model.project_id, model.source_type, model.timestamp).filter(or_(*[
+        and_(model.project_id == project_id, model.timestamp >= min(starts), model.timestamp < _next_month(max(starts)))
+        for project_id, starts in months.items()
+    ])).all()
+    archived = {(partition.project_id, partition.month) for partition in partitions}
+    rows = [row for row in rows if (row.project_id, month_start(row.timestamp)) in archived]
+    if not rows:
+        return None
+    return pa.table({
+        "project_id": pa.array([row.project_id for row in rows], type=pa.int64()),
+        "source_type": pa.array([row.source_type.value for row in rows], type=pa.string()),
+        "timestamp": pa.array([_naive_utc(row.timestamp) for row in rows], type=pa.timestamp("us")),
+    })
+
+def scan(db: Session, kind: str, partitions: Sequence[ArchivedPartition], columns: List[str], condition=None) -> "pa.Table":
+    """
+    The `columns` of the partitions' rows matching `condition` (a
+    pyarrow.dataset expression), skipping row groups whose statistics
+    rule it out. Rows with a newer reading in the database are left out.
+    """
+    import pyarrow.dataset as ds
+
+    start = time.perf_counter()
+    filesystem, _ = _filesystem()
+    dataset = ds.dataset([_full_path(p.path) for p in partitions], format="parquet", filesystem=filesystem)
+    keys = _database_keys(db, kind, partitions)
+    if keys is None:
+        table = dataset.to_table(columns=columns, filter=condition)
+    else:
+        table = dataset.to_table(columns=list(dict.fromkeys(columns + READING_KEY)), filter=condition)
+        rows = table.num_rows
+        table = table.join(keys, keys=READING_KEY, join_type="left anti").select(columns)
+        metrics.increment("archive.superseded_readings", rows - table.num_rows, labels={"kind": kind})
+    metrics.observe("archive.scan_seconds", time.perf_counter() - start)
+    return table
+
+def _range_condition(start: datetime, end: datetime, source_types: Optional[Sequence[EnergySourceType]] = None):
+    import pyarrow.dataset as ds
+
+    condition = (ds.field("timestamp") >= _naive_utc(start)) & (ds.field("timestamp") <= _naive_utc(end))
+    if source_types:
+        condition &= ds.field("source_type").isin([source.value for source in source_types])
+    return condition
+
+def _local_days(db: Session, table: "pa.Table") -> "pa.Array":
+    # Local dates of each project's timezone, like the database's daily sums
+    import numpy as np
+    import pyarrow as pa
+
+    project_ids = table["project_id"].to_numpy()
+    timestamps = table["timestamp"].to_numpy()
+    days = np.empty(len(timestamps), dtype="datetime64[D]")
+    timezones = project_timezones(db, np.unique(project_ids).tolist())
+    for timezone in set(timezones.values()):
+        selected = np.isin(project_ids, [project_id for project_id, tz in timezones.items() if tz == timezone])
+        days[selected] = local_dates(timestamps[selected], timezone)
+    return pa.array(days, type=pa.date32())
+
+def _grouped_sums(table: "pa.Table", key: str, value: str) -> list:
+    return table.group_by(key).aggregate([(value, "sum")]).to_pylist()
+
+def archived_totals(
+    db: Session,
+    kind: str,
+    project_ids: Sequence[int],
+    start: datetime,
+    end: datetime,
+    source_types: Optional[Sequence[EnergySourceType]] = None,
+    from_day: Optional[date] = None,
+) -> Optional[dict]:
+    """
+    kWh by_day (from `from_day` on), by_source and by_project of the
+    archived readings in the range, with their number of readings and (for
+    generation) efficiency sums, like core.energy_queries.efficiency_columns.
+    None when no archived partition overlaps the range, without reading any
+    file.
+    """
+    partitions = archived_partitions(db, kind, project_ids, start, end)
+    if not partitions:
+        return None
+
+    columns = ["project_id", "source_type", "timestamp", "value_kwh"]
+    if kind == "generation":
+        columns.append("efficiency")
+    table = scan(db, kind, partitions, columns, _range_condition(start, end, source_types))
+    table = table.append_column("day", _local_days(db, table))
+
+    by_day = {row["day"]: row["value_kwh_sum"] or 0.0 for row in _grouped_sums(table, "day", "value_kwh")}
+    if from_day is not None:
+        by_day = {day: value for day, value in by_day.items() if day >= from_day}
+    totals = {
+        "by_day": by_day,
+        "by_source": {row["source_type"]: row["value_kwh_sum"] or 0.0 for row in _grouped_sums(table, "source_type", "value_kwh")},
+        "by_project": {str(row["project_id"]): row["value_kwh_sum"] or 0.0 for row in _grouped_sums(table, "project_id", "value_kwh")},
+        "readings": table.num_rows,
+    }
+    if kind == "generation":
+        totals["efficiency_weighted"], totals["efficiency_kwh"] = _efficiency_sums(table)
+    return totals
+
+def _efficiency_sums(table: "pa.Table") -> tuple:
+    # Like core.energy_queries.efficiency_columns, readings without an efficiency are left out
+    import pyarrow.compute as pc
+
+    weighted = pc.multiply(table["efficiency"], table["value_kwh"])
+    measured = pc.if_else(pc.is_valid(table["efficiency"]), table["value_kwh"], 0.0)
+    return pc.sum(weighted).as_py() or 0.0, pc.sum(measured).as_py() or 0.0
+
+def archived_efficiency(
+    db: Session,
+    project_ids: Sequence[int],
+    start: datetime,
+    end: datetime,
+    source_types: Optional[Sequence[EnergySourceType]] = None,
+) -> list:
+    """
+    Archived generation in the range grouped by local day, project and
+    source: (day, project_id, source value, efficiency x kWh, kWh with an
+    efficiency, kWh)
+    """
+    partitions = archived_partitions(db, "generation", project_ids, start, end)
+    if not partitions:
+        return []
+    import pyarrow.compute as pc
+
+    columns = ["project_id", "source_type", "timestamp", "value_kwh", "efficiency"]
+    table = scan(db, "generation", partitions, columns, _range_condition(start, end, source_types))
+    table = table.append_column("day", _local_days(db, table))
+    table = table.append_column("weighted", pc.multiply(table["efficiency"], table["value_kwh"]))
+    table = table.append_column("measured", pc.if_else(pc.is_valid(table["efficiency"]), table["value_kwh"], 0.0))
+    grouped = table.group_by(["day", "project_id", "source_type"]).aggregate(
+        [("weighted", "sum"), ("measured", "sum"), ("value_kwh", "sum")]
+    )
+    return [
+        (row["day"], row["project_id"], row["source_type"], row["weighted_sum"] or 0.0, row["measured_sum"] or 0.0, row["value_kwh_sum"] or 0.0)
+        for row in grouped.to_pylist()
+    ]
+
+def add_archived(results: dict, archived: Optional[dict]) -> dict:
+    """
+    Add archived totals to the by_day, by_source and by_project sums
+    computed by the database
+    """
+    if archived is None:
+        return results
+    for name in ("by_day", "by_source", "by_project"):
+        if name not in results:
+            continue
+        merged = dict(results[name])
+        for key, value in archived[name].items():
+            merged[key] = merged.get(key, 0.0) + value
+        results[name] = merged
+    return results
+
+def archived_readings(db: Session, kind: str, project_id: int, start: datetime, end: datetime) -> Optional[tuple]:
+    """
+    (source values, epoch seconds, kWh) of a project's archived readings
+    from start up to, not including, end. None when there are none.
+    """
+    partitions = archived_partitions(db, kind, [project_id], start, end)
+    if not partitions:
+        return None
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    condition = (ds.field("timestamp") >= _naive_utc(start)) & (ds.field("timestamp") < _naive_utc(end))
+    table = scan(db, kind, partitions, ["source_type", "timestamp", "value_kwh"], condition)
+    if table.num_rows == 0:
+        return None
+    return (
+        table["source_type"].to_pylist(),
+        table["timestamp"].cast(pa.int64()).to_numpy() // 1_000_000,
+        table["value_kwh"].to_numpy(),
+    )
+
+def _month_table(db: Session, kind: str, project_id: int, month: datetime) -> Optional["pa.Table"]:
+    import pyarrow as pa
+
+    model = READING_MODELS[kind]
+    schema = _schema(kind)
+    columns = [getattr(model, name) for name in schema.names]
+    rows = db.query(*columns).filter(
+        model.project_id == project_id,
+        model.timestamp >= month,
+        model.timestamp < _next_month(month),
+    ).all()
+    if not rows:
+        return None
+
+    values = {}
+    for i, field in enumerate(schema):
+        column = [row[i] for row in rows]
+        if field.name == "source_type":
+            column = [source.value for source in column]
+        elif pa.types.is_timestamp(field.type):
+            column = [None if value is None else _naive_utc(value) for value in column]
+        values[field.name] = pa.array(column, type=field.type)
+    return pa.table(values, schema=schema)
+
+def _write(table: "pa.Table", path: str):
+    import pyarrow.parquet as pq
+
+    filesystem, _ = _filesystem()
+    full_path = _full_path(path)
+    filesystem.create_dir(full_path.rsplit("/", 1)[0], recursive=True)
+    pq.write_table(
+        table,
+        full_path,
+        filesystem=filesystem,
+        row_group_size=settings.ARCHIVE_ROW_GROUP_ROWS,
+        compression="zstd",
+    )
+
+def archive_partition(db: Session, kind: str, project_id: int, month: datetime) -> int:
+    """
+    Move a project's readings of one month to the archive and commit.
+    Readings already archived for the month are merged, newer rows winning.
+    Returns the number of readings moved out of the database.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    model = READING_MODELS[kind]
+    table = _month_table(db, kind, project_id, month)
+    if table is None:
+        return 0
+    moved = table["id"].to_pylist()
+
+    entry = db.query(ArchivedPartition).filter(
+        ArchivedPartition.kind == kind,
+        ArchivedPartition.project_id == project_id,
+        ArchivedPartition.month == month,
+    ).first()
+    previous_path = entry.path if entry else None
+    if previous_path:
+        existing = pq.read_table(_full_path(previous_path), filesystem=_filesystem()[0], schema=table.schema)
+        frame = pa.concat_tables([existing, table]).to_pandas()
+        frame = frame.drop_duplicates(["source_type", "timestamp"], keep="last")
+        table = pa.Table.from_pandas(frame, schema=table.schema, preserve_index=False).replace_schema_metadata()
+
+    # Row groups then cover one source's time range, which keeps their statistics selective
+    table = table.sort_by([("source_type", "ascending"), ("timestamp", "ascending")])
+    path = f"{kind}/project_id={project_id}/month={month:%Y-%m}/part-{uuid.uuid4().hex[:12]}.parquet"
+    _write(table, path)
+
+    try:
+        for offset in range(0, len(moved), settings.INGEST_BATCH_SIZE):
+            db.query(model).filter(model.id.in_(moved[offset:offset + settings.INGEST_BATCH_SIZE])).delete(synchronize_session=False)
+        if entry is None:
+            entry = ArchivedPartition(kind=kind, project_id=project_id, month=month)
+            db.add(entry)
+        timestamps = pc.min_max(table["timestamp"]).as_py()
+        entry.path = path
+        entry.readings = table.num_rows
+        entry.first_timestamp = timestamps["min"]
+        entry.last_timestamp = timestamps["max"]
+        db.commit()
+    except Exception:
+        db.rollback()
+        # The catalog still points at the previous file, so the new one is unused
+        _filesystem()[0].delete_file(_full_path(path))
+        raise
+
+    if previous_path:
+        _filesystem()[0].delete_file(_full_path(previous_path))
+    return len(moved)
+
+def archive_readings(db: Session, kind: str, before: Optional[datetime] = None) -> int:
+    """
+    Archive every whole month of readings before `before` (default:
+    archive_cutoff()), one transaction per project and month. Returns the
+    number of readings moved.
+    """
+    model = READING_MODELS[kind]
+    before = month_start(before or archive_cutoff())
+    start = time.perf_counter()
+    moved = 0
+
+    projects = db.query(model.project_id).filter(model.timestamp < before).distinct().all()
+    for project_id, in sorted(projects):
+        first = db.query(model.timestamp).filter(
+            model.project_id == project_id,
+            model.timestamp < before,
+        ).order_by(model.timestamp).first()
+        month = month_start(first[0])
+        while month < before:
+            count = archive_partition(db, kind, project_id, month)
+            if count:
+                logger.info(f"Archived {count} {kind} readings of project {project_id} for {month:%Y-%m}")
+            moved += count
+            month = _next_month(month)
+
+    metrics.observe("archive.run_seconds", time.perf_counter() - start, labels={"kind": kind})
+    metrics.increment("archive.readings_moved", moved, labels={"kind": kind})
+    logger.info(f"Archived {moved} {kind} readings before {before:%Y-%m-%d} in {time.perf_counter() - start:.2f}s")
+    return moved
@@ -0,0 +1,195 @@
+"""
+Local-time calendar of the projects' timezones.
+
+Each project has an IANA timezone (projects.timezone, DEFAULT_TIMEZONE when
+unset). The calendar_hours dimension maps every UTC hour to its local date,
+ISO week, month, UTC offset and DST flag in a timezone. It is built with
+pandas a whole year at a time, for the years a request needs between
+CALENDAR_FIRST_YEAR and next year, and the daily and weekly aggregates join
+it on (timezone, hour) in SQL, so local buckets cost one primary key lookup
+per reading instead of a conversion per row in Python.
+
+A reading belongs to the local date of the start of its UTC hour. For the
+few timezones with a fractional-hour offset (e.g. Asia/Kolkata) the readings
+of the UTC hour containing local midnight count towards the earlier day.
+Readings outside the built years fall back to their UTC date.
+"""
+from datetime import date, datetime, timedelta
+from typing import TYPE_CHECKING, Dict, Iterable, List, Set, Tuple
+import logging
+import threading
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import BigInteger, Integer, and_, cast, func, insert, literal, literal_column
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Query, Session
+
+from config import settings
+from core.metrics import metrics
+from models.calendar import CalendarHour
+from models.energy_data import Project
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Local midnight is at most this far from UTC midnight
+MAX_UTC_OFFSET = timedelta(hours=14)
+
+def validate_timezone(name: str) -> str:
+    """
+    The IANA timezone name, or ValueError if it is not one
+    """
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {name}")
+    return name
+
+def hour_key(column, dialect: str):
+    """
+    SQL expression of the whole hours between 1970-01-01 UTC and a naive
+    UTC timestamp column
+    """
+    if dialect == "mysql":
+        return func.timestampdiff(literal_column("HOUR"), literal("1970-01-01 00:00:00"), column)
+    if dialect == "sqlite":
+        return cast(func.strftime("%s", column), Integer) // 3600
+    if dialect == "postgresql":
+        return cast(func.extract("epoch", column), BigInteger) // 3600
+    raise ValueError(f"Local calendars are not supported for the {dialect} dialect")
+
+def project_timezone():
+    """
+    SQL expression of a project's timezone
+    """
+    return func.coalesce(Project.timezone, settings.DEFAULT_TIMEZONE)
+
+def calendar_rows(timezone: str, year: int) -> List[dict]:
+    """
+    The calendar_hours rows of the UTC hours of one year
+    """
+    # Imported here, they are only needed when a calendar year is built
+    import numpy as np
+    import pandas as pd
+
+    hours = pd.date_range(f"{year}-01-01", f"{year + 1}-01-01", freq="h", inclusive="left", tz="UTC")
+    local = hours.tz_convert(timezone)
+    wall = local.tz_localize(None)
+    days = wall.normalize()
+    iso = wall.isocalendar()
+    offsets = (wall - hours.tz_localize(None)).total_seconds().astype(np.int64) // 60
+    # dst() differs only between transitions, so it is looked up once per distinct offset
+    dst = {offset: bool(local[i].dst()) for offset, i in zip(*np.unique(offsets, return_index=True))}
+    columns = {
+        "hour_key": (hours.asi8 // 3_600_000_000_000).tolist(),
+        "local_date": days.date.tolist(),
+        "week_start": (days - pd.to_timedelta(wall.weekday, unit="D")).date.tolist(),
+        "month_start": wall.to_period("M").start_time.date.tolist(),
+        "iso_year": iso["year"].tolist(),
+        "iso_week": iso["week"].tolist(),
+        "utc_offset_minutes": offsets.tolist(),
+        "is_dst": [dst[offset] for offset in offsets],
+    }
+    return [{"timezone": timezone, **dict(zip(columns, values))} for values in zip(*columns.values())]
+
+def local_dates(timestamps: "np.ndarray", timezone: str) -> "np.ndarray":
+    """
+    Local dates (datetime64[D]) of naive UTC timestamps, by the start of
+    their UTC hour like the calendar dimension
+    """
+    import pandas as pd
+
+    hours = pd.DatetimeIndex(timestamps).floor("h").tz_localize("UTC").tz_convert(timezone)
+    return hours.tz_localize(None).normalize().to_numpy().astype("datetime64[D]")
+
+_covered: Set[Tuple[str, int]] = set()
+_covered_lock = threading.Lock()
+
+def _years(start: datetime, end: datetime) -> range:
+    first = max(settings.CALENDAR_FIRST_YEAR, (start - MAX_UTC_OFFSET).year)
+    last = min(datetime.utcnow().year + 1, (end + MAX_UTC_OFFSET).year)
+    return range(first, last + 1)
+
+def _first_hour_key(year: int) -> int:
+    return int((datetime(year, 1, 1) - datetime(1970, 1, 1)).total_seconds()) // 3600
+
+def _build(db: Session, needed: Set[Tuple[str, int]]):
+    # A year's rows are committed together, so its first hour marks it as built
+    for timezone in {timezone for timezone, _ in needed}:
+        years = {year for tz, year in needed if tz == timezone}
+        built = {
+            key for key, in db.query(CalendarHour.hour_key).filter(
+                CalendarHour.timezone == timezone,
+                CalendarHour.hour_key.in_([_first_hour_key(year) for year in years]),
+            ).all()
+        }
+        for year in sorted(years):
+            if _first_hour_key(year) in built:
+                continue
+            rows = calendar_rows(timezone, year)
+            try:
+                for offset in range(0, len(rows), settings.INGEST_BATCH_SIZE):
+                    db.execute(insert(CalendarHour), rows[offset:offset + settings.INGEST_BATCH_SIZE])
+                db.commit()
+            except IntegrityError:
+                # Another worker built the same year
+                db.rollback()
+                continue
+            metrics.increment("calendar.years_built", labels={"timezone": timezone})
+            logger.info(f"Built the {timezone} calendar of {year}")
+
+def ensure_calendar(db: Session, timezones: Iterable[str], start: datetime, end: datetime):
+    """
+    Build the calendar years of the timezones that the range touches and
+    that are not built yet. Cheap once they are, so read paths call it on
+    every request.
+    """
+    needed = {(timezone, year) for timezone in timezones for year in _years(start, end)}
+    with _covered_lock:
+        needed -= _covered
+    if not needed:
+        return
+
+    if db.info:
+        # Read paths may be on a replica or under a statement timeout, the
+        # calendar is written on the primary without one
+        from database import SessionLocal
+
+        primary = SessionLocal()
+        try:
+            _build(primary, needed)
+        finally:
+            primary.close()
+    else:
+        _build(db, needed)
+    with _covered_lock:
+        _covered.update(needed)
+
+def project_timezones(db: Session, project_ids: List[int]) -> Dict[int, str]:
+    return dict(db.query(Project.id, project_timezone()).filter(Project.id.in_(project_ids)).all())
+
+def ensure_project_calendars(db: Session, project_ids: List[int], start: datetime, end: datetime):
+    ensure_calendar(db, set(project_timezones(db, project_ids).values()), start, end)
+
+def with_local_day(query: Query, model) -> Tuple[Query, object]:
+    """
+    `query` joined to the calendar of each reading's project, and the SQL
+    expression of the reading's local date
+    """
+    dialect = query.session.get_bind().dialect.name
+    query = query.join(Project, Project.id == model.project_id).outerjoin(
+        CalendarHour,
+        and_(
+            CalendarHour.timezone == project_timezone(),
+            CalendarHour.hour_key == hour_key(model.timestamp, dialect),
+        ),
+    )
+    return query, func.coalesce(CalendarHour.local_date, func.date(model.timestamp))
+
+def local_day_start(day: date) -> datetime:
+    """
+    The earliest UTC time at which `day` can start in any timezone
+    """
+    return datetime(day.year, day.month, day.day) - MAX_UTC_OFFSET
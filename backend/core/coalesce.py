@@ -0,0 +1,101 @@
+"""
+Single-flight coalescing of identical concurrent analytics requests.
+
+The first request for a key computes the result; requests with the same key
+that arrive while it is running wait for it and share the result instead of
+running the same queries again. Nothing is cached after the computation
+finishes, so results are never older than the request that was in flight.
+
+Keys must be built after ownership has been resolved, from the project ids
+the user is allowed to read, so requests of different users never share a
+computation unless they are entitled to the same data.
+"""
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+import threading
+import time
+
+from config import settings
+from core.ingest import normalize_timestamp
+from core.metrics import metrics
+
+def _normalize(value: Any) -> Hashable:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return normalize_timestamp(value).isoformat()
+    if hasattr(value, "value"):
+        # Enums such as EnergySourceType
+        return value.value
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(sorted(_normalize(item) for item in value))
+    return value
+
+def analytics_key(route: str, project_ids: Iterable[int], **params) -> Tuple:
+    """
+    Normalized key of an analytics request: the route, the resolved project
+    set and the request parameters, independent of their order
+    """
+    return (
+        route,
+        tuple(sorted(set(project_ids))),
+        tuple(sorted((name, _normalize(value)) for name, value in params.items())),
+    )
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+class RequestCoalescer:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Tuple, compute: Callable[[], Any]) -> Any:
+        """
+        Run `compute`, or wait for the identical computation already in flight.
+        The result is shared by all callers and must not be mutated.
+        """
+        if not self.enabled:
+            return compute()
+
+        labels = {"route": key[0]}
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+            metrics.set_gauge("coalesce.in_flight", len(self._calls))
+
+        if leader:
+            start = time.perf_counter()
+            try:
+                call.result = compute()
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                    metrics.set_gauge("coalesce.in_flight", len(self._calls))
+                call.done.set()
+                metrics.increment("coalesce.computations", labels=labels)
+                metrics.observe("coalesce.compute_seconds", time.perf_counter() - start, labels=labels)
+                if call.waiters:
+                    metrics.increment("coalesce.shared_requests", call.waiters, labels=labels)
+            return call.result
+
+        start = time.perf_counter()
+        call.done.wait()
+        metrics.observe("coalesce.wait_seconds", time.perf_counter() - start, labels=labels)
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+coalescer = RequestCoalescer(enabled=settings.COALESCE_ANALYTICS)
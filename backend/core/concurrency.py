@@ -0,0 +1,91 @@
+"""
+Concurrent execution of the independent queries of a composite endpoint.
+
+Each task receives a session of its own, so the queries run on separate
+pooled connections at the same time and the request takes roughly as long
+as its slowest query. The calling thread runs tasks on the request's own
+session as well, so a request never waits idle for the pool.
+
+Two limits protect the connection pool: QUERY_MAX_FANOUT caps how many of a
+request's tasks run at once, and the shared executor of QUERY_POOL_WORKERS
+threads caps the extra connections taken by all requests of a worker.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import threading
+
+from sqlalchemy.orm import Session
+
+from config import settings
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.QUERY_POOL_WORKERS,
+                    thread_name_prefix="query",
+                )
+    return _executor
+
+def run_concurrently(
+    db: Session,
+    tasks: Dict[str, Callable[[Session], Any]],
+    max_fanout: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Run independent read-only query tasks concurrently and return their
+    results by name. Each task is called with the session to query on, e.g.
+    `lambda s: query.with_session(s).count()`. The first error is re-raised
+    once every started task has finished.
+    """
+    max_fanout = max_fanout or settings.QUERY_MAX_FANOUT
+    workers = min(max_fanout, len(tasks), settings.QUERY_POOL_WORKERS + 1)
+    if workers <= 1:
+        return {name: task(db) for name, task in tasks.items()}
+
+    pending = list(tasks.items())
+    pending_lock = threading.Lock()
+    results: Dict[str, Any] = {}
+    errors = []
+
+    def drain(session: Session):
+        while not errors:
+            with pending_lock:
+                if not pending:
+                    return
+                name, task = pending.pop(0)
+            try:
+                results[name] = task(session)
+            except Exception as e:
+                errors.append(e)
+
+    def drain_on_own_session():
+        # Same engine and session info as the request, so replicas, statement
+        # timeouts and test binds carry over
+        session = Session(bind=db.get_bind(), info=dict(db.info))
+        try:
+            drain(session)
+        finally:
+            session.close()
+
+    futures = [_get_executor().submit(drain_on_own_session) for _ in range(workers - 1)]
+    drain(db)
+    for future in futures:
+        # Helpers still queued behind other requests are not needed anymore
+        if not future.cancel():
+            future.result()
+
+    if errors:
+        raise errors[0]
+    return {name: results[name] for name in tasks}
+
+def shutdown_query_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
@@ -0,0 +1,305 @@
+"""
+Composite dashboard: many widgets answered in one request.
+
+POST /api/dashboard takes a list of widget specs and resolves the user's
+projects once. The widgets over raw readings (summary and the daily and
+weekly consumption and generation aggregates) are planned into one grouped
+scan per kind instead of one set of queries each: the scan covers the union
+of the widgets' ranges, projects and sources, and groups by range segment,
+local day (core.calendar), project and source. A reading's segment is the
+number of the widgets' range boundaries it lies past, so every widget's
+range is a contiguous run of segments and each widget is summed exactly
+from the scan's rows, whatever ranges the widgets have.
+
+Widgets whose range is inside this worker's hot window are answered from
+memory and skip the scan, and archived readings are added per widget, like
+on the individual endpoints. Environmental impact and cost are computed by
+their regular helpers, which read the hourly rollups.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+import time
+
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import Session
+
+from core.admission import estimate_cost
+from core.archive import add_archived, archived_totals
+from core.calendar import ensure_project_calendars, with_local_day
+from core.coalesce import analytics_key
+from core.data_quality import bucket_list, filled_buckets
+from core.energy_queries import current_watermark, efficiency_columns, week_start, weighted_efficiency
+from core.hot_window import hot_window
+from core.ingest import READING_MODELS, normalize_timestamp
+from core.metrics import metrics
+from models.energy_data import EnergySourceType
+
+logger = logging.getLogger(__name__)
+
+# Kinds of readings each widget sums
+READING_WIDGETS = {
+    "summary": ("consumption", "generation"),
+    "consumption_daily": ("consumption",),
+    "consumption_weekly": ("consumption",),
+    "generation_daily": ("generation",),
+    "generation_weekly": ("generation",),
+}
+# Route of the individual endpoint each widget stands for (core.admission)
+WIDGET_ROUTES = {
+    "summary": "insights.summary",
+    "consumption_daily": "consumption.daily",
+    "consumption_weekly": "consumption.weekly",
+    "generation_daily": "generation.daily",
+    "generation_weekly": "generation.weekly",
+    "environmental_impact": "insights.environmental_impact",
+    "cost": "insights.cost",
+}
+# Days before end_date a widget covers without a start_date, as on its endpoint
+DEFAULT_DAYS = {
+    "summary": 30,
+    "consumption_daily": 30,
+    "consumption_weekly": 90,
+    "generation_daily": 30,
+    "generation_weekly": 90,
+    "environmental_impact": 30,
+    "cost": 30,
+}
+
+Cut = Tuple[datetime, int]
+
+def widget_range(widget, now: datetime) -> Tuple[datetime, datetime]:
+    """
+    The widget's range in naive UTC, so the boundaries of all widgets can be
+    ordered, with its endpoint's default start
+    """
+    end_date = normalize_timestamp(widget.end_date) if widget.end_date else now
+    if widget.start_date:
+        return normalize_timestamp(widget.start_date), end_date
+    return end_date - timedelta(days=DEFAULT_DAYS[widget.type]), end_date
+
+def range_cuts(ranges: Sequence[Tuple[datetime, datetime]]) -> List[Cut]:
+    """
+    The boundaries of the ranges in time order: a reading is past a start
+    (value, 0) from the start on and past an end (value, 1) after the end
+    """
+    return sorted({(start, 0) for start, _ in ranges} | {(end, 1) for _, end in ranges})
+
+def _segment(model, cuts: List[Cut]):
+    # The number of cuts a reading is past. A reading past a cut is past
+    # all earlier ones, so the last cut it is past gives the count.
+    whens = [
+        (model.timestamp > value if after else model.timestamp >= value, i + 1)
+        for i, (value, after) in enumerate(cuts)
+    ]
+    return case(*reversed(whens), else_=0)
+
+def segments_of(cuts: List[Cut], start: datetime, end: datetime) -> range:
+    """
+    Segments of the readings from start to end inclusive
+    """
+    return range(cuts.index((start, 0)) + 1, cuts.index((end, 1)) + 1)
+
+def shared_scan(
+    db: Session,
+    kind: str,
+    ranges: Sequence[Tuple[datetime, datetime]],
+    project_ids: Sequence[int],
+    source_types: Optional[Sequence[EnergySourceType]],
+) -> Tuple[List[Cut], list]:
+    """
+    One grouped query over the readings in any of the ranges: (segment,
+    local day, project_id, source, kWh) rows, plus the efficiency sums of
+    core.energy_queries.efficiency_columns for generation
+    """
+    model = READING_MODELS[kind]
+    cuts = range_cuts(ranges)
+    query = db.query(model).filter(
+        model.project_id.in_(project_ids),
+        or_(*[and_(model.timestamp >= start, model.timestamp <= end) for start, end in set(ranges)]),
+    )
+    if source_types:
+        query = query.filter(model.source_type.in_(source_types))
+    query, day = with_local_day(query, model)
+    started = time.perf_counter()
+    segment = _segment(model, cuts)
+    columns = [segment, day, model.project_id, model.source_type, func.sum(model.value_kwh)]
+    if kind == "generation":
+        columns += efficiency_columns(model)
+    rows = query.with_entities(*columns).group_by(segment, day, model.project_id, model.source_type).all()
+    metrics.observe("dashboard.scan_seconds", time.perf_counter() - started, labels={"kind": kind})
+    return cuts, rows
+
+def _widget_sums(rows: list, segments: range, project_ids: Sequence[int], source_types: Optional[Sequence[EnergySourceType]]) -> dict:
+    # The widget's by_day, by_source, by_project and efficiency sums from the scan's rows
+    projects = set(project_ids)
+    sources = set(source_types or EnergySourceType)
+    by_day: Dict[date, float] = defaultdict(float)
+    by_source: Dict[str, float] = defaultdict(float)
+    by_project: Dict[str, float] = defaultdict(float)
+    weighted_sum, efficiency_kwh = 0.0, 0.0
+    for row in rows:
+        segment, day, project_id, source, value = row[:5]
+        if segment not in segments or project_id not in projects or EnergySourceType(source) not in sources:
+            continue
+        value = float(value or 0)
+        # SQLite returns dates as strings
+        by_day[day if isinstance(day, date) else date.fromisoformat(day)] += value
+        by_source[EnergySourceType(source).value] += value
+        by_project[str(project_id)] += value
+        if len(row) > 5:
+            weighted_sum += float(row[5] or 0)
+            efficiency_kwh += float(row[6] or 0)
+    return {
+        "by_day": dict(by_day),
+        "by_source": dict(by_source),
+        "by_project": dict(by_project),
+        "efficiency": (weighted_sum, efficiency_kwh),
+    }
+
+def _with_archive(db: Session, kind: str, results: dict, project_ids: Sequence[int], start: datetime, end: datetime, source_types) -> dict:
+    # Readings moved to the cold-storage archive are added to the scan's sums
+    archived = archived_totals(db, kind, project_ids, start, end, source_types)
+    results = add_archived(results, archived)
+    weighted_sum, efficiency_kwh = results["efficiency"]
+    if archived and kind == "generation":
+        weighted_sum += archived["efficiency_weighted"]
+        efficiency_kwh += archived["efficiency_kwh"]
+    results["avg_efficiency"] = weighted_efficiency(weighted_sum, efficiency_kwh)
+    return results
+
+def _aggregate_widget(db: Session, widget, kind: str, results: dict, start: datetime, end: datetime, project_ids: List[int], watermark: datetime) -> dict:
+    # Same response as the widget's aggregate endpoint
+    weekly = widget.type.endswith("_weekly")
+    by_day = results.get("by_day", {})
+    if weekly:
+        by_week: Dict[date, float] = defaultdict(float)
+        for day, value in by_day.items():
+            by_week[week_start(day)] += value
+        buckets = [{"week_start": week.isoformat(), "value_kwh": value} for week, value in sorted(by_week.items())]
+    else:
+        buckets = [{"date": day.isoformat(), "value_kwh": value} for day, value in sorted(by_day.items())]
+    # Filled buckets come from the hourly rollups and cover the whole range
+    if widget.fill:
+        filled = filled_buckets(db, kind, project_ids, start, end, widget.source_type, widget.fill)
+        buckets = bucket_list(filled, "week_start", week_start) if weekly else bucket_list(filled, "date")
+
+    total_kwh = float(sum(results["by_source"].values()))
+    response = {
+        f"{'weekly' if weekly else 'daily'}_{kind}": buckets,
+        "total_kwh": total_kwh,
+        "by_source": results["by_source"],
+        "by_project": results["by_project"],
+        "fill": widget.fill,
+        "estimated_total_kwh": float(sum(bucket["value_kwh"] for bucket in buckets)) if widget.fill else total_kwh,
+        "watermark": watermark,
+    }
+    if kind == "generation":
+        response["avg_efficiency"] = results["avg_efficiency"]
+    return response
+
+def _summary_widget(widget, consumption: dict, generation: dict, start: datetime, end: datetime) -> dict:
+    # Same response as GET /insights/summary
+    total_consumption = float(sum(consumption["by_source"].values()))
+    total_generation = float(sum(generation["by_source"].values()))
+    renewable_percentage = 0.0
+    if total_consumption > 0:
+        renewable_percentage = min(100.0, total_generation / total_consumption * 100)
+    return {
+        "total_consumption": total_consumption,
+        "total_generation": total_generation,
+        "renewable_percentage": renewable_percentage,
+        "start_date": start,
+        "end_date": end,
+        "project_id": widget.project_id,
+    }
+
+def dashboard_cost(widgets: list, widget_projects: Dict[str, List[int]], now: datetime) -> float:
+    """
+    Project-days the dashboard will read (core.admission): one shared scan
+    per kind over the union of its widgets' ranges and projects, plus the
+    widgets computed separately
+    """
+    cost = 0.0
+    scans: Dict[str, list] = defaultdict(list)
+    for widget in widgets:
+        if widget.type not in WIDGET_ROUTES:
+            continue
+        start, end = widget_range(widget, now)
+        if widget.type in READING_WIDGETS:
+            for kind in READING_WIDGETS[widget.type]:
+                scans[kind].append((start, end, widget_projects[widget.id]))
+        else:
+            cost += estimate_cost(analytics_key(WIDGET_ROUTES[widget.type], widget_projects[widget.id]), start, end, DEFAULT_DAYS[widget.type])
+    for kind, ranges in scans.items():
+        projects = {project_id for _, _, project_ids in ranges for project_id in project_ids}
+        start, end = min(start for start, _, _ in ranges), max(end for _, end, _ in ranges)
+        cost += estimate_cost(analytics_key(f"{kind}.daily", projects), start, end, 30)
+    return cost
+
+def dashboard(db: Session, widgets: list, widget_projects: Dict[str, List[int]], now: Optional[datetime] = None) -> Dict[str, dict]:
+    """
+    Results of the reading, environmental impact and cost widgets by widget
+    id, each in its endpoint's response shape. `widget_projects` are the
+    resolved project ids of each widget.
+    """
+    now = now or datetime.utcnow()
+    ranges = {widget.id: widget_range(widget, now) for widget in widgets if widget.type in WIDGET_ROUTES}
+    results: Dict[str, dict] = {}
+
+    reading_widgets = [widget for widget in widgets if widget.type in READING_WIDGETS]
+    if reading_widgets:
+        all_projects = sorted({project_id for widget in reading_widgets for project_id in widget_projects[widget.id]})
+        ensure_project_calendars(db, all_projects, min(ranges[w.id][0] for w in reading_widgets), max(ranges[w.id][1] for w in reading_widgets))
+        # Taken before reading, like on the aggregate endpoints
+        watermark = current_watermark(db)
+
+        # Widgets inside this worker's window of recent readings are answered from memory
+        sums: Dict[Tuple[str, str], dict] = {}
+        pending: Dict[str, list] = defaultdict(list)
+        for widget in reading_widgets:
+            start, end = ranges[widget.id]
+            source_types = None if widget.type == "summary" else widget.source_type
+            for kind in READING_WIDGETS[widget.type]:
+                by_day = widget.type != "summary" and not widget.fill
+                recent = hot_window.aggregate(db, kind, widget_projects[widget.id], start, end, source_types, by_day=by_day)
+                if recent is not None:
+                    sums[(widget.id, kind)] = recent
+                else:
+                    pending[kind].append((widget, source_types))
+
+        # One scan per kind for all the other widgets
+        for kind, planned in pending.items():
+            scan_sources = None
+            if all(source_types for _, source_types in planned):
+                scan_sources = sorted({source for _, source_types in planned for source in source_types}, key=lambda source: source.value)
+            scan_projects = sorted({project_id for widget, _ in planned for project_id in widget_projects[widget.id]})
+            cuts, rows = shared_scan(db, kind, [ranges[widget.id] for widget, _ in planned], scan_projects, scan_sources)
+            logger.info(f"Dashboard scanned {kind} for {len(planned)} widgets in {len(rows)} groups")
+            for widget, source_types in planned:
+                start, end = ranges[widget.id]
+                widget_sums = _widget_sums(rows, segments_of(cuts, start, end), widget_projects[widget.id], source_types)
+                sums[(widget.id, kind)] = _with_archive(db, kind, widget_sums, widget_projects[widget.id], start, end, source_types)
+        metrics.increment("dashboard.scans", len(pending))
+
+        for widget in reading_widgets:
+            start, end = ranges[widget.id]
+            if widget.type == "summary":
+                results[widget.id] = _summary_widget(widget, sums[(widget.id, "consumption")], sums[(widget.id, "generation")], start, end)
+            else:
+                kind = READING_WIDGETS[widget.type][0]
+                results[widget.id] = _aggregate_widget(db, widget, kind, sums[(widget.id, kind)], start, end, widget_projects[widget.id], watermark)
+
+    for widget in widgets:
+        if widget.type == "environmental_impact":
+            # numpy and the emissions engine are loaded on first use only
+            from core.emissions import environmental_impact
+            start, end = ranges[widget.id]
+            results[widget.id] = environmental_impact(db, widget_projects[widget.id], start, end, widget.project_id)
+        elif widget.type == "cost":
+            # numpy and the cost engine are loaded on first use only
+            from core.tariffs import energy_cost
+            start, end = ranges[widget.id]
+            results[widget.id] = energy_cost(db, widget_projects[widget.id], start, end, widget.project_id, widget.include_daily)
+    return results
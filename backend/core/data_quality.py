@@ -0,0 +1,324 @@
+"""
+Data quality of the reading series: expected cadence, gaps and coverage.
+
+On ingest, every committed batch updates its series' row in
+data_quality_series (expected cadence, first and last reading) and records
+intervals longer than ANOMALY_GAP_FACTOR cadences as gap anomalies, with
+the same key the batch detector (core.anomalies) uses, so gaps show up in
+/api/insights/anomalies as soon as the reading after them arrives.
+
+On read, the daily and weekly aggregates accept a fill mode. Buckets are
+then computed from the hourly rollups, not raw readings. Each series is laid
+out on a dense grid of slots of its cadence (an hour, or several for series
+reporting less often) from its first reading, or the start of the range,
+up to now, or the end of the range:
+
+- coverage: readings received / readings expected, per slot capped at 1
+- partially covered slots are scaled up to a full slot
+- empty slots are filled from the previous slot (ffill), by linear
+  interpolation between their neighbours (linear), or with the series'
+  mean for the same hour of the week (profile)
+
+`none` reports coverage without estimating anything. Series with no
+tracked cadence (readings loaded before tracking) get one estimated from
+their rollups.
+"""
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+import logging
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from core.calendar import local_dates, project_timezones
+from core.ingest import add_ingest_listener, normalize_timestamp, remove_ingest_listener, upsert_statement
+from core.metrics import metrics
+from models.anomaly import Anomaly, AnomalyType
+from models.data_quality import DataQualitySeries
+from models.energy_data import EnergySourceType
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FILL_MODES = ("none", "ffill", "linear", "profile")
+FILL_PATTERN = f"^({'|'.join(FILL_MODES)})$"
+HOURS_PER_WEEK = 168
+# Bucket columns: estimated kWh, measured kWh, readings counted towards coverage, readings expected
+VALUE, MEASURED, COVERED, EXPECTED = range(4)
+
+def _seconds(values) -> "np.ndarray":
+    import numpy as np
+
+    return np.array(values, dtype="datetime64[s]").astype(np.int64)
+
+def _to_datetime(seconds) -> datetime:
+    import numpy as np
+
+    return np.datetime64(int(seconds), "s").astype(datetime)
+
+def update_cadence(cadence: Optional[float], intervals: "np.ndarray", factor: float) -> Optional[float]:
+    """
+    Expected interval of a series after new reading intervals. Gaps and
+    bursts of duplicates do not move it.
+    """
+    import numpy as np
+
+    intervals = intervals[intervals > 0]
+    if cadence is not None:
+        intervals = intervals[intervals <= factor * cadence]
+    if len(intervals) == 0:
+        return cadence
+    observed = float(np.median(intervals))
+    return observed if cadence is None else 0.9 * cadence + 0.1 * observed
+
+def track_readings(db: Session, kind: str, rows: List[dict]) -> int:
+    """
+    Update the cadence and extent of the series in a committed batch and
+    record the gaps before its readings. Commits. Returns the gaps found.
+    """
+    # The analytics stack is imported on first use only
+    import numpy as np
+
+    from core.anomalies import ANOMALY_COLUMNS, ANOMALY_KEY, detect_gaps
+
+    by_series: Dict[Tuple[int, EnergySourceType], List[datetime]] = {}
+    for row in rows:
+        by_series.setdefault((row["project_id"], EnergySourceType(row["source_type"])), []).append(row["timestamp"])
+
+    states = {
+        (state.project_id, state.source_type): state
+        for state in db.query(DataQualitySeries).filter(
+            DataQualitySeries.kind == kind,
+            DataQualitySeries.project_id.in_({project_id for project_id, _ in by_series}),
+        ).all()
+    }
+    gaps = []
+    for (project_id, source_type), timestamps in by_series.items():
+        seconds = np.unique(_seconds(timestamps))
+        state = states.get((project_id, source_type))
+        if state is None:
+            state = DataQualitySeries(kind=kind, project_id=project_id, source_type=source_type)
+            db.add(state)
+
+        previous = None if state.last_timestamp is None else float(_seconds([state.last_timestamp])[0])
+        # Backfilled readings before the last one extend the series but are not gap-checked
+        fresh = seconds if previous is None else seconds[seconds > previous]
+        if len(fresh) and state.cadence_seconds:
+            starts, ends, lengths, _ = detect_gaps(fresh, previous, state.cadence_seconds, settings.ANOMALY_GAP_FACTOR)
+            for start, end, length in zip(starts, ends, lengths):
+                gaps.append({
+                    "kind": kind,
+                    "project_id": project_id,
+                    "source_type": source_type,
+                    "anomaly_type": AnomalyType.GAP,
+                    "start_time": _to_datetime(start),
+                    "end_time": _to_datetime(end),
+                    "value_kwh": None,
+                    "score": float(length),
+                    "detail": f"no readings for {length:.1f} intervals",
+                })
+        if len(fresh):
+            points = fresh if previous is None else np.r_[previous, fresh]
+            state.cadence_seconds = update_cadence(state.cadence_seconds, np.diff(points), settings.ANOMALY_GAP_FACTOR)
+            state.last_timestamp = _to_datetime(fresh[-1])
+        if state.first_timestamp is None or seconds[0] < _seconds([state.first_timestamp])[0]:
+            state.first_timestamp = _to_datetime(seconds[0])
+        state.updated_at = datetime.utcnow()
+
+    if gaps:
+        db.execute(upsert_statement(Anomaly.__table__, ANOMALY_KEY, ANOMALY_COLUMNS, db.get_bind().dialect.name), gaps)
+        metrics.increment("data_quality.gaps", len(gaps), labels={"kind": kind})
+    db.commit()
+    return len(gaps)
+
+def _track(kind: str, rows: List[dict]):
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        track_readings(db, kind, rows)
+    except IntegrityError:
+        # Another worker created the same series at the same time, its next batch catches up
+        db.rollback()
+    finally:
+        db.close()
+
+def start_gap_tracking():
+    if settings.DATA_QUALITY_TRACKING_ENABLED:
+        add_ingest_listener(_track)
+
+def stop_gap_tracking():
+    remove_ingest_listener(_track)
+
+def estimate_cadence(hour_keys: "np.ndarray", counts: "np.ndarray") -> float:
+    """
+    Cadence of a series from its hourly reading counts: from the readings
+    per hour when it reports several times an hour, otherwise from the
+    spacing of the hours with readings
+    """
+    import numpy as np
+
+    per_hour = float(np.median(counts[counts > 0])) if (counts > 0).any() else 1.0
+    if per_hour > 1 or len(hour_keys) < 2:
+        return 3600.0 / per_hour
+    return float(np.median(np.diff(np.unique(hour_keys)))) * 3600.0
+
+def fill_series(
+    hour_keys: "np.ndarray",
+    values: "np.ndarray",
+    counts: "np.ndarray",
+    first_key: int,
+    last_key: int,
+    cadence: float,
+    mode: str,
+    elapsed: float = 1.0,
+) -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    Slots of a series from hour first_key to last_key: the hour key each
+    starts at, and their estimated kWh, measured kWh, covered and expected
+    readings (columns VALUE, MEASURED, COVERED, EXPECTED). `elapsed` is the
+    share of the last slot that has passed.
+    """
+    import numpy as np
+
+    slot = max(1, int(round(cadence / 3600)))
+    first_slot, last_slot = first_key // slot, last_key // slot
+    n = last_slot - first_slot + 1
+    index = hour_keys // slot - first_slot
+    inside = (index >= 0) & (index < n)
+    index, values, counts = index[inside], values[inside], counts[inside]
+
+    out = np.zeros((n, 4))
+    out[:, MEASURED] = np.bincount(index, weights=values, minlength=n)
+    count = np.bincount(index, weights=counts, minlength=n)
+    out[:, EXPECTED] = slot * 3600 / cadence
+    out[-1, EXPECTED] *= elapsed
+    out[:, COVERED] = np.minimum(count, out[:, EXPECTED])
+    out[:, VALUE] = out[:, MEASURED]
+
+    known = count > 0
+    if mode != "none" and known.any():
+        coverage = np.divide(out[:, COVERED], out[:, EXPECTED], out=np.ones(n), where=out[:, EXPECTED] > 0)
+        estimate = out[:, VALUE]
+        estimate[known] /= np.maximum(coverage[known], 1e-9)
+        missing = np.flatnonzero(~known)
+        positions = np.flatnonzero(known)
+        if mode == "ffill":
+            last_known = np.maximum.accumulate(np.where(known, np.arange(n), -1))[missing]
+            estimate[missing[last_known >= 0]] = estimate[last_known[last_known >= 0]]
+        elif mode == "linear":
+            estimate[missing] = np.interp(missing, positions, estimate[positions])
+        elif mode == "profile":
+            week_slot = ((first_slot + np.arange(n)) * slot % HOURS_PER_WEEK) // slot
+            slots_per_week = HOURS_PER_WEEK // slot + 1
+            sums = np.bincount(week_slot[positions], weights=estimate[positions], minlength=slots_per_week)
+            seen = np.bincount(week_slot[positions], minlength=slots_per_week)
+            profile = np.where(seen > 0, sums / np.maximum(seen, 1), estimate[positions].mean())
+            estimate[missing] = profile[week_slot[missing]]
+        # Slots still to come are not estimated
+        if elapsed < 1 and not known[-1]:
+            estimate[-1] = 0.0
+    return (first_slot + np.arange(n)) * slot, out
+
+def filled_buckets(
+    db: Session,
+    kind: str,
+    project_ids: List[int],
+    start_date: datetime,
+    end_date: datetime,
+    source_types: Optional[Sequence[EnergySourceType]],
+    mode: str,
+) -> Dict[date, "np.ndarray"]:
+    """
+    Per local date (core.calendar) of the readings' projects, the summed
+    slot columns (VALUE, MEASURED, COVERED, EXPECTED) of every series
+    """
+    import numpy as np
+
+    from core.rollups import ROLLUPS, refresh_rollups_if_due
+
+    rollup_model = ROLLUPS[kind][1]
+    refresh_rollups_if_due(db, kind)
+
+    now = datetime.utcnow()
+    range_first = int(_seconds([normalize_timestamp(start_date)])[0]) // 3600
+    range_end = int(_seconds([min(normalize_timestamp(end_date), now)])[0])
+    # Hours starting before the end of the range
+    range_last = (range_end - 1) // 3600
+
+    query = db.query(
+        rollup_model.project_id, rollup_model.source_type, rollup_model.hour, rollup_model.value_kwh, rollup_model.readings
+    ).filter(
+        rollup_model.project_id.in_(project_ids),
+        rollup_model.hour >= _to_datetime(range_first * 3600),
+        rollup_model.hour <= _to_datetime(range_last * 3600),
+    )
+    states_query = db.query(DataQualitySeries).filter(
+        DataQualitySeries.kind == kind,
+        DataQualitySeries.project_id.in_(project_ids),
+    )
+    if source_types:
+        query = query.filter(rollup_model.source_type.in_(source_types))
+        states_query = states_query.filter(DataQualitySeries.source_type.in_(source_types))
+    rows = query.all()
+    states = {(state.project_id, state.source_type): state for state in states_query.all()}
+
+    series: Dict[Tuple[int, EnergySourceType], list] = {key: [] for key in states}
+    for project_id, source_type, hour, value, readings in rows:
+        series.setdefault((project_id, source_type), []).append((hour, value, readings))
+
+    timezones = project_timezones(db, project_ids)
+    buckets: Dict[date, "np.ndarray"] = {}
+    for (project_id, source_type), points in series.items():
+        state = states.get((project_id, source_type))
+        hour_keys = _seconds([hour for hour, _, _ in points]) // 3600
+        values = np.fromiter((value for _, value, _ in points), dtype=np.float64, count=len(points))
+        counts = np.fromiter((readings for _, _, readings in points), dtype=np.float64, count=len(points))
+
+        cadence = state.cadence_seconds if state is not None and state.cadence_seconds else None
+        if cadence is None:
+            if not len(points):
+                continue
+            cadence = estimate_cadence(hour_keys, counts)
+        # The series is expected to report from its first reading on
+        firsts = [int(hour_keys.min())] if len(points) else []
+        if state is not None and state.first_timestamp is not None:
+            firsts.append(int(_seconds([state.first_timestamp])[0]) // 3600)
+        first_key = max(range_first, min(firsts))
+        if first_key > range_last:
+            continue
+
+        slot_seconds = max(1, int(round(cadence / 3600))) * 3600
+        elapsed = min(1.0, (range_end - range_last * 3600 // slot_seconds * slot_seconds) / slot_seconds)
+        slot_keys, slots = fill_series(hour_keys, values, counts, first_key, range_last, cadence, mode, elapsed)
+
+        days = local_dates(slot_keys.astype("datetime64[h]"), timezones.get(project_id, settings.DEFAULT_TIMEZONE))
+        unique_days, day_index = np.unique(days, return_inverse=True)
+        sums = np.zeros((len(unique_days), 4))
+        np.add.at(sums, day_index, slots)
+        for day, row in zip(unique_days.astype(date), sums):
+            buckets[day] = buckets[day] + row if day in buckets else row
+    return buckets
+
+def bucket_list(buckets: Dict[date, "np.ndarray"], key: str, group=None) -> List[dict]:
+    """
+    Response rows of filled buckets, optionally merged by `group` (e.g.
+    week_start)
+    """
+    if group is not None:
+        merged: Dict[date, "np.ndarray"] = {}
+        for day, row in buckets.items():
+            merged[group(day)] = merged[group(day)] + row if group(day) in merged else row
+        buckets = merged
+    return [
+        {
+            key: bucket.isoformat(),
+            "value_kwh": float(row[VALUE]),
+            "measured_kwh": float(row[MEASURED]),
+            "coverage_percent": float(100 * row[COVERED] / row[EXPECTED]) if row[EXPECTED] > 0 else None,
+        }
+        for bucket, row in sorted(buckets.items())
+    ]
@@ -0,0 +1,202 @@
+"""
+Peak demand, percentiles and load-duration curves from the rollup sketches.
+
+Demand is the average kW of a reading: its kWh times the number of readings
+in its hour, so hourly readings are read as kW directly and 15-minute
+readings are multiplied by 4. Every hourly rollup bucket carries a quantile
+sketch of its readings' demand (core.sketches). Per project, the buckets are
+merged into one sketch per (day, source) and cached per worker; answering a
+range or a portfolio merges those daily sketches instead of reading and
+sorting raw readings.
+
+Percentiles are within RELATIVE_ACCURACY (1%) of the exact value at their
+rank. Peaks come from the buckets' exact maxima. Portfolio percentiles are
+over the readings of all selected projects and sources together.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from core.rollups import ROLLUPS, SOURCE_CODES, ProjectRollupCache, refresh_rollups_if_due
+from core.sketches import RELATIVE_ACCURACY, ZERO_BIN, decode, merge_flat, quantiles
+from models.energy_data import EnergySourceType
+
+PERCENTILES = (50, 90, 95, 99)
+DAY_SECONDS = 86400
+# Daily sketch entries are keyed group * BIN_KEY_FACTOR + (bin - ZERO_BIN)
+BIN_KEY_FACTOR = 1 << 16
+
+class DemandSeries:
+    """
+    A project's demand sketches and peaks per (day, source), with the
+    sketches stored back to back in `bins` and `counts`
+    """
+
+    def __init__(self, days, sources, starts, ends, bins, counts, peaks, peak_hours):
+        self.days = days
+        self.sources = sources
+        self.starts = starts
+        self.ends = ends
+        self.bins = bins
+        self.counts = counts
+        self.peaks = peaks
+        self.peak_hours = peak_hours
+
+    def select(self, first_day: int, last_day: int, sources: Optional[Sequence[int]]) -> np.ndarray:
+        mask = (self.days >= first_day) & (self.days <= last_day)
+        if sources is not None:
+            mask &= np.isin(self.sources, sources)
+        return np.flatnonzero(mask)
+
+    def entries(self, selected: np.ndarray):
+        """
+        The concatenated bins and counts of the selected daily sketches
+        """
+        lengths = self.ends[selected] - self.starts[selected]
+        if lengths.sum() == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        offsets = np.repeat(self.starts[selected] - np.cumsum(np.r_[0, lengths[:-1]]), lengths)
+        index = offsets + np.arange(lengths.sum())
+        return self.bins[index], self.counts[index]
+
+def build_series(rows: List[tuple]) -> DemandSeries:
+    """
+    Daily series from a project's rollup rows of (source_type, hour,
+    readings, value_max, sketch)
+    """
+    rows = [row for row in rows if row[4]]
+    if not rows:
+        empty = np.empty(0, dtype=np.int64)
+        return DemandSeries(empty, empty, empty, empty, empty, empty, np.empty(0), empty)
+
+    hours = np.array([row[1] for row in rows], dtype="datetime64[s]").astype(np.int64)
+    sources = np.fromiter((SOURCE_CODES[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+    peaks = np.fromiter((row[3] * row[2] for row in rows), dtype=np.float64, count=len(rows))
+    group_keys, group = np.unique(hours // DAY_SECONDS * len(SOURCE_CODES) + sources, return_inverse=True)
+
+    sketches = [decode(row[4]) for row in rows]
+    lengths = np.fromiter((len(bins) for bins, _ in sketches), dtype=np.int64, count=len(sketches))
+    bins = np.concatenate([bins for bins, _ in sketches])
+    counts = np.concatenate([counts for _, counts in sketches])
+
+    # Merge the hours of each (day, source): equal (group, bin) keys add up
+    keys, entry = np.unique(np.repeat(group, lengths) * BIN_KEY_FACTOR + (bins - ZERO_BIN), return_inverse=True)
+    merged_counts = np.bincount(entry, weights=counts, minlength=len(keys)).astype(np.int64)
+    entry_groups = keys // BIN_KEY_FACTOR
+    bounds = np.searchsorted(entry_groups, np.arange(len(group_keys) + 1))
+
+    # Highest bucket per group: sorted by group then peak, the last of each group
+    order = np.lexsort((peaks, group))
+    last = np.r_[np.flatnonzero(np.diff(group[order])), len(order) - 1]
+    return DemandSeries(
+        days=group_keys // len(SOURCE_CODES),
+        sources=group_keys % len(SOURCE_CODES),
+        starts=bounds[:-1],
+        ends=bounds[1:],
+        bins=keys % BIN_KEY_FACTOR + ZERO_BIN,
+        counts=merged_counts,
+        peaks=peaks[order][last],
+        peak_hours=hours[order][last],
+    )
+
+def _builder(kind: str):
+    rollup_model = ROLLUPS[kind][1]
+
+    def build(db: Session, project_ids: List[int]) -> Dict[int, DemandSeries]:
+        by_project: Dict[int, List[tuple]] = {project_id: [] for project_id in project_ids}
+        for project_id, *row in db.query(
+            rollup_model.project_id,
+            rollup_model.source_type,
+            rollup_model.hour,
+            rollup_model.readings,
+            rollup_model.value_max,
+            rollup_model.sketch,
+        ).filter(rollup_model.project_id.in_(project_ids)).all():
+            by_project[project_id].append(tuple(row))
+        return {project_id: build_series(rows) for project_id, rows in by_project.items()}
+
+    return build
+
+demand_caches = {kind: ProjectRollupCache(f"demand.{kind}", _builder(kind)) for kind in ROLLUPS}
+
+def _as_day(value: datetime) -> int:
+    # The rollup hours are naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return (value.date() - date(1970, 1, 1)).days
+
+def _summary(sketch, curve_points: int = 0) -> dict:
+    values = quantiles(sketch, [p / 100 for p in PERCENTILES])
+    summary = {
+        "readings": int(sketch[1].sum()),
+        "percentiles": {f"p{p}": None if np.isnan(v) else float(v) for p, v in zip(PERCENTILES, values)},
+    }
+    if curve_points:
+        # Share of the time demand was at or above each value, from the peak down
+        shares = np.linspace(0, 100, curve_points)
+        curve = quantiles(sketch, 1 - shares / 100)
+        summary["duration_curve"] = [] if summary["readings"] == 0 else [
+            {"percent_of_time": float(share), "demand_kw": float(value)} for share, value in zip(shares, curve)
+        ]
+    return summary
+
+def demand_analytics(
+    db: Session,
+    kind: str,
+    project_ids: List[int],
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    source_types: Optional[List[EnergySourceType]] = None,
+    project_id: Optional[int] = None,
+    curve_points: int = 21,
+) -> dict:
+    """
+    Peak kW, percentiles and load-duration curve of the projects over whole days
+    """
+    if not start_date:
+        start_date = datetime.utcnow() - timedelta(days=30)
+
+    if not end_date:
+        end_date = datetime.utcnow()
+
+    cache = demand_caches[kind]
+    refresh_rollups_if_due(db, kind)
+    cache.invalidate_changed(db)
+
+    first_day, last_day = _as_day(start_date), _as_day(end_date)
+    sources = [SOURCE_CODES[source] for source in source_types] if source_types else None
+    all_bins, all_counts = [], []
+    peak_kw, peak_hour = None, None
+    by_project = {}
+
+    for key, series in cache.get(db, project_ids).items():
+        selected = series.select(first_day, last_day, sources)
+        bins, counts = series.entries(selected)
+        project = _summary(merge_flat(bins, counts))
+        project["peak_kw"] = None
+        if len(selected):
+            top = selected[np.argmax(series.peaks[selected])]
+            project["peak_kw"] = float(series.peaks[top])
+            if peak_kw is None or project["peak_kw"] > peak_kw:
+                peak_kw, peak_hour = project["peak_kw"], int(series.peak_hours[top])
+        by_project[str(key)] = project
+        all_bins.append(bins)
+        all_counts.append(counts)
+
+    portfolio = merge_flat(
+        np.concatenate(all_bins) if all_bins else np.empty(0, dtype=np.int64),
+        np.concatenate(all_counts) if all_counts else np.empty(0, dtype=np.int64),
+    )
+    return {
+        "kind": kind,
+        "start_date": start_date,
+        "end_date": end_date,
+        "project_id": project_id,
+        **_summary(portfolio, curve_points),
+        "peak_kw": peak_kw,
+        "peak_time": None if peak_hour is None else np.datetime64(peak_hour, "s").astype(datetime),
+        "relative_accuracy": RELATIVE_ACCURACY,
+        "by_project": by_project,
+    }
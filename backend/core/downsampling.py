@@ -0,0 +1,194 @@
+"""
+Downsampling of reading time series for charts.
+
+Both modes select existing readings rather than synthesising points, so
+every returned point is a real reading with its id and source:
+
+- lttb: Largest-Triangle-Three-Buckets, keeps the visual shape of the series
+- minmax: the lowest and highest reading of each bucket, keeps every peak and trough
+
+Each (project, source) series is downsampled on its own, with the point
+budget shared in proportion to the series' length and never more than
+max_points in total.
+
+Large ranges are reduced in SQL first: every series is cut into buckets of
+equal counts, and only the first, last, lowest and highest reading of each
+bucket are read back as candidates, so at most 4 x max_points narrow rows
+reach Python however many readings match.
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Query
+
+DOWNSAMPLE_MODES = ("lttb", "minmax")
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets. The first
+    and last point are always kept. x must be increasing.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # n_out - 2 buckets between the fixed first and last point
+    edges = (np.arange(n_out - 1) * ((n - 2) / (n_out - 2))).astype(np.int64) + 1
+    edges[-1] = n - 1
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y[:-1], edges[:-1]) / counts
+    # The point after the last bucket is the last point itself
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Twice the area of the triangle (a, candidate, next bucket average)
+        area = np.abs(
+            (x[a] - next_x[i]) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (next_y[i] - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+def minmax_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Indices of the minimum and maximum of n_out / 2 equal-count buckets,
+    plus the first and last point
+    """
+    n = len(x)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+
+    n_buckets = (n_out - 2) // 2
+    bucket = np.arange(n) * n_buckets // n
+    # Sorted by bucket then value: each bucket starts at its minimum and ends at its maximum
+    order = np.lexsort((y, bucket))
+    starts = np.flatnonzero(np.r_[True, bucket[order][1:] != bucket[order][:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    return np.unique(np.concatenate(([0, n - 1], order[starts], order[ends])))
+
+def _budgets(lengths: Dict[Tuple, int], max_points: int) -> Dict[Tuple, int]:
+    # Shares of max_points in proportion to the series' lengths, rounded
+    # down and the remainder given to the largest fractions, so they add up
+    # to max_points exactly
+    total = sum(lengths.values())
+    budgets = {key: max_points * length // total for key, length in lengths.items()}
+    fractions = sorted(lengths, key=lambda key: max_points * lengths[key] % total, reverse=True)
+    for key in fractions[:max_points - sum(budgets.values())]:
+        budgets[key] += 1
+    return budgets
+
+def _few_indices(x: np.ndarray, y: np.ndarray, n_out: int, mode: str) -> np.ndarray:
+    # Below what the modes select from: the extremes for minmax, evenly spaced points for lttb
+    if mode == "minmax" and n_out >= 2:
+        keep = [int(np.argmin(y)), int(np.argmax(y))] + ([0] if n_out > 2 else [])
+        return np.unique(keep)
+    return np.unique(np.linspace(0, len(x) - 1, n_out).round().astype(np.int64))
+
+def select_indices(
+    series: List[Tuple],
+    x: np.ndarray,
+    y: np.ndarray,
+    max_points: int,
+    mode: str = "lttb",
+    lengths: Optional[Dict[Tuple, int]] = None,
+) -> np.ndarray:
+    """
+    Indices to keep of points ordered by x, belonging to the given series
+    keys, with at most max_points in total. The budget is shared by the
+    series' `lengths` (default: their number of points).
+    """
+    if mode not in DOWNSAMPLE_MODES:
+        raise ValueError(f"Unknown downsampling mode: {mode}")
+    if len(x) <= max_points:
+        return np.arange(len(x))
+
+    by_series: Dict[Tuple, List[int]] = defaultdict(list)
+    for index, key in enumerate(series):
+        by_series[key].append(index)
+    budgets = _budgets(lengths or {key: len(indices) for key, indices in by_series.items()}, max_points)
+
+    select = lttb_indices if mode == "lttb" else minmax_indices
+    # Fewer points than the mode's own selection needs, which would keep them all
+    smallest = 3 if mode == "lttb" else 4
+    kept = [np.arange(0)]
+    for key, indices in by_series.items():
+        indices = np.asarray(indices)
+        budget = min(budgets.get(key, 0), len(indices))
+        if budget >= smallest:
+            kept.append(indices[select(x[indices], y[indices], budget)])
+        elif budget > 0:
+            kept.append(indices[_few_indices(x[indices], y[indices], budget, mode)])
+    return np.sort(np.concatenate(kept))
+
+def _candidates(query: Query, model, buckets: int) -> list:
+    """
+    (id, project_id, source_type, timestamp, value_kwh) of the first, last,
+    lowest and highest reading of each of about `buckets` equal-count
+    buckets, shared by the series in proportion to their length, ordered by
+    timestamp
+    """
+    series = (model.project_id, model.source_type)
+    position = func.row_number().over(partition_by=series, order_by=(model.timestamp, model.id)) - 1
+    numbered = query.with_entities(
+        model.id, model.project_id, model.source_type, model.timestamp, model.value_kwh,
+        (position * buckets // func.count().over()).label("bucket"),
+    ).subquery()
+
+    columns = numbered.c
+    bucket = (columns.project_id, columns.source_type, columns.bucket)
+    def rank(*order):
+        return func.row_number().over(partition_by=bucket, order_by=order)
+    ranked = select(
+        columns.id, columns.project_id, columns.source_type, columns.timestamp, columns.value_kwh,
+        rank(columns.timestamp, columns.id).label("first"),
+        rank(columns.timestamp.desc(), columns.id.desc()).label("last"),
+        rank(columns.value_kwh, columns.id).label("lowest"),
+        rank(columns.value_kwh.desc(), columns.id).label("highest"),
+    ).subquery()
+
+    columns = ranked.c
+    return query.session.execute(
+        select(columns.id, columns.project_id, columns.source_type, columns.timestamp, columns.value_kwh)
+        .where(or_(columns.first == 1, columns.last == 1, columns.lowest == 1, columns.highest == 1))
+        .order_by(columns.timestamp, columns.id)
+    ).all()
+
+def downsample_query(query: Query, model, max_points: int, mode: str = "lttb") -> list:
+    """
+    The readings of `query` reduced to at most max_points, ordered by
+    timestamp. The selection is made from the candidates of a SQL
+    pre-bucketing; full rows are loaded for the kept readings only.
+    """
+    lengths = {
+        (project_id, source_type): count
+        for project_id, source_type, count in query.with_entities(
+            model.project_id, model.source_type, func.count(model.id)
+        ).group_by(model.project_id, model.source_type).all()
+    }
+    if sum(lengths.values()) <= max_points:
+        return query.order_by(model.timestamp).all()
+
+    points = _candidates(query, model, max_points)
+    # Naive UTC timestamps, as epoch seconds without the server's timezone
+    x = np.array([point.timestamp for point in points], dtype="datetime64[us]").astype(np.int64) / 1e6
+    y = np.fromiter((point.value_kwh for point in points), dtype=np.float64, count=len(points))
+    series = [(point.project_id, point.source_type) for point in points]
+
+    keep = select_indices(series, x, y, max_points, mode, lengths)
+    ids = [points[i].id for i in keep]
+
+    readings = []
+    # Bounded IN lists keep the statements small on every backend
+    for offset in range(0, len(ids), 1000):
+        readings.extend(query.filter(model.id.in_(ids[offset:offset + 1000])).all())
+    readings.sort(key=lambda reading: (reading.timestamp, reading.id))
+    return readings
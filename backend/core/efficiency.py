@@ -0,0 +1,192 @@
+"""
+Energy-weighted generation efficiency and its trends.
+
+Each reading's efficiency is weighted by its kWh, so a 1 MWh reading counts
+a thousand times as much as a 1 kWh one, and readings without an efficiency
+are left out (core.energy_queries.efficiency_columns). The database returns
+the efficiency x kWh and kWh sums per local day (core.calendar), project and
+source in one grouped query, archived readings are added from the archive,
+and weeks and months are summed from the days.
+
+Trends are kWh-weighted least-squares slopes of the bucket efficiencies
+against time, fitted for every series at once. Degradation is the decline
+per year relative to the series' mean efficiency, in percent per year.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from core.archive import archived_efficiency
+from core.calendar import ensure_project_calendars, with_local_day
+from core.energy_queries import efficiency_columns, week_start
+from models.energy_data import EnergyGeneration, EnergySourceType
+
+RESOLUTIONS = ("day", "week", "month")
+DAYS_PER_YEAR = 365.25
+
+def period_start(day: date, resolution: str) -> date:
+    if resolution == "week":
+        return week_start(day)
+    if resolution == "month":
+        return day.replace(day=1)
+    return day
+
+def trend_slopes(x: np.ndarray, efficiency: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Weighted least-squares slope of each row of `efficiency` against `x`,
+    NaN for rows with fewer than two weighted points
+    """
+    total = weights.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        y = np.where(weights > 0, efficiency, 0.0)
+        mean_x = weights @ x / total
+        mean_y = (weights * y).sum(axis=1) / total
+        dx = x[None, :] - mean_x[:, None]
+        variance = (weights * dx ** 2).sum(axis=1)
+        covariance = (weights * dx * (y - mean_y[:, None])).sum(axis=1)
+        slopes = covariance / variance
+    return np.where((weights > 0).sum(axis=1) >= 2, slopes, np.nan)
+
+def _ratio(weighted: np.ndarray, measured: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(measured > 0, weighted / measured, np.nan)
+
+def _value(number) -> Optional[float]:
+    return None if number is None or np.isnan(number) else float(number)
+
+def _daily_sums(
+    db: Session,
+    project_ids: List[int],
+    start_date: datetime,
+    end_date: datetime,
+    source_types: Optional[Sequence[EnergySourceType]],
+) -> List[Tuple[date, int, EnergySourceType, float, float, float]]:
+    query = db.query(EnergyGeneration).filter(
+        EnergyGeneration.project_id.in_(project_ids),
+        EnergyGeneration.timestamp >= start_date,
+        EnergyGeneration.timestamp <= end_date,
+    )
+    if source_types:
+        query = query.filter(EnergyGeneration.source_type.in_(source_types))
+    query, day = with_local_day(query, EnergyGeneration)
+    rows = query.with_entities(
+        day,
+        EnergyGeneration.project_id,
+        EnergyGeneration.source_type,
+        *efficiency_columns(EnergyGeneration),
+        func.sum(EnergyGeneration.value_kwh),
+    ).group_by(day, EnergyGeneration.project_id, EnergyGeneration.source_type).all()
+    rows += archived_efficiency(db, project_ids, start_date, end_date, source_types)
+    return [
+        (
+            row_day if isinstance(row_day, date) else date.fromisoformat(row_day),
+            project_id,
+            EnergySourceType(source_type),
+            float(weighted or 0),
+            float(measured or 0),
+            float(total or 0),
+        )
+        for row_day, project_id, source_type, weighted, measured, total in rows
+    ]
+
+def efficiency_analytics(
+    db: Session,
+    project_ids: List[int],
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    source_types: Optional[List[EnergySourceType]] = None,
+    project_id: Optional[int] = None,
+    resolution: str = "week",
+) -> dict:
+    """
+    Energy-weighted efficiency of the projects' generation per bucket, source
+    and project, with trend and degradation slopes per series
+    """
+    if not start_date:
+        start_date = datetime.utcnow() - timedelta(days=365)
+
+    if not end_date:
+        end_date = datetime.utcnow()
+
+    ensure_project_calendars(db, project_ids, start_date, end_date)
+    rows = _daily_sums(db, project_ids, start_date, end_date, source_types)
+
+    series = sorted({(project, source) for _, project, source, _, _, _ in rows}, key=lambda key: (key[0], key[1].value))
+    periods = sorted({period_start(day, resolution) for day, _, _, _, _, _ in rows})
+    series_index = {key: i for i, key in enumerate(series)}
+    period_index = {period: i for i, period in enumerate(periods)}
+
+    # Sums per series (rows) and bucket (columns)
+    weighted, measured, total = (np.zeros((len(series), len(periods))) for _ in range(3))
+    if rows:
+        rows_series = np.array([series_index[(project, source)] for _, project, source, _, _, _ in rows])
+        rows_period = np.array([period_index[period_start(day, resolution)] for day, _, _, _, _, _ in rows])
+        for matrix, column in ((weighted, 3), (measured, 4), (total, 5)):
+            np.add.at(matrix, (rows_series, rows_period), [row[column] for row in rows])
+
+    x = np.array([period.toordinal() for period in periods], dtype=np.float64)
+    series_efficiency = _ratio(weighted.sum(axis=1), measured.sum(axis=1))
+    slopes = trend_slopes(x, _ratio(weighted, measured), measured) * DAYS_PER_YEAR
+    portfolio_slope = trend_slopes(x, _ratio(weighted.sum(axis=0), measured.sum(axis=0))[None, :], measured.sum(axis=0)[None, :])[0] * DAYS_PER_YEAR
+    portfolio_efficiency = _ratio(weighted.sum(), measured.sum())
+
+    sources = sorted({source for _, source in series}, key=lambda source: source.value)
+    source_rows = {source: [series_index[key] for key in series if key[1] == source] for source in sources}
+    project_rows: Dict[int, List[int]] = {}
+    for key in series:
+        project_rows.setdefault(key[0], []).append(series_index[key])
+
+    bucket_efficiency = _ratio(weighted.sum(axis=0), measured.sum(axis=0))
+    source_efficiency = {
+        source: _ratio(weighted[selected].sum(axis=0), measured[selected].sum(axis=0))
+        for source, selected in source_rows.items()
+    }
+    buckets = [
+        {
+            "period_start": period,
+            "efficiency": _value(bucket_efficiency[i]),
+            "generation_kwh": float(total[:, i].sum()),
+            "measured_kwh": float(measured[:, i].sum()),
+            "by_source": {source.value: _value(values[i]) for source, values in source_efficiency.items()},
+        }
+        for i, period in enumerate(periods)
+    ]
+    series_stats = []
+    for (series_project, source), i in series_index.items():
+        degradation = None
+        if not np.isnan(slopes[i]) and series_efficiency[i] > 0:
+            degradation = float(-slopes[i] / series_efficiency[i] * 100)
+        series_stats.append({
+            "project_id": series_project,
+            "source_type": source,
+            "efficiency": _value(series_efficiency[i]),
+            "generation_kwh": float(total[i].sum()),
+            "measured_kwh": float(measured[i].sum()),
+            "buckets": int((measured[i] > 0).sum()),
+            "trend_per_year": _value(slopes[i]),
+            "degradation_percent_per_year": degradation,
+        })
+
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "project_id": project_id,
+        "resolution": resolution,
+        "efficiency": _value(portfolio_efficiency),
+        "generation_kwh": float(total.sum()),
+        "measured_kwh": float(measured.sum()),
+        "trend_per_year": _value(portfolio_slope),
+        "by_source": {
+            source.value: _value(_ratio(weighted[selected].sum(), measured[selected].sum()))
+            for source, selected in source_rows.items()
+        },
+        "by_project": {
+            str(key): _value(_ratio(weighted[selected].sum(), measured[selected].sum()))
+            for key, selected in project_rows.items()
+        },
+        "buckets": buckets,
+        "series": series_stats,
+    }
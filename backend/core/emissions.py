@@ -0,0 +1,206 @@
+"""
+Environmental impact of generation, against time-varying grid carbon intensity.
+
+Each hour of renewable generation avoids the CO2 the grid would have emitted
+in that hour: renewable kWh x the grid intensity of the project's region at
+that hour. Hourly generation and consumption come from the rollups; the
+intensity intervals are joined onto the rollup hours with an as-of join
+(the latest interval starting at or before the hour, if it is no older than
+GRID_INTENSITY_MAX_GAP_HOURS, otherwise GRID_INTENSITY_DEFAULT).
+
+Per project, the hourly series are kept as prefix sums, so the totals of any
+range are two binary searches and a subtraction. They are cached per worker
+until the project's rollups, the project or the intensity data change.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+import logging
+
+import numpy as np
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from config import settings
+from core.ingest import upsert_statement
+from core.rollups import ProjectRollupCache, refresh_rollups_if_due
+from models.energy_data import EnergySourceType, Project
+from models.grid import GridIntensity
+from models.rollups import ConsumptionHourly, GenerationHourly
+
+logger = logging.getLogger(__name__)
+
+INTENSITY_KEY = ("region", "hour")
+INTENSITY_COLUMNS = ("g_co2_per_kwh",)
+
+# Equivalents of the avoided CO2
+TREES_PER_TONNE_CO2 = 45  # trees absorbing a tonne of CO2 in a year
+CAR_KG_CO2_PER_KM = 0.17  # average passenger car
+
+# Rows of ImpactSeries sums
+CONSUMPTION, GENERATION, RENEWABLE, AVOIDED_KG = range(4)
+
+def _seconds(timestamps) -> np.ndarray:
+    return np.array(timestamps, dtype="datetime64[s]").astype(np.int64)
+
+def _naive_utc(value: datetime) -> datetime:
+    # The rollup hours are naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def align_intensity(
+    hours: np.ndarray,
+    interval_starts: np.ndarray,
+    intensities: np.ndarray,
+    max_gap_seconds: float,
+    default: float,
+) -> np.ndarray:
+    """
+    Intensity at each of `hours` (epoch seconds), from the interval starting
+    at or before it. Hours before the first interval, or more than
+    max_gap_seconds after the start of theirs, get the default.
+    """
+    if len(interval_starts) == 0:
+        return np.full(len(hours), default, dtype=np.float64)
+    index = np.searchsorted(interval_starts, hours, side="right") - 1
+    found = index >= 0
+    index = np.maximum(index, 0)
+    fresh = found & (hours - interval_starts[index] <= max_gap_seconds)
+    return np.where(fresh, intensities[index], default)
+
+class ImpactSeries:
+    """
+    Prefix sums of a project's hourly consumption, generation, renewable
+    generation and avoided CO2
+    """
+
+    def __init__(self, hours: np.ndarray, values: np.ndarray):
+        self.hours = hours
+        self.sums = np.concatenate([np.zeros((len(values), 1)), np.cumsum(values, axis=1)], axis=1)
+
+    def totals(self, start: datetime, end: datetime) -> np.ndarray:
+        """
+        Sums over the hourly buckets from the hour containing `start` up to
+        and including the one containing `end`
+        """
+        start_hour = _naive_utc(start).replace(minute=0, second=0, microsecond=0)
+        lo = np.searchsorted(self.hours, _seconds([start_hour])[0], side="left")
+        hi = np.searchsorted(self.hours, _seconds([_naive_utc(end)])[0], side="right")
+        return self.sums[:, hi] - self.sums[:, lo]
+
+def build_series(db: Session, project_id: int, region: str) -> ImpactSeries:
+    consumption = db.query(ConsumptionHourly.hour, func.sum(ConsumptionHourly.value_kwh)).filter(
+        ConsumptionHourly.project_id == project_id
+    ).group_by(ConsumptionHourly.hour).all()
+    renewable = case((GenerationHourly.source_type != EnergySourceType.GRID, GenerationHourly.value_kwh), else_=0)
+    generation = db.query(
+        GenerationHourly.hour, func.sum(GenerationHourly.value_kwh), func.sum(renewable)
+    ).filter(
+        GenerationHourly.project_id == project_id
+    ).group_by(GenerationHourly.hour).all()
+
+    consumption_hours = _seconds([row[0] for row in consumption])
+    generation_hours = _seconds([row[0] for row in generation])
+    hours = np.union1d(consumption_hours, generation_hours)
+    values = np.zeros((4, len(hours)))
+    if len(hours) == 0:
+        return ImpactSeries(hours, values)
+
+    values[CONSUMPTION, np.searchsorted(hours, consumption_hours)] = [float(row[1]) for row in consumption]
+    generation_index = np.searchsorted(hours, generation_hours)
+    values[GENERATION, generation_index] = [float(row[1]) for row in generation]
+    values[RENEWABLE, generation_index] = [float(row[2] or 0) for row in generation]
+
+    max_gap = settings.GRID_INTENSITY_MAX_GAP_HOURS * 3600
+    first = np.datetime64(int(hours[0]) - max_gap, "s").astype(datetime)
+    last = np.datetime64(int(hours[-1]), "s").astype(datetime)
+    intervals = db.query(GridIntensity.hour, GridIntensity.g_co2_per_kwh).filter(
+        GridIntensity.region == region,
+        GridIntensity.hour >= first,
+        GridIntensity.hour <= last,
+    ).order_by(GridIntensity.hour).all()
+    intensity = align_intensity(
+        hours,
+        _seconds([row[0] for row in intervals]),
+        np.array([row[1] for row in intervals], dtype=np.float64),
+        max_gap,
+        settings.GRID_INTENSITY_DEFAULT,
+    )
+    values[AVOIDED_KG] = values[RENEWABLE] * intensity / 1000
+    return ImpactSeries(hours, values)
+
+def _build_projects(db: Session, project_ids: List[int]) -> Dict[int, ImpactSeries]:
+    regions = {row[0] for row in db.query(GridIntensity.region).distinct().all()}
+    series = {}
+    for project_id, location in db.query(Project.id, Project.location).filter(Project.id.in_(project_ids)).all():
+        region = location if location in regions else settings.GRID_REGION
+        series[project_id] = build_series(db, project_id, region)
+    return series
+
+# Rebuilt per project when its rollups change, and for all projects when intensity data is loaded
+emissions_cache = ProjectRollupCache("emissions", _build_projects, global_models=[GridIntensity])
+
+def environmental_impact(
+    db: Session,
+    project_ids: List[int],
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    project_id: Optional[int] = None,
+) -> dict:
+    """
+    CO2 avoided, renewable share and equivalents of the projects over a range
+    """
+    if not start_date:
+        start_date = datetime.utcnow() - timedelta(days=30)
+
+    if not end_date:
+        end_date = datetime.utcnow()
+
+    refresh_rollups_if_due(db, "consumption")
+    refresh_rollups_if_due(db, "generation")
+    emissions_cache.invalidate_changed(db)
+
+    by_project = {}
+    totals = np.zeros(4)
+    for key, series in emissions_cache.get(db, project_ids).items():
+        project_totals = series.totals(start_date, end_date)
+        by_project[str(key)] = float(project_totals[AVOIDED_KG])
+        totals += project_totals
+
+    consumption, generation, renewable, avoided_kg = (float(value) for value in totals)
+    renewable_percentage = min(100.0, renewable / consumption * 100) if consumption > 0 else 0.0
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "project_id": project_id,
+        "total_consumption": consumption,
+        "total_generation": generation,
+        "renewable_generation": renewable,
+        "renewable_percentage": renewable_percentage,
+        "co2_avoided_kg": avoided_kg,
+        # Generation-weighted intensity of the hours that renewables displaced
+        "avg_grid_intensity": avoided_kg * 1000 / renewable if renewable > 0 else settings.GRID_INTENSITY_DEFAULT,
+        "trees_equivalent": avoided_kg / 1000 * TREES_PER_TONNE_CO2,
+        "car_km_equivalent": avoided_kg / CAR_KG_CO2_PER_KM,
+        "co2_avoided_by_project": by_project,
+    }
+
+def load_grid_intensity(db: Session, region: str, rows: Iterable[dict]) -> int:
+    """
+    Upsert intensity intervals ({"hour", "g_co2_per_kwh"}) of a region and
+    commit. Returns the number of rows written.
+    """
+    stmt = upsert_statement(GridIntensity.__table__, INTENSITY_KEY, INTENSITY_COLUMNS, db.get_bind().dialect.name)
+    batch, written = [], 0
+    for row in rows:
+        batch.append({"region": region, "hour": row["hour"], "g_co2_per_kwh": float(row["g_co2_per_kwh"])})
+        if len(batch) >= settings.INGEST_BATCH_SIZE:
+            db.execute(stmt, batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        db.execute(stmt, batch)
+        written += len(batch)
+    db.commit()
+    logger.info(f"Loaded {written} grid intensity intervals for region {region}")
+    return written
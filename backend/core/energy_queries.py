@@ -0,0 +1,190 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.orm import Query, Session
+
+from config import settings
+from core.calendar import local_day_start, with_local_day
+from core.concurrency import run_concurrently
+from models.energy_data import EnergyConsumption, EnergyGeneration
+
+def changed_since(model, since: datetime):
+    """
+    Filter for rows inserted or updated at or after `since`
+    """
+    return or_(model.created_at >= since, model.updated_at >= since)
+
+def current_watermark(db: Session) -> datetime:
+    """
+    Watermark to hand back to clients for their next delta request.
+
+    Taken from the database clock, which also stamps created_at/updated_at,
+    and held back by DELTA_WATERMARK_LAG_SECONDS so rows from transactions
+    that are still open when this request runs are picked up next time.
+    Clients may therefore receive a few buckets again, and they replace them.
+    On a read replica it is capped at the primary time the replica has
+    applied (core.replicas), as rows committed after it may still arrive.
+    """
+    now = db.scalar(select(func.now()))
+    if isinstance(now, str):
+        now = datetime.fromisoformat(now)
+    if now.tzinfo is not None:
+        now = now.replace(tzinfo=None)
+    replicated_until = db.info.get("replicated_until")
+    if replicated_until is not None:
+        now = min(now, replicated_until)
+    return now - timedelta(seconds=settings.DELTA_WATERMARK_LAG_SECONDS)
+
+def changed_dates(query: Query, model, since: datetime) -> Set[date]:
+    """
+    Local dates (core.calendar) of the readings in `query` that changed
+    since the watermark
+    """
+    query, day = with_local_day(query.filter(changed_since(model, since)), model)
+    rows = query.with_entities(day).distinct().all()
+    return {_as_date(row[0]) for row in rows}
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+def _as_date(value) -> date:
+    # SQLite returns dates as strings
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+def sum_by_day(query: Query, model, from_day: Optional[date] = None) -> Dict[date, float]:
+    """
+    kWh per local date of the readings' projects (core.calendar) of the
+    readings in `query`, optionally from `from_day` on
+    """
+    query, day = with_local_day(query, model)
+    if from_day is not None:
+        # The timestamp bound keeps the index usable, the local date is exact
+        query = query.filter(model.timestamp >= local_day_start(from_day), day >= from_day)
+    return {
+        _as_date(row_day): float(value or 0)
+        for row_day, value in query.with_entities(day, func.sum(model.value_kwh)).group_by(day).all()
+    }
+
+def sum_by_source(query: Query, model) -> Dict[str, float]:
+    return {
+        source.value: float(value or 0)
+        for source, value in query.with_entities(
+            model.source_type, func.sum(model.value_kwh)
+        ).group_by(model.source_type).all()
+    }
+
+def sum_by_project(query: Query, model) -> Dict[str, float]:
+    return {
+        str(project_id): float(value or 0)
+        for project_id, value in query.with_entities(
+            model.project_id, func.sum(model.value_kwh)
+        ).group_by(model.project_id).all()
+    }
+
+def totals(query: Query, model) -> dict:
+    """
+    total_kwh, by_source and by_project of the readings in `query`, computed
+    by the database
+    """
+    by_source = sum_by_source(query, model)
+    return {
+        "total_kwh": float(sum(by_source.values())),
+        "by_source": by_source,
+        "by_project": sum_by_project(query, model),
+    }
+
+def efficiency_columns(model) -> list:
+    """
+    SQL sums of efficiency x kWh and of the kWh of the readings that have an
+    efficiency. Their ratio is the energy-weighted average efficiency, which
+    leaves readings without one out.
+    """
+    measured = model.efficiency.isnot(None)
+    return [
+        func.sum(case((measured, model.efficiency * model.value_kwh), else_=0)),
+        func.sum(case((measured, model.value_kwh), else_=0)),
+    ]
+
+def weighted_efficiency(weighted_sum: float, efficiency_kwh: float) -> Optional[float]:
+    """
+    Energy-weighted average efficiency, None without readings that have one
+    """
+    return float(weighted_sum) / float(efficiency_kwh) if efficiency_kwh else None
+
+def efficiency_totals(query: Query, model) -> Tuple[float, float]:
+    """
+    Sums of efficiency x kWh and of the kWh with an efficiency of the
+    readings in `query`
+    """
+    weighted_sum, efficiency_kwh = query.with_entities(*efficiency_columns(model)).one()
+    return float(weighted_sum or 0), float(efficiency_kwh or 0)
+
+def from_date(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day)
+
+def _last_readings(session: Session, model, project_ids: List[int]) -> Dict[int, datetime]:
+    # Grouped by the unique key's leading columns, so MySQL reads one index entry per series
+    last: Dict[int, datetime] = {}
+    for project_id, _, timestamp in session.query(
+        model.project_id, model.source_type, func.max(model.timestamp)
+    ).filter(model.project_id.in_(project_ids)).group_by(model.project_id, model.source_type).all():
+        if project_id not in last or timestamp > last[project_id]:
+            last[project_id] = timestamp
+    return last
+
+def _recent_totals(session: Session, model, project_ids: List[int], day_start: datetime, month_start: datetime) -> list:
+    columns = [
+        model.project_id,
+        model.source_type,
+        func.sum(case((model.timestamp >= day_start, model.value_kwh), else_=0)),
+        func.sum(model.value_kwh),
+    ]
+    if model is EnergyGeneration:
+        columns += efficiency_columns(model)
+    return session.query(*columns).filter(
+        model.project_id.in_(project_ids),
+        model.timestamp >= month_start,
+    ).group_by(model.project_id, model.source_type).all()
+
+def project_stats(db: Session, project_ids: List[int], now: Optional[datetime] = None) -> Dict[int, dict]:
+    """
+    Summary statistics of a page of projects: last reading times, 24 hour and
+    30 day kWh per source and the 30 day energy-weighted efficiency. A fixed
+    number of grouped queries, however many projects there are.
+    """
+    now = now or datetime.utcnow()
+    day_start, month_start = now - timedelta(hours=24), now - timedelta(days=30)
+    results = run_concurrently(db, {
+        "last_consumption": lambda s: _last_readings(s, EnergyConsumption, project_ids),
+        "last_generation": lambda s: _last_readings(s, EnergyGeneration, project_ids),
+        "consumption": lambda s: _recent_totals(s, EnergyConsumption, project_ids, day_start, month_start),
+        "generation": lambda s: _recent_totals(s, EnergyGeneration, project_ids, day_start, month_start),
+    })
+
+    stats = {
+        project_id: {
+            "last_consumption_at": results["last_consumption"].get(project_id),
+            "last_generation_at": results["last_generation"].get(project_id),
+            "consumption_24h": {},
+            "consumption_30d": {},
+            "generation_24h": {},
+            "generation_30d": {},
+            "avg_efficiency_30d": None,
+        }
+        for project_id in project_ids
+    }
+    for project_id, source, day_total, month_total in results["consumption"]:
+        stats[project_id]["consumption_24h"][source.value] = float(day_total or 0)
+        stats[project_id]["consumption_30d"][source.value] = float(month_total or 0)
+
+    efficiency: Dict[int, list] = {}
+    for project_id, source, day_total, month_total, weighted_sum, efficiency_kwh in results["generation"]:
+        stats[project_id]["generation_24h"][source.value] = float(day_total or 0)
+        stats[project_id]["generation_30d"][source.value] = float(month_total or 0)
+        totals = efficiency.setdefault(project_id, [0.0, 0.0])
+        totals[0] += float(weighted_sum or 0)
+        totals[1] += float(efficiency_kwh or 0)
+    for project_id, (weighted_sum, efficiency_kwh) in efficiency.items():
+        stats[project_id]["avg_efficiency_30d"] = weighted_efficiency(weighted_sum, efficiency_kwh)
+    return stats
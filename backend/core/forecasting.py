@@ -0,0 +1,256 @@
+"""
+Seasonal baseline forecasts of generation per project and source.
+
+For series s, forecast day d and hour of day h:
+
+    forecast[s, d, h] = level[s] * seasonal[s, d] * profile[s, h]
+
+- level: exponentially smoothed daily kWh (FORECAST_LEVEL_ALPHA)
+- profile: exponentially smoothed share of a day's kWh per hour of day (FORECAST_PROFILE_ALPHA)
+- seasonal: day-of-year factor, the kWh around the same day a year earlier
+  relative to the kWh around the fit day a year earlier; 1 without a year of history
+
+Models are fitted from the hourly rollups, for all requested series at once
+as (series, day, hour) arrays, and cached per worker until their series'
+rollups change or another day of history completes.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from config import settings
+from core.energy_queries import changed_since, current_watermark, from_date
+from core.metrics import metrics
+from core.rollups import Series, refresh_rollups_if_due
+from models.rollups import GenerationHourly
+
+logger = logging.getLogger(__name__)
+
+# Days around the same day a year earlier averaged for the seasonal factor
+SEASONAL_WINDOW_DAYS = 3
+SEASONAL_FACTOR_LIMITS = (0.25, 4.0)
+
+def _smoothing_weights(length: int, alpha: float) -> np.ndarray:
+    # Newest (last) observation weighted most
+    return (1 - alpha) ** np.arange(length - 1, -1, -1)
+
+def fit_level(daily: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Exponentially smoothed level of (series, day) kWh, ignoring missing (NaN) days
+    """
+    weights = _smoothing_weights(daily.shape[1], alpha)
+    observed = ~np.isnan(daily)
+    total_weight = (observed * weights).sum(axis=1)
+    level = np.nansum(daily * weights, axis=1) / np.where(total_weight > 0, total_weight, 1)
+    return np.where(total_weight > 0, level, 0.0)
+
+def fit_profile(hourly: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    Smoothed share of the daily kWh per hour of day from (series, day, 24)
+    kWh. Rows sum to 1; series without data get a flat profile.
+    """
+    daily = np.nansum(hourly, axis=2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        share = np.where(daily[..., None] > 0, hourly / daily[..., None], np.nan)
+    weights = _smoothing_weights(hourly.shape[1], alpha)[None, :, None]
+    observed = ~np.isnan(share)
+    total_weight = (observed * weights).sum(axis=1)
+    profile = np.nansum(share * weights, axis=1) / np.where(total_weight > 0, total_weight, 1)
+
+    totals = profile.sum(axis=1, keepdims=True)
+    flat = np.full_like(profile, 1 / 24)
+    return np.where(totals > 0, profile / np.where(totals > 0, totals, 1), flat)
+
+def seasonal_factors(daily: np.ndarray, horizon_days: int) -> np.ndarray:
+    """
+    Day-of-year factors for the `horizon_days` days after the last day of
+    (series, day) history, from the history a year earlier
+    """
+    n_series, n_days = daily.shape
+    observed = ~np.isnan(daily)
+    sums = np.concatenate([np.zeros((n_series, 1)), np.cumsum(np.where(observed, daily, 0), axis=1)], axis=1)
+    counts = np.concatenate([np.zeros((n_series, 1)), np.cumsum(observed, axis=1)], axis=1)
+
+    def window_mean(centers: np.ndarray) -> np.ndarray:
+        lo = np.clip(centers - SEASONAL_WINDOW_DAYS, 0, n_days)
+        hi = np.clip(centers + SEASONAL_WINDOW_DAYS + 1, 0, n_days)
+        n = counts[:, hi] - counts[:, lo]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = (sums[:, hi] - sums[:, lo]) / n
+        # Require most of the window, and a window that lies inside the history
+        return np.where((n > SEASONAL_WINDOW_DAYS) & (centers - SEASONAL_WINDOW_DAYS >= 0), mean, np.nan)
+
+    last = n_days - 1
+    reference = window_mean(np.array([last - 365]))
+    target = window_mean(last + np.arange(1, horizon_days + 1) - 365)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        factors = target / reference
+    factors = np.where(np.isfinite(factors) & (reference > 0), factors, 1.0)
+    return np.clip(factors, *SEASONAL_FACTOR_LIMITS)
+
+class FittedModel:
+    def __init__(self, level: float, profile: np.ndarray, daily: np.ndarray, fit_day: date, fitted_at: float):
+        self.level = level
+        self.profile = profile
+        # Daily kWh history ending on fit_day, for the seasonal factors
+        self.daily = daily
+        self.fit_day = fit_day
+        self.fitted_at = fitted_at
+
+def fit_models(hourly: np.ndarray, daily: np.ndarray, fit_day: date) -> List[FittedModel]:
+    """
+    Fit all series at once from (series, profile days, 24) hourly and
+    (series, history days) daily kWh, both ending on fit_day
+    """
+    level = fit_level(daily, settings.FORECAST_LEVEL_ALPHA)
+    profile = fit_profile(hourly, settings.FORECAST_PROFILE_ALPHA)
+    now = time.time()
+    return [FittedModel(float(level[i]), profile[i], daily[i], fit_day, now) for i in range(len(level))]
+
+def forecast(models: Sequence[FittedModel], start: datetime, horizon_hours: int) -> np.ndarray:
+    """
+    (series, hour) kWh forecast for the hours from `start`. All models must
+    share the same fit day.
+    """
+    fit_day = models[0].fit_day
+    hours = [start + timedelta(hours=i) for i in range(horizon_hours)]
+    day_offsets = np.array([(hour.date() - fit_day).days for hour in hours])
+    hours_of_day = np.array([hour.hour for hour in hours])
+
+    level = np.array([model.level for model in models])
+    profile = np.stack([model.profile for model in models])
+    seasonal = seasonal_factors(np.stack([model.daily for model in models]), int(day_offsets.max()))
+    return level[:, None] * seasonal[:, day_offsets - 1] * profile[:, hours_of_day]
+
+class ForecastCache:
+    """
+    Fitted models per series for this worker. A model is refitted when the
+    rollups of its series change or a new day of history has completed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: Dict[Series, FittedModel] = {}
+        self._watermark: Optional[datetime] = None
+        self._checked_at = float("-inf")
+
+    def invalidate_changed(self, db: Session):
+        """
+        Drop the models of series whose rollups changed since the last check,
+        including changes made by other workers. Checks at most once per
+        ROLLUP_REFRESH_SECONDS.
+        """
+        with self._lock:
+            if time.monotonic() - self._checked_at < settings.ROLLUP_REFRESH_SECONDS:
+                return
+            self._checked_at = time.monotonic()
+        watermark = current_watermark(db)
+        if self._watermark is not None:
+            changed = db.query(GenerationHourly.project_id, GenerationHourly.source_type).filter(
+                changed_since(GenerationHourly, self._watermark)
+            ).distinct().all()
+            with self._lock:
+                for series in changed:
+                    self._models.pop(tuple(series), None)
+        self._watermark = watermark
+
+    def get(self, db: Session, series: List[Series], fit_day: date) -> Dict[Series, FittedModel]:
+        with self._lock:
+            models = {key: self._models.get(key) for key in series}
+        stale = [key for key, model in models.items() if model is None or model.fit_day != fit_day]
+        if stale:
+            start = time.perf_counter()
+            fitted = _fit_from_rollups(db, stale, fit_day)
+            with self._lock:
+                self._models.update(fitted)
+            models.update(fitted)
+            metrics.observe("forecast.fit_seconds", time.perf_counter() - start)
+            metrics.increment("forecast.series_fitted", len(stale))
+        return models
+
+forecast_cache = ForecastCache()
+
+def _fit_from_rollups(db: Session, series: List[Series], fit_day: date) -> Dict[Series, FittedModel]:
+    index = {key: i for i, key in enumerate(series)}
+    project_ids = {project_id for project_id, _ in series}
+    end = from_date(fit_day + timedelta(days=1))
+    history_start = fit_day - timedelta(days=settings.FORECAST_HISTORY_DAYS - 1)
+    profile_start = fit_day - timedelta(days=settings.FORECAST_PROFILE_DAYS - 1)
+
+    daily = np.full((len(series), settings.FORECAST_HISTORY_DAYS), np.nan)
+    day = func.date(GenerationHourly.hour)
+    for project_id, source_type, row_day, value in db.query(
+        GenerationHourly.project_id, GenerationHourly.source_type, day, func.sum(GenerationHourly.value_kwh)
+    ).filter(
+        GenerationHourly.project_id.in_(project_ids),
+        GenerationHourly.hour >= from_date(history_start),
+        GenerationHourly.hour < end,
+    ).group_by(GenerationHourly.project_id, GenerationHourly.source_type, day).all():
+        i = index.get((project_id, source_type))
+        if i is not None:
+            row_day = row_day if isinstance(row_day, date) else date.fromisoformat(row_day)
+            daily[i, (row_day - history_start).days] = value
+
+    hourly = np.full((len(series), settings.FORECAST_PROFILE_DAYS, 24), np.nan)
+    for project_id, source_type, hour, value in db.query(
+        GenerationHourly.project_id, GenerationHourly.source_type, GenerationHourly.hour, GenerationHourly.value_kwh
+    ).filter(
+        GenerationHourly.project_id.in_(project_ids),
+        GenerationHourly.hour >= from_date(profile_start),
+        GenerationHourly.hour < end,
+    ).all():
+        i = index.get((project_id, source_type))
+        if i is not None:
+            hourly[i, (hour.date() - profile_start).days, hour.hour] = value
+
+    return dict(zip(series, fit_models(hourly, daily, fit_day)))
+
+def forecast_generation(
+    db: Session,
+    project_ids: List[int],
+    source_types: Optional[list],
+    horizon_hours: int,
+) -> dict:
+    """
+    Hourly generation forecast per project and source for the next
+    `horizon_hours` hours
+    """
+    refresh_rollups_if_due(db, "generation")
+    forecast_cache.invalidate_changed(db)
+
+    query = db.query(GenerationHourly.project_id, GenerationHourly.source_type).filter(
+        GenerationHourly.project_id.in_(project_ids)
+    )
+    if source_types:
+        query = query.filter(GenerationHourly.source_type.in_(source_types))
+    series = sorted((tuple(row) for row in query.distinct().all()), key=lambda key: (key[0], key[1].value))
+
+    now = datetime.utcnow()
+    start = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    # Fit on complete days only, today's partial day would pull the level down
+    fit_day = now.date() - timedelta(days=1)
+
+    result = {"start": start, "horizon_hours": horizon_hours, "series": [], "total_kwh": 0.0}
+    if not series:
+        return result
+
+    models = forecast_cache.get(db, series, fit_day)
+    values = forecast([models[key] for key in series], start, horizon_hours)
+    timestamps = [(start + timedelta(hours=i)).isoformat() for i in range(horizon_hours)]
+
+    for (project_id, source_type), row in zip(series, values):
+        result["series"].append({
+            "project_id": project_id,
+            "source_type": source_type.value,
+            "level_kwh_per_day": models[(project_id, source_type)].level,
+            "total_kwh": float(row.sum()),
+            "forecast": [{"timestamp": ts, "value_kwh": float(value)} for ts, value in zip(timestamps, row)],
+        })
+    result["total_kwh"] = float(values.sum())
+    return result
@@ -0,0 +1,403 @@
+"""
+This worker's in-memory window of recent readings.
+
+The last HOT_WINDOW_HOURS of every (kind, project, source) series are kept
+in NumPy arrays: timestamps as int64 epoch seconds, values (and generation
+efficiency, NaN when missing) as float64 like the database's columns, 24
+bytes a generation reading and 16 a consumption reading. The window is loaded in the background at startup
+and fed by the ingest listeners. Readings written by other workers or
+processes are merged from one delta query per reading table, at most once
+per HOT_WINDOW_SYNC_SECONDS, before a read is answered.
+
+Aggregates whose whole range is inside the window are computed from it
+with searchsorted slices and bincounts instead of a database round trip,
+and they match the database's sums up to summation order.
+"""
+from datetime import date, datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+import logging
+import threading
+import time
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from config import settings
+from core.calendar import local_dates, project_timezones
+from core.energy_queries import changed_since, current_watermark, weighted_efficiency
+from core.ingest import READING_MODELS, add_ingest_listener, normalize_timestamp, remove_ingest_listener
+from core.metrics import metrics
+from models.energy_data import EnergySourceType
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SeriesKey = Tuple[str, int, EnergySourceType]
+READING_COLUMNS = {
+    "consumption": ("project_id", "source_type", "timestamp", "value_kwh"),
+    "generation": ("project_id", "source_type", "timestamp", "value_kwh", "efficiency"),
+}
+SOURCES = list(EnergySourceType)
+# Ingest rows may carry the enum or its value
+SOURCE_CODES = {**{source: code for code, source in enumerate(SOURCES)}, **{source.value: code for code, source in enumerate(SOURCES)}}
+
+def _epoch_seconds(values) -> "np.ndarray":
+    import numpy as np
+
+    return np.array(values, dtype="datetime64[s]").astype(np.int64)
+
+class SeriesWindow:
+    """
+    Readings of one series ordered by timestamp, in preallocated arrays.
+    The live readings are [head, tail); evicting moves head forward and the
+    arrays are compacted or grown when tail reaches their end.
+    """
+
+    def __init__(self, with_efficiency: bool, capacity: int = 64):
+        # NumPy is imported on first use only, not with the app
+        import numpy as np
+
+        self.timestamps = np.empty(capacity, dtype=np.int64)
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.efficiency = np.empty(capacity, dtype=np.float64) if with_efficiency else None
+        self.head = 0
+        self.tail = 0
+
+    def __len__(self) -> int:
+        return self.tail - self.head
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.timestamps, self.values] + ([self.efficiency] if self.efficiency is not None else [])
+        return sum(array.nbytes for array in arrays)
+
+    def _live(self, array: "np.ndarray") -> "np.ndarray":
+        return array[self.head:self.tail]
+
+    def _reserve(self, extra: int):
+        size = len(self)
+        if self.tail + extra <= len(self.timestamps):
+            return
+        import numpy as np
+
+        capacity = len(self.timestamps)
+        while capacity < size + extra:
+            capacity *= 2
+        # Compacting in place is enough while under half the arrays are live
+        for name in ("timestamps", "values", "efficiency"):
+            array = getattr(self, name)
+            if array is None:
+                continue
+            target = array if capacity == len(array) else np.empty(capacity, dtype=array.dtype)
+            target[:size] = array[self.head:self.tail]
+            setattr(self, name, target)
+        self.head, self.tail = 0, size
+
+    def upsert(self, timestamps: "np.ndarray", values: "np.ndarray", efficiency: Optional["np.ndarray"] = None):
+        """
+        Add readings (sorted by timestamp, unique); readings already held
+        for the same timestamps are replaced
+        """
+        import numpy as np
+
+        if not len(timestamps):
+            return
+        if not len(self) or timestamps[0] > self.timestamps[self.tail - 1]:
+            # Readings usually arrive in order and are appended
+            self._reserve(len(timestamps))
+            end = self.tail + len(timestamps)
+            self.timestamps[self.tail:end] = timestamps
+            self.values[self.tail:end] = values
+            if self.efficiency is not None:
+                self.efficiency[self.tail:end] = efficiency
+            self.tail = end
+            return
+
+        merged_timestamps = np.concatenate([self._live(self.timestamps), timestamps])
+        order = np.argsort(merged_timestamps, kind="stable")
+        merged_timestamps = merged_timestamps[order]
+        # Equal timestamps keep their order, so the last of each is the new reading
+        keep = np.r_[merged_timestamps[1:] != merged_timestamps[:-1], True]
+        columns = {
+            "timestamps": merged_timestamps[keep],
+            "values": np.concatenate([self._live(self.values), values])[order][keep],
+        }
+        if self.efficiency is not None:
+            columns["efficiency"] = np.concatenate([self._live(self.efficiency), efficiency])[order][keep]
+        self.head = self.tail = 0
+        self._reserve(len(columns["timestamps"]))
+        for name, column in columns.items():
+            getattr(self, name)[:len(column)] = column
+        self.tail = len(columns["timestamps"])
+
+    def evict(self, before: int):
+        import numpy as np
+
+        self.head += int(np.searchsorted(self._live(self.timestamps), before, side="left"))
+
+    def slice(self, start: int, end: int) -> slice:
+        """
+        Positions in the arrays of the readings from start to end inclusive
+        """
+        import numpy as np
+
+        live = self._live(self.timestamps)
+        return slice(
+            self.head + int(np.searchsorted(live, start, side="left")),
+            self.head + int(np.searchsorted(live, end, side="right")),
+        )
+
+class HotWindow:
+    def __init__(self, hours: float):
+        self.hours = hours
+        self._lock = threading.Lock()
+        self._series: Dict[SeriesKey, SeriesWindow] = {}
+        # Readings are complete from this epoch second on, None until loaded
+        self._complete_from: Optional[int] = None
+        self._watermark: Optional[datetime] = None
+        self._checked_at = float("-inf")
+
+    def _window_start(self) -> int:
+        return int(time.time() - self.hours * 3600)
+
+    def _add_arrays(self, kind: str, project_ids: "np.ndarray", source_codes: "np.ndarray", timestamps: "np.ndarray",
+                    values: "np.ndarray", efficiency: Optional["np.ndarray"]):
+        # Caller holds the lock
+        import numpy as np
+
+        order = np.lexsort((timestamps, source_codes, project_ids))
+        project_ids, source_codes, timestamps = project_ids[order], source_codes[order], timestamps[order]
+        values = values[order]
+        efficiency = efficiency[order] if efficiency is not None else None
+        boundaries = np.flatnonzero((np.diff(project_ids) != 0) | (np.diff(source_codes) != 0)) + 1
+        for begin, end in zip(np.r_[0, boundaries], np.r_[boundaries, len(order)]):
+            key = (kind, int(project_ids[begin]), SOURCES[source_codes[begin]])
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = SeriesWindow(with_efficiency=efficiency is not None)
+            # A batch may repeat a reading, its last value wins
+            batch = timestamps[begin:end]
+            last = np.r_[batch[1:] != batch[:-1], True]
+            series.upsert(
+                batch[last],
+                values[begin:end][last],
+                efficiency[begin:end][last] if efficiency is not None else None,
+            )
+
+    def add_rows(self, kind: str, rows: Sequence):
+        """
+        Ingest listener: add readings given as dicts with project_id,
+        source_type, timestamp, value_kwh and, for generation, efficiency
+        """
+        names = READING_COLUMNS[kind]
+        self.add_columns(kind, list(zip(*[[row.get(name) for name in names] for row in rows])))
+
+    def add_columns(self, kind: str, columns: Sequence):
+        """
+        Add readings given as columns, in the order of READING_COLUMNS
+        """
+        import numpy as np
+
+        if not columns or not len(columns[0]):
+            return
+        count = len(columns[0])
+        timestamps = _epoch_seconds(columns[2])
+        recent = timestamps >= self._window_start()
+        if not recent.any():
+            return
+        arrays = [
+            np.fromiter(columns[0], dtype=np.int64, count=count),
+            np.fromiter((SOURCE_CODES[source] for source in columns[1]), dtype=np.int64, count=count),
+            timestamps,
+            np.fromiter(columns[3], dtype=np.float64, count=count),
+            np.array(columns[4], dtype=np.float64) if kind == "generation" else None,
+        ]
+        arrays = [array[recent] if array is not None else None for array in arrays]
+        with self._lock:
+            self._add_arrays(kind, *arrays)
+
+    def load(self, db: Session):
+        """
+        Load the window from the database, in chunks of column tuples
+        """
+        watermark = current_watermark(db)
+        window_start = self._window_start()
+        start = time.perf_counter()
+        for kind, model in READING_MODELS.items():
+            columns = [getattr(model, name) for name in READING_COLUMNS[kind]]
+            statement = select(*columns).where(model.timestamp >= _to_datetime(window_start))
+            for rows in db.execute(statement.execution_options(yield_per=settings.HOT_WINDOW_LOAD_CHUNK_ROWS)).partitions():
+                self.add_columns(kind, list(zip(*rows)))
+        with self._lock:
+            self._complete_from = window_start
+            self._watermark = watermark
+            self._checked_at = time.monotonic()
+        self._report()
+        logger.info(f"Loaded the hot window of {self.stats()['readings']} readings in {time.perf_counter() - start:.2f}s")
+
+    def sync(self, db: Session):
+        """
+        Merge readings written elsewhere since the last sync and evict the
+        readings that left the window. At most once per HOT_WINDOW_SYNC_SECONDS.
+        """
+        with self._lock:
+            if self._complete_from is None or time.monotonic() - self._checked_at < settings.HOT_WINDOW_SYNC_SECONDS:
+                return
+            self._checked_at = time.monotonic()
+            since = self._watermark
+        watermark = current_watermark(db)
+        window_start = self._window_start()
+        for kind, model in READING_MODELS.items():
+            rows = db.query(*[getattr(model, name) for name in READING_COLUMNS[kind]]).filter(
+                changed_since(model, since),
+                model.timestamp >= _to_datetime(window_start),
+            ).all()
+            if rows:
+                self.add_columns(kind, list(zip(*rows)))
+                metrics.increment("hot_window.synced_readings", len(rows), labels={"kind": kind})
+        with self._lock:
+            for series in self._series.values():
+                series.evict(window_start)
+            for key in [key for key, series in self._series.items() if not len(series)]:
+                del self._series[key]
+            self._complete_from = max(self._complete_from, window_start)
+            self._watermark = watermark
+        self._report()
+
+    def covers(self, start: datetime) -> bool:
+        with self._lock:
+            return self._complete_from is not None and _epoch_seconds([normalize_timestamp(start)])[0] >= self._complete_from
+
+    def aggregate(
+        self,
+        db: Session,
+        kind: str,
+        project_ids: List[int],
+        start_date: datetime,
+        end_date: datetime,
+        source_types: Optional[Sequence[EnergySourceType]] = None,
+        by_day: bool = True,
+    ) -> Optional[dict]:
+        """
+        by_source, by_project and, if `by_day`, local by_day (core.calendar)
+        kWh of the readings from start_date to end_date inclusive, plus the
+        energy-weighted avg_efficiency for generation. None when the range
+        starts before the window.
+        """
+        if not self.covers(start_date):
+            metrics.increment("hot_window.misses", labels={"kind": kind})
+            return None
+        self.sync(db)
+        import numpy as np
+
+        started = time.perf_counter()
+        timezones = project_timezones(db, project_ids) if by_day else {}
+        start_date, end_date = normalize_timestamp(start_date), normalize_timestamp(end_date)
+        # Timestamps are whole seconds, a fractional start excludes its second
+        start_seconds = int(_epoch_seconds([start_date])[0]) + (1 if start_date.microsecond else 0)
+        end_seconds = int(_epoch_seconds([end_date])[0])
+        projects, sources = set(project_ids), set(source_types or EnergySourceType)
+
+        by_source: Dict[str, float] = {}
+        by_project: Dict[str, float] = {}
+        days: Dict[date, float] = {}
+        weighted_sum, efficiency_kwh = 0.0, 0.0
+        with self._lock:
+            for (series_kind, project_id, source_type), series in self._series.items():
+                if series_kind != kind or project_id not in projects or source_type not in sources:
+                    continue
+                positions = series.slice(start_seconds, end_seconds)
+                values = series.values[positions]
+                if not len(values):
+                    continue
+                total = float(values.sum())
+                by_source[source_type.value] = by_source.get(source_type.value, 0.0) + total
+                by_project[str(project_id)] = by_project.get(str(project_id), 0.0) + total
+                if series.efficiency is not None:
+                    # Readings without an efficiency are left out, like core.energy_queries.efficiency_columns
+                    efficiency = series.efficiency[positions]
+                    measured = ~np.isnan(efficiency)
+                    weighted_sum += float(np.dot(efficiency[measured], values[measured]))
+                    efficiency_kwh += float(values[measured].sum())
+                if by_day:
+                    local = local_dates(series.timestamps[positions].astype("datetime64[s]"), timezones.get(project_id, settings.DEFAULT_TIMEZONE))
+                    unique_days, day_index = np.unique(local, return_inverse=True)
+                    sums = np.bincount(day_index, weights=values)
+                    for day, value in zip(unique_days.astype(date), sums):
+                        days[day] = days.get(day, 0.0) + float(value)
+        metrics.increment("hot_window.hits", labels={"kind": kind})
+        metrics.observe("hot_window.aggregate_seconds", time.perf_counter() - started, labels={"kind": kind})
+
+        results = {"by_source": by_source, "by_project": by_project}
+        if by_day:
+            results["by_day"] = days
+        if kind == "generation":
+            results["avg_efficiency"] = weighted_efficiency(weighted_sum, efficiency_kwh)
+        return results
+
+    def stats(self) -> dict:
+        """
+        Readings and memory held, in total and per series
+        """
+        with self._lock:
+            series = [
+                {
+                    "kind": kind,
+                    "project_id": project_id,
+                    "source_type": source_type.value,
+                    "readings": len(window),
+                    "bytes": window.nbytes,
+                    "oldest": _to_datetime(window.timestamps[window.head]) if len(window) else None,
+                    "newest": _to_datetime(window.timestamps[window.tail - 1]) if len(window) else None,
+                }
+                for (kind, project_id, source_type), window in sorted(self._series.items(), key=lambda item: (item[0][0], item[0][1], item[0][2].value))
+            ]
+            complete_from = self._complete_from
+        return {
+            "loaded": complete_from is not None,
+            "complete_from": _to_datetime(complete_from) if complete_from is not None else None,
+            "hours": self.hours,
+            "readings": sum(item["readings"] for item in series),
+            "bytes": sum(item["bytes"] for item in series),
+            "series": series,
+        }
+
+    def _report(self):
+        stats = self.stats()
+        metrics.set_gauge("hot_window.series", len(stats["series"]))
+        metrics.set_gauge("hot_window.readings", stats["readings"])
+        metrics.set_gauge("hot_window.bytes", stats["bytes"])
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+            self._complete_from = None
+            self._watermark = None
+
+def _to_datetime(seconds) -> datetime:
+    return datetime(1970, 1, 1) + timedelta(seconds=int(seconds))
+
+hot_window = HotWindow(settings.HOT_WINDOW_HOURS)
+
+def _load():
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        hot_window.load(db)
+    except Exception as e:
+        logger.error(f"Loading the hot window failed, recent reads use the database: {e}", exc_info=True)
+    finally:
+        db.close()
+
+def start_hot_window():
+    if not settings.HOT_WINDOW_ENABLED:
+        return
+    add_ingest_listener(hot_window.add_rows)
+    threading.Thread(target=_load, name="hot-window-load", daemon=True).start()
+
+def stop_hot_window():
+    remove_ingest_listener(hot_window.add_rows)
+    hot_window.clear()
@@ -0,0 +1,127 @@
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Type
+import logging
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from config import settings
+from models.energy_data import EnergyConsumption, EnergyGeneration
+
+logger = logging.getLogger(__name__)
+
+# Natural key of a meter reading. Matches the unique constraints on
+# energy_consumption and energy_generation.
+READING_KEY = ("project_id", "source_type", "timestamp")
+
+READING_MODELS = {
+    "consumption": EnergyConsumption,
+    "generation": EnergyGeneration,
+}
+
+# Callables invoked with (kind, rows) after readings have been committed
+_ingest_listeners: List[Callable[[str, List[dict]], None]] = []
+
+# Columns overwritten when a reading with the same key is ingested again
+UPDATABLE_COLUMNS = {
+    EnergyConsumption: ("value_kwh",),
+    EnergyGeneration: ("value_kwh", "efficiency"),
+}
+
+def normalize_timestamp(value: datetime) -> datetime:
+    """
+    Store readings as naive UTC so retries with a different offset notation
+    still hit the same key
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _dedupe(model, rows: Iterable[dict]) -> List[dict]:
+    # The last reading for a key within one request wins, as it would across requests
+    columns = READING_KEY + UPDATABLE_COLUMNS[model]
+    unique: Dict[Tuple, dict] = {}
+    for row in rows:
+        row = {column: row.get(column) for column in columns}
+        row["timestamp"] = normalize_timestamp(row["timestamp"])
+        unique[tuple(row[column] for column in READING_KEY)] = row
+    return list(unique.values())
+
+def upsert_statement(table, key_columns: Iterable[str], update_columns: Iterable[str], dialect: str):
+    """
+    INSERT statement that overwrites `update_columns` (and updated_at) of
+    rows that already exist for the unique key `key_columns`
+    """
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+
+        stmt = insert(table)
+        values = {column: stmt.inserted[column] for column in update_columns}
+        values["updated_at"] = func.now()
+        return stmt.on_duplicate_key_update(**values)
+
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+
+        stmt = insert(table)
+        values = {column: stmt.excluded[column] for column in update_columns}
+        values["updated_at"] = func.now()
+        return stmt.on_conflict_do_update(index_elements=list(key_columns), set_=values)
+
+    raise ValueError(f"Upsert ingestion is not supported for the {dialect} dialect")
+
+def _upsert_statement(model, dialect: str):
+    return upsert_statement(model.__table__, READING_KEY, UPDATABLE_COLUMNS[model], dialect)
+
+def upsert_readings(
+    db: Session,
+    model: Type,
+    rows: Iterable[dict],
+    batch_size: Optional[int] = None,
+) -> int:
+    """
+    Insert readings, overwriting the values of readings that already exist
+    for the same (project_id, source_type, timestamp).
+
+    Rows are written in batches with one multi-row statement each and no
+    read-before-write lookups, so gateway retries are safe. The caller owns
+    the transaction and must commit. Returns the number of distinct readings
+    written.
+    """
+    rows = _dedupe(model, rows)
+    if not rows:
+        return 0
+
+    batch_size = batch_size or settings.INGEST_BATCH_SIZE
+    stmt = _upsert_statement(model, db.get_bind().dialect.name)
+
+    for offset in range(0, len(rows), batch_size):
+        db.execute(stmt, rows[offset:offset + batch_size])
+
+    logger.debug(f"Upserted {len(rows)} {model.__tablename__} readings")
+    return len(rows)
+
+def add_ingest_listener(listener: Callable[[str, List[dict]], None]):
+    if listener not in _ingest_listeners:
+        _ingest_listeners.append(listener)
+
+def remove_ingest_listener(listener: Callable[[str, List[dict]], None]):
+    if listener in _ingest_listeners:
+        _ingest_listeners.remove(listener)
+
+def notify_ingested(kind: str, rows: Iterable[dict]):
+    """
+    Tell listeners (live streams, caches) about readings that were just
+    committed. Listener errors are logged and never fail the ingest.
+    """
+    if not _ingest_listeners:
+        return
+    rows = _dedupe(READING_MODELS[kind], rows)
+    for listener in list(_ingest_listeners):
+        try:
+            listener(kind, rows)
+        except Exception as e:
+            logger.error(f"Ingest listener {listener} failed: {e}", exc_info=True)
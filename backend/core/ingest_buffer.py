@@ -0,0 +1,399 @@
+"""
+Write-behind buffer for meter readings.
+
+Readings are acknowledged as soon as they are appended to a local spill file
+and queued in memory. A background thread flushes the queue to the database
+in one transaction when it reaches INGEST_BUFFER_FLUSH_SIZE readings or every
+INGEST_BUFFER_FLUSH_INTERVAL seconds, replacing one commit per request with
+one commit per flush.
+
+Durability: every accepted reading is in a spill segment until the flush
+containing it has committed. Segments are named after a token of the
+process start, held as a lease (core.leases) while the process runs.
+Segments whose token's lease is free were left by a process that exited and
+are replayed on startup. Replays are safe because flushes are upserts.
+
+A batch the database rejects while it is reachable is written again in
+halves, down to single readings, so one bad reading cannot hold the queue.
+Readings rejected on their own are moved to the dead-letter file
+(dead-letter.jsonl in the spill dir) with the error.
+"""
+from collections import deque
+from datetime import datetime
+from typing import Callable, Deque, List, Optional, Tuple
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import text
+
+from config import settings
+from core.ingest import READING_MODELS, normalize_timestamp, notify_ingested, upsert_readings
+from core.leases import Lease, lease_held, new_token
+from core.metrics import metrics
+from core.replicas import mark_project_writes
+from models.energy_data import EnergySourceType
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTER_FILE = "dead-letter.jsonl"
+
+class IngestBufferFull(Exception):
+    """
+    Raised when accepting readings would exceed the buffer capacity
+    """
+
+def _encode_row(row: dict) -> dict:
+    encoded = dict(row)
+    encoded["timestamp"] = row["timestamp"].isoformat()
+    encoded["source_type"] = EnergySourceType(row["source_type"]).value
+    return encoded
+
+def _decode_row(row: dict) -> dict:
+    decoded = dict(row)
+    decoded["timestamp"] = datetime.fromisoformat(row["timestamp"])
+    decoded["source_type"] = EnergySourceType(row["source_type"])
+    return decoded
+
+def _error_summary(error: Exception) -> str:
+    # SQLAlchemy errors go on with the statement and all its parameters
+    lines = str(error).splitlines()
+    return lines[0] if lines else type(error).__name__
+
+class IngestBuffer:
+    def __init__(
+        self,
+        session_factory: Callable,
+        max_size: int,
+        flush_size: int,
+        flush_interval: float,
+        spill_dir: str,
+        fsync: bool = True,
+    ):
+        self.session_factory = session_factory
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.spill_dir = spill_dir
+        self.fsync = fsync
+
+        # (kind, row, enqueued_at)
+        self._queue: Deque[Tuple[str, dict, float]] = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+        # Spill segments whose readings are queued but not yet committed
+        self._pending_segments: List[str] = []
+        self._spill_file = None
+        self._spill_path: Optional[str] = None
+        self._segment_seq = 0
+        self._token = new_token()
+        self._lease: Optional[Lease] = None
+
+    # Lifecycle
+
+    def start(self):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self._lease = Lease(self.spill_dir, f"ingest-{self._token}")
+        self._recover_orphaned_segments()
+        self._open_spill_segment()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="ingest-buffer-flusher", daemon=True)
+        self._thread.start()
+        logger.info(f"Ingest buffer started (pid {os.getpid()}, token {self._token}, spill dir {self.spill_dir})")
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=self.flush_interval + 30)
+        # Final flush of anything accepted after the flusher exited. If it
+        # fails the spill segments stay on disk and are replayed on restart.
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Final ingest buffer flush failed, readings left in spill segments: {e}")
+        if self._spill_file:
+            self._spill_file.close()
+            self._spill_file = None
+        if not self._queue and self._spill_path and os.path.exists(self._spill_path):
+            os.remove(self._spill_path)
+        # Segments still on disk are replayed by the next worker to start
+        if self._lease:
+            self._lease.release()
+            self._lease = None
+        logger.info("Ingest buffer stopped")
+
+    # Producer side
+
+    def submit(self, kind: str, rows: List[dict]) -> int:
+        """
+        Accept readings for a later flush. Returns the queue depth after
+        accepting them, or raises IngestBufferFull.
+        """
+        if kind not in READING_MODELS:
+            raise ValueError(f"Unknown reading kind: {kind}")
+
+        rows = [dict(row, timestamp=normalize_timestamp(row["timestamp"])) for row in rows]
+        lines = "".join(json.dumps({"kind": kind, "row": _encode_row(row)}) + "\n" for row in rows)
+
+        with self._cond:
+            if len(self._queue) + len(rows) > self.max_size:
+                metrics.increment("ingest_buffer.rejected_readings", len(rows))
+                raise IngestBufferFull(f"Ingest buffer is full ({len(self._queue)}/{self.max_size} readings)")
+
+            # Persist before acknowledging so a crash cannot lose accepted readings
+            self._spill_file.write(lines)
+            self._spill_file.flush()
+            if self.fsync:
+                os.fsync(self._spill_file.fileno())
+
+            now = time.monotonic()
+            self._queue.extend((kind, row, now) for row in rows)
+            depth = len(self._queue)
+            metrics.increment("ingest_buffer.accepted_readings", len(rows))
+            metrics.set_gauge("ingest_buffer.queue_depth", depth)
+
+            if depth >= self.flush_size:
+                self._cond.notify_all()
+        return depth
+
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    # Flushing
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._queue) < self.flush_size:
+                    self._cond.wait(timeout=self.flush_interval)
+                stopping = self._stopping
+            if stopping:
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Ingest buffer flush failed, will retry: {e}", exc_info=True)
+                # Back off instead of retrying a full queue in a tight loop
+                with self._cond:
+                    if not self._stopping:
+                        self._cond.wait(timeout=self.flush_interval)
+
+    def flush(self) -> int:
+        """
+        Write everything queued so far in one transaction. On failure the
+        readings are put back at the front of the queue, unless the database
+        is reachable and rejected the batch: then the readings it still
+        rejects on their own are dead-lettered and the rest are written.
+        """
+        with self._flush_lock:
+            with self._cond:
+                if not self._queue:
+                    return 0
+                items = list(self._queue)
+                self._queue.clear()
+                # Readings accepted from now on go to a new segment, so the
+                # segments captured here can be deleted once this flush commits
+                self._rotate_spill_segment()
+                segments = list(self._pending_segments)
+                self._pending_segments.clear()
+
+            start = time.perf_counter()
+            rejected: List[Tuple[str, dict, float, str]] = []
+            try:
+                try:
+                    self._write(items)
+                except Exception as e:
+                    if not self._database_reachable():
+                        raise
+                    logger.warning(f"The database rejected a batch of {len(items)} buffered readings, writing it in halves: {_error_summary(e)}")
+                    middle = len(items) // 2
+                    rejected = self._write_isolating(items[:middle]) + self._write_isolating(items[middle:])
+                    if rejected:
+                        self._dead_letter(rejected)
+            except Exception:
+                with self._cond:
+                    self._queue.extendleft(reversed(items))
+                    self._pending_segments[:0] = segments
+                    metrics.set_gauge("ingest_buffer.queue_depth", len(self._queue))
+                metrics.increment("ingest_buffer.flush_failures")
+                raise
+
+            for path in segments:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+            rejected_rows = {id(row) for _, row, _, _ in rejected}
+            for kind in READING_MODELS:
+                rows = [row for item_kind, row, _ in items if item_kind == kind and id(row) not in rejected_rows]
+                if rows:
+                    notify_ingested(kind, rows)
+
+            now = time.monotonic()
+            metrics.observe("ingest_buffer.flush_seconds", time.perf_counter() - start)
+            metrics.observe("ingest_buffer.ack_to_commit_seconds", now - min(item[2] for item in items))
+            metrics.increment("ingest_buffer.flushed_readings", len(items) - len(rejected))
+            metrics.set_gauge("ingest_buffer.queue_depth", len(self._queue))
+            logger.debug(f"Flushed {len(items) - len(rejected)} buffered readings")
+            return len(items) - len(rejected)
+
+    def _write(self, items: List[Tuple[str, dict, float]]):
+        # Upserts the readings in one transaction
+        db = self.session_factory()
+        try:
+            for kind, model in READING_MODELS.items():
+                rows = [row for item_kind, row, _ in items if item_kind == kind]
+                if rows:
+                    upsert_readings(db, model, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            db.close()
+            raise
+        try:
+            # After the commit, so the owners' reads wait for a replica that has it
+            mark_project_writes(db, {row["project_id"] for _, row, _ in items})
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Could not stamp the owners' last write after a flush: {_error_summary(e)}")
+        finally:
+            db.close()
+
+    def _write_isolating(self, items: List[Tuple[str, dict, float]]) -> List[Tuple[str, dict, float, str]]:
+        """
+        Write the readings, splitting the batch in halves while the database
+        rejects it. Returns the readings rejected on their own, with the
+        error. Raises if the database becomes unreachable.
+        """
+        if not items:
+            return []
+        try:
+            self._write(items)
+            return []
+        except Exception as e:
+            if len(items) > 1:
+                middle = len(items) // 2
+                return self._write_isolating(items[:middle]) + self._write_isolating(items[middle:])
+            if not self._database_reachable():
+                raise
+            kind, row, enqueued_at = items[0]
+            return [(kind, row, enqueued_at, _error_summary(e))]
+
+    def _database_reachable(self) -> bool:
+        db = self.session_factory()
+        try:
+            db.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            return False
+        finally:
+            db.close()
+
+    def _dead_letter(self, rejected: List[Tuple[str, dict, float, str]]):
+        # Written and synced before the spill segments holding the readings are deleted
+        failed_at = datetime.utcnow().isoformat()
+        lines = "".join(
+            json.dumps({"kind": kind, "row": _encode_row(row), "error": error, "failed_at": failed_at}) + "\n"
+            for kind, row, _, error in rejected
+        )
+        with open(os.path.join(self.spill_dir, DEAD_LETTER_FILE), "a", encoding="utf-8") as f:
+            f.write(lines)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        metrics.increment("ingest_buffer.dead_lettered_readings", len(rejected))
+        logger.error(f"Moved {len(rejected)} readings the database rejects to {DEAD_LETTER_FILE}: {rejected[0][3]}")
+
+    # Spill segments
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.spill_dir, f"ingest-{self._token}-{seq}.jsonl")
+
+    def _open_spill_segment(self):
+        self._segment_seq += 1
+        self._spill_path = self._segment_path(self._segment_seq)
+        self._spill_file = open(self._spill_path, "a", encoding="utf-8")
+
+    def _rotate_spill_segment(self):
+        # Called with self._cond held
+        self._spill_file.close()
+        self._pending_segments.append(self._spill_path)
+        self._open_spill_segment()
+
+    def _recover_orphaned_segments(self):
+        """
+        Claim and queue the segments of processes whose lease is free, i.e.
+        that are no longer running
+        """
+        recovered = 0
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, "ingest-*-*.jsonl"))):
+            token = os.path.basename(path).split("-")[1]
+            if token == self._token or lease_held(self.spill_dir, f"ingest-{token}"):
+                continue
+
+            # Renaming claims the segment, so only one worker replays it
+            self._segment_seq += 1
+            claimed = self._segment_path(self._segment_seq)
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+
+            with open(claimed, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn last line from a crash mid-write was never acknowledged
+                        logger.warning(f"Skipping corrupt line in spill segment {claimed}")
+                        continue
+                    self._queue.append((entry["kind"], _decode_row(entry["row"]), time.monotonic()))
+                    recovered += 1
+            self._pending_segments.append(claimed)
+
+        if recovered:
+            logger.warning(f"Recovered {recovered} unflushed readings from spill segments")
+            metrics.increment("ingest_buffer.recovered_readings", recovered)
+
+_buffer: Optional[IngestBuffer] = None
+
+def get_ingest_buffer() -> Optional[IngestBuffer]:
+    """
+    The buffer of this worker, or None when buffering is disabled
+    """
+    return _buffer
+
+def start_ingest_buffer():
+    global _buffer
+    if not settings.INGEST_BUFFER_ENABLED or _buffer is not None:
+        return
+    from database import SessionLocal
+
+    _buffer = IngestBuffer(
+        session_factory=SessionLocal,
+        max_size=settings.INGEST_BUFFER_MAX_SIZE,
+        flush_size=settings.INGEST_BUFFER_FLUSH_SIZE,
+        flush_interval=settings.INGEST_BUFFER_FLUSH_INTERVAL,
+        spill_dir=settings.INGEST_SPILL_DIR,
+        fsync=settings.INGEST_SPILL_FSYNC,
+    )
+    _buffer.start()
+
+def stop_ingest_buffer():
+    global _buffer
+    if _buffer is None:
+        return
+    _buffer.stop()
+    _buffer = None
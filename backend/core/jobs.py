@@ -0,0 +1,622 @@
+"""
+Background jobs for heavy reports and exports.
+
+`POST /api/jobs/` queues a job and returns its id at once. Clients poll
+`GET /api/jobs/{id}` or follow `/events`, then download the result from
+`/result`. Two types of job:
+
+- export: the raw readings of a kind, projects and range as CSV or Parquet,
+  with the archived readings (core.archive) included, streamed in chunks of
+  JOBS_EXPORT_CHUNK_ROWS so memory stays flat however large the range.
+- report: per project and local day, week or month, consumption, generation
+  by source, net energy and renewable share, built with pandas from the
+  hourly rollups.
+
+Jobs of type rollups are queued by the read paths, not by users: the
+initial build of an hourly rollup (core.rollups).
+
+The queue is a local SQLite file (JOBS_DB_PATH) shared by the processes of
+a host. A runner (in each web worker with JOBS_RUNNER_ENABLED, or
+`python manage.py run-jobs`) claims queued jobs in a write transaction, so
+every job runs once, and runs them on a pool of JOBS_WORKERS processes.
+Claimed jobs record the runner's token, which the runner holds as a lease
+(core.leases) while it runs. A stopping runner queues its jobs again, and
+jobs of a runner whose lease is free (it died) are queued again when a
+runner starts.
+
+Submitting the same job (same user, type and resolved parameters) while
+one is queued, running or has an unexpired result returns that job. Results
+and finished jobs are evicted JOBS_RESULT_TTL_SECONDS after they finish.
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from config import settings
+from core.leases import Lease, lease_held, new_token
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+# Owner of the jobs queued by the app itself, which no user can list
+ROLLUPS_JOB_USER_ID = 0
+FINISHED = (SUCCEEDED, FAILED)
+CONTENT_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    params TEXT NOT NULL,
+    params_key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    error TEXT,
+    result_path TEXT,
+    result_size INTEGER,
+    runner_pid INTEGER,
+    runner_token TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_params_key ON jobs (params_key);
+CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS ix_jobs_user ON jobs (user_id, created_at);
+"""
+
+def params_key(user_id: int, job_type: str, params: dict) -> str:
+    canonical = json.dumps([user_id, job_type, params], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def _as_job(row: Optional[sqlite3.Row]) -> Optional[dict]:
+    if row is None:
+        return None
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    for name in ("created_at", "started_at", "finished_at", "expires_at"):
+        if job[name] is not None:
+            job[name] = datetime.utcfromtimestamp(job[name])
+    return job
+
+class JobQueue:
+    """
+    Jobs and their state in a local SQLite file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Runners' leases are kept next to the queue
+        self.lease_dir = os.path.dirname(os.path.abspath(path))
+        self._initialized = False
+
+    @contextmanager
+    def _connection(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            if not self._initialized:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(SCHEMA)
+                # Queues created before runner tokens
+                if "runner_token" not in {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}:
+                    connection.execute("ALTER TABLE jobs ADD COLUMN runner_token TEXT")
+                self._initialized = True
+            yield connection
+        finally:
+            connection.close()
+
+    @contextmanager
+    def _transaction(self):
+        # Taking the write lock up front serializes claims and submissions across processes
+        with self._connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+    def submit(self, user_id: int, job_type: str, params: dict) -> Tuple[dict, bool]:
+        """
+        Queue a job, or return the queued, running or unexpired job with the
+        same parameters. Returns the job and whether it was created.
+        """
+        key = params_key(user_id, job_type, params)
+        now = time.time()
+        with self._transaction() as connection:
+            existing = connection.execute(
+                "SELECT * FROM jobs WHERE params_key = ? AND (status IN (?, ?) OR (status = ? AND expires_at > ?)) "
+                "ORDER BY created_at DESC LIMIT 1",
+                (key, QUEUED, RUNNING, SUCCEEDED, now),
+            ).fetchone()
+            if existing is not None:
+                return _as_job(existing), False
+
+            job_id = uuid.uuid4().hex
+            connection.execute(
+                "INSERT INTO jobs (id, user_id, type, params, params_key, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, user_id, job_type, json.dumps(params, sort_keys=True, default=str), key, QUEUED, now),
+            )
+            return _as_job(connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()), True
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._connection() as connection:
+            return _as_job(connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def list(self, user_id: int, limit: int = 50) -> List[dict]:
+        with self._connection() as connection:
+            rows = connection.execute(
+                "SELECT * FROM jobs WHERE user_id = ? ORDER BY created_at DESC LIMIT ?", (user_id, limit)
+            ).fetchall()
+        return [_as_job(row) for row in rows]
+
+    def pending(self, user_id: int) -> int:
+        with self._connection() as connection:
+            return connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE user_id = ? AND status IN (?, ?)", (user_id, QUEUED, RUNNING)
+            ).fetchone()[0]
+
+    def claim(self, runner_token: str) -> Optional[dict]:
+        """
+        Mark the oldest queued job running for the runner and return it
+        """
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = ?, runner_pid = ?, runner_token = ?, started_at = ?, progress = 0, message = NULL "
+                "WHERE id = ?",
+                (RUNNING, os.getpid(), runner_token, time.time(), row["id"]),
+            )
+            return _as_job(connection.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    def update_progress(self, job_id: str, progress: float, message: Optional[str] = None):
+        with self._connection() as connection:
+            connection.execute(
+                "UPDATE jobs SET progress = ?, message = ? WHERE id = ? AND status = ?",
+                (min(1.0, max(0.0, progress)), message, job_id, RUNNING),
+            )
+
+    def finish(self, runner_token: str, job_id: str, result_path: Optional[str] = None, error: Optional[str] = None):
+        """
+        Record the result of a job the runner still holds. A job queued
+        again in the meantime belongs to its next run.
+        """
+        now = time.time()
+        size = os.path.getsize(result_path) if result_path else None
+        with self._connection() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, progress = ?, error = ?, result_path = ?, result_size = ?, "
+                "finished_at = ?, expires_at = ? WHERE id = ? AND status = ? AND runner_token = ?",
+                (
+                    FAILED if error else SUCCEEDED, 0.0 if error else 1.0, error, result_path, size,
+                    now, now + settings.JOBS_RESULT_TTL_SECONDS, job_id, RUNNING, runner_token,
+                ),
+            )
+
+    def _requeue(self, connection, job_ids: List[str]):
+        for job_id in job_ids:
+            connection.execute(
+                "UPDATE jobs SET status = ?, runner_pid = NULL, runner_token = NULL, started_at = NULL, progress = 0 "
+                "WHERE id = ?",
+                (QUEUED, job_id),
+            )
+
+    def requeue_orphaned(self, runner_token: str) -> int:
+        """
+        Queue again the running jobs of other runners whose lease is free,
+        i.e. that are no longer running, whatever process has their PID now
+        """
+        with self._transaction() as connection:
+            rows = connection.execute("SELECT id, runner_token FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+            orphaned = [
+                row["id"] for row in rows
+                if row["runner_token"] != runner_token and not (
+                    row["runner_token"] and lease_held(self.lease_dir, runner_lease(row["runner_token"]))
+                )
+            ]
+            self._requeue(connection, orphaned)
+        if orphaned:
+            logger.warning(f"Queued {len(orphaned)} jobs of stopped runners again")
+        return len(orphaned)
+
+    def requeue(self, runner_token: str, job_id: str):
+        """
+        Queue again a job the runner claimed but could not start
+        """
+        with self._connection() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, runner_pid = NULL, runner_token = NULL, started_at = NULL, progress = 0 "
+                "WHERE id = ? AND status = ? AND runner_token = ?",
+                (QUEUED, job_id, RUNNING, runner_token),
+            )
+
+    def release(self, runner_token: str) -> int:
+        """
+        Queue again the running jobs of a runner that is stopping
+        """
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT id FROM jobs WHERE status = ? AND runner_token = ?", (RUNNING, runner_token)
+            ).fetchall()
+            self._requeue(connection, [row["id"] for row in rows])
+        if rows:
+            logger.info(f"Queued {len(rows)} unfinished jobs again")
+        return len(rows)
+
+    def evict(self) -> int:
+        """
+        Delete the results and rows of jobs finished more than
+        JOBS_RESULT_TTL_SECONDS ago
+        """
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT id, result_path FROM jobs WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            ).fetchall()
+            for row in rows:
+                if row["result_path"] and os.path.exists(row["result_path"]):
+                    os.remove(row["result_path"])
+                connection.execute("DELETE FROM jobs WHERE id = ?", (row["id"],))
+        if rows:
+            metrics.increment("jobs.evicted", len(rows))
+            logger.info(f"Evicted {len(rows)} expired jobs")
+        return len(rows)
+
+def runner_lease(runner_token: str) -> str:
+    return f"jobs-runner-{runner_token}"
+
+job_queue = JobQueue(settings.JOBS_DB_PATH)
+
+# Job functions, run in the worker processes
+
+def _parse(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+class _Progress:
+    """
+    Writes a job's progress at most every half second
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self._written = 0.0
+
+    def __call__(self, progress: float, message: Optional[str] = None):
+        now = time.monotonic()
+        if now - self._written >= 0.5:
+            self._written = now
+            job_queue.update_progress(self.job_id, progress, message)
+
+def _export(db, params: dict, path: str, progress: Callable):
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    from core.archive import archived_partitions, scan
+    from core.ingest import READING_MODELS
+    from models.energy_data import EnergySourceType
+
+    kind = params["kind"]
+    model = READING_MODELS[kind]
+    start, end = _parse(params["start_date"]), _parse(params["end_date"])
+    sources = [EnergySourceType(source) for source in params["source_types"]] if params.get("source_types") else None
+
+    fields = [
+        ("project_id", pa.int64()),
+        ("source_type", pa.string()),
+        ("timestamp", pa.timestamp("us")),
+        ("value_kwh", pa.float64()),
+    ]
+    if kind == "generation":
+        fields.append(("efficiency", pa.float64()))
+    schema = pa.schema(fields)
+
+    query = db.query(*[getattr(model, name) for name in schema.names]).filter(
+        model.project_id.in_(params["project_ids"]),
+        model.timestamp >= start,
+        model.timestamp <= end,
+    )
+    if sources:
+        query = query.filter(model.source_type.in_(sources))
+
+    archived = None
+    partitions = archived_partitions(db, kind, params["project_ids"], start, end)
+    if partitions:
+        condition = (ds.field("timestamp") >= start) & (ds.field("timestamp") <= end)
+        if sources:
+            condition &= ds.field("source_type").isin([source.value for source in sources])
+        archived = scan(db, kind, partitions, schema.names, condition).cast(schema)
+        archived = archived.sort_by([("project_id", "ascending"), ("source_type", "ascending"), ("timestamp", "ascending")])
+
+    total = query.count() + (archived.num_rows if archived is not None else 0)
+    written = 0
+    if params["format"] == "parquet":
+        writer = pq.ParquetWriter(path, schema, compression="zstd")
+    else:
+        writer = pacsv.CSVWriter(path, schema)
+    try:
+        if archived is not None:
+            writer.write_table(archived)
+            written += archived.num_rows
+            progress(written / max(1, total), f"{written} of {total} readings")
+
+        statement = query.order_by(model.project_id, model.source_type, model.timestamp).statement
+        for chunk in db.execute(statement.execution_options(yield_per=settings.JOBS_EXPORT_CHUNK_ROWS)).partitions():
+            columns = list(zip(*chunk))
+            columns[1] = [source.value for source in columns[1]]
+            writer.write_table(pa.table(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+            ))
+            written += len(chunk)
+            progress(written / max(1, total), f"{written} of {total} readings")
+    finally:
+        writer.close()
+
+def _report(db, params: dict, path: str, progress: Callable):
+    import numpy as np
+    import pandas as pd
+    from core.calendar import local_dates, project_timezones
+    from core.rollups import ROLLUPS, refresh_rollups_if_due
+    from models.energy_data import EnergySourceType, Project
+
+    start, end = _parse(params["start_date"]), _parse(params["end_date"])
+    frequency = {"day": "D", "week": "W", "month": "M"}[params["resolution"]]
+    project_ids = params["project_ids"]
+
+    timezones = project_timezones(db, project_ids)
+    totals = {}
+    for step, (kind, (_, rollup_model)) in enumerate(ROLLUPS.items()):
+        progress(step / (len(ROLLUPS) + 1), f"Reading {kind} rollups")
+        refresh_rollups_if_due(db, kind, initial_build=True)
+        rows = db.query(
+            rollup_model.project_id, rollup_model.source_type, rollup_model.hour, rollup_model.value_kwh
+        ).filter(
+            rollup_model.project_id.in_(project_ids),
+            rollup_model.hour >= start,
+            rollup_model.hour <= end,
+        ).all()
+        frame = pd.DataFrame(
+            [(project_id, EnergySourceType(source).value, hour, value) for project_id, source, hour, value in rows],
+            columns=["project_id", "source_type", "hour", "value_kwh"],
+        )
+        # Periods of each project's local calendar, like the daily and weekly aggregates
+        days = np.empty(len(frame), dtype="datetime64[D]")
+        hours = frame["hour"].to_numpy(dtype="datetime64[s]")
+        for timezone in set(timezones.values()):
+            selected = frame["project_id"].isin([pid for pid, tz in timezones.items() if tz == timezone]).to_numpy()
+            days[selected] = local_dates(hours[selected], timezone)
+        frame["period"] = pd.Series(days, index=frame.index, dtype="datetime64[ns]").dt.to_period(frequency).dt.start_time
+        totals[kind] = frame.pivot_table(
+            index=["period", "project_id"], columns="source_type", values="value_kwh", aggfunc="sum", fill_value=0.0
+        )
+
+    progress(len(ROLLUPS) / (len(ROLLUPS) + 1), "Building report")
+    generation = totals["generation"].add_prefix("generation_").add_suffix("_kwh")
+    report = pd.DataFrame({
+        "consumption_kwh": totals["consumption"].sum(axis=1),
+        "generation_kwh": totals["generation"].sum(axis=1),
+    }).join(generation, how="outer").fillna(0.0)
+    report["net_kwh"] = report["generation_kwh"] - report["consumption_kwh"]
+    report["renewable_percentage"] = (
+        (report["generation_kwh"] / report["consumption_kwh"].where(report["consumption_kwh"] > 0) * 100)
+        .clip(upper=100)
+        .fillna(0.0)
+    )
+
+    names = dict(db.query(Project.id, Project.name).filter(Project.id.in_(project_ids)).all())
+    report = report.reset_index()
+    report.insert(2, "project_name", report["project_id"].map(names))
+    report = report.sort_values(["period", "project_id"])
+    if params["format"] == "parquet":
+        report.to_parquet(path, index=False, compression="zstd")
+    else:
+        report.to_csv(path, index=False)
+
+def _rollups(db, params: dict, path: str, progress: Callable):
+    from database import SessionLocal
+    from core.rollups import refresh_rollups
+
+    progress(0.0, f"Building the {params['kind']} rollup")
+    # Rollups are written on the primary, the job's session may be a replica
+    primary = SessionLocal()
+    try:
+        series = refresh_rollups(primary, params["kind"])
+    finally:
+        primary.close()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"kind,series\n{params['kind']},{len(series)}\n")
+
+JOB_TYPES: Dict[str, Callable] = {
+    "export": _export,
+    "report": _report,
+    "rollups": _rollups,
+}
+
+def result_path(job: dict) -> str:
+    return os.path.join(settings.JOBS_RESULT_DIR, f"{job['id']}.{job['params']['format']}")
+
+def run_job(job_id: str) -> str:
+    """
+    Run a claimed job to its result file and return the file's path.
+    Called in a worker process.
+    """
+    from core.replicas import read_router
+    import models  # noqa: F401  (registers all tables)
+
+    job = job_queue.get(job_id)
+    path = result_path(job)
+    # A job queued again by a stopping runner may still be finishing there
+    partial_path = f"{path}.{uuid.uuid4().hex[:8]}.partial"
+    os.makedirs(settings.JOBS_RESULT_DIR, exist_ok=True)
+
+    db = read_router.session()
+    try:
+        JOB_TYPES[job["type"]](db, job["params"], partial_path, _Progress(job_id))
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    finally:
+        db.close()
+    os.replace(partial_path, path)
+    return path
+
+# Runner, in the web workers or `python manage.py run-jobs`
+
+class JobRunner:
+    """
+    Claims queued jobs and runs them on a pool of worker processes
+    """
+
+    def __init__(self, queue: JobQueue, workers: int, poll_interval: float):
+        self.queue = queue
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._running: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._evicted_at = float("-inf")
+        self.token = new_token()
+        self._lease: Optional[Lease] = None
+
+    def start(self):
+        self._lease = Lease(self.queue.lease_dir, runner_lease(self.token))
+        self.queue.requeue_orphaned(self.token)
+        self._executor = self._new_executor()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="job-runner", daemon=True)
+        self._thread.start()
+        logger.info(f"Job runner started (pid {os.getpid()}, token {self.token}, {self.workers} workers, queue {self.queue.path})")
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # Spawned, not forked: the workers must not inherit this process's
+        # threads or database connections
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread:
+            self._thread.join(timeout=self.poll_interval + 5)
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        # Jobs still running here are picked up by another runner. A result
+        # finishing here later is ignored (JobQueue.finish).
+        self.queue.release(self.token)
+        if self._lease:
+            self._lease.release()
+            self._lease = None
+        logger.info("Job runner stopped")
+
+    def run_forever(self):
+        self.start()
+        try:
+            while self._thread.is_alive():
+                self._thread.join(timeout=1)
+        finally:
+            self.stop()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if time.monotonic() - self._evicted_at >= settings.JOBS_EVICT_INTERVAL_SECONDS:
+                    self._evicted_at = time.monotonic()
+                    self.queue.evict()
+                self._dispatch()
+            except Exception as e:
+                logger.error(f"Job runner error: {e}", exc_info=True)
+            self._stopping.wait(self.poll_interval)
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                if len(self._running) >= self.workers:
+                    return
+            job = self.queue.claim(self.token)
+            if job is None:
+                return
+            with self._lock:
+                self._running[job["id"]] = time.monotonic()
+            logger.info(f"Running {job['type']} job {job['id']}")
+            try:
+                future = self._executor.submit(run_job, job["id"])
+            except BrokenProcessPool:
+                # A worker process was killed (e.g. out of memory), which
+                # breaks the pool for good. The job never started.
+                with self._lock:
+                    self._running.pop(job["id"], None)
+                self.queue.requeue(self.token, job["id"])
+                logger.warning("Job worker pool is broken, starting a new one")
+                metrics.increment("jobs.pool_restarts")
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._new_executor()
+                continue
+            except Exception as e:
+                with self._lock:
+                    self._running.pop(job["id"], None)
+                logger.error(f"Could not start {job['type']} job {job['id']}: {e!r}")
+                self.queue.finish(self.token, job["id"], error=str(e) or type(e).__name__)
+                metrics.increment("jobs.finished", labels={"type": job["type"], "status": FAILED})
+                raise
+            future.add_done_callback(partial(self._done, job))
+
+    def _done(self, job: dict, future: Future):
+        with self._lock:
+            started = self._running.pop(job["id"])
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            self.queue.finish(self.token, job["id"], result_path=future.result())
+        else:
+            logger.error(f"{job['type']} job {job['id']} failed: {error!r}")
+            self.queue.finish(self.token, job["id"], error=str(error) or type(error).__name__)
+        status = FAILED if error else SUCCEEDED
+        metrics.increment("jobs.finished", labels={"type": job["type"], "status": status})
+        metrics.observe("jobs.run_seconds", time.monotonic() - started, labels={"type": job["type"]})
+
+_runner: Optional[JobRunner] = None
+
+def start_job_runner():
+    global _runner
+    if not settings.JOBS_RUNNER_ENABLED or _runner is not None:
+        return
+    _runner = JobRunner(job_queue, settings.JOBS_WORKERS, settings.JOBS_POLL_SECONDS)
+    _runner.start()
+
+def stop_job_runner():
+    global _runner
+    if _runner is None:
+        return
+    _runner.stop()
+    _runner = None
+
+def submit_job(user_id: int, job_type: str, params: dict) -> Tuple[dict, bool]:
+    job, created = job_queue.submit(user_id, job_type, params)
+    metrics.increment("jobs.submitted" if created else "jobs.deduplicated", labels={"type": job_type})
+    return job, created
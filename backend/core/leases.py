@@ -0,0 +1,68 @@
+"""
+Liveness of this host's processes, safe against PID reuse.
+
+A process takes a lease by holding an exclusive flock on
+`{directory}/{name}.lock`, where the name carries a uuid4 token of this
+process start. The kernel drops the lock when the process exits, however it
+exits, so a lease is free exactly when its holder is gone, even after a
+container restart hands the holder's PID to a new process.
+"""
+from typing import Optional
+import fcntl
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+def new_token() -> str:
+    return uuid.uuid4().hex[:16]
+
+def _path(directory: str, name: str) -> str:
+    return os.path.join(directory, f"{name}.lock")
+
+class Lease:
+    """
+    A lease held by this process until released or until it exits
+    """
+
+    def __init__(self, directory: str, name: str):
+        os.makedirs(directory, exist_ok=True)
+        self.path = _path(directory, name)
+        self._fd: Optional[int] = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        # Names are unique per process start, so nobody else holds this one
+        fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+def lease_held(directory: str, name: str) -> bool:
+    """
+    Whether a running process holds the lease. A lease left by a process
+    that exited is removed.
+    """
+    try:
+        fd = os.open(_path(directory, name), os.O_RDWR)
+    except FileNotFoundError:
+        return False
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        try:
+            os.remove(_path(directory, name))
+        except FileNotFoundError:
+            pass
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        return False
+    finally:
+        os.close(fd)
@@ -0,0 +1,55 @@
+import threading
+from collections import defaultdict
+from typing import Dict, Optional
+
+def _metric_key(name: str, labels: Optional[Dict[str, str]] = None) -> str:
+    if not labels:
+        return name
+    label_str = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{label_str}}}"
+
+class Metrics:
+    """
+    Minimal in-process metrics registry (per worker): counters, gauges and
+    timers that keep count/sum/max/last of observed durations
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._timers: Dict[str, Dict[str, float]] = {}
+
+    def increment(self, name: str, value: float = 1, labels: Optional[Dict[str, str]] = None):
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._counters[key] += value
+
+    def set_gauge(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, seconds: float, labels: Optional[Dict[str, str]] = None):
+        key = _metric_key(name, labels)
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is None:
+                timer = self._timers[key] = {"count": 0, "sum": 0.0, "max": 0.0, "last": 0.0}
+            timer["count"] += 1
+            timer["sum"] += seconds
+            timer["max"] = max(timer["max"], seconds)
+            timer["last"] = seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            timers = {}
+            for key, timer in self._timers.items():
+                timers[key] = dict(timer, avg=timer["sum"] / timer["count"] if timer["count"] else 0.0)
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timers": timers,
+            }
+
+metrics = Metrics()
@@ -0,0 +1,310 @@
+"""
+In-process publish/subscribe for live reading streams.
+
+Ingest paths publish committed readings once, and the broker fans every event
+out to all subscribers of the project's topic. Events are formatted as
+Server-Sent Events a single time at publish, so a reading costs the same
+whether ten or ten thousand clients are watching.
+
+Each subscriber has a bounded queue. When a slow client falls behind, its
+oldest events are dropped and it receives a `lagged` event, telling it to
+resynchronise through the delta (`since`) API instead of stalling the
+publisher or growing memory without bound.
+
+Readings ingested by other workers are picked up by a change-feed poller:
+one delta query per worker per interval for all subscribed projects, over
+readings timestamped within STREAM_CHANGE_FEED_LOOKBACK_HOURS. Older
+backfills are not streamed, clients pick them up with a `since` request. A
+worker without subscribers skips the query, so idle workers put no load on
+the database.
+"""
+from collections import OrderedDict, defaultdict, deque
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+import threading
+
+from config import settings
+from core.ingest import READING_MODELS, add_ingest_listener, remove_ingest_listener
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+def project_topic(project_id: int) -> str:
+    return f"project:{project_id}"
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+class Subscription:
+    """
+    A client's bounded event queue, consumed on the event loop it was created on
+    """
+
+    def __init__(self, topics: Iterable[str], loop: asyncio.AbstractEventLoop, max_queue: int):
+        self.topics = frozenset(topics)
+        self.loop = loop
+        self.dropped = 0
+        self._lagged = False
+        self._events = deque(maxlen=max_queue)
+        self._ready = asyncio.Event()
+
+    def _deliver(self, message: str):
+        # Runs on self.loop
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+            self._lagged = True
+            metrics.increment("stream.events_dropped")
+        self._events.append(message)
+        self._ready.set()
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Next SSE message, or None if nothing arrived within `timeout`
+        """
+        if not self._events:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        if self._lagged:
+            self._lagged = False
+            return format_sse("lagged", {"dropped": self.dropped})
+        return self._events.popleft()
+
+class RollingBuckets:
+    """
+    Running totals of the current time bucket per (kind, project, source).
+    Readings are keyed by timestamp, so a re-ingested reading replaces its
+    previous value instead of being counted twice.
+    """
+
+    def __init__(self, bucket_minutes: int):
+        self.width = timedelta(minutes=bucket_minutes)
+        # (kind, project_id, source) -> bucket start -> timestamp -> value
+        self._series: Dict[Tuple, Dict[datetime, Dict[datetime, float]]] = {}
+
+    def bucket_start(self, timestamp: datetime) -> datetime:
+        epoch = datetime(1970, 1, 1)
+        return epoch + ((timestamp - epoch) // self.width) * self.width
+
+    def add(self, kind: str, row: dict) -> dict:
+        series_key = (kind, row["project_id"], row["source_type"].value)
+        start = self.bucket_start(row["timestamp"])
+        series = self._series.setdefault(series_key, {})
+        readings = series.setdefault(start, {})
+        readings[row["timestamp"]] = row["value_kwh"]
+
+        # Keep the latest two buckets of the series only
+        if len(series) > 2:
+            for stale in sorted(series)[:-2]:
+                del series[stale]
+
+        return {
+            "kind": kind,
+            "project_id": row["project_id"],
+            "source_type": series_key[2],
+            "bucket_start": start.isoformat(),
+            "bucket_minutes": int(self.width.total_seconds() // 60),
+            "value_kwh": float(sum(readings.values())),
+            "readings": len(readings),
+        }
+
+class Broker:
+    def __init__(self, max_queue: int, bucket_minutes: int, recent_keys: int = 100000):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._buckets = RollingBuckets(bucket_minutes)
+        # Reading keys already published, so the change feed does not repeat them
+        self._recent: "OrderedDict[Tuple, Tuple]" = OrderedDict()
+        self._recent_keys = recent_keys
+
+    # Subscribers
+
+    def subscribe(self, topics: Iterable[str], max_queue: Optional[int] = None) -> Subscription:
+        """
+        Register a subscriber. Must be called from the event loop that will consume it.
+        """
+        subscription = Subscription(topics, asyncio.get_running_loop(), max_queue or self.max_queue)
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscribers[topic].add(subscription)
+            count = self._subscriber_count()
+        metrics.set_gauge("stream.subscribers", count)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+            count = self._subscriber_count()
+        metrics.set_gauge("stream.subscribers", count)
+
+    def _subscriber_count(self) -> int:
+        return len({sub for subs in self._subscribers.values() for sub in subs})
+
+    def has_subscribers(self) -> bool:
+        with self._lock:
+            return bool(self._subscribers)
+
+    def subscribed_project_ids(self) -> List[int]:
+        with self._lock:
+            return [int(topic.split(":", 1)[1]) for topic in self._subscribers if topic.startswith("project:")]
+
+    # Publishing
+
+    def publish_many(self, messages: List[Tuple[str, str]]):
+        """
+        Fan (topic, SSE message) pairs out to subscribers. Thread safe, and
+        wakes each event loop once per call however many subscribers it has.
+        """
+        per_loop: Dict[asyncio.AbstractEventLoop, List[Tuple[Subscription, str]]] = defaultdict(list)
+        with self._lock:
+            for topic, message in messages:
+                for subscription in self._subscribers.get(topic, ()):
+                    per_loop[subscription.loop].append((subscription, message))
+
+        for loop, deliveries in per_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver_all, deliveries)
+            except RuntimeError:
+                # The loop has been closed, its subscribers are going away
+                continue
+        metrics.increment("stream.events_published", len(messages))
+
+    def publish_readings(self, kind: str, rows: List[dict]):
+        """
+        Ingest listener: publish committed readings and their rolling buckets
+        """
+        messages = []
+        with self._lock:
+            for row in rows:
+                key = (kind, row["project_id"], row["source_type"].value, row["timestamp"])
+                # Everything a reading event carries, so a corrected efficiency is published too
+                payload = (row["value_kwh"], row.get("efficiency"))
+                if self._recent.get(key) == payload:
+                    continue
+                self._recent[key] = payload
+                self._recent.move_to_end(key)
+                if len(self._recent) > self._recent_keys:
+                    self._recent.popitem(last=False)
+
+                topic = project_topic(row["project_id"])
+                bucket = self._buckets.add(kind, row)
+                if topic not in self._subscribers:
+                    continue
+                reading = {
+                    "kind": kind,
+                    "project_id": row["project_id"],
+                    "source_type": row["source_type"].value,
+                    "timestamp": row["timestamp"].isoformat(),
+                    "value_kwh": row["value_kwh"],
+                }
+                if kind == "generation":
+                    reading["efficiency"] = row.get("efficiency")
+                messages.append((topic, format_sse("reading", reading)))
+                messages.append((topic, format_sse("bucket", bucket)))
+        if messages:
+            self.publish_many(messages)
+
+def _deliver_all(deliveries: List[Tuple[Subscription, str]]):
+    for subscription, message in deliveries:
+        subscription._deliver(message)
+
+class ChangeFeedPoller:
+    """
+    Publishes readings committed by other workers, found with one delta query
+    per reading table per interval for all projects that have subscribers
+    """
+
+    def __init__(self, broker: Broker, session_factory, interval: float):
+        self.broker = broker
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._watermark: Optional[datetime] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stream-change-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 5)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if not self.broker.has_subscribers():
+                # Resumed from the database clock once someone subscribes
+                self._watermark = None
+                continue
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Stream change feed poll failed: {e}", exc_info=True)
+
+    def poll(self):
+        from core.energy_queries import changed_since, current_watermark
+
+        project_ids = self.broker.subscribed_project_ids()
+        db = self.session_factory()
+        try:
+            watermark = current_watermark(db)
+            if not project_ids:
+                self._watermark = watermark
+                return
+            # After an idle spell, look back one interval as a running poller would have
+            since = self._watermark or watermark - timedelta(seconds=self.interval)
+            oldest = watermark - timedelta(hours=settings.STREAM_CHANGE_FEED_LOOKBACK_HOURS)
+            for kind, model in READING_MODELS.items():
+                columns = [model.project_id, model.source_type, model.timestamp, model.value_kwh]
+                if kind == "generation":
+                    columns.append(model.efficiency)
+                rows = db.query(*columns).filter(
+                    model.project_id.in_(project_ids),
+                    model.timestamp >= oldest,
+                    changed_since(model, since)
+                ).order_by(model.timestamp).all()
+                if rows:
+                    self.broker.publish_readings(kind, [row._asdict() for row in rows])
+            self._watermark = watermark
+        finally:
+            db.close()
+
+_broker: Optional[Broker] = None
+_poller: Optional[ChangeFeedPoller] = None
+
+def get_broker() -> Optional[Broker]:
+    return _broker
+
+def start_stream_broker():
+    global _broker, _poller
+    if _broker is not None:
+        return
+    _broker = Broker(max_queue=settings.STREAM_QUEUE_SIZE, bucket_minutes=settings.STREAM_BUCKET_MINUTES)
+    add_ingest_listener(_broker.publish_readings)
+
+    if settings.STREAM_CHANGE_FEED_INTERVAL > 0:
+        from database import SessionLocal
+
+        _poller = ChangeFeedPoller(_broker, SessionLocal, settings.STREAM_CHANGE_FEED_INTERVAL)
+        _poller.start()
+
+def stop_stream_broker():
+    global _broker, _poller
+    if _poller is not None:
+        _poller.stop()
+        _poller = None
+    if _broker is not None:
+        remove_ingest_listener(_broker.publish_readings)
+        _broker = None
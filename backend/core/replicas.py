@@ -0,0 +1,228 @@
+"""
+Routing of analytics reads to read replicas.
+
+Endpoints that only read take their session from `get_read_db`, which hands
+out a session on one of the READ_REPLICA_URLS, round robin, or on the
+primary when no replica qualifies:
+
+- Lag: every REPLICA_CHECK_SECONDS, a background thread of each worker reads
+  the heartbeat row every replica has applied and then stamps a new one on
+  the primary with the primary's clock, so no request waits for the check.
+  Processes without the thread (jobs, management commands) check inline. A replica showing the previous stamp has caught
+  up; otherwise its lag is the age of the stamp it shows. Replicas more than
+  REPLICA_MAX_LAG_SECONDS behind, or that fail the check, are skipped.
+- Read-your-writes: synchronous ingest stamps users.last_write_at with the
+  primary's clock, and a user's reads stay on the primary until a replica
+  shows a heartbeat later than that stamp. This holds across workers.
+
+Watermarks handed out by a replica session (delta reads, rollup caches) are
+capped at the replica's heartbeat, so rows it has not applied yet are
+picked up by the next request. Without READ_REPLICA_URLS every read uses
+the primary and nothing else changes.
+"""
+from datetime import datetime
+from itertools import count
+from typing import Iterable, List, Optional
+import logging
+import threading
+import time
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from config import settings
+from core.metrics import metrics
+from database import SessionLocal
+from models.energy_data import Project
+from models.replica import ReplicaHeartbeat
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_ID = 1
+
+def _as_datetime(value) -> Optional[datetime]:
+    # SQLite returns timestamps as strings
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value is not None and value.tzinfo is not None:
+        value = value.replace(tzinfo=None)
+    return value
+
+class Replica:
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.engine = create_engine(url)
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        # Latest primary heartbeat the replica has applied
+        self.applied: Optional[datetime] = None
+        self.lag: Optional[float] = None
+        self.available = False
+
+class ReadRouter:
+    """
+    Picks the database of each analytics read, per worker
+    """
+
+    def __init__(self, urls: List[str]):
+        self.replicas = [Replica(f"replica-{i}", url) for i, url in enumerate(urls)]
+        self._lock = threading.Lock()
+        self._checked_at = float("-inf")
+        self._last_beat: Optional[datetime] = None
+        self._next = count()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """
+        Check the replicas in the background from now on
+        """
+        if not self.replicas or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="replica-heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=settings.REPLICA_CHECK_SECONDS + 5)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Replica check failed: {e}", exc_info=True)
+            if self._stop.wait(settings.REPLICA_CHECK_SECONDS):
+                return
+
+    def _beat(self) -> datetime:
+        primary = SessionLocal()
+        try:
+            now = _as_datetime(primary.scalar(select(func.now())))
+            heartbeat = primary.get(ReplicaHeartbeat, HEARTBEAT_ID)
+            if heartbeat is None:
+                primary.add(ReplicaHeartbeat(id=HEARTBEAT_ID, beat=now))
+            else:
+                heartbeat.beat = now
+            primary.commit()
+            return now
+        finally:
+            primary.close()
+
+    def check(self):
+        """
+        Measure every replica's lag and stamp a new heartbeat on the primary
+        """
+        for replica in self.replicas:
+            try:
+                session = replica.session_factory()
+                try:
+                    replica.applied = _as_datetime(session.scalar(
+                        select(ReplicaHeartbeat.beat).where(ReplicaHeartbeat.id == HEARTBEAT_ID)
+                    ))
+                finally:
+                    session.close()
+                replica.available = True
+            except Exception as e:
+                if replica.available:
+                    logger.warning(f"Read replica {replica.name} is unavailable: {e}")
+                replica.available = False
+                metrics.increment("replicas.check_errors", labels={"pool": replica.name})
+
+        try:
+            beat = self._beat()
+        except Exception as e:
+            logger.error(f"Could not write the replica heartbeat: {e}")
+            beat = None
+
+        for replica in self.replicas:
+            if beat is None or replica.applied is None:
+                replica.lag = None
+            elif self._last_beat is not None and replica.applied >= self._last_beat:
+                replica.lag = 0.0
+            else:
+                replica.lag = max(0.0, (beat - replica.applied).total_seconds())
+            metrics.set_gauge("replicas.lag_seconds", -1 if replica.lag is None else replica.lag, labels={"pool": replica.name})
+        if beat is not None:
+            self._last_beat = beat
+
+    def check_if_due(self):
+        # Only used without the background thread
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked_at < settings.REPLICA_CHECK_SECONDS:
+                return
+            self._checked_at = now
+        self.check()
+
+    def session(self, last_write_at: Optional[datetime] = None) -> Session:
+        """
+        A session on a replica that is within REPLICA_MAX_LAG_SECONDS and
+        has applied the caller's last write, otherwise on the primary
+        """
+        if not self.replicas:
+            return SessionLocal()
+        if self._thread is None:
+            self.check_if_due()
+
+        candidates = [replica for replica in self.replicas if replica.available]
+        reason = "unavailable"
+        if candidates:
+            candidates = [
+                replica for replica in candidates
+                if replica.lag is not None and replica.lag <= settings.REPLICA_MAX_LAG_SECONDS
+            ]
+            reason = "lagging"
+        if candidates and last_write_at is not None:
+            candidates = [replica for replica in candidates if replica.applied > last_write_at]
+            reason = "read_your_writes"
+
+        if not candidates:
+            metrics.increment("replicas.reads", labels={"pool": "primary", "reason": reason})
+            return SessionLocal()
+
+        replica = candidates[next(self._next) % len(candidates)]
+        metrics.increment("replicas.reads", labels={"pool": replica.name, "reason": "replica"})
+        session = replica.session_factory()
+        session.info["replicated_until"] = replica.applied
+        return session
+
+read_router = ReadRouter([url.strip() for url in settings.READ_REPLICA_URLS.split(",") if url.strip()])
+
+def start_replica_checks():
+    read_router.start()
+
+def stop_replica_checks():
+    read_router.stop()
+
+def dispose_engines():
+    """
+    Drop the replica connections inherited from a parent process, e.g. the
+    Gunicorn master, without closing them under the parent
+    """
+    for replica in read_router.replicas:
+        replica.engine.dispose(close=False)
+
+def mark_user_write(db: Session, user: User):
+    """
+    Stamp the user's last write with the primary's clock, after the write
+    has committed, so their next reads wait for a replica that has it
+    """
+    if not read_router.replicas:
+        return
+    db.query(User).filter(User.id == user.id).update({User.last_write_at: func.now()}, synchronize_session=False)
+    db.commit()
+
+def mark_project_writes(db: Session, project_ids: Iterable[int]):
+    """
+    Stamp the last write of the projects' owners, for writes made on their
+    behalf after the request, e.g. by the ingest buffer
+    """
+    if not read_router.replicas:
+        return
+    owners = select(Project.user_id).where(Project.id.in_(list(project_ids)))
+    db.query(User).filter(User.id.in_(owners)).update({User.last_write_at: func.now()}, synchronize_session=False)
+    db.commit()
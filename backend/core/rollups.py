@@ -0,0 +1,322 @@
+"""
+Hourly rollups of the reading tables.
+
+Refreshes are incremental: only the (project, source, hour) buckets that
+have readings inserted or updated since the previous refresh's watermark are
+recomputed from raw readings, with a quantile sketch of their demand
+(core.sketches), and upserted, so a refresh costs in proportion to what
+changed rather than to the size of the reading tables. Changed hours are
+read back one contiguous span at a time, so a late reading for an old hour
+costs that hour, not a scan up to now.
+
+The first refresh builds a rollup in full. It runs from `python manage.py
+refresh-rollups` or as a job of the job runner (core.jobs), never inside a
+request: a read path finding the rollup unbuilt queues that job and answers
+503 with a Retry-After until it is built, rather than totals of an empty
+rollup.
+Buckets of archived months (core.archive) are kept when their readings
+leave the database, and recomputed with the archived readings if a late
+reading lands in them.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+import logging
+import threading
+import time
+
+import numpy as np
+from fastapi import HTTPException, status
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from config import settings
+from core.archive import archived_readings
+from core.energy_queries import changed_since, current_watermark
+from core.ingest import upsert_statement
+from core.metrics import metrics
+from core.sketches import encode, sketch_groups
+from models.energy_data import EnergyConsumption, EnergyGeneration, EnergySourceType, Project
+from models.rollups import ConsumptionHourly, GenerationHourly, RollupState
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS = {
+    "consumption": (EnergyConsumption, ConsumptionHourly),
+    "generation": (EnergyGeneration, GenerationHourly),
+}
+ROLLUP_KEY = ("project_id", "source_type", "hour")
+ROLLUP_COLUMNS = ("value_kwh", "value_min", "value_max", "readings", "sketch")
+
+SOURCES = list(EnergySourceType)
+SOURCE_CODES = {source: code for code, source in enumerate(SOURCES)}
+# Buckets are keyed source * SOURCE_KEY_FACTOR + hours since the epoch
+SOURCE_KEY_FACTOR = 1 << 32
+
+# Series are (project_id, source_type)
+Series = Tuple[int, EnergySourceType]
+
+def hour_bucket(column, dialect: str):
+    """
+    SQL expression truncating a timestamp column to the hour
+    """
+    if dialect == "mysql":
+        return func.date_format(column, "%Y-%m-%d %H:00:00")
+    if dialect == "sqlite":
+        return func.strftime("%Y-%m-%d %H:00:00", column)
+    if dialect == "postgresql":
+        return func.date_trunc("hour", column)
+    raise ValueError(f"Rollups are not supported for the {dialect} dialect")
+
+def _as_hour(value) -> datetime:
+    # MySQL and SQLite return the truncated hour as a string
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.replace(tzinfo=None)
+
+def hour_spans(hours: Sequence[datetime]) -> List[Tuple[datetime, datetime]]:
+    """
+    The runs of consecutive hours, as [first, end) ranges
+    """
+    spans: List[List[datetime]] = []
+    for hour in sorted(set(hours)):
+        if spans and spans[-1][1] == hour:
+            spans[-1][1] = hour + timedelta(hours=1)
+        else:
+            spans.append([hour, hour + timedelta(hours=1)])
+    return [(first, end) for first, end in spans]
+
+def _aggregate(db: Session, kind: str, buckets: Set[Tuple[int, EnergySourceType, datetime]]) -> List[dict]:
+    """
+    Rollup rows of the changed buckets, computed from their raw readings in
+    one pass per project and span of changed hours: totals, extremes, counts
+    and the demand sketch. Readings of the buckets' hours that were archived
+    are merged in.
+    """
+    model = ROLLUPS[kind][0]
+    rows = []
+    by_project: Dict[int, List[datetime]] = {}
+    for project_id, _, bucket in buckets:
+        by_project.setdefault(project_id, []).append(bucket)
+
+    spans = [(project_id, first, end) for project_id, hours in by_project.items() for first, end in hour_spans(hours)]
+    for project_id, first, end in spans:
+        readings = db.query(model.source_type, model.timestamp, model.value_kwh).filter(
+            model.project_id == project_id,
+            model.timestamp >= first,
+            model.timestamp < end,
+        ).all()
+        archived = archived_readings(db, kind, project_id, first, end)
+        if not readings and archived is None:
+            continue
+
+        sources = np.fromiter((SOURCE_CODES[row.source_type] for row in readings), dtype=np.int64, count=len(readings))
+        seconds = np.array([row.timestamp for row in readings], dtype="datetime64[s]").astype(np.int64)
+        values = np.fromiter((row.value_kwh for row in readings), dtype=np.float64, count=len(readings))
+        if archived is not None:
+            archived_sources, archived_seconds, archived_values = archived
+            codes = np.fromiter((SOURCE_CODES[EnergySourceType(value)] for value in archived_sources), dtype=np.int64, count=len(archived_sources))
+            sources = np.r_[sources, codes]
+            seconds = np.r_[seconds, archived_seconds]
+            values = np.r_[values, archived_values]
+        keys, group = np.unique(sources * SOURCE_KEY_FACTOR + seconds // 3600, return_inverse=True)
+        n = len(keys)
+
+        count = np.bincount(group, minlength=n)
+        total = np.bincount(group, weights=values, minlength=n)
+        low = np.full(n, np.inf)
+        high = np.full(n, -np.inf)
+        np.minimum.at(low, group, values)
+        np.maximum.at(high, group, values)
+        # Each of a bucket's readings covers 1/count of the hour, so kWh x count is its average kW
+        sketches = sketch_groups(group, values * count[group], n)
+
+        for i, key in enumerate(keys):
+            source = SOURCES[key // SOURCE_KEY_FACTOR]
+            bucket = np.datetime64(int(key % SOURCE_KEY_FACTOR) * 3600, "s").astype(datetime)
+            if (project_id, source, bucket) in buckets:
+                rows.append({
+                    "project_id": project_id,
+                    "source_type": source,
+                    "hour": bucket,
+                    "value_kwh": float(total[i]),
+                    "value_min": float(low[i]),
+                    "value_max": float(high[i]),
+                    "readings": int(count[i]),
+                    "sketch": encode(sketches[i]),
+                })
+    return rows
+
+def _queue_initial_build(kind: str):
+    from core.jobs import ROLLUPS_JOB_USER_ID, submit_job
+
+    job, created = submit_job(ROLLUPS_JOB_USER_ID, "rollups", {"kind": kind, "format": "csv"})
+    if created:
+        logger.warning(
+            f"The {kind} rollup is not built yet, queued job {job['id']} to build it "
+            f"(or run `python manage.py refresh-rollups`)"
+        )
+
+def _not_built(kind: str) -> HTTPException:
+    # Reads of one rollup tend to need the other too, so both are queued at once
+    for other in ROLLUPS:
+        if other == kind or f"{other}_hourly" not in _built:
+            _queue_initial_build(other)
+    metrics.increment("rollups.not_built", labels={"rollup": f"{kind}_hourly"})
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=f"The {kind} rollups are being built, retry after the Retry-After delay",
+        headers={"Retry-After": str(max(1, int(settings.ROLLUP_REFRESH_SECONDS)))},
+    )
+
+# Rollups this process has seen built, which stay built
+_built: Set[str] = set()
+
+def refresh_rollups(db: Session, kind: str, initial_build: bool = True) -> Set[Series]:
+    """
+    Bring the hourly rollup of `kind` up to date and commit. Returns the
+    series that had buckets recomputed. Without `initial_build`, a rollup
+    that was never built is queued for the job runner to build instead,
+    and HTTPException 503 is raised.
+    """
+    model, rollup_model = ROLLUPS[kind]
+    name = f"{kind}_hourly"
+    dialect = db.get_bind().dialect.name
+    start = time.perf_counter()
+
+    state = db.get(RollupState, name)
+    if state is None and not initial_build:
+        raise _not_built(kind)
+    since = state.watermark if state else None
+    # Taken before reading, like the delta API, so nothing committed meanwhile is missed
+    watermark = current_watermark(db)
+
+    hour = hour_bucket(model.timestamp, dialect)
+    changed_query = db.query(model.project_id, model.source_type, hour).distinct()
+    if since is not None:
+        changed_query = changed_query.filter(changed_since(model, since))
+    buckets = {(project_id, source, _as_hour(bucket)) for project_id, source, bucket in changed_query.all()}
+
+    rows = _aggregate(db, kind, buckets) if buckets else []
+    if rows:
+        stmt = upsert_statement(rollup_model.__table__, ROLLUP_KEY, ROLLUP_COLUMNS, dialect)
+        for offset in range(0, len(rows), settings.INGEST_BATCH_SIZE):
+            db.execute(stmt, rows[offset:offset + settings.INGEST_BATCH_SIZE])
+
+    if state is None:
+        db.add(RollupState(name=name, watermark=watermark))
+    else:
+        state.watermark = watermark
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another worker built the same rollup at the same time
+        db.rollback()
+        return set()
+    _built.add(name)
+
+    metrics.observe("rollups.refresh_seconds", time.perf_counter() - start, labels={"rollup": name})
+    metrics.increment("rollups.buckets_refreshed", len(rows), labels={"rollup": name})
+    if rows:
+        logger.info(f"Refreshed {len(rows)} {name} buckets")
+    return {(project_id, source) for project_id, source, _ in buckets}
+
+_last_refresh: Dict[str, float] = {}
+_refresh_lock = threading.Lock()
+
+def refresh_rollups_if_due(db: Session, kind: str, initial_build: bool = False) -> Set[Series]:
+    """
+    Refresh at most once per ROLLUP_REFRESH_SECONDS per worker, so read
+    paths can call this on every request. The first build is left to the
+    job runner unless `initial_build`, and until it is done HTTPException
+    503 is raised.
+    """
+    name = f"{kind}_hourly"
+    if not initial_build and name not in _built:
+        # Checked on every call until built, as skipped refreshes would answer from an empty rollup
+        if db.get(RollupState, name) is None:
+            raise _not_built(kind)
+        _built.add(name)
+    with _refresh_lock:
+        now = time.monotonic()
+        if now - _last_refresh.get(kind, float("-inf")) < settings.ROLLUP_REFRESH_SECONDS:
+            return set()
+        _last_refresh[kind] = now
+    if db.info:
+        # Read paths may be on a replica or under a statement timeout, rollups
+        # are written on the primary without one
+        from database import SessionLocal
+
+        primary = SessionLocal()
+        try:
+            return refresh_rollups(primary, kind, initial_build)
+        finally:
+            primary.close()
+    return refresh_rollups(db, kind, initial_build)
+
+class ProjectRollupCache:
+    """
+    Values built per project from its hourly rollups, cached for this worker.
+
+    A project's value is rebuilt after its rollups, the project itself or its
+    rows in `project_models` (models with a project_id) change, and every
+    value after a row of `global_models` changes. Changes are found with the
+    updated_at/created_at watermark, so writes by other workers count too.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        build: Callable[[Session, List[int]], Dict[int, Any]],
+        project_models: Sequence = (),
+        global_models: Sequence = (),
+    ):
+        self.name = name
+        self._build = build
+        self._project_columns = [
+            (model, model.project_id) for model in (ConsumptionHourly, GenerationHourly, *project_models)
+        ] + [(Project, Project.id)]
+        self._global_models = global_models
+        self._lock = threading.Lock()
+        self._values: Dict[int, Any] = {}
+        self._watermark: Optional[datetime] = None
+        self._checked_at = float("-inf")
+
+    def invalidate_changed(self, db: Session):
+        """
+        Drop the values of projects whose data changed since the last check.
+        Checks at most once per ROLLUP_REFRESH_SECONDS.
+        """
+        with self._lock:
+            if time.monotonic() - self._checked_at < settings.ROLLUP_REFRESH_SECONDS:
+                return
+            self._checked_at = time.monotonic()
+        watermark = current_watermark(db)
+        if self._watermark is not None:
+            if any(db.query(model.id).filter(changed_since(model, self._watermark)).first() for model in self._global_models):
+                with self._lock:
+                    self._values.clear()
+            else:
+                changed = set()
+                for model, column in self._project_columns:
+                    changed.update(row[0] for row in db.query(column).filter(
+                        changed_since(model, self._watermark)
+                    ).distinct().all())
+                with self._lock:
+                    for project_id in changed:
+                        self._values.pop(project_id, None)
+        self._watermark = watermark
+
+    def get(self, db: Session, project_ids: List[int]) -> Dict[int, Any]:
+        with self._lock:
+            values = {project_id: self._values.get(project_id) for project_id in project_ids}
+        missing = [project_id for project_id, value in values.items() if value is None]
+        if missing:
+            start = time.perf_counter()
+            built = self._build(db, missing)
+            with self._lock:
+                self._values.update(built)
+            values.update(built)
+            metrics.observe(f"{self.name}.build_seconds", time.perf_counter() - start)
+            metrics.increment(f"{self.name}.projects_built", len(missing))
+        return values
@@ -0,0 +1,144 @@
+"""
+Idempotent schema upgrades for databases created before a model change.
+
+`Base.metadata.create_all` only creates missing tables, so constraints,
+indexes and columns added to existing tables are applied here by
+`python manage.py bootstrap`.
+"""
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+READING_TABLES = {
+    "energy_consumption": "uq_energy_consumption_reading",
+    "energy_generation": "uq_energy_generation_reading",
+}
+READING_KEY_COLUMNS = ["project_id", "source_type", "timestamp"]
+
+def _has_unique_key(inspector, table: str, columns) -> bool:
+    wanted = set(columns)
+    for constraint in inspector.get_unique_constraints(table):
+        if set(constraint["column_names"]) == wanted:
+            return True
+    for index in inspector.get_indexes(table):
+        if index.get("unique") and set(index["column_names"]) == wanted:
+            return True
+    return False
+
+def ensure_reading_unique_keys(engine: Engine):
+    """
+    Remove duplicate readings (keeping the most recent row per key) and add
+    the (project_id, source_type, timestamp) unique key
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    for table, name in READING_TABLES.items():
+        if table not in existing_tables or _has_unique_key(inspector, table, READING_KEY_COLUMNS):
+            continue
+
+        key = ", ".join(READING_KEY_COLUMNS)
+        logger.info(f"Adding unique key {name} to {table}")
+        with engine.begin() as conn:
+            # The derived table is required by MySQL, which cannot select from
+            # the table it is deleting from
+            result = conn.execute(text(
+                f"DELETE FROM {table} WHERE id NOT IN ("
+                f"SELECT keep_id FROM (SELECT MAX(id) AS keep_id FROM {table} GROUP BY {key}) AS keep)"
+            ))
+            if result.rowcount:
+                logger.warning(f"Removed {result.rowcount} duplicate readings from {table}")
+            conn.execute(text(f"CREATE UNIQUE INDEX {name} ON {table} ({key})"))
+
+ROLLUP_TABLES = {
+    "energy_consumption_hourly": "consumption_hourly",
+    "energy_generation_hourly": "generation_hourly",
+}
+
+def ensure_rollup_sketches(engine: Engine):
+    """
+    Add the demand sketch column to hourly rollups built before it existed,
+    and reset their watermarks so the next refresh rebuilds every bucket
+    with its sketch
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    for table, rollup in ROLLUP_TABLES.items():
+        if table not in existing_tables:
+            continue
+        if "sketch" in {column["name"] for column in inspector.get_columns(table)}:
+            continue
+
+        logger.info(f"Adding sketch column to {table}, its rollups will be rebuilt on the next refresh")
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN sketch TEXT"))
+            if "rollup_state" in existing_tables:
+                conn.execute(text("DELETE FROM rollup_state WHERE name = :name"), {"name": rollup})
+
+def ensure_user_last_write(engine: Engine):
+    """
+    Add users.last_write_at, used to route a user's reads after their own
+    writes (core.replicas)
+    """
+    inspector = inspect(engine)
+    if "users" not in inspector.get_table_names():
+        return
+    if "last_write_at" in {column["name"] for column in inspector.get_columns("users")}:
+        return
+
+    logger.info("Adding last_write_at column to users")
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE users ADD COLUMN last_write_at DATETIME"))
+
+def ensure_project_timezone(engine: Engine):
+    """
+    Add projects.timezone, used to bucket readings by local date
+    (core.calendar)
+    """
+    inspector = inspect(engine)
+    if "projects" not in inspector.get_table_names():
+        return
+    if "timezone" in {column["name"] for column in inspector.get_columns("projects")}:
+        return
+
+    logger.info("Adding timezone column to projects")
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE projects ADD COLUMN timezone VARCHAR(64)"))
+
+# Tables read by change feeds (core.energy_queries.changed_since), which
+# filter on created_at OR updated_at and need both indexed to avoid a scan
+CHANGE_TRACKED_TABLES = [
+    "energy_consumption",
+    "energy_generation",
+    "energy_consumption_hourly",
+    "energy_generation_hourly",
+]
+
+def ensure_change_indexes(engine: Engine):
+    """
+    Index created_at and updated_at of the change-tracked tables
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in CHANGE_TRACKED_TABLES:
+        if table not in existing_tables:
+            continue
+        indexed = {tuple(index["column_names"]) for index in inspector.get_indexes(table)}
+        for column in ("created_at", "updated_at"):
+            if (column,) in indexed:
+                continue
+            logger.info(f"Indexing {table}.{column}")
+            with engine.begin() as conn:
+                conn.execute(text(f"CREATE INDEX ix_{table}_{column} ON {table} ({column})"))
+
+def upgrade_schema(engine: Engine):
+    ensure_reading_unique_keys(engine)
+    ensure_rollup_sketches(engine)
+    ensure_user_last_write(engine)
+    ensure_project_timezone(engine)
+    ensure_change_indexes(engine)
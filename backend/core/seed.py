@@ -0,0 +1,437 @@
+"""
+Demo and benchmark datasets, written through the database's bulk paths.
+
+`python manage.py seed` creates the demo user and projects and generates
+their readings (`demo`), generates any number of benchmark projects at any
+reading interval (`generate`), or loads readings from a CSV or Parquet
+fixture (`load`). Generated readings are deterministic for a given seed:
+solar follows the sun and the seasons, wind is smoothed Weibull noise and
+grid, geothermal and biomass are baseload with a working-hours bump.
+
+Readings are written in batches of SEED_BATCH_ROWS, bypassing the ORM and
+the ingest listeners (rollups and hot windows catch up through the
+created_at watermarks):
+
+- MySQL: `LOAD DATA LOCAL INFILE` from a temporary CSV file when the server
+  allows local infile, otherwise multi-row INSERTs (PyMySQL rewrites
+  `executemany` into statements of many rows). Unique and foreign key
+  checks are switched off for the loading session.
+- Other databases: `executemany` of a batch in one transaction.
+
+When a reading table is empty, its secondary indexes are dropped before the
+load and built once afterwards, which is much faster than maintaining them
+row by row. The unique reading key is kept, as it also backs the foreign
+key on project_id.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from config import settings
+from core.ingest import READING_MODELS
+from core.security import get_password_hash
+from models.energy_data import EnergySourceType, Project
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("auto", "load-data", "insert")
+
+# Mean kWh per hour of each project's consumption and generation sources
+DEMO_PROJECTS = [
+    {
+        "name": "Downtown Office Tower",
+        "description": "Main Office asset",
+        "consumption": {EnergySourceType.GRID: 1.07},
+        "generation": {},
+    },
+    {
+        "name": "Riverside University",
+        "description": "Regional HQ asset",
+        "consumption": {EnergySourceType.GRID: 0.49, EnergySourceType.BIOMASS: 0.64, EnergySourceType.SOLAR: 0.57},
+        "generation": {EnergySourceType.BIOMASS: 0.64, EnergySourceType.SOLAR: 0.57},
+    },
+    {
+        "name": "Sunridge Solar Facility",
+        "description": "Solar Plant asset",
+        "consumption": {},
+        "generation": {EnergySourceType.SOLAR: 0.81},
+    },
+    {
+        "name": "Hybrid Wind-Solar Farm",
+        "description": "Wind Farm asset",
+        "consumption": {},
+        "generation": {EnergySourceType.SOLAR: 0.80, EnergySourceType.WIND: 0.96},
+    },
+    {
+        "name": "Regional Distribution Hub",
+        "description": "Eco Campus asset",
+        "consumption": {EnergySourceType.GRID: 0.86, EnergySourceType.GEOTHERMAL: 1.49, EnergySourceType.WIND: 0.25},
+        "generation": {EnergySourceType.GEOTHERMAL: 1.49, EnergySourceType.WIND: 0.25},
+    },
+    {
+        "name": "Northpoint Logistics Park",
+        "description": "Industrial Site asset",
+        "consumption": {EnergySourceType.GRID: 1.12, EnergySourceType.SOLAR: 0.61, EnergySourceType.WIND: 0.52},
+        "generation": {EnergySourceType.SOLAR: 0.61, EnergySourceType.WIND: 0.52},
+    },
+]
+DEMO_LOCATION = "Demo Location"
+DEMO_USER = {"email": "demo@example.com", "username": "demo", "password": "password"}
+BENCHMARK_USER = {"email": "benchmark@example.com", "username": "benchmark", "password": "password"}
+
+SOURCE_ORDER = {source: i for i, source in enumerate(EnergySourceType)}
+KIND_ORDER = {kind: i for i, kind in enumerate(READING_MODELS)}
+
+def reading_schema(kind: str) -> pa.Schema:
+    fields = [
+        ("project_id", pa.int64()),
+        ("timestamp", pa.timestamp("s")),
+        ("value_kwh", pa.float64()),
+        # Enum names, as SQLAlchemy stores them
+        ("source_type", pa.string()),
+    ]
+    if kind == "generation":
+        fields.append(("efficiency", pa.float64()))
+    return pa.schema(fields)
+
+def reading_values(
+    source: EnergySourceType,
+    timestamps: np.ndarray,
+    mean_kwh_per_hour: float,
+    interval_minutes: int,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """
+    Synthetic kWh of the readings of one source at `timestamps`
+    (datetime64[s]), averaging `mean_kwh_per_hour`
+    """
+    seconds = timestamps.astype("int64")
+    hour = (seconds % 86400) / 3600.0
+    day_of_year = (seconds / 86400.0) % 365.25
+    # 1.25 at midsummer, 0.75 at midwinter
+    season = 1 + 0.25 * np.cos(2 * np.pi * (day_of_year - 172) / 365.25)
+    n = len(timestamps)
+
+    if source == EnergySourceType.SOLAR:
+        shape = np.clip(np.sin(np.pi * (hour - 6) / 12), 0, None) * season * rng.uniform(0.5, 1.0, n)
+    elif source == EnergySourceType.WIND:
+        # A moving average of Weibull gusts keeps consecutive readings close
+        window = max(1, 360 // interval_minutes)
+        gusts = np.convolve(rng.weibull(2.0, n + window - 1), np.ones(window) / window, mode="valid")
+        shape = gusts ** 2 * (2 - season)
+    elif source == EnergySourceType.HYDRO:
+        shape = season * rng.normal(1, 0.05, n)
+    else:
+        working_hours = (hour >= 8) & (hour < 18)
+        bump = 0.4 if source == EnergySourceType.GRID else 0.1
+        shape = 1 + bump * working_hours + rng.normal(0, 0.08, n)
+    shape = np.clip(shape, 0, None)
+
+    scale = mean_kwh_per_hour * interval_minutes / 60.0 / (shape.mean() or 1.0)
+    return np.round(shape * scale, 3)
+
+def reading_efficiency(timestamps: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Synthetic efficiency (%) around 87.5, declining by 0.8 points a year and
+    missing for 2% of the readings (NaN)
+    """
+    years = (timestamps - timestamps[0]).astype("int64") / (86400 * 365.25)
+    efficiency = np.round(np.clip(rng.normal(87.5, 3.0, len(timestamps)) - 0.8 * years, 70, 98), 2)
+    efficiency[rng.random(len(timestamps)) < 0.02] = np.nan
+    return efficiency
+
+def generate_readings(
+    kind: str,
+    project_sources: List[Tuple[int, Dict[EnergySourceType, float]]],
+    start: datetime,
+    end: datetime,
+    interval_minutes: int = 60,
+    seed: int = 1,
+) -> Iterator[pa.Table]:
+    """
+    Tables of synthetic readings from `start` (inclusive) to `end`
+    (exclusive), one per project and source, in the reading_schema
+    """
+    step = np.timedelta64(interval_minutes * 60, "s")
+    timestamps = np.arange(np.datetime64(start, "s"), np.datetime64(end, "s"), step)
+    if not len(timestamps):
+        return
+    schema = reading_schema(kind)
+
+    for project_id, sources in project_sources:
+        for source, mean in sources.items():
+            rng = np.random.default_rng([seed, project_id, SOURCE_ORDER[source], KIND_ORDER[kind]])
+            columns = {
+                "project_id": np.full(len(timestamps), project_id, dtype=np.int64),
+                "timestamp": timestamps,
+                "value_kwh": reading_values(source, timestamps, mean, interval_minutes, rng),
+                "source_type": np.full(len(timestamps), source.name, dtype=object),
+            }
+            if kind == "generation":
+                efficiency = reading_efficiency(timestamps, rng)
+                columns["efficiency"] = pa.array(efficiency, mask=np.isnan(efficiency))
+            yield pa.table(columns, schema=schema)
+
+def read_fixture(path: str, kind: str, batch_rows: Optional[int] = None) -> Iterator[pa.Table]:
+    """
+    Batches of readings from a CSV or Parquet file with project_id,
+    timestamp, value_kwh, source_type and (generation) efficiency columns.
+    Source types may be given as names or values, in any case.
+    """
+    batch_rows = batch_rows or settings.SEED_BATCH_ROWS
+    schema = reading_schema(kind)
+    if path.endswith(".parquet"):
+        batches = pq.ParquetFile(path).iter_batches(batch_size=batch_rows, columns=schema.names)
+    else:
+        batches = pacsv.open_csv(
+            path,
+            convert_options=pacsv.ConvertOptions(
+                column_types={name: schema.field(name).type for name in schema.names},
+                include_columns=schema.names,
+                timestamp_parsers=["%Y-%m-%d %H:%M:%S", pacsv.ISO8601],
+            ),
+        )
+
+    valid = pa.array([source.name for source in EnergySourceType])
+    for batch in batches:
+        table = pa.Table.from_batches([batch])
+        sources = pc.utf8_upper(table["source_type"].cast(pa.string()))
+        unknown = pc.filter(sources, pc.invert(pc.is_in(sources, value_set=valid)))
+        if len(unknown):
+            raise ValueError(f"Unknown source types in {path}: {sorted(set(unknown.to_pylist()))}")
+        table = table.set_column(table.schema.get_field_index("source_type"), "source_type", sources)
+        yield table.select(schema.names).cast(schema)
+
+def _rebatch(tables: Iterable[pa.Table], batch_rows: int) -> Iterator[pa.Table]:
+    pending: List[pa.Table] = []
+    pending_rows = 0
+    for table in tables:
+        pending.append(table)
+        pending_rows += table.num_rows
+        while pending_rows >= batch_rows:
+            combined = pa.concat_tables(pending)
+            yield combined.slice(0, batch_rows)
+            pending = [combined.slice(batch_rows)]
+            pending_rows = pending[0].num_rows
+    if pending_rows:
+        yield pa.concat_tables(pending)
+
+def seed_engine() -> Engine:
+    """
+    Engine for bulk loads. On MySQL the client must opt in to LOAD DATA
+    LOCAL INFILE, which the application's engine does not.
+    """
+    if settings.DATABASE_URL.startswith("mysql"):
+        return create_engine(settings.DATABASE_URL, connect_args={"local_infile": True})
+    from database import engine
+    return engine
+
+def _deferrable_indexes(engine: Engine, table: str) -> List[Tuple[str, List[str]]]:
+    # Non-unique indexes that no foreign key depends on
+    inspector = inspect(engine)
+    foreign_key_columns = {
+        column
+        for foreign_key in inspector.get_foreign_keys(table)
+        for column in foreign_key["constrained_columns"]
+    }
+    return [
+        (index["name"], index["column_names"])
+        for index in inspector.get_indexes(table)
+        if not index.get("unique") and index["column_names"] and index["column_names"][0] not in foreign_key_columns
+    ]
+
+def _drop_index(engine: Engine, table: str, name: str):
+    statement = f"DROP INDEX {name} ON {table}" if engine.dialect.name == "mysql" else f"DROP INDEX {name}"
+    with engine.begin() as conn:
+        conn.execute(text(statement))
+
+def _create_index(engine: Engine, table: str, name: str, columns: List[str]):
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+
+def _timestamp_strings(engine: Engine, timestamps: pa.ChunkedArray) -> pa.ChunkedArray:
+    # "YYYY-MM-DD HH:MM:SS", much faster than pc.strftime
+    strings = timestamps.cast(pa.string())
+    if engine.dialect.name == "sqlite":
+        # SQLite stores SQLAlchemy DateTimes as strings with microseconds and
+        # compares them as strings, so the seeded ones must match exactly
+        strings = pc.binary_join_element_wise(strings, ".000000", "")
+    return strings
+
+def _insert_batch(cursor, engine: Engine, table: str, batch: pa.Table):
+    placeholder = "?" if engine.dialect.paramstyle == "qmark" else "%s"
+    columns = [
+        _timestamp_strings(engine, column) if name == "timestamp" else column
+        for name, column in zip(batch.column_names, batch.columns)
+    ]
+    cursor.executemany(
+        f"INSERT INTO {table} ({', '.join(batch.column_names)}) VALUES ({', '.join([placeholder] * len(columns))})",
+        list(zip(*(column.to_pylist() for column in columns))),
+    )
+
+def _load_data_batch(cursor, engine: Engine, table: str, batch: pa.Table):
+    timestamps = _timestamp_strings(engine, batch["timestamp"])
+    batch = batch.set_column(batch.schema.get_field_index("timestamp"), "timestamp", timestamps)
+    handle, path = tempfile.mkstemp(suffix=".csv")
+    os.close(handle)
+    try:
+        pacsv.write_csv(batch, path, write_options=pacsv.WriteOptions(include_header=False))
+        # Empty fields would load as 0, not NULL
+        columns = [f"@{name}" if name == "efficiency" else name for name in batch.column_names]
+        nullable = " SET efficiency = NULLIF(@efficiency, '')" if "efficiency" in batch.column_names else ""
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} "
+            f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' LINES TERMINATED BY '\\n' "
+            f"({', '.join(columns)}){nullable}",
+            (path,),
+        )
+    finally:
+        os.remove(path)
+
+def bulk_load(
+    engine: Engine,
+    kind: str,
+    tables: Iterable[pa.Table],
+    method: str = "auto",
+    batch_rows: Optional[int] = None,
+) -> int:
+    """
+    Write readings to the kind's table in batches of `batch_rows`, through
+    LOAD DATA (MySQL), multi-row INSERTs or executemany, with the secondary
+    indexes built afterwards when the table was empty. With method "auto",
+    LOAD DATA is tried first and INSERTs are used when the server refuses
+    it. Returns the number of readings written.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown load method {method}, expected one of {METHODS}")
+    batch_rows = batch_rows or settings.SEED_BATCH_ROWS
+    table = READING_MODELS[kind].__tablename__
+    use_load_data = engine.dialect.name == "mysql" and method != "insert"
+    if method == "load-data" and not use_load_data:
+        raise ValueError("LOAD DATA is only available on MySQL")
+
+    with engine.connect() as conn:
+        empty = conn.execute(select(READING_MODELS[kind].id).limit(1)).first() is None
+    deferred = _deferrable_indexes(engine, table) if empty else []
+    for name, _ in deferred:
+        _drop_index(engine, table, name)
+
+    start = time.perf_counter()
+    written = 0
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if engine.dialect.name == "mysql":
+            cursor.execute("SET SESSION unique_checks = 0, foreign_key_checks = 0")
+        for batch in _rebatch(tables, batch_rows):
+            if use_load_data:
+                try:
+                    _load_data_batch(cursor, engine, table, batch)
+                except Exception as e:
+                    if method == "load-data":
+                        raise
+                    logger.warning(f"LOAD DATA LOCAL INFILE is not available ({e}), using multi-row INSERTs")
+                    connection.rollback()
+                    use_load_data = False
+            if not use_load_data:
+                _insert_batch(cursor, engine, table, batch)
+            connection.commit()
+            written += batch.num_rows
+            logger.info(f"Loaded {written:,} {kind} readings ({written / (time.perf_counter() - start):,.0f}/s)")
+    finally:
+        if engine.dialect.name == "mysql":
+            # Discarded rather than returned to the pool with the checks off
+            connection.invalidate()
+        else:
+            connection.close()
+        for name, columns in deferred:
+            index_start = time.perf_counter()
+            _create_index(engine, table, name, columns)
+            logger.info(f"Built index {name} on {table} in {time.perf_counter() - index_start:.2f}s")
+    return written
+
+def _get_or_create_user(db: Session, spec: dict) -> User:
+    user = db.query(User).filter(User.email == spec["email"]).first()
+    if user is None:
+        user = User(
+            email=spec["email"],
+            username=spec["username"],
+            hashed_password=get_password_hash(spec["password"]),
+            is_active=True,
+        )
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+    return user
+
+def _get_or_create_project(db: Session, user: User, name: str, description: str) -> Project:
+    project = db.query(Project).filter(Project.user_id == user.id, Project.name == name).first()
+    if project is None:
+        project = Project(name=name, description=description, location=DEMO_LOCATION, user_id=user.id)
+        db.add(project)
+        db.commit()
+        db.refresh(project)
+    return project
+
+def has_readings(db: Session) -> bool:
+    return any(db.query(model.id).first() is not None for model in READING_MODELS.values())
+
+def seed_projects(db: Session, user_spec: dict, count: Optional[int] = None, name: Optional[str] = None) -> List[Tuple[Project, dict]]:
+    """
+    Get or create the user and its projects: the demo projects, or `count`
+    projects cycling through their source mixes named "{name} {n}"
+    """
+    user = _get_or_create_user(db, user_spec)
+    if count is None:
+        return [
+            (_get_or_create_project(db, user, spec["name"], spec["description"]), spec)
+            for spec in DEMO_PROJECTS
+        ]
+    projects = []
+    for i in range(count):
+        spec = DEMO_PROJECTS[i % len(DEMO_PROJECTS)]
+        projects.append((_get_or_create_project(db, user, f"{name} {i + 1}", spec["description"]), spec))
+    return projects
+
+def seed_readings(
+    engine: Engine,
+    projects: List[Tuple[Project, dict]],
+    start: datetime,
+    end: datetime,
+    interval_minutes: int = 60,
+    seed: int = 1,
+    method: str = "auto",
+    batch_rows: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    Generate and bulk load the projects' consumption and generation readings
+    from `start` to `end`. Returns the number of readings per kind.
+    """
+    written = {}
+    for kind in READING_MODELS:
+        project_sources = [(project.id, spec[kind]) for project, spec in projects if spec[kind]]
+        tables = generate_readings(kind, project_sources, start, end, interval_minutes, seed)
+        written[kind] = bulk_load(engine, kind, tables, method, batch_rows)
+    return written
+
+def default_range(days: int, start: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """
+    `days` days from `start`, or up to the start of the current UTC hour
+    """
+    if start is None:
+        end = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        return end - timedelta(days=days), end
+    return start, start + timedelta(days=days)
@@ -0,0 +1,89 @@
+"""
+Mergeable quantile sketches of demand values.
+
+A sketch counts values in logarithmic bins: value v > 0 falls in bin
+k = ceil(log(v) / log(gamma)) with gamma = (1 + a) / (1 - a), and every bin
+is read back as 2 * gamma**k / (gamma + 1). Any quantile is therefore
+returned within relative error a (RELATIVE_ACCURACY) of the true value at
+that rank, however many sketches are merged (DDSketch). Values at or below
+MIN_VALUE are counted in a zero bin. Merging is adding the counts of equal
+bins, so sketches of hours combine into days, ranges and portfolios exactly
+as if the raw values had been sketched at once.
+
+Sketches are stored as JSON `[[bins...], [counts...]]`.
+"""
+from typing import Iterable, List, Sequence, Tuple
+import json
+import math
+
+import numpy as np
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+MIN_VALUE = 1e-9
+ZERO_BIN = math.floor(math.log(MIN_VALUE) / LOG_GAMMA) - 1
+
+Sketch = Tuple[np.ndarray, np.ndarray]
+
+def bin_of(values: np.ndarray) -> np.ndarray:
+    bins = np.full(len(values), ZERO_BIN, dtype=np.int64)
+    positive = values > MIN_VALUE
+    bins[positive] = np.ceil(np.log(values[positive]) / LOG_GAMMA).astype(np.int64)
+    return bins
+
+def bin_value(bins: np.ndarray) -> np.ndarray:
+    return np.where(bins == ZERO_BIN, 0.0, 2 * np.power(GAMMA, bins.astype(np.float64)) / (GAMMA + 1))
+
+def sketch_groups(groups: np.ndarray, values: np.ndarray, n_groups: int) -> List[Sketch]:
+    """
+    One sketch per group of values, for group ids 0..n_groups-1
+    """
+    bins = bin_of(values)
+    # Sorted by group then bin: each run of equal (group, bin) is one count
+    order = np.lexsort((bins, groups))
+    groups, bins = groups[order], bins[order]
+    run_starts = np.flatnonzero(np.r_[True, (groups[1:] != groups[:-1]) | (bins[1:] != bins[:-1])])
+    run_counts = np.diff(np.r_[run_starts, len(bins)])
+    run_groups = groups[run_starts]
+    bounds = np.searchsorted(run_groups, np.arange(n_groups + 1))
+    return [
+        (bins[run_starts[lo:hi]], run_counts[lo:hi])
+        for lo, hi in zip(bounds[:-1], bounds[1:])
+    ]
+
+def merge(sketches: Iterable[Sketch]) -> Sketch:
+    sketches = list(sketches)
+    if not sketches:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return merge_flat(np.concatenate([s[0] for s in sketches]), np.concatenate([s[1] for s in sketches]))
+
+def merge_flat(bins: np.ndarray, counts: np.ndarray) -> Sketch:
+    """
+    Merge sketches given as their concatenated bins and counts
+    """
+    if len(bins) == 0:
+        return bins.astype(np.int64), counts.astype(np.int64)
+    lowest = bins.min()
+    totals = np.bincount(bins - lowest, weights=counts)
+    present = np.flatnonzero(totals)
+    return present + lowest, totals[present].astype(np.int64)
+
+def quantiles(sketch: Sketch, qs: Sequence[float]) -> np.ndarray:
+    """
+    Values at quantiles qs (0..1) of a merged sketch, NaN if it is empty
+    """
+    bins, counts = sketch
+    total = counts.sum()
+    if total == 0:
+        return np.full(len(qs), np.nan)
+    cumulative = np.cumsum(counts)
+    ranks = np.asarray(qs, dtype=np.float64) * (total - 1)
+    return bin_value(bins[np.searchsorted(cumulative, ranks, side="right")])
+
+def encode(sketch: Sketch) -> str:
+    return json.dumps([sketch[0].tolist(), sketch[1].tolist()], separators=(",", ":"))
+
+def decode(text: str) -> Sketch:
+    bins, counts = json.loads(text)
+    return np.asarray(bins, dtype=np.int64), np.asarray(counts, dtype=np.int64)
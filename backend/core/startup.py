@@ -0,0 +1,76 @@
+import importlib
+import logging
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Modules only needed by the analytics endpoints. They are imported lazily by
+# the handlers, and warmed up front by the production launcher.
+ANALYTICS_MODULES = ("numpy", "pandas", "pyarrow")
+
+class StartupReport:
+    """
+    Records cold-start timings for this process: import time per module,
+    named startup phases and the time until the first request was served
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.imports: Dict[str, float] = {}
+        self.phases: Dict[str, float] = {}
+        self.first_request_seconds: Optional[float] = None
+
+    def _elapsed(self) -> float:
+        return round(time.perf_counter() - self.started_at, 4)
+
+    def timed_import(self, name: str):
+        """
+        Import a module and record how long it took. Modules that were
+        already imported are not recorded again.
+        """
+        if name in sys.modules:
+            return sys.modules[name]
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        self.imports[name] = round(time.perf_counter() - start, 4)
+        return module
+
+    def mark(self, phase: str):
+        self.phases[phase] = self._elapsed()
+
+    def mark_first_request(self):
+        if self.first_request_seconds is not None:
+            return
+        self.first_request_seconds = self._elapsed()
+        logger.info(f"Startup report: {self.as_dict()}")
+
+    def as_dict(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "imports": dict(self.imports),
+            "phases": dict(self.phases),
+            "time_to_first_request": self.first_request_seconds,
+        }
+
+startup_report = StartupReport()
+
+def load_analytics_stack():
+    """
+    Import numpy/pandas/pyarrow eagerly, e.g. in the Gunicorn master before forking
+    """
+    for name in ANALYTICS_MODULES:
+        startup_report.timed_import(name)
+
+def eager_analytics_imports() -> List[str]:
+    """
+    The ANALYTICS_MODULES that `import main` loads, checked in a fresh
+    interpreter. Empty while the handlers keep importing them lazily.
+    """
+    code = f"import sys, main; print(','.join(name for name in {ANALYTICS_MODULES!r} if name in sys.modules))"
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", code], cwd=backend, capture_output=True, text=True, check=True)
+    return [name for name in result.stdout.strip().split(",") if name]
@@ -0,0 +1,287 @@
+"""
+Energy cost and savings from per-project tariffs.
+
+Each hour of a project nets its renewable generation against consumption:
+what is left of consumption is imported, what is left of generation is
+exported. With r[h] the import rate of hour h (time-of-use rate plus the
+tier adder of the month's imported kWh so far):
+
+    energy_cost   = sum(import[h] * r[h])
+    export_credit = sum(export[h] * export_rate)
+    baseline_cost = the energy cost of all consumption, as if nothing was generated
+    savings       = baseline_cost - (energy_cost - export_credit)
+
+Costs are computed from the hourly rollups with NumPy, rolled up per day and
+kept per project as prefix sums, so a bill over any range of days is two
+binary searches. Hours are UTC. Projects without a tariff use
+TARIFF_DEFAULT_RATE, and the daily charge accrues from a project's first
+reading.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+import json
+
+import numpy as np
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from config import settings
+from core.rollups import ProjectRollupCache, refresh_rollups_if_due
+from models.energy_data import EnergySourceType
+from models.rollups import ConsumptionHourly, GenerationHourly
+from models.tariff import Tariff
+
+# Rows of CostSeries sums
+COLUMNS = (
+    "consumption_kwh", "generation_kwh", "import_kwh", "export_kwh",
+    "energy_cost", "export_credit", "baseline_cost",
+)
+DAY_SECONDS = 86400
+
+def import_rates(tariff: dict, hours: np.ndarray) -> np.ndarray:
+    """
+    Time-of-use rate of each hour (epoch seconds). Later periods override
+    earlier ones.
+    """
+    hour_of_day = (hours // 3600) % 24
+    # 1970-01-01 was a Thursday, Monday = 0
+    weekday = (hours // DAY_SECONDS + 3) % 7
+    rates = np.full(len(hours), tariff["base_rate"], dtype=np.float64)
+    for period in tariff["tou_periods"]:
+        start, end = period["start_hour"], period["end_hour"]
+        if start < end:
+            in_hours = (hour_of_day >= start) & (hour_of_day < end)
+        else:
+            in_hours = (hour_of_day >= start) | (hour_of_day < end)
+        rates[in_hours & np.isin(weekday, period.get("days", range(7)))] = period["rate"]
+    return rates
+
+def tier_charges(tariff: dict, hours: np.ndarray, kwh: np.ndarray) -> np.ndarray:
+    """
+    Tier adders owed by each hour's kWh, with the tiers filling up per
+    calendar month. An hour crossing a tier boundary pays both rates.
+    """
+    charges = np.zeros(len(kwh))
+    if not tariff["tiers"] or len(kwh) == 0:
+        return charges
+
+    month = hours.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+    month_starts = np.flatnonzero(np.r_[True, month[1:] != month[:-1]])
+    cumulative = np.cumsum(kwh)
+    before_month = np.r_[0.0, cumulative][month_starts]
+    month_to_date = cumulative - np.repeat(before_month, np.diff(np.r_[month_starts, len(kwh)]))
+    previous = month_to_date - kwh
+
+    lower = 0.0
+    for tier in tariff["tiers"]:
+        upper = tier["up_to_kwh"] if tier.get("up_to_kwh") is not None else np.inf
+        in_tier = np.clip(month_to_date, lower, upper) - np.clip(previous, lower, upper)
+        charges += in_tier * tier["rate"]
+        lower = upper
+    return charges
+
+def hourly_costs(tariff: dict, hours: np.ndarray, consumption: np.ndarray, generation: np.ndarray) -> np.ndarray:
+    """
+    (COLUMNS, hour) kWh and costs of sorted hours (epoch seconds)
+    """
+    rates = import_rates(tariff, hours)
+    net = consumption - generation
+    imported = np.maximum(net, 0)
+    exported = np.maximum(-net, 0)
+    return np.stack([
+        consumption,
+        generation,
+        imported,
+        exported,
+        imported * rates + tier_charges(tariff, hours, imported),
+        exported * tariff["export_rate"],
+        consumption * rates + tier_charges(tariff, hours, consumption),
+    ])
+
+class CostSeries:
+    """
+    Prefix sums of a project's daily kWh and costs
+    """
+
+    def __init__(self, tariff: dict, days: np.ndarray, daily: np.ndarray):
+        self.tariff = tariff
+        self.days = days
+        self.daily = daily
+        self.sums = np.concatenate([np.zeros((len(COLUMNS), 1)), np.cumsum(daily, axis=1)], axis=1)
+
+    def _bounds(self, first: date, last: date):
+        lo = np.searchsorted(self.days, (first - date(1970, 1, 1)).days, side="left")
+        hi = np.searchsorted(self.days, (last - date(1970, 1, 1)).days, side="right")
+        return lo, hi
+
+    def totals(self, first: date, last: date) -> np.ndarray:
+        lo, hi = self._bounds(first, last)
+        return self.sums[:, hi] - self.sums[:, lo]
+
+    def billed_days(self, first: date, last: date) -> int:
+        """
+        Days of the range from the project's first reading on, which owe
+        the daily charge
+        """
+        if len(self.days) == 0:
+            return 0
+        first = max(first, date(1970, 1, 1) + timedelta(days=int(self.days[0])))
+        return max(0, (last - first).days + 1)
+
+    def days_between(self, first: date, last: date):
+        lo, hi = self._bounds(first, last)
+        return self.days[lo:hi], self.daily[:, lo:hi]
+
+def build_cost_series(
+    tariff: dict,
+    consumption_hours: np.ndarray,
+    consumption_kwh: np.ndarray,
+    generation_hours: np.ndarray,
+    generation_kwh: np.ndarray,
+) -> CostSeries:
+    """
+    Daily costs of a project from its sorted hourly kWh (epoch seconds)
+    """
+    hours = np.union1d(consumption_hours, generation_hours)
+    aligned = np.zeros((2, len(hours)))
+    aligned[0, np.searchsorted(hours, consumption_hours)] = consumption_kwh
+    aligned[1, np.searchsorted(hours, generation_hours)] = generation_kwh
+
+    costs = hourly_costs(tariff, hours, aligned[0], aligned[1])
+    days, day_index = np.unique(hours // DAY_SECONDS, return_inverse=True)
+    daily = np.stack([np.bincount(day_index, weights=row, minlength=len(days)) for row in costs])
+    return CostSeries(tariff, days, daily)
+
+def tariff_dict(tariff: Optional[Tariff]) -> dict:
+    if tariff is None:
+        return {
+            "currency": settings.TARIFF_DEFAULT_CURRENCY,
+            "base_rate": settings.TARIFF_DEFAULT_RATE,
+            "export_rate": 0.0,
+            "daily_charge": 0.0,
+            "tou_periods": [],
+            "tiers": [],
+        }
+    return {
+        "currency": tariff.currency,
+        "base_rate": tariff.base_rate,
+        "export_rate": tariff.export_rate or 0.0,
+        "daily_charge": tariff.daily_charge or 0.0,
+        "tou_periods": json.loads(tariff.tou_periods) if tariff.tou_periods else [],
+        "tiers": json.loads(tariff.tiers) if tariff.tiers else [],
+    }
+
+def _hourly_by_project(db: Session, value, model, project_ids: List[int]) -> Dict[int, tuple]:
+    rows = db.query(model.project_id, model.hour, func.sum(value)).filter(
+        model.project_id.in_(project_ids)
+    ).group_by(model.project_id, model.hour).all()
+    by_project: Dict[int, tuple] = {}
+    if not rows:
+        return by_project
+    projects = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    hours = np.array([row[1] for row in rows], dtype="datetime64[s]").astype(np.int64)
+    values = np.fromiter((float(row[2] or 0) for row in rows), dtype=np.float64, count=len(rows))
+    order = np.lexsort((hours, projects))
+    projects, hours, values = projects[order], hours[order], values[order]
+    starts = np.flatnonzero(np.r_[True, projects[1:] != projects[:-1]])
+    for start, end in zip(starts, np.r_[starts[1:], len(projects)]):
+        by_project[int(projects[start])] = (hours[start:end], values[start:end])
+    return by_project
+
+def _build_projects(db: Session, project_ids: List[int]) -> Dict[int, CostSeries]:
+    tariffs = {tariff.project_id: tariff for tariff in db.query(Tariff).filter(Tariff.project_id.in_(project_ids)).all()}
+    renewable = case((GenerationHourly.source_type != EnergySourceType.GRID, GenerationHourly.value_kwh), else_=0)
+    consumption = _hourly_by_project(db, ConsumptionHourly.value_kwh, ConsumptionHourly, project_ids)
+    generation = _hourly_by_project(db, renewable, GenerationHourly, project_ids)
+    empty = (np.empty(0, dtype=np.int64), np.empty(0))
+
+    series = {}
+    for project_id in project_ids:
+        tariff = tariff_dict(tariffs.get(project_id))
+        consumption_hours, consumption_kwh = consumption.get(project_id, empty)
+        generation_hours, generation_kwh = generation.get(project_id, empty)
+        series[project_id] = build_cost_series(
+            tariff, consumption_hours, consumption_kwh, generation_hours, generation_kwh
+        )
+    return series
+
+# Daily costs per project, rebuilt when its rollups or tariff change
+cost_cache = ProjectRollupCache("tariffs", _build_projects, project_models=[Tariff])
+
+def _as_day(value: datetime) -> date:
+    # The rollup hours are naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+def energy_cost(
+    db: Session,
+    project_ids: List[int],
+    start_date: Optional[datetime],
+    end_date: Optional[datetime],
+    project_id: Optional[int] = None,
+    include_daily: bool = False,
+) -> dict:
+    """
+    Cost, export credit and savings of the projects over whole days
+    """
+    if not start_date:
+        start_date = datetime.utcnow() - timedelta(days=30)
+
+    if not end_date:
+        end_date = datetime.utcnow()
+
+    refresh_rollups_if_due(db, "consumption")
+    refresh_rollups_if_due(db, "generation")
+    cost_cache.invalidate_changed(db)
+
+    first, last = _as_day(start_date), _as_day(end_date)
+    n_days = max(0, (last - first).days + 1)
+    totals = np.zeros(len(COLUMNS))
+    fixed_charges = 0.0
+    by_project = {}
+    # Every day of the range: COLUMNS, then the fixed charge
+    daily = np.zeros((n_days, len(COLUMNS) + 1))
+    first_day = (first - date(1970, 1, 1)).days
+    currencies = set()
+
+    for key, series in cost_cache.get(db, project_ids).items():
+        project_totals = series.totals(first, last)
+        billed_days = series.billed_days(first, last)
+        project_fixed = series.tariff["daily_charge"] * billed_days
+        values = dict(zip(COLUMNS, project_totals))
+        by_project[str(key)] = {
+            "total_cost": float(values["energy_cost"] - values["export_credit"] + project_fixed),
+            "savings": float(values["baseline_cost"] - values["energy_cost"] + values["export_credit"]),
+        }
+        totals += project_totals
+        fixed_charges += project_fixed
+        currencies.add(series.tariff["currency"])
+        if include_daily:
+            days, rows = series.days_between(first, last)
+            daily[days - first_day, :-1] += rows.T
+            if billed_days:
+                daily[-billed_days:, -1] += series.tariff["daily_charge"]
+
+    values = {column: float(value) for column, value in zip(COLUMNS, totals)}
+    result = {
+        "start_date": start_date,
+        "end_date": end_date,
+        "project_id": project_id,
+        "currency": currencies.pop() if len(currencies) == 1 else None,
+        **values,
+        "fixed_charges": fixed_charges,
+        "total_cost": values["energy_cost"] - values["export_credit"] + fixed_charges,
+        "savings": values["baseline_cost"] - values["energy_cost"] + values["export_credit"],
+        "by_project": by_project,
+    }
+    if include_daily:
+        result["daily"] = []
+        for offset, row in enumerate(daily):
+            values = dict(zip(COLUMNS, row))
+            result["daily"].append({
+                "date": (first + timedelta(days=offset)).isoformat(),
+                "total_cost": float(values["energy_cost"] - values["export_credit"] + row[-1]),
+                "savings": float(values["baseline_cost"] - values["energy_cost"] + values["export_credit"]),
+            })
+    return result
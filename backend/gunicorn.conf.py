@@ -0,0 +1,64 @@
+# Gunicorn configuration for the production launcher (SERVER_MODE=production).
+# Every value can be overridden through the environment so Elastic Beanstalk and
+# docker-compose can tune the server without code changes.
+import os
+
+
+def _available_cores() -> int:
+    # Respect CPU affinity/cgroup pinning inside containers where possible
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', '8000')}")
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Pandas aggregation is CPU bound, so size the pool from the available cores
+# rather than the classic (2 x cores + 1) used for I/O bound apps.
+workers = int(os.getenv("WEB_CONCURRENCY", max(2, _available_cores())))
+
+# Import the application (FastAPI, SQLAlchemy, pandas, numpy) once in the
+# master and fork the workers from it, so the heavy modules are shared
+# copy-on-write instead of being imported again in every worker.
+preload_app = os.getenv("PRELOAD_APP", "true").lower() == "true"
+
+# Recycle workers periodically to keep memory creep from pandas allocations in
+# check. The jitter stops all workers from restarting at the same moment.
+max_requests = int(os.getenv("MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "100"))
+
+# Give in-flight requests time to finish on SIGTERM/HUP before a worker is killed
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+
+def when_ready(server):
+    # The endpoints import pandas/numpy lazily; load them in the master so the
+    # forked workers inherit them instead of paying the import on first use.
+    if preload_app:
+        from core.startup import load_analytics_stack
+
+        load_analytics_stack()
+
+
+def post_fork(server, worker):
+    # Connections opened in the master while preloading must not be shared
+    # between forked workers, so every worker starts with a fresh pool.
+    if preload_app:
+        from core.replicas import dispose_engines
+        from database import engine
+
+        engine.dispose(close=False)
+        dispose_engines()
+    server.log.info(f"Worker spawned (pid: {worker.pid})")
+
+
+def worker_int(worker):
+    worker.log.info(f"Worker interrupted (pid: {worker.pid})")
@@ -1,23 +1,26 @@
-from fastapi import FastAPI
+from core.startup import startup_report
+
+# Framework imports are timed first so they are not attributed to the app
+startup_report.timed_import("fastapi")
+startup_report.timed_import("sqlalchemy")
+
+from fastapi import FastAPI, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import text
 import logging
 import datetime
-from config import settings
-from database import engine, Base, get_db
-from api.api import api_router
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create database tables if they don't exist
-try:
-    logger.info("Creating database tables if they don't exist...")
-    Base.metadata.create_all(bind=engine)
-    logger.info("Database tables created or already exist")
-except SQLAlchemyError as e:
-    logger.error(f"Error creating database tables: {e}")
+# Time the application imports so cold-start regressions show up in the
+# startup report. Schema creation is not done here any more, it is an explicit
+# step (`python manage.py bootstrap`) run before the server starts.
+settings = startup_report.timed_import("config").settings
+get_db = startup_report.timed_import("database").get_db
+api_router = startup_report.timed_import("api.api").api_router
+startup_report.mark("app_imported")
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -31,11 +34,69 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Watermark"],
 )
 
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+# Startup/readiness state used by the orchestration probes
+app.state.started = False
+app.state.shutting_down = False
+
+@app.on_event("startup")
+def start_background_services():
+    from core.data_quality import start_gap_tracking
+    from core.hot_window import start_hot_window
+    from core.ingest_buffer import start_ingest_buffer
+    from core.jobs import start_job_runner
+    from core.pubsub import start_stream_broker
+    from core.replicas import start_replica_checks
+
+    start_replica_checks()
+    start_stream_broker()
+    start_gap_tracking()
+    start_hot_window()
+    start_ingest_buffer()
+    start_job_runner()
+
+@app.on_event("startup")
+async def mark_started():
+    app.state.started = True
+    startup_report.mark("startup_complete")
+    logger.info("Application startup complete")
+
+@app.middleware("http")
+async def record_first_request(request: Request, call_next):
+    response = await call_next(request)
+    if startup_report.first_request_seconds is None:
+        startup_report.mark_first_request()
+    return response
+
+@app.on_event("shutdown")
+async def mark_shutting_down():
+    app.state.shutting_down = True
+    logger.info("Application shutting down")
+
+@app.on_event("shutdown")
+def stop_background_services():
+    from core.ingest_buffer import stop_ingest_buffer
+    from core.concurrency import shutdown_query_pool
+    from core.data_quality import stop_gap_tracking
+    from core.hot_window import stop_hot_window
+    from core.jobs import stop_job_runner
+    from core.pubsub import stop_stream_broker
+    from core.replicas import stop_replica_checks
+
+    # Flush the ingest buffer first so its readings still reach live streams
+    stop_ingest_buffer()
+    stop_stream_broker()
+    stop_gap_tracking()
+    stop_hot_window()
+    stop_job_runner()
+    stop_replica_checks()
+    shutdown_query_pool()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Wattwize API", "version": "1.0.0"}
@@ -57,4 +118,38 @@ async def health_check():
         "timestamp": datetime.datetime.now().isoformat(),
         "environment": settings.ENVIRONMENT,
         "database": db_status
-    }
\ No newline at end of file
+    }
+
+@app.get("/health/startup")
+async def startup_probe(response: Response):
+    """
+    Startup probe: succeeds once the worker has finished importing the app
+    and running its startup hooks
+    """
+    if not app.state.started:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "starting", "report": startup_report.as_dict()}
+    return {"status": "started", "report": startup_report.as_dict()}
+
+@app.get("/health/ready")
+def readiness_probe(response: Response):
+    """
+    Readiness probe: succeeds when the worker can serve traffic, i.e. it has
+    started, is not draining and can run a query against the database
+    """
+    if not app.state.started or app.state.shutting_down:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "not_ready", "database": "unknown"}
+
+    try:
+        db = next(get_db())
+        try:
+            db.execute(text("SELECT 1"))
+        finally:
+            db.close()
+    except Exception as e:
+        logger.error(f"Database readiness check failed: {e}")
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "not_ready", "database": "error"}
+
+    return {"status": "ready", "database": "ok"}
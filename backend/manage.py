@@ -0,0 +1,281 @@
+"""
+Management commands for the Wattwize backend.
+
+Usage:
+    python manage.py bootstrap [--wait-timeout SECONDS]
+    python manage.py check-imports
+    python manage.py refresh-rollups [--kind consumption|generation]
+    python manage.py detect-anomalies [--kind consumption|generation] [--loop SECONDS]
+    python manage.py load-grid-intensity FILE [--region REGION]
+    python manage.py archive-readings [--kind consumption|generation] [--older-than-days DAYS]
+    python manage.py run-jobs [--workers N]
+    python manage.py seed demo [--days DAYS] [--start YYYY-MM-DD] [--if-empty]
+    python manage.py seed generate [--projects N] [--days DAYS] [--interval-minutes MINUTES] [--start YYYY-MM-DD]
+    python manage.py seed load FILE --kind consumption|generation
+"""
+import argparse
+import logging
+import sys
+import time
+
+logger = logging.getLogger("manage")
+
+def bootstrap(args) -> int:
+    """
+    Wait for the database, create any missing tables and apply schema
+    upgrades to existing ones.
+
+    Run once per deployment before the server starts, instead of on every
+    worker import.
+    """
+    from wait_for_db import wait_for_db
+
+    start = time.perf_counter()
+    if not wait_for_db(timeout=args.wait_timeout):
+        return 1
+
+    from sqlalchemy.exc import SQLAlchemyError
+    from database import engine, Base
+    from core.schema import upgrade_schema
+    import models  # noqa: F401  (registers all tables on Base.metadata)
+
+    try:
+        logger.info("Creating database tables if they don't exist...")
+        Base.metadata.create_all(bind=engine)
+        logger.info("Database tables created or already exist")
+        upgrade_schema(engine)
+    except SQLAlchemyError as e:
+        logger.error(f"Error creating database tables: {e}")
+        return 1
+
+    logger.info(f"Bootstrap finished in {time.perf_counter() - start:.2f}s")
+    return 0
+
+def check_imports(args) -> int:
+    """
+    Fail if importing the app loads the analytics stack, which every worker
+    would then pay for at boot instead of on the first analytics request
+    """
+    from core.startup import ANALYTICS_MODULES, eager_analytics_imports
+
+    loaded = eager_analytics_imports()
+    if loaded:
+        logger.error(f"import main loads {', '.join(loaded)}: import them inside the functions that use them")
+        return 1
+    logger.info(f"import main does not load {', '.join(ANALYTICS_MODULES)}")
+    return 0
+
+def refresh_rollups(args) -> int:
+    """
+    Bring the hourly rollups up to date. The first run builds them in full,
+    later runs only recompute the hours with changed readings.
+    """
+    from database import SessionLocal
+    from core.rollups import ROLLUPS, refresh_rollups as refresh
+    import models  # noqa: F401
+
+    kinds = [args.kind] if args.kind else list(ROLLUPS)
+    db = SessionLocal()
+    try:
+        for kind in kinds:
+            start = time.perf_counter()
+            changed = refresh(db, kind)
+            logger.info(f"Refreshed {kind} rollups of {len(changed)} series in {time.perf_counter() - start:.2f}s")
+    finally:
+        db.close()
+    return 0
+
+def detect_anomalies(args) -> int:
+    """
+    Scan the readings added since the previous run for anomalies. With
+    --loop, keep running every SECONDS (for a worker process or sidecar).
+    """
+    from database import SessionLocal
+    from core.anomalies import detect_anomalies as detect
+    import models  # noqa: F401
+
+    kinds = [args.kind] if args.kind else None
+    while True:
+        db = SessionLocal()
+        try:
+            detect(db, kinds)
+        except Exception as e:
+            logger.error(f"Anomaly detection failed: {e}", exc_info=True)
+            if not args.loop:
+                return 1
+        finally:
+            db.close()
+        if not args.loop:
+            return 0
+        time.sleep(args.loop)
+
+def load_grid_intensity(args) -> int:
+    """
+    Load grid carbon intensity from a CSV file with `timestamp` (interval
+    start, UTC) and `g_co2_per_kwh` columns. Existing intervals are updated.
+    """
+    import csv
+    from datetime import datetime
+    from config import settings
+    from database import SessionLocal
+    from core.emissions import load_grid_intensity as load
+    import models  # noqa: F401
+
+    with open(args.file, newline="") as f:
+        rows = [
+            {"hour": datetime.fromisoformat(row["timestamp"]), "g_co2_per_kwh": row["g_co2_per_kwh"]}
+            for row in csv.DictReader(f)
+        ]
+    db = SessionLocal()
+    try:
+        load(db, args.region or settings.GRID_REGION, rows)
+    finally:
+        db.close()
+    return 0
+
+def archive_readings(args) -> int:
+    """
+    Move whole months of readings older than --older-than-days (default:
+    ARCHIVE_AFTER_DAYS) to the Parquet archive. Safe to re-run: months that
+    gained readings are merged into their archived partition.
+    """
+    from database import SessionLocal
+    from core.archive import archive_cutoff, archive_readings as archive
+    from core.ingest import READING_MODELS
+    import models  # noqa: F401
+
+    kinds = [args.kind] if args.kind else list(READING_MODELS)
+    before = archive_cutoff(args.older_than_days)
+    db = SessionLocal()
+    try:
+        for kind in kinds:
+            archive(db, kind, before)
+    except Exception as e:
+        logger.error(f"Archiving failed: {e}", exc_info=True)
+        return 1
+    finally:
+        db.close()
+    return 0
+
+def run_jobs(args) -> int:
+    """
+    Run queued reports and exports until interrupted. Use it instead of the
+    web workers' runners by setting JOBS_RUNNER_ENABLED=false on those.
+    """
+    from config import settings
+    from core.jobs import JobRunner, job_queue
+
+    runner = JobRunner(job_queue, args.workers or settings.JOBS_WORKERS, settings.JOBS_POLL_SECONDS)
+    try:
+        runner.run_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+def seed(args) -> int:
+    """
+    Create the demo dataset, generate a benchmark dataset or load readings
+    from a CSV or Parquet fixture, through the database's bulk paths. With
+    --if-empty, nothing is written when readings exist already.
+    """
+    from datetime import datetime
+    from database import SessionLocal
+    from core.seed import (
+        BENCHMARK_USER, DEMO_USER, bulk_load, default_range, has_readings,
+        read_fixture, seed_engine, seed_projects, seed_readings,
+    )
+    import models  # noqa: F401
+
+    start = time.perf_counter()
+    engine = seed_engine()
+    db = SessionLocal()
+    try:
+        if args.if_empty and has_readings(db):
+            logger.info("Readings exist already, not seeding")
+            return 0
+
+        if args.dataset == "load":
+            written = {args.kind: bulk_load(engine, args.kind, read_fixture(args.file, args.kind, args.batch_rows), args.method, args.batch_rows)}
+        else:
+            if args.dataset == "demo":
+                projects = seed_projects(db, DEMO_USER)
+            else:
+                projects = seed_projects(db, BENCHMARK_USER, args.projects, args.name)
+            range_start, range_end = default_range(args.days, datetime.fromisoformat(args.start) if args.start else None)
+            written = seed_readings(
+                engine, projects, range_start, range_end,
+                args.interval_minutes, args.seed, args.method, args.batch_rows,
+            )
+    except Exception as e:
+        logger.error(f"Seeding failed: {e}", exc_info=True)
+        return 1
+    finally:
+        db.close()
+        engine.dispose()
+
+    total = sum(written.values())
+    elapsed = time.perf_counter() - start
+    logger.info(f"Seeded {total:,} readings {written} in {elapsed:.2f}s ({total / elapsed:,.0f}/s)")
+    return 0
+
+def main(argv=None) -> int:
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Wattwize backend management commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    bootstrap_parser = subparsers.add_parser("bootstrap", help="Wait for the database and create or upgrade the schema")
+    bootstrap_parser.add_argument("--wait-timeout", type=float, default=120.0, help="Seconds to wait for the database")
+    bootstrap_parser.set_defaults(func=bootstrap)
+
+    check_imports_parser = subparsers.add_parser("check-imports", help="Fail if importing the app loads numpy, pandas or pyarrow")
+    check_imports_parser.set_defaults(func=check_imports)
+
+    rollups_parser = subparsers.add_parser("refresh-rollups", help="Build or incrementally refresh the hourly rollups")
+    rollups_parser.add_argument("--kind", choices=["consumption", "generation"], help="Only refresh this rollup")
+    rollups_parser.set_defaults(func=refresh_rollups)
+
+    anomalies_parser = subparsers.add_parser("detect-anomalies", help="Scan new readings for spikes, drops, flatlines and gaps")
+    anomalies_parser.add_argument("--kind", choices=["consumption", "generation"], help="Only scan this kind of readings")
+    anomalies_parser.add_argument("--loop", type=float, default=0, help="Run again every LOOP seconds")
+    anomalies_parser.set_defaults(func=detect_anomalies)
+
+    intensity_parser = subparsers.add_parser("load-grid-intensity", help="Load grid carbon intensity from a CSV file")
+    intensity_parser.add_argument("file", help="CSV with timestamp and g_co2_per_kwh columns")
+    intensity_parser.add_argument("--region", default=None, help="Region the intensity applies to (default: GRID_REGION)")
+    intensity_parser.set_defaults(func=load_grid_intensity)
+
+    archive_parser = subparsers.add_parser("archive-readings", help="Move old readings to the Parquet archive")
+    archive_parser.add_argument("--kind", choices=["consumption", "generation"], help="Only archive this kind of readings")
+    archive_parser.add_argument("--older-than-days", type=int, default=None, help="Archive months before this many days ago")
+    archive_parser.set_defaults(func=archive_readings)
+
+    jobs_parser = subparsers.add_parser("run-jobs", help="Run queued reports and exports")
+    jobs_parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: JOBS_WORKERS)")
+    jobs_parser.set_defaults(func=run_jobs)
+
+    seed_parser = subparsers.add_parser("seed", help="Create demo or benchmark data, or load readings from a file")
+    datasets = seed_parser.add_subparsers(dest="dataset", required=True)
+    demo_parser = datasets.add_parser("demo", help="The demo user, its six projects and their readings")
+    generate_parser = datasets.add_parser("generate", help="Benchmark projects with synthetic readings")
+    generate_parser.add_argument("--projects", type=int, default=100, help="Projects to create")
+    generate_parser.add_argument("--name", default="Benchmark Project", help="Project name prefix")
+    load_parser = datasets.add_parser("load", help="Readings from a CSV or Parquet file")
+    load_parser.add_argument("file", help="File with project_id, timestamp, value_kwh, source_type (and efficiency) columns")
+    load_parser.add_argument("--kind", choices=["consumption", "generation"], required=True, help="Table to load into")
+    for dataset_parser, days in ((demo_parser, 90), (generate_parser, 365)):
+        dataset_parser.add_argument("--days", type=int, default=days, help=f"Days of readings (default: {days})")
+        dataset_parser.add_argument("--start", default=None, help="First day, YYYY-MM-DD (default: DAYS before now)")
+        dataset_parser.add_argument("--interval-minutes", type=int, default=60, help="Minutes between readings")
+        dataset_parser.add_argument("--seed", type=int, default=1, help="Random seed of the generated readings")
+    for dataset_parser in (demo_parser, generate_parser, load_parser):
+        dataset_parser.add_argument("--if-empty", action="store_true", help="Only seed when there are no readings yet")
+        dataset_parser.add_argument("--method", choices=["auto", "load-data", "insert"], default="auto", help="Bulk load path (default: LOAD DATA on MySQL when allowed)")
+        dataset_parser.add_argument("--batch-rows", type=int, default=None, help="Readings per batch (default: SEED_BATCH_ROWS)")
+        dataset_parser.set_defaults(func=seed)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1 +1,4 @@
-# Models package
\ No newline at end of file
+# Models package
+
+# Import every model module so all tables are registered on Base.metadata
+from models import user, energy_data, rollups, anomaly, grid, tariff, archive, replica, calendar, data_quality  # noqa: F401
@@ -0,0 +1,50 @@
+from sqlalchemy import Column, DateTime, Enum, Float, ForeignKey, Index, Integer, String, Text, UniqueConstraint
+
+from database import Base
+from models.base import BaseModel
+from models.energy_data import EnergySourceType
+
+class AnomalyType:
+    SPIKE = "spike"
+    DROP = "drop"
+    FLATLINE = "flatline"
+    GAP = "gap"
+
+class Anomaly(BaseModel):
+    """
+    A suspicious stretch of a reading series found by core.anomalies
+    """
+    __tablename__ = "anomalies"
+    __table_args__ = (
+        # Re-running detection over the same readings updates, never duplicates
+        UniqueConstraint("kind", "project_id", "source_type", "anomaly_type", "start_time", name="uq_anomaly"),
+        Index("ix_anomalies_project_start", "project_id", "start_time"),
+    )
+
+    kind = Column(String(16), nullable=False)  # consumption or generation
+    project_id = Column(ForeignKey("projects.id"), nullable=False)
+    source_type = Column(Enum(EnergySourceType), nullable=False)
+    anomaly_type = Column(String(16), nullable=False)
+    start_time = Column(DateTime, nullable=False)
+    end_time = Column(DateTime, nullable=False)
+    value_kwh = Column(Float, nullable=True)
+    score = Column(Float, nullable=True)
+    detail = Column(String(255), nullable=True)
+
+class AnomalySeriesState(Base):
+    """
+    Running statistics of a series, so each detection run only reads the
+    readings after last_timestamp
+    """
+    __tablename__ = "anomaly_series_state"
+
+    kind = Column(String(16), primary_key=True)
+    project_id = Column(Integer, primary_key=True)
+    source_type = Column(Enum(EnergySourceType), primary_key=True)
+    last_timestamp = Column(DateTime, nullable=True)
+    # JSON list of the latest readings, the baseline window for the next run
+    recent_values = Column(Text, nullable=True)
+    cadence_seconds = Column(Float, nullable=True)
+    flat_run_start = Column(DateTime, nullable=True)
+    flat_run_value = Column(Float, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
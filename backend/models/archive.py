@@ -0,0 +1,25 @@
+from sqlalchemy import Column, DateTime, Integer, String, UniqueConstraint
+
+from models.base import BaseModel
+
+class ArchivedPartition(BaseModel):
+    """
+    A month of one project's readings moved from a reading table to a
+    Parquet file in the cold-storage archive (core.archive). The catalog row
+    is committed in the same transaction that deletes the readings. A
+    reading written for the month later is stored in the database again and
+    replaces its archived copy until the month is archived again.
+    """
+    __tablename__ = "archived_partitions"
+    __table_args__ = (
+        UniqueConstraint("kind", "project_id", "month", name="uq_archived_partition"),
+    )
+
+    kind = Column(String(16), nullable=False)
+    project_id = Column(Integer, nullable=False, index=True)
+    month = Column(DateTime, nullable=False)
+    # Relative to ARCHIVE_URI
+    path = Column(String(512), nullable=False)
+    readings = Column(Integer, nullable=False)
+    first_timestamp = Column(DateTime, nullable=False)
+    last_timestamp = Column(DateTime, nullable=False)
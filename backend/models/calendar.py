@@ -0,0 +1,22 @@
+from sqlalchemy import Boolean, Column, Date, Integer, String
+
+from database import Base
+
+class CalendarHour(Base):
+    """
+    Calendar dimension: where each UTC hour falls in a timezone's local
+    calendar. Built per timezone and year by core.calendar, and joined by
+    the aggregations that bucket readings by local day.
+    """
+    __tablename__ = "calendar_hours"
+
+    timezone = Column(String(64), primary_key=True)
+    # Whole hours since 1970-01-01 00:00 UTC
+    hour_key = Column(Integer, primary_key=True, autoincrement=False)
+    local_date = Column(Date, nullable=False)
+    week_start = Column(Date, nullable=False)  # Monday of the ISO week
+    month_start = Column(Date, nullable=False)
+    iso_year = Column(Integer, nullable=False)
+    iso_week = Column(Integer, nullable=False)
+    utc_offset_minutes = Column(Integer, nullable=False)
+    is_dst = Column(Boolean, nullable=False)
@@ -0,0 +1,19 @@
+from sqlalchemy import Column, DateTime, Enum, Float, Integer, String
+
+from database import Base
+from models.energy_data import EnergySourceType
+
+class DataQualitySeries(Base):
+    """
+    Expected reading cadence and observed extent of a series, kept up to
+    date on ingest by core.data_quality
+    """
+    __tablename__ = "data_quality_series"
+
+    kind = Column(String(16), primary_key=True)
+    project_id = Column(Integer, primary_key=True)
+    source_type = Column(Enum(EnergySourceType), primary_key=True)
+    cadence_seconds = Column(Float, nullable=True)
+    first_timestamp = Column(DateTime, nullable=True)
+    last_timestamp = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Float, DateTime, ForeignKey, Enum, String, Text
+from sqlalchemy import Column, Float, DateTime, ForeignKey, Enum, Index, String, Text, UniqueConstraint
 from sqlalchemy.orm import relationship
 import enum
 from models.base import BaseModel
@@ -17,6 +17,9 @@ class Project(BaseModel):
     name = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
     location = Column(String(255), nullable=True)
+    # IANA timezone of the site, e.g. "Europe/Berlin". Daily and weekly
+    # aggregates bucket its readings by local date. None: DEFAULT_TIMEZONE.
+    timezone = Column(String(64), nullable=True)
     user_id = Column(ForeignKey("users.id"), nullable=False)
     
     # Relationships
@@ -26,6 +29,13 @@ class Project(BaseModel):
 
 class EnergyConsumption(BaseModel):
     __tablename__ = "energy_consumption"
+    __table_args__ = (
+        # One reading per meter interval, so ingest retries can upsert
+        UniqueConstraint("project_id", "source_type", "timestamp", name="uq_energy_consumption_reading"),
+        # Change feeds (core.energy_queries.changed_since) seek on these
+        Index("ix_energy_consumption_created_at", "created_at"),
+        Index("ix_energy_consumption_updated_at", "updated_at"),
+    )
 
     project_id = Column(ForeignKey("projects.id"), nullable=False)
     timestamp = Column(DateTime, nullable=False, index=True)
@@ -37,6 +47,11 @@ class EnergyConsumption(BaseModel):
 
 class EnergyGeneration(BaseModel):
     __tablename__ = "energy_generation"
+    __table_args__ = (
+        UniqueConstraint("project_id", "source_type", "timestamp", name="uq_energy_generation_reading"),
+        Index("ix_energy_generation_created_at", "created_at"),
+        Index("ix_energy_generation_updated_at", "updated_at"),
+    )
 
     project_id = Column(ForeignKey("projects.id"), nullable=False)
     timestamp = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, DateTime, Float, String, UniqueConstraint
+
+from models.base import BaseModel
+
+class GridIntensity(BaseModel):
+    """
+    Carbon intensity of grid electricity in a region, per interval starting
+    at `hour` (UTC). Loaded with `python manage.py load-grid-intensity`.
+    """
+    __tablename__ = "grid_intensity"
+    __table_args__ = (
+        UniqueConstraint("region", "hour", name="uq_grid_intensity"),
+    )
+
+    region = Column(String(64), nullable=False)
+    hour = Column(DateTime, nullable=False)
+    g_co2_per_kwh = Column(Float, nullable=False)
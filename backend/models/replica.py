@@ -0,0 +1,14 @@
+from sqlalchemy import Column, DateTime, Integer
+
+from database import Base
+
+class ReplicaHeartbeat(Base):
+    """
+    One row the primary stamps with its clock at every replica lag check
+    (core.replicas). The stamp a replica shows is the primary time up to
+    which it has applied every commit.
+    """
+    __tablename__ = "replica_heartbeat"
+
+    id = Column(Integer, primary_key=True)
+    beat = Column(DateTime, nullable=False)
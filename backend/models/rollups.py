@@ -0,0 +1,45 @@
+from sqlalchemy import Column, DateTime, Enum, Float, ForeignKey, Index, Integer, String, Text, UniqueConstraint
+
+from database import Base
+from models.base import BaseModel
+from models.energy_data import EnergySourceType
+
+class HourlyRollupMixin:
+    """
+    Readings summed per project, source and hour (UTC). Maintained by
+    core.rollups from the raw reading tables.
+    """
+    project_id = Column(ForeignKey("projects.id"), nullable=False)
+    source_type = Column(Enum(EnergySourceType), nullable=False)
+    hour = Column(DateTime, nullable=False, index=True)
+    value_kwh = Column(Float, nullable=False)
+    value_min = Column(Float, nullable=False)
+    value_max = Column(Float, nullable=False)
+    readings = Column(Integer, nullable=False)
+    # Quantile sketch of the bucket's demand in kW (core.sketches)
+    sketch = Column(Text, nullable=True)
+
+class ConsumptionHourly(HourlyRollupMixin, BaseModel):
+    __tablename__ = "energy_consumption_hourly"
+    __table_args__ = (
+        UniqueConstraint("project_id", "source_type", "hour", name="uq_energy_consumption_hourly"),
+        Index("ix_energy_consumption_hourly_created_at", "created_at"),
+        Index("ix_energy_consumption_hourly_updated_at", "updated_at"),
+    )
+
+class GenerationHourly(HourlyRollupMixin, BaseModel):
+    __tablename__ = "energy_generation_hourly"
+    __table_args__ = (
+        UniqueConstraint("project_id", "source_type", "hour", name="uq_energy_generation_hourly"),
+        Index("ix_energy_generation_hourly_created_at", "created_at"),
+        Index("ix_energy_generation_hourly_updated_at", "updated_at"),
+    )
+
+class RollupState(Base):
+    """
+    Watermark up to which a rollup table reflects its source table
+    """
+    __tablename__ = "rollup_state"
+
+    name = Column(String(64), primary_key=True)
+    watermark = Column(DateTime, nullable=True)
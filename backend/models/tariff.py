@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Float, ForeignKey, String, Text
+
+from models.base import BaseModel
+
+class Tariff(BaseModel):
+    """
+    Electricity tariff of a project, used by core.tariffs.
+
+    Per-kWh import rate of an hour: the rate of the last time-of-use period
+    covering it (base_rate if none) plus the adder of the tier the month's
+    imported kWh have reached. Exported kWh are credited at export_rate.
+    """
+    __tablename__ = "tariffs"
+
+    project_id = Column(ForeignKey("projects.id"), nullable=False, unique=True)
+    name = Column(String(255), nullable=False)
+    currency = Column(String(3), nullable=False, default="USD")
+    base_rate = Column(Float, nullable=False)
+    export_rate = Column(Float, nullable=False, default=0.0)
+    daily_charge = Column(Float, nullable=False, default=0.0)
+    # JSON lists of {"days", "start_hour", "end_hour", "rate"} and {"up_to_kwh", "rate"}
+    tou_periods = Column(Text, nullable=True)
+    tiers = Column(Text, nullable=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Boolean
+from sqlalchemy import Column, String, Boolean, DateTime
 from sqlalchemy.orm import relationship
 from models.base import BaseModel
 
@@ -10,6 +10,8 @@ class User(BaseModel):
     hashed_password = Column(String(255), nullable=False)
     is_active = Column(Boolean, default=True)
     is_admin = Column(Boolean, default=False)
+    # Primary clock time of the user's last ingest, for read-your-writes on replicas
+    last_write_at = Column(DateTime, nullable=True)
     
     # Relationships
     projects = relationship("Project", back_populates="user")
\ No newline at end of file
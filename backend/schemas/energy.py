@@ -1,6 +1,9 @@
-from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional, List
-from datetime import datetime
+from pydantic import BaseModel, Field, ConfigDict, field_validator
+from typing import Any, Dict, Literal, Optional, List
+from datetime import date, datetime
+import json
+from core.calendar import validate_timezone
+from core.data_quality import FILL_PATTERN
 from models.energy_data import EnergySourceType
 
 # Project schemas
@@ -8,6 +11,13 @@ class ProjectBase(BaseModel):
     name: str
     description: Optional[str] = None
     location: Optional[str] = None
+    # IANA timezone of the site, e.g. "Europe/Berlin"
+    timezone: Optional[str] = None
+
+    @field_validator("timezone")
+    @classmethod
+    def check_timezone(cls, value):
+        return validate_timezone(value) if value is not None else value
 
 class ProjectCreate(ProjectBase):
     pass
@@ -16,6 +26,12 @@ class ProjectUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
     location: Optional[str] = None
+    timezone: Optional[str] = None
+
+    @field_validator("timezone")
+    @classmethod
+    def check_timezone(cls, value):
+        return validate_timezone(value) if value is not None else value
 
 class ProjectInDB(ProjectBase):
     id: int
@@ -28,6 +44,19 @@ class ProjectInDB(ProjectBase):
 class Project(ProjectInDB):
     pass
 
+class ProjectStats(BaseModel):
+    last_consumption_at: Optional[datetime] = None
+    last_generation_at: Optional[datetime] = None
+    # kWh per source
+    consumption_24h: Dict[str, float]
+    consumption_30d: Dict[str, float]
+    generation_24h: Dict[str, float]
+    generation_30d: Dict[str, float]
+    avg_efficiency_30d: Optional[float] = None
+
+class ProjectWithStats(Project):
+    stats: Optional[ProjectStats] = None
+
 # Base classes
 class EnergyConsumptionBase(BaseModel):
     timestamp: datetime
@@ -47,6 +76,17 @@ class EnergyConsumptionCreate(EnergyConsumptionBase):
 class EnergyGenerationCreate(EnergyGenerationBase):
     project_id: int
 
+# Bulk ingest schemas
+class EnergyConsumptionBulkCreate(BaseModel):
+    readings: List[EnergyConsumptionCreate] = Field(..., min_length=1)
+
+class EnergyGenerationBulkCreate(BaseModel):
+    readings: List[EnergyGenerationCreate] = Field(..., min_length=1)
+
+class EnergyIngestResult(BaseModel):
+    accepted: int
+    queue_depth: Optional[int] = None
+
 # Update schemas
 class EnergyConsumptionUpdate(BaseModel):
     timestamp: Optional[datetime] = None
@@ -102,4 +142,177 @@ class EnergySummary(BaseModel):
     renewable_percentage: float
     start_date: datetime
     end_date: datetime
-    project_id: Optional[int] = None
\ No newline at end of file
+    project_id: Optional[int] = None
+
+# Anomaly schemas
+class EnvironmentalImpact(BaseModel):
+    start_date: datetime
+    end_date: datetime
+    project_id: Optional[int] = None
+    total_consumption: float
+    total_generation: float
+    renewable_generation: float
+    renewable_percentage: float
+    co2_avoided_kg: float
+    avg_grid_intensity: float  # g CO2 per kWh
+    trees_equivalent: float
+    car_km_equivalent: float
+    co2_avoided_by_project: Dict[str, float]
+
+# Tariff schemas
+class TariffPeriod(BaseModel):
+    # Weekdays, Monday = 0. A period with start_hour > end_hour runs past midnight.
+    days: List[int] = Field(default_factory=lambda: list(range(7)))
+    start_hour: int = Field(..., ge=0, le=23)
+    end_hour: int = Field(..., ge=1, le=24)
+    rate: float
+
+class TariffTier(BaseModel):
+    # Added to the rate of the kWh imported in a month up to up_to_kwh (None: no limit)
+    up_to_kwh: Optional[float] = Field(None, gt=0)
+    rate: float
+
+class TariffBase(BaseModel):
+    name: str
+    currency: str = Field("USD", min_length=3, max_length=3)
+    base_rate: float = Field(..., ge=0)
+    export_rate: float = Field(0.0, ge=0)
+    daily_charge: float = Field(0.0, ge=0)
+    tou_periods: List[TariffPeriod] = []
+    tiers: List[TariffTier] = []
+
+    @field_validator("tou_periods", "tiers", mode="before")
+    @classmethod
+    def parse_json(cls, value):
+        # Stored as JSON text
+        if isinstance(value, str):
+            return json.loads(value)
+        return value or []
+
+    @field_validator("tiers")
+    @classmethod
+    def check_tier_order(cls, tiers):
+        limits = [tier.up_to_kwh for tier in tiers]
+        bounded = limits[:-1] if limits and limits[-1] is None else limits
+        if None in bounded or bounded != sorted(bounded):
+            raise ValueError("Tiers must be in increasing up_to_kwh order, with only the last one unlimited")
+        return tiers
+
+class TariffCreate(TariffBase):
+    pass
+
+class Tariff(TariffBase):
+    id: int
+    project_id: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class EnergyCost(BaseModel):
+    start_date: datetime
+    end_date: datetime
+    project_id: Optional[int] = None
+    currency: Optional[str] = None  # None when the projects bill in different currencies
+    consumption_kwh: float
+    generation_kwh: float
+    import_kwh: float
+    export_kwh: float
+    energy_cost: float
+    export_credit: float
+    fixed_charges: float
+    total_cost: float
+    baseline_cost: float  # what the consumption would have cost without generation
+    savings: float
+    by_project: Dict[str, Dict[str, float]]
+    daily: Optional[List[Dict[str, Any]]] = None
+
+class LoadDurationPoint(BaseModel):
+    percent_of_time: float
+    demand_kw: float
+
+class DemandAnalytics(BaseModel):
+    kind: str
+    start_date: datetime
+    end_date: datetime
+    project_id: Optional[int] = None
+    readings: int
+    peak_kw: Optional[float] = None
+    peak_time: Optional[datetime] = None  # start of the hour of the peak
+    percentiles: Dict[str, Optional[float]]
+    relative_accuracy: float
+    duration_curve: List[LoadDurationPoint]
+    by_project: Dict[str, Dict[str, Any]]
+
+class EfficiencyBucket(BaseModel):
+    period_start: date
+    efficiency: Optional[float] = None  # energy-weighted %, None without readings that have one
+    generation_kwh: float
+    measured_kwh: float  # kWh of the readings with an efficiency
+    by_source: Dict[str, Optional[float]]
+
+class EfficiencySeries(BaseModel):
+    project_id: int
+    source_type: EnergySourceType
+    efficiency: Optional[float] = None
+    generation_kwh: float
+    measured_kwh: float
+    buckets: int  # buckets with an efficiency
+    trend_per_year: Optional[float] = None  # percentage points per year
+    degradation_percent_per_year: Optional[float] = None  # decline relative to the mean efficiency
+
+class EfficiencyAnalytics(BaseModel):
+    start_date: datetime
+    end_date: datetime
+    project_id: Optional[int] = None
+    resolution: str
+    efficiency: Optional[float] = None
+    generation_kwh: float
+    measured_kwh: float
+    trend_per_year: Optional[float] = None
+    by_source: Dict[str, Optional[float]]
+    by_project: Dict[str, Optional[float]]
+    buckets: List[EfficiencyBucket]
+    series: List[EfficiencySeries]
+
+class Anomaly(BaseModel):
+    id: int
+    kind: str
+    project_id: int
+    source_type: EnergySourceType
+    anomaly_type: str
+    start_time: datetime
+    end_time: datetime
+    value_kwh: Optional[float] = None
+    score: Optional[float] = None
+    detail: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+# Dashboard schemas
+class DashboardWidget(BaseModel):
+    id: str = Field(..., min_length=1, max_length=64)
+    type: Literal[
+        "summary", "consumption_daily", "consumption_weekly", "generation_daily", "generation_weekly",
+        "environmental_impact", "cost", "projects",
+    ]
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    project_id: Optional[int] = None
+    source_type: Optional[List[EnergySourceType]] = None  # daily and weekly aggregates
+    fill: Optional[str] = Field(None, pattern=FILL_PATTERN)  # daily and weekly aggregates
+    include_daily: bool = False  # cost
+    include_stats: bool = False  # projects
+
+class DashboardRequest(BaseModel):
+    widgets: List[DashboardWidget] = Field(..., min_length=1, max_length=32)
+
+    @field_validator("widgets")
+    @classmethod
+    def unique_ids(cls, widgets: List[DashboardWidget]) -> List[DashboardWidget]:
+        if len({widget.id for widget in widgets}) != len(widgets):
+            raise ValueError("Widget ids must be unique")
+        return widgets
+
+class Dashboard(BaseModel):
+    widgets: Dict[str, Any]  # widget id -> the response of the widget's endpoint
@@ -0,0 +1,33 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Optional
+from datetime import datetime
+from models.energy_data import EnergySourceType
+
+class JobCreate(BaseModel):
+    type: str = Field(..., pattern="^(export|report)$")
+    # Exports: which readings to export
+    kind: str = Field("consumption", pattern="^(consumption|generation)$")
+    source_type: Optional[EnergySourceType] = None
+    # Reports: period of each row
+    resolution: str = Field("day", pattern="^(day|week|month)$")
+    project_id: Optional[int] = None
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    format: str = Field("csv", pattern="^(csv|parquet)$")
+
+class Job(BaseModel):
+    id: str
+    type: str
+    status: str  # queued, running, succeeded or failed
+    progress: float
+    message: Optional[str] = None
+    error: Optional[str] = None
+    params: Dict[str, Any]
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
+    result_size: Optional[int] = None
+    result_url: Optional[str] = None
+    # True when an identical queued, running or finished job was returned
+    deduplicated: bool = False
@@ -1,11 +1,23 @@
 #!/bin/bash
 
-echo "Waiting for MySQL to be ready via Python..."
+# Wait until the database is reachable and create any missing tables. This is
+# an explicit step so workers do not touch the schema while importing the app.
+echo "Bootstrapping database..."
+python3 /app/manage.py bootstrap || exit 1
 
-# Run Python script to wait until DB is reachable
-python3 /app/wait_for_db.py
+# Bulk load the demo readings into an empty database
+if [ "${SEED_DATABASE:-false}" = "true" ]; then
+  echo "Seeding demo data..."
+  python3 /app/manage.py seed demo --if-empty || exit 1
+fi
 
 # If successful, start the FastAPI server
-echo "MySQL is ready. Launching FastAPI...
-"
-uvicorn main:app --host 0.0.0.0 --port 8000
+if [ "${SERVER_MODE:-development}" = "production" ]; then
+  # Multi-worker server: workers sized from the available cores, app preloaded
+  # in the master, periodic worker recycling (see gunicorn.conf.py)
+  echo "Database is ready. Launching FastAPI with Gunicorn..."
+  exec gunicorn main:app -c /app/gunicorn.conf.py
+else
+  echo "Database is ready. Launching FastAPI..."
+  exec uvicorn main:app --host 0.0.0.0 --port 8000
+fi
@@ -0,0 +1,68 @@
+"""
+Every test runs against a fresh SQLite database in a temporary directory,
+with the background services of the app turned off
+"""
+import os
+import tempfile
+
+TEST_DIR = tempfile.mkdtemp(prefix="wattwize-tests-")
+
+# Read by config at import, so set before any app module is imported
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{TEST_DIR}/app.db",
+    "SECRET_KEY": "test",
+    "JOBS_RUNNER_ENABLED": "false",
+    "JOBS_DB_PATH": f"{TEST_DIR}/jobs/jobs.sqlite3",
+    "JOBS_RESULT_DIR": f"{TEST_DIR}/jobs/results",
+    "HOT_WINDOW_ENABLED": "false",
+    "INGEST_SPILL_DIR": f"{TEST_DIR}/spill",
+    "ARCHIVE_URI": f"{TEST_DIR}/archive",
+    "READ_REPLICA_URLS": "",
+})
+
+from datetime import datetime
+
+import pytest
+
+@pytest.fixture
+def db():
+    from database import Base, SessionLocal, engine
+    import models  # noqa: F401  (registers all tables on Base.metadata)
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def user(db):
+    from core.security import get_password_hash
+    from models.user import User
+
+    user = User(email="owner@example.com", username="owner", hashed_password=get_password_hash("password1"), is_active=True)
+    db.add(user)
+    db.commit()
+    return user
+
+@pytest.fixture
+def project(db, user):
+    from models.energy_data import Project
+
+    project = Project(name="Site", user_id=user.id)
+    db.add(project)
+    db.commit()
+    return project
+
+def reading(project_id: int, timestamp: datetime, value_kwh: float, source_type="grid", **columns) -> dict:
+    from models.energy_data import EnergySourceType
+
+    return {
+        "project_id": project_id,
+        "timestamp": timestamp,
+        "value_kwh": value_kwh,
+        "source_type": EnergySourceType(source_type),
+        **columns,
+    }
@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from conftest import reading
+from core.archive import archive_readings, archived_partitions, archived_readings, archived_totals
+from core.ingest import upsert_readings
+from models.archive import ArchivedPartition
+from models.energy_data import EnergyConsumption, EnergyGeneration
+
+JANUARY = datetime(2025, 1, 1)
+FEBRUARY = datetime(2025, 2, 1)
+START, END = datetime(2024, 12, 1), datetime(2025, 3, 1)
+
+def ingest_january(db, project, model=EnergyConsumption, **columns):
+    # Two sources, every six hours for the month
+    rows = [
+        reading(project.id, JANUARY + timedelta(hours=6 * i), float(i % 7), source, **columns)
+        for i in range(31 * 4)
+        for source in ("grid", "solar")
+    ]
+    upsert_readings(db, model, rows)
+    db.commit()
+    return rows
+
+def database_total(db, model=EnergyConsumption) -> float:
+    return db.query(func.coalesce(func.sum(model.value_kwh), 0.0)).scalar()
+
+def total(db, project, kind="consumption") -> float:
+    archived = archived_totals(db, kind, [project.id], START, END)
+    return (sum(archived["by_source"].values()) if archived else 0.0) + database_total(db, EnergyConsumption if kind == "consumption" else EnergyGeneration)
+
+def test_archived_totals_match_the_database_before_archiving(db, project):
+    rows = ingest_january(db, project)
+    before = database_total(db)
+
+    assert archive_readings(db, "consumption", before=FEBRUARY) == len(rows)
+    assert db.query(EnergyConsumption).count() == 0
+    [partition] = archived_partitions(db, "consumption", [project.id])
+    assert partition.month == JANUARY and partition.readings == len(rows)
+
+    archived = archived_totals(db, "consumption", [project.id], START, END)
+    assert archived["readings"] == len(rows)
+    assert sum(archived["by_source"].values()) == before
+    assert sum(archived["by_day"].values()) == before
+    assert archived["by_project"] == {str(project.id): before}
+
+def test_only_whole_months_before_the_cutoff_are_archived(db, project):
+    ingest_january(db, project)
+    upsert_readings(db, EnergyConsumption, [reading(project.id, FEBRUARY, 1.0)])
+    db.commit()
+
+    archive_readings(db, "consumption", before=datetime(2025, 2, 15))
+    assert db.query(EnergyConsumption.timestamp).all() == [(FEBRUARY,)]
+    assert [partition.month for partition in db.query(ArchivedPartition)] == [JANUARY]
+
+def test_a_corrected_reading_is_counted_once(db, project):
+    ingest_january(db, project)
+    before = total(db, project)
+    archive_readings(db, "consumption", before=FEBRUARY)
+
+    corrected_at = JANUARY + timedelta(hours=6)  # archived as 1.0
+    upsert_readings(db, EnergyConsumption, [reading(project.id, corrected_at, 10.0)])
+    db.commit()
+
+    assert total(db, project) == before - 1.0 + 10.0
+    sources, seconds, values = archived_readings(db, "consumption", project.id, corrected_at, corrected_at + timedelta(hours=1))
+    assert list(values) == [1.0]  # only solar: the grid reading is read from the database
+    assert sources == ["solar"]
+
+def test_a_late_reading_is_added_once(db, project):
+    rows = ingest_january(db, project)
+    before = total(db, project)
+    archive_readings(db, "consumption", before=FEBRUARY)
+
+    late = JANUARY + timedelta(hours=1)
+    upsert_readings(db, EnergyConsumption, [reading(project.id, late, 4.0)])
+    db.commit()
+
+    assert total(db, project) == before + 4.0
+    assert archived_totals(db, "consumption", [project.id], START, END)["readings"] == len(rows)
+
+def test_archiving_a_month_again_merges_newer_readings(db, project):
+    rows = ingest_january(db, project)
+    archive_readings(db, "consumption", before=FEBRUARY)
+    [first] = archived_partitions(db, "consumption", [project.id])
+    first_path = first.path
+
+    upsert_readings(db, EnergyConsumption, [
+        reading(project.id, JANUARY + timedelta(hours=6), 10.0),
+        reading(project.id, JANUARY + timedelta(hours=1), 4.0),
+    ])
+    db.commit()
+    before = total(db, project)
+
+    assert archive_readings(db, "consumption", before=FEBRUARY) == 2
+    assert db.query(EnergyConsumption).count() == 0
+    [partition] = archived_partitions(db, "consumption", [project.id])
+    assert partition.path != first_path
+    assert partition.readings == len(rows) + 1
+    assert total(db, project) == before
+
+def test_generation_efficiency_is_federated(db, project):
+    rows = ingest_january(db, project, EnergyGeneration, efficiency=0.5)
+    before = database_total(db, EnergyGeneration)
+    archive_readings(db, "generation", before=FEBRUARY)
+
+    archived = archived_totals(db, "generation", [project.id], START, END)
+    assert archived["readings"] == len(rows)
+    assert archived["efficiency_kwh"] == before
+    assert archived["efficiency_weighted"] == before * 0.5
+
+def test_a_range_without_archived_partitions_reads_no_file(db, project):
+    ingest_january(db, project)
+    archive_readings(db, "consumption", before=FEBRUARY)
+    assert archived_totals(db, "consumption", [project.id], FEBRUARY, END) is None
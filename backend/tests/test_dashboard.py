@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+import itertools
+
+from sqlalchemy import func
+
+from conftest import reading
+from core.dashboard import dashboard, range_cuts, segments_of
+from core.ingest import upsert_readings
+from models.energy_data import EnergyConsumption, EnergyGeneration, EnergySourceType, Project
+from schemas.energy import DashboardWidget
+
+T0 = datetime(2026, 3, 1)
+NOW = T0 + timedelta(days=20)
+
+def test_every_range_is_a_run_of_segments():
+    ranges = [
+        (T0, T0 + timedelta(days=5)),
+        (T0 + timedelta(days=5), T0 + timedelta(days=10)),  # starts where the first ends
+        (T0 + timedelta(days=2), T0 + timedelta(days=3)),  # inside the first
+        (T0, T0 + timedelta(days=5)),  # the first again
+    ]
+    cuts = range_cuts(ranges)
+    assert cuts == sorted(set(cuts))
+    for start, end in ranges:
+        segments = segments_of(cuts, start, end)
+        # Past the start cut and not past the end cut
+        assert segments.start == cuts.index((start, 0)) + 1
+        assert segments.stop - 1 == cuts.index((end, 1))
+
+    # A reading at a shared boundary is past the second range's start but
+    # not past the first range's end, so it is in both
+    boundary = cuts.index((T0 + timedelta(days=5), 0)) + 1
+    assert boundary in segments_of(cuts, *ranges[0])
+    assert boundary in segments_of(cuts, *ranges[1])
+
+def direct_total(db, model, project_ids, start, end, source_types=None) -> float:
+    query = db.query(func.coalesce(func.sum(model.value_kwh), 0.0)).filter(
+        model.project_id.in_(project_ids), model.timestamp >= start, model.timestamp <= end,
+    )
+    if source_types:
+        query = query.filter(model.source_type.in_(source_types))
+    return query.scalar()
+
+def test_widgets_of_one_scan_match_their_own_queries(db, project, user):
+    other = Project(name="Other", user_id=user.id, timezone="America/New_York")
+    db.add(other)
+    db.commit()
+    for model in (EnergyConsumption, EnergyGeneration):
+        upsert_readings(db, model, [
+            reading(project_id, T0 + timedelta(hours=hour), float(hour % 5 + 1), source, **({"efficiency": 0.8} if model is EnergyGeneration else {}))
+            for project_id, source, hour in itertools.product((project.id, other.id), ("grid", "solar"), range(0, 20 * 24, 3))
+        ])
+    db.commit()
+
+    day = timedelta(days=1)
+    widgets = [
+        DashboardWidget(id="summary", type="summary", start_date=T0, end_date=T0 + 7 * day),
+        DashboardWidget(id="daily", type="consumption_daily", start_date=T0 + 7 * day, end_date=T0 + 14 * day),
+        DashboardWidget(id="nested", type="consumption_daily", start_date=T0 + 2 * day, end_date=T0 + 3 * day, source_type=[EnergySourceType.SOLAR]),
+        DashboardWidget(id="weekly", type="consumption_weekly", start_date=T0 + day, end_date=T0 + 15 * day),
+        DashboardWidget(id="generation", type="generation_daily", start_date=T0 + 3 * day, end_date=T0 + 9 * day),
+    ]
+    widget_projects = {
+        "summary": [project.id, other.id],
+        "daily": [project.id],
+        "nested": [project.id, other.id],
+        "weekly": [other.id],
+        "generation": [project.id, other.id],
+    }
+    results = dashboard(db, widgets, widget_projects, now=NOW)
+
+    for widget in widgets:
+        start, end = widget.start_date, widget.end_date
+        projects = widget_projects[widget.id]
+        if widget.type == "summary":
+            assert results["summary"]["total_consumption"] == direct_total(db, EnergyConsumption, projects, start, end)
+            assert results["summary"]["total_generation"] == direct_total(db, EnergyGeneration, projects, start, end)
+            continue
+        model = EnergyGeneration if widget.type.startswith("generation") else EnergyConsumption
+        result = results[widget.id]
+        expected = direct_total(db, model, projects, start, end, widget.source_type)
+        assert result["total_kwh"] == expected
+        assert sum(result["by_project"].values()) == expected
+        buckets = result["weekly_consumption" if widget.type.endswith("weekly") else f"daily_{model.__tablename__.split('_')[1]}"]
+        assert sum(bucket["value_kwh"] for bucket in buckets) == expected
+
+    assert set(results["nested"]["by_source"]) == {"solar"}
+    assert set(results["weekly"]["by_project"]) == {str(other.id)}
+    assert results["generation"]["avg_efficiency"] == 0.8
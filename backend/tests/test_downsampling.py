@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+import math
+
+import numpy as np
+import pytest
+
+from conftest import reading
+from core.downsampling import _budgets, downsample_query, select_indices
+from core.ingest import upsert_readings
+from models.energy_data import EnergyConsumption
+
+T0 = datetime(2026, 1, 1)
+
+def test_budgets_add_up_to_max_points():
+    lengths = {("a",): 1000, ("b",): 10, ("c",): 1, ("d",): 333}
+    for max_points in (1, 3, 10, 97, 500):
+        budgets = _budgets(lengths, max_points)
+        assert sum(budgets.values()) == max_points
+        assert budgets[("a",)] >= budgets[("d",)] >= budgets[("b",)] >= budgets[("c",)]
+
+@pytest.mark.parametrize("mode", ["lttb", "minmax"])
+def test_many_series_stay_within_max_points(mode):
+    series = [(i % 12,) for i in range(1200)]
+    x = np.arange(1200, dtype=np.float64)
+    y = np.sin(x)
+    for max_points in (5, 10, 50):
+        assert 0 < len(select_indices(series, x, y, max_points, mode)) <= max_points
+
+def test_unknown_modes_are_rejected():
+    with pytest.raises(ValueError):
+        select_indices([(1,)] * 10, np.arange(10.0), np.arange(10.0), 5, "mean")
+
+def ingest_series(db, project, source_type, count):
+    values = [math.sin(i / 10) for i in range(count)]
+    values[count // 3] = 100.0
+    values[2 * count // 3] = -100.0
+    upsert_readings(db, EnergyConsumption, [
+        reading(project.id, T0 + timedelta(minutes=15 * i), value, source_type) for i, value in enumerate(values)
+    ])
+    db.commit()
+
+def test_small_queries_are_returned_whole(db, project):
+    ingest_series(db, project, "grid", 50)
+    readings = downsample_query(db.query(EnergyConsumption), EnergyConsumption, 100)
+    assert len(readings) == 50
+
+@pytest.mark.parametrize("mode", ["lttb", "minmax"])
+def test_downsampled_readings_are_real_ordered_and_capped(db, project, mode):
+    ingest_series(db, project, "grid", 3000)
+    ingest_series(db, project, "solar", 300)
+    readings = downsample_query(db.query(EnergyConsumption), EnergyConsumption, 100, mode)
+
+    assert 0 < len(readings) <= 100
+    assert [reading.timestamp for reading in readings] == sorted(reading.timestamp for reading in readings)
+    for source in ("grid", "solar"):
+        values = [reading.value_kwh for reading in readings if reading.source_type.value == source]
+        assert values, source
+        if mode == "minmax":
+            # Peaks and troughs survive
+            assert max(values) == 100.0 and min(values) == -100.0
+
+def test_lttb_keeps_the_ends_of_a_series(db, project):
+    ingest_series(db, project, "grid", 2000)
+    readings = downsample_query(db.query(EnergyConsumption), EnergyConsumption, 40, "lttb")
+    assert readings[0].timestamp == T0
+    assert readings[-1].timestamp == T0 + timedelta(minutes=15 * 1999)
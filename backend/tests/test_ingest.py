@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta, timezone
+
+from conftest import reading
+from core.ingest import upsert_readings
+from models.energy_data import EnergyConsumption, EnergyGeneration
+
+T0 = datetime(2026, 1, 1, 12)
+
+def test_ingesting_a_reading_again_overwrites_it(db, project):
+    upsert_readings(db, EnergyConsumption, [reading(project.id, T0, 1.0)])
+    db.commit()
+    upsert_readings(db, EnergyConsumption, [reading(project.id, T0, 2.5)])
+    db.commit()
+
+    rows = db.query(EnergyConsumption).all()
+    assert [(row.timestamp, row.value_kwh) for row in rows] == [(T0, 2.5)]
+    assert rows[0].updated_at is not None
+
+def test_last_duplicate_within_a_batch_wins(db, project):
+    written = upsert_readings(db, EnergyConsumption, [
+        reading(project.id, T0, 1.0),
+        reading(project.id, T0 + timedelta(hours=1), 5.0),
+        reading(project.id, T0, 3.0),
+    ])
+    db.commit()
+
+    assert written == 2
+    assert dict(db.query(EnergyConsumption.timestamp, EnergyConsumption.value_kwh).all()) == {
+        T0: 3.0,
+        T0 + timedelta(hours=1): 5.0,
+    }
+
+def test_offset_notation_hits_the_same_key(db, project):
+    upsert_readings(db, EnergyConsumption, [reading(project.id, T0, 1.0)])
+    shifted = T0.replace(tzinfo=timezone.utc).astimezone(timezone(timedelta(hours=2)))
+    upsert_readings(db, EnergyConsumption, [reading(project.id, shifted, 4.0)])
+    db.commit()
+
+    assert db.query(EnergyConsumption.timestamp, EnergyConsumption.value_kwh).all() == [(T0, 4.0)]
+
+def test_sources_are_separate_readings(db, project):
+    upsert_readings(db, EnergyGeneration, [
+        reading(project.id, T0, 1.0, "solar", efficiency=80.0),
+        reading(project.id, T0, 2.0, "wind", efficiency=None),
+    ])
+    upsert_readings(db, EnergyGeneration, [reading(project.id, T0, 1.0, "solar", efficiency=90.0)])
+    db.commit()
+
+    rows = {row.source_type.value: (row.value_kwh, row.efficiency) for row in db.query(EnergyGeneration)}
+    assert rows == {"solar": (1.0, 90.0), "wind": (2.0, None)}
+
+def test_batches_write_every_reading(db, project):
+    rows = [reading(project.id, T0 + timedelta(minutes=i), float(i)) for i in range(25)]
+    assert upsert_readings(db, EnergyConsumption, rows, batch_size=10) == 25
+    db.commit()
+
+    assert db.query(EnergyConsumption).count() == 25
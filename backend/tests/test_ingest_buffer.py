@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta
+import json
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from conftest import reading
+from core.ingest_buffer import DEAD_LETTER_FILE, IngestBuffer, _encode_row
+from database import SessionLocal
+from models.energy_data import EnergyConsumption
+from test_leases import hold_lease
+
+T0 = datetime(2026, 1, 1)
+
+def make_buffer(spill_dir, session_factory=SessionLocal) -> IngestBuffer:
+    # Flushed by the tests only
+    return IngestBuffer(session_factory, max_size=1000, flush_size=1000, flush_interval=3600, spill_dir=str(spill_dir), fsync=False)
+
+def segments(spill_dir):
+    return sorted(name for name in os.listdir(spill_dir) if name.endswith(".jsonl") and name != DEAD_LETTER_FILE)
+
+def write_segment(spill_dir, token, rows, seq=1):
+    with open(os.path.join(spill_dir, f"ingest-{token}-{seq}.jsonl"), "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps({"kind": "consumption", "row": _encode_row(row)}) + "\n")
+
+@pytest.fixture
+def buffer(db, tmp_path):
+    buffer = make_buffer(tmp_path)
+    buffer.start()
+    yield buffer
+    buffer.stop()
+
+def test_readings_are_spilled_before_the_flush_and_removed_after(db, project, buffer, tmp_path):
+    buffer.submit("consumption", [reading(project.id, T0, 1.0), reading(project.id, T0 + timedelta(hours=1), 2.0)])
+    assert len(open(tmp_path / segments(tmp_path)[0]).readlines()) == 2
+    assert db.query(EnergyConsumption).count() == 0
+
+    assert buffer.flush() == 2
+    assert db.query(EnergyConsumption).count() == 2
+    # Only the segment that takes new readings is left, and it is empty
+    assert [os.path.getsize(tmp_path / name) for name in segments(tmp_path)] == [0]
+
+def test_segments_of_a_dead_process_are_replayed(db, project, tmp_path):
+    write_segment(tmp_path, "deadtoken", [reading(project.id, T0, 7.0)])
+    # A leftover lock file without a holder, as after a crash
+    open(tmp_path / "ingest-deadtoken.lock", "w").close()
+
+    buffer = make_buffer(tmp_path)
+    buffer.start()
+    try:
+        assert buffer.queue_depth() == 1
+        assert buffer.flush() == 1
+    finally:
+        buffer.stop()
+    assert db.query(EnergyConsumption.value_kwh).scalar() == 7.0
+    assert segments(tmp_path) == []
+
+def test_segments_of_a_live_process_are_left_alone(db, project, tmp_path):
+    write_segment(tmp_path, "livetoken", [reading(project.id, T0, 7.0)])
+    holder = hold_lease(str(tmp_path), "ingest-livetoken")
+    try:
+        buffer = make_buffer(tmp_path)
+        buffer.start()
+        try:
+            assert buffer.queue_depth() == 0
+        finally:
+            buffer.stop()
+        assert "ingest-livetoken-1.jsonl" in segments(tmp_path)
+    finally:
+        holder.kill()
+        holder.wait()
+
+def test_rejected_readings_are_dead_lettered_and_the_rest_written(db, project, buffer, tmp_path):
+    good = [reading(project.id, T0 + timedelta(hours=i), float(i)) for i in range(5)]
+    bad = reading(None, T0, 1.0)
+    buffer.submit("consumption", good[:2] + [bad] + good[2:])
+
+    assert buffer.flush() == 5
+    assert db.query(EnergyConsumption).count() == 5
+    dead = [json.loads(line) for line in open(tmp_path / DEAD_LETTER_FILE)]
+    assert len(dead) == 1
+    assert dead[0]["row"]["project_id"] is None
+    assert "NOT NULL" in dead[0]["error"]
+    assert buffer.queue_depth() == 0
+
+def test_readings_are_kept_while_the_database_is_unreachable(db, project, tmp_path):
+    unreachable = sessionmaker(bind=create_engine(f"sqlite:///{tmp_path}/missing/app.db"))
+    buffer = make_buffer(tmp_path, unreachable)
+    buffer.start()
+    try:
+        buffer.submit("consumption", [reading(project.id, T0, 1.0)])
+        with pytest.raises(Exception):
+            buffer.flush()
+        assert buffer.queue_depth() == 1
+        assert not os.path.exists(tmp_path / DEAD_LETTER_FILE)
+
+        # Back once the database is
+        buffer.session_factory = SessionLocal
+        assert buffer.flush() == 1
+    finally:
+        buffer.stop()
+    assert db.query(EnergyConsumption).count() == 1
@@ -0,0 +1,140 @@
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from core.jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue, JobRunner, runner_lease
+from core.leases import Lease
+from test_leases import hold_lease
+
+PARAMS = {"format": "csv", "kind": "consumption"}
+
+class FakeExecutor:
+    """
+    Accepts submissions without running them, or fails them with an error
+    """
+
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.submitted = []
+        self.shut_down = False
+
+    def submit(self, fn, job_id):
+        if self.error is not None:
+            raise self.error
+        self.submitted.append(job_id)
+        return Future()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"))
+
+def test_the_same_job_is_submitted_once(queue):
+    job, created = queue.submit(1, "export", PARAMS)
+    again, created_again = queue.submit(1, "export", dict(PARAMS))
+    assert created and not created_again
+    assert again["id"] == job["id"]
+    assert queue.submit(2, "export", PARAMS)[1]
+
+def test_a_job_is_claimed_by_one_runner(queue):
+    job, _ = queue.submit(1, "export", PARAMS)
+    claimed = queue.claim("runner-a")
+    assert claimed["id"] == job["id"]
+    assert claimed["status"] == RUNNING and claimed["runner_token"] == "runner-a"
+    assert queue.claim("runner-b") is None
+
+def test_a_result_is_recorded_only_by_the_runner_holding_the_job(queue, tmp_path):
+    job, _ = queue.submit(1, "export", PARAMS)
+    queue.claim("runner-a")
+    queue.release("runner-a")
+    queue.claim("runner-b")
+
+    # The first run finishing late does not overwrite the second
+    queue.finish("runner-a", job["id"], error="stale")
+    assert queue.get(job["id"])["status"] == RUNNING
+
+    result = tmp_path / "result.csv"
+    result.write_text("x\n")
+    queue.finish("runner-b", job["id"], result_path=str(result))
+    finished = queue.get(job["id"])
+    assert finished["status"] == SUCCEEDED and finished["result_size"] == 2 and finished["error"] is None
+
+def test_jobs_of_runners_without_a_lease_are_queued_again(queue):
+    dead, _ = queue.submit(1, "export", PARAMS)
+    live, _ = queue.submit(2, "export", PARAMS)
+    own, _ = queue.submit(3, "export", PARAMS)
+    queue.claim("dead")
+    queue.claim("live")
+    queue.claim("own")
+
+    holder = hold_lease(queue.lease_dir, runner_lease("live"))
+    try:
+        assert queue.requeue_orphaned("own") == 1
+    finally:
+        holder.kill()
+        holder.wait()
+
+    assert queue.get(dead["id"])["status"] == QUEUED
+    assert queue.get(dead["id"])["runner_token"] is None
+    assert queue.get(live["id"])["status"] == RUNNING
+    assert queue.get(own["id"])["status"] == RUNNING
+
+    # Once the live runner is gone its job is orphaned too
+    assert queue.requeue_orphaned("own") == 1
+    assert queue.get(live["id"])["status"] == QUEUED
+
+def test_a_stopping_runner_releases_only_its_own_jobs(queue):
+    mine, _ = queue.submit(1, "export", PARAMS)
+    theirs, _ = queue.submit(2, "export", PARAMS)
+    queue.claim("mine")
+    queue.claim("theirs")
+
+    assert queue.release("mine") == 1
+    assert queue.get(mine["id"])["status"] == QUEUED
+    assert queue.get(theirs["id"])["status"] == RUNNING
+
+def test_requeue_needs_the_runner_token(queue):
+    job, _ = queue.submit(1, "export", PARAMS)
+    queue.claim("runner-a")
+    queue.requeue("runner-b", job["id"])
+    assert queue.get(job["id"])["status"] == RUNNING
+    queue.requeue("runner-a", job["id"])
+    assert queue.get(job["id"])["status"] == QUEUED
+
+def make_runner(queue, executor) -> JobRunner:
+    runner = JobRunner(queue, workers=2, poll_interval=0.1)
+    runner._lease = Lease(queue.lease_dir, runner_lease(runner.token))
+    runner._executor = executor
+    return runner
+
+def test_a_broken_pool_is_replaced_and_the_job_run_on_the_new_one(queue, monkeypatch):
+    job, _ = queue.submit(1, "export", PARAMS)
+    broken, replacement = FakeExecutor(BrokenProcessPool("worker killed")), FakeExecutor()
+    runner = make_runner(queue, broken)
+    monkeypatch.setattr(runner, "_new_executor", lambda: replacement)
+    try:
+        runner._dispatch()
+    finally:
+        runner._lease.release()
+
+    assert broken.shut_down
+    assert runner._executor is replacement
+    assert replacement.submitted == [job["id"]]
+    assert list(runner._running) == [job["id"]]
+    assert queue.get(job["id"])["runner_token"] == runner.token
+
+def test_a_job_that_cannot_be_started_fails_and_frees_its_slot(queue):
+    job, _ = queue.submit(1, "export", PARAMS)
+    runner = make_runner(queue, FakeExecutor(RuntimeError("cannot pickle")))
+    try:
+        with pytest.raises(RuntimeError):
+            runner._dispatch()
+    finally:
+        runner._lease.release()
+
+    assert runner._running == {}
+    failed = queue.get(job["id"])
+    assert failed["status"] == FAILED and failed["error"] == "cannot pickle"
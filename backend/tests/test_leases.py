@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+
+from core.leases import Lease, lease_held, new_token
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def hold_lease(directory: str, name: str) -> subprocess.Popen:
+    """
+    A process holding the lease until it is killed
+    """
+    holder = subprocess.Popen(
+        [sys.executable, "-c", (
+            "import sys, time\n"
+            "from core.leases import Lease\n"
+            f"lease = Lease({directory!r}, {name!r})\n"
+            "print('held', flush=True)\n"
+            "time.sleep(60)\n"
+        )],
+        cwd=BACKEND_DIR,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    assert holder.stdout.readline().strip() == "held"
+    return holder
+
+def test_tokens_are_unique_per_start():
+    assert new_token() != new_token()
+
+def test_a_lease_is_held_until_released(tmp_path):
+    lease = Lease(str(tmp_path), "worker-a")
+    # flock is per open file, so another open of the same file sees the lock
+    assert lease_held(str(tmp_path), "worker-a")
+
+    lease.release()
+    assert not lease_held(str(tmp_path), "worker-a")
+    assert not os.path.exists(tmp_path / "worker-a.lock")
+
+def test_a_lease_is_free_once_its_holder_is_killed(tmp_path):
+    holder = hold_lease(str(tmp_path), "worker-b")
+    try:
+        assert lease_held(str(tmp_path), "worker-b")
+    finally:
+        holder.kill()
+        holder.wait()
+
+    # The kernel dropped the lock, however the process exited, and the stale file is removed
+    assert not lease_held(str(tmp_path), "worker-b")
+    assert not os.path.exists(tmp_path / "worker-b.lock")
+
+def test_an_unknown_lease_is_not_held(tmp_path):
+    assert not lease_held(str(tmp_path), "never-taken")
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+import asyncio
+import json
+
+from conftest import reading
+from core.ingest import upsert_readings
+from core.pubsub import Broker, ChangeFeedPoller, project_topic
+from database import SessionLocal
+from models.energy_data import EnergyGeneration
+
+T0 = datetime(2026, 1, 1, 12)
+
+def events(subscription) -> list:
+    # The events delivered so far, as (event, data)
+    async def drain():
+        await asyncio.sleep(0)
+        received = []
+        while (message := await subscription.get(timeout=0.01)) is not None:
+            event, data = message.strip().split("\n")
+            received.append((event[len("event: "):], json.loads(data[len("data: "):])))
+        return received
+    return subscription.loop.run_until_complete(drain())
+
+def subscribe(broker, project_id, max_queue=None):
+    loop = asyncio.new_event_loop()
+
+    async def create():
+        return broker.subscribe([project_topic(project_id)], max_queue)
+    return loop.run_until_complete(create())
+
+def test_a_reading_is_published_once_until_it_changes():
+    broker = Broker(max_queue=100, bucket_minutes=15)
+    subscription = subscribe(broker, 1)
+    row = reading(1, T0, 2.0, "solar", efficiency=0.5)
+
+    broker.publish_readings("generation", [row])
+    broker.publish_readings("generation", [dict(row)])
+    assert [event for event, _ in events(subscription)] == ["reading", "bucket"]
+
+    # A corrected efficiency is an update, though the kWh are the same
+    broker.publish_readings("generation", [dict(row, efficiency=0.6)])
+    received = events(subscription)
+    assert received[0] == ("reading", {
+        "kind": "generation", "project_id": 1, "source_type": "solar",
+        "timestamp": T0.isoformat(), "value_kwh": 2.0, "efficiency": 0.6,
+    })
+    subscription.loop.close()
+
+def test_a_corrected_reading_replaces_its_value_in_the_bucket():
+    broker = Broker(max_queue=100, bucket_minutes=15)
+    subscription = subscribe(broker, 1)
+    broker.publish_readings("consumption", [reading(1, T0, 2.0), reading(1, T0 + timedelta(minutes=5), 1.0)])
+    broker.publish_readings("consumption", [reading(1, T0, 3.0)])
+
+    buckets = [data for event, data in events(subscription) if event == "bucket"]
+    assert [(bucket["value_kwh"], bucket["readings"]) for bucket in buckets] == [(2.0, 1), (3.0, 2), (4.0, 2)]
+    subscription.loop.close()
+
+def test_a_slow_subscriber_is_told_it_lagged():
+    broker = Broker(max_queue=4, bucket_minutes=15)
+    subscription = subscribe(broker, 1)
+    broker.publish_readings("consumption", [reading(1, T0 + timedelta(minutes=i), 1.0) for i in range(5)])
+
+    received = events(subscription)
+    assert received[0] == ("lagged", {"dropped": 6})
+    assert len(received) == 5
+    subscription.loop.close()
+
+def test_the_change_feed_publishes_recent_readings_only(db, project):
+    broker = Broker(max_queue=100, bucket_minutes=15)
+    subscription = subscribe(broker, project.id)
+    now = datetime.utcnow()
+    upsert_readings(db, EnergyGeneration, [
+        reading(project.id, now - timedelta(hours=1), 1.0, "solar"),
+        # A backfill far outside the lookback is left to `since` requests
+        reading(project.id, now - timedelta(days=30), 5.0, "solar"),
+    ])
+    db.commit()
+
+    poller = ChangeFeedPoller(broker, SessionLocal, interval=60)
+    poller.poll()
+    readings = [data for event, data in events(subscription) if event == "reading"]
+    assert [data["value_kwh"] for data in readings] == [1.0]
+
+    # Nothing new since the last poll
+    poller.poll()
+    assert events(subscription) == []
+    subscription.loop.close()
+
+def test_the_change_feed_skips_the_query_without_subscribers(db, project, monkeypatch):
+    broker = Broker(max_queue=100, bucket_minutes=15)
+    published = []
+    monkeypatch.setattr(broker, "publish_readings", lambda kind, rows: published.append(rows))
+    upsert_readings(db, EnergyGeneration, [reading(project.id, datetime.utcnow(), 1.0, "solar")])
+    db.commit()
+
+    poller = ChangeFeedPoller(broker, SessionLocal, interval=60)
+    poller.poll()
+    assert published == []
+    assert poller._watermark is not None
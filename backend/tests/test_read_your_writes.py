@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+import time
+
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+import pytest
+
+from api.deps import get_current_user, get_write_db
+from api.endpoints import energy_consumption, energy_generation
+from core.replicas import ReadRouter, read_router
+from database import engine
+from models.user import User
+
+T0 = datetime(2026, 1, 1, 12)
+
+def dependencies(dependant):
+    for dependency in dependant.dependencies:
+        yield dependency.call
+        yield from dependencies(dependency)
+
+@pytest.mark.parametrize("router", [energy_consumption.router, energy_generation.router])
+def test_every_write_route_stamps_the_users_writes(router):
+    routes = [route for route in router.routes if isinstance(route, APIRoute) and route.methods & {"POST", "PUT", "PATCH", "DELETE"}]
+    assert routes
+    for route in routes:
+        assert get_write_db in set(dependencies(route.dependant)), route.path
+
+@pytest.fixture
+def client(db, user, monkeypatch):
+    from main import app
+
+    # Stamps are only written when there are replicas to wait for
+    monkeypatch.setattr(read_router, "replicas", [object()])
+    app.dependency_overrides[get_current_user] = lambda: user
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+
+def last_write_at(db, user):
+    db.expire_all()
+    return db.get(User, user.id).last_write_at
+
+def test_a_write_is_stamped_once_it_succeeds(db, user, project, client):
+    readings = [{"project_id": project.id, "timestamp": T0.isoformat(), "value_kwh": 1.0, "source_type": "grid"}]
+    response = client.post("/api/v1/energy/consumption/bulk", json={"readings": readings})
+    assert response.status_code == 200
+    assert last_write_at(db, user) is not None
+
+def test_a_rejected_write_is_not_stamped(db, user, project, client):
+    reading = {"project_id": project.id + 1, "timestamp": T0.isoformat(), "value_kwh": 1.0, "source_type": "grid"}
+    response = client.post("/api/v1/energy/consumption/", json=reading)
+    assert response.status_code == 404
+    assert last_write_at(db, user) is None
+
+def test_reads_stay_on_the_primary_until_a_replica_has_the_write(tmp_path):
+    router = ReadRouter([f"sqlite:///{tmp_path}/replica.db"])
+    [replica] = router.replicas
+    replica.available, replica.lag, replica.applied = True, 0.0, T0
+    router._checked_at = time.monotonic()  # no check during the test
+
+    assert router.session(T0 - timedelta(seconds=1)).get_bind() is replica.engine
+    assert router.session(T0).get_bind() is engine
+    assert router.session(None).get_bind() is replica.engine
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+import pytest
+from sqlalchemy import text
+
+from conftest import reading
+from core import rollups
+from core.energy_queries import changed_since
+from core.ingest import upsert_readings
+from core.rollups import refresh_rollups, refresh_rollups_if_due
+from core.schema import CHANGE_TRACKED_TABLES, ensure_change_indexes
+from database import engine
+from models.energy_data import EnergyConsumption
+from models.rollups import ConsumptionHourly
+
+T0 = datetime(2026, 1, 1)
+
+@pytest.fixture
+def queued(monkeypatch):
+    # Rollup state of this process starts empty, and builds are recorded instead of queued
+    queued = []
+    monkeypatch.setattr(rollups, "_built", set())
+    monkeypatch.setattr(rollups, "_last_refresh", {})
+    monkeypatch.setattr(rollups, "_queue_initial_build", queued.append)
+    return queued
+
+def test_reads_of_an_unbuilt_rollup_are_answered_503(db, project, queued):
+    upsert_readings(db, EnergyConsumption, [reading(project.id, T0, 1.0)])
+    db.commit()
+
+    with pytest.raises(HTTPException) as raised:
+        refresh_rollups_if_due(db, "consumption")
+    assert raised.value.status_code == 503
+    assert int(raised.value.headers["Retry-After"]) >= 1
+    assert sorted(queued) == ["consumption", "generation"]
+    assert db.query(ConsumptionHourly).count() == 0
+
+def test_a_built_rollup_is_refreshed_with_new_readings(db, project, queued):
+    upsert_readings(db, EnergyConsumption, [reading(project.id, T0 + timedelta(minutes=15 * i), 1.0) for i in range(8)])
+    db.commit()
+    refresh_rollups(db, "consumption")
+    assert [(row.hour, row.value_kwh, row.readings) for row in db.query(ConsumptionHourly).order_by(ConsumptionHourly.hour)] == [
+        (T0, 4.0, 4), (T0 + timedelta(hours=1), 4.0, 4),
+    ]
+
+    upsert_readings(db, EnergyConsumption, [reading(project.id, T0, 3.0)])
+    db.commit()
+    refresh_rollups_if_due(db, "consumption")
+    db.expire_all()
+    assert db.query(ConsumptionHourly).filter(ConsumptionHourly.hour == T0).one().value_kwh == 6.0
+    assert queued == []
+
+def test_change_queries_use_the_created_and_updated_indexes(db):
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_energy_consumption_updated_at"))
+    ensure_change_indexes(engine)
+
+    for table in CHANGE_TRACKED_TABLES:
+        names = {row[1] for row in db.execute(text(f"PRAGMA index_list({table})"))}
+        assert {f"ix_{table}_created_at", f"ix_{table}_updated_at"} <= names, table
+
+    query = db.query(EnergyConsumption.id).filter(changed_since(EnergyConsumption, T0))
+    statement = query.statement.compile(engine, compile_kwargs={"literal_binds": True})
+    plan = " ".join(str(row[-1]) for row in db.execute(text(f"EXPLAIN QUERY PLAN {statement}")))
+    assert "ix_energy_consumption_created_at" in plan and "ix_energy_consumption_updated_at" in plan
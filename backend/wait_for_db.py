@@ -1,32 +1,52 @@
-import time
-import pymysql
+import logging
+import random
 import sys
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+def wait_for_db(
+    timeout: float = 120.0,
+    initial_delay: float = 0.5,
+    max_delay: float = 10.0,
+) -> bool:
+    """
+    Wait until the database accepts connections.
 
-host = "db"
-port = 3306
-user = "root"
-password = "Qywter@123"
-database = "renewable_energy_db_sql"
+    Retries with exponential backoff and full jitter until `timeout` seconds
+    have passed, so a briefly unreachable database during a scale-out does not
+    fail the deployment and many instances do not retry in lockstep.
+    """
+    engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    attempt = 0
 
-retries = 10
-while retries > 0:
     try:
-        print("Trying to connect to MySQL...")
-        conn = pymysql.connect(
-            host=host,
-            user=user,
-            password=password,
-            database=database,
-            port=port,
-            connect_timeout=5
-        )
-        conn.close()
-        print("✅ MySQL is available.")
-        sys.exit(0)
-    except pymysql.err.OperationalError as e:
-        print(f"❌ MySQL not ready yet: {e}")
-        retries -= 1
-        time.sleep(3)
+        while True:
+            attempt += 1
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                logger.info(f"Database is available (attempt {attempt})")
+                return True
+            except OperationalError as e:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.error(f"Could not connect to the database after {attempt} attempts: {e}")
+                    return False
+                sleep_for = min(random.uniform(0, delay), remaining)
+                logger.warning(f"Database not ready yet (attempt {attempt}), retrying in {sleep_for:.1f}s: {e}")
+                time.sleep(sleep_for)
+                delay = min(delay * 2, max_delay)
+    finally:
+        engine.dispose()
 
-print("🔥 Could not connect to MySQL after several retries.")
-sys.exit(1)
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(0 if wait_for_db() else 1)
@@ -1,16 +1,16 @@
 import React from "react";
-import { EnergySummary, EnergySourceType } from "../types";
+import { EnergyCost, EnvironmentalImpact } from "../types";
 
 interface EnvironmentalImpactCardProps {
-  summary: EnergySummary | null;
-  generationBySource?: Record<string, number>;
+  impact: EnvironmentalImpact | null;
+  cost?: EnergyCost | null;
   isLoading?: boolean;
   className?: string;
 }
 
 const EnvironmentalImpactCard: React.FC<EnvironmentalImpactCardProps> = ({
-  summary,
-  generationBySource = {},
+  impact,
+  cost = null,
   isLoading = false,
   className = "",
 }) => {
@@ -39,22 +39,14 @@ const EnvironmentalImpactCard: React.FC<EnvironmentalImpactCardProps> = ({
     );
   }
 
-  if (!summary) return null;
+  if (!impact) return null;
 
-  // Calculate renewable energy generation (excluding grid)
-  const renewableGeneration = Object.entries(generationBySource)
-    .filter(([source]) => source !== EnergySourceType.GRID)
-    .reduce((sum, [_, value]) => sum + value, 0);
-
-  // Conversion constants
-  const CO2_PER_KWH_GRID = 0.42; // kg CO₂ per kWh from grid (example average)
-  const TREES_PER_TON_CO2 = 45; // Trees needed to absorb 1 ton CO₂ per year
-  const costPerKWh = 0.12; // Electricity cost per kWh in dollars
-
-  // Calculate environmental metrics
-  const co2Saved = renewableGeneration * CO2_PER_KWH_GRID; // in kg
-  const treesEquivalent = Math.round((co2Saved / 1000) * TREES_PER_TON_CO2); // converting kg to tons for tree calculation
-  const electricitySavings = renewableGeneration * costPerKWh; // in dollars
+  // CO₂ and its equivalents are computed by the server against hourly grid intensity
+  const co2Saved = impact.co2_avoided_kg;
+  const treesEquivalent = Math.round(impact.trees_equivalent);
+  // Savings are priced by the server with each project's tariff
+  const electricitySavings = cost?.savings ?? 0;
+  const currency = cost?.currency || "USD";
 
   // Utility to format large numbers
   const formatValue = (value: number): string => {
@@ -69,7 +61,9 @@ const EnvironmentalImpactCard: React.FC<EnvironmentalImpactCardProps> = ({
     {
       title: "CO₂ Saved",
       value: `${co2Saved.toFixed(1)} kg`,
-      description: "Emissions prevented by using renewable energy",
+      description: `Emissions prevented at an average grid intensity of ${Math.round(
+        impact.avg_grid_intensity
+      )} g/kWh`,
       icon: "🌿",
       accentColor: "var(--color-primary)",
     },
@@ -82,8 +76,11 @@ const EnvironmentalImpactCard: React.FC<EnvironmentalImpactCardProps> = ({
     },
     {
       title: "Electricity Savings",
-      value: `$${electricitySavings.toFixed(2)}`,
-      description: "Annual savings on electricity bills",
+      value: electricitySavings.toLocaleString(undefined, {
+        style: "currency",
+        currency,
+      }),
+      description: "Savings on electricity bills over the selected period",
       icon: "💰",
       accentColor: "var(--color-secondary)",
     },
@@ -140,8 +137,8 @@ const EnvironmentalImpactCard: React.FC<EnvironmentalImpactCardProps> = ({
           fontStyle: "italic",
         }}
       >
-        Impact metrics calculated using standard environmental conversion
-        factors. Actual values may vary.
+        CO₂ avoided is calculated against the hourly carbon intensity of the
+        grid. Equivalents use standard conversion factors.
       </div>
     </div>
   );
@@ -1,9 +1,10 @@
 import { useState, useEffect } from 'react';
 import {
   projectsApi,
-  insightsApi,
+  dashboardApi,
   consumptionApi,
   generationApi,
+  CHART_MAX_POINTS,
 } from "../services/api";
 import {
   Project,
@@ -88,24 +89,30 @@ export function useEnergyData(filters: EnergyDataFilters) {
           project_id: Number(projectId),
         };
         
-        // Fetch all relevant data in parallel
-        const [
-          summaryData,
-          consumptionResponse,
-          generationResponse,
-          dailyConsumptionResponse,
-          dailyGenerationResponse,
-          weeklyConsumptionResponse,
-          weeklyGenerationResponse,
-        ] = await Promise.all([
-          insightsApi.getSummary(startDate, endDate, Number(projectId)),
-          consumptionApi.getAll(filters),
-          generationApi.getAll(filters),
-          consumptionApi.getDailyAggregate(filters),
-          generationApi.getDailyAggregate(filters),
-          consumptionApi.getWeeklyAggregate(filters),
-          generationApi.getWeeklyAggregate(filters),
-        ]);
+        // The aggregates come in one request, the raw readings in parallel
+        const [widgets, consumptionResponse, generationResponse] =
+          await Promise.all([
+            dashboardApi.get([
+              {
+                id: "summary",
+                type: "summary",
+                start_date: startDate,
+                end_date: endDate,
+                project_id: Number(projectId),
+              },
+              { id: "dailyConsumption", type: "consumption_daily", ...filters },
+              { id: "dailyGeneration", type: "generation_daily", ...filters },
+              { id: "weeklyConsumption", type: "consumption_weekly", ...filters },
+              { id: "weeklyGeneration", type: "generation_weekly", ...filters },
+            ]),
+            consumptionApi.getAll({ ...filters, max_points: CHART_MAX_POINTS }),
+            generationApi.getAll({ ...filters, max_points: CHART_MAX_POINTS }),
+          ]);
+        const summaryData: EnergySummary = widgets.summary;
+        const dailyConsumptionResponse = widgets.dailyConsumption;
+        const dailyGenerationResponse = widgets.dailyGeneration;
+        const weeklyConsumptionResponse = widgets.weeklyConsumption;
+        const weeklyGenerationResponse = widgets.weeklyGeneration;
 
         setState(prevState => ({
           ...prevState,
@@ -2,12 +2,18 @@ import { useState, useEffect } from "react";
 import { format, subDays } from "date-fns";
 import { Link } from "react-router-dom";
 import {
-  insightsApi,
+  dashboardApi,
   consumptionApi,
-  generationApi,
   projectsApi,
+  CHART_MAX_POINTS,
 } from "../services/api";
-import { EnergySummary, EnergySourceType, Project } from "../types";
+import {
+  EnergyCost,
+  EnergySummary,
+  EnergySourceType,
+  EnvironmentalImpact,
+  Project,
+} from "../types";
 import { useDateRange } from "../context/DateRangeContext";
 import { useAuth } from "../context/AuthContext"; // Import auth context
 import EnergySummaryCard from "../components/EnergySummaryCard";
@@ -22,6 +28,8 @@ const Dashboard = () => {
   const [isLoading, setIsLoading] = useState(true);
   const [hasData, setHasData] = useState(false);
   const [summary, setSummary] = useState<EnergySummary | null>(null);
+  const [impact, setImpact] = useState<EnvironmentalImpact | null>(null);
+  const [cost, setCost] = useState<EnergyCost | null>(null);
   const [_, setHourlyConsumptionData] = useState<any[]>([]);
   const [consumptionBySource, setConsumptionBySource] = useState<
     Record<string, number>
@@ -74,24 +82,35 @@ const Dashboard = () => {
         project_id: selectedProjectId || undefined,
       };
 
-      // Fetch all data in parallel.
-      const [
-        summaryData,
-        dailyConsumptionResponse,
-        dailyGenerationResponse,
-        hourlyConsumptionResponse,
-      ] = await Promise.all([
-        insightsApi.getSummary(
-          startDate,
-          endDate,
-          selectedProjectId || undefined
-        ),
-        consumptionApi.getDailyAggregate(filters),
-        generationApi.getDailyAggregate(filters),
-        consumptionApi.getAll({ ...filters, start_date: sevenDaysAgo }),
+      // The widgets come in one request, the raw readings in parallel.
+      const range = {
+        start_date: startDate,
+        end_date: endDate,
+        project_id: selectedProjectId || undefined,
+      };
+      const [widgets, hourlyConsumptionResponse] = await Promise.all([
+        dashboardApi.get([
+          { id: "summary", type: "summary", ...range },
+          { id: "dailyConsumption", type: "consumption_daily", ...filters },
+          { id: "dailyGeneration", type: "generation_daily", ...filters },
+          { id: "impact", type: "environmental_impact", ...range },
+          { id: "cost", type: "cost", ...range },
+        ]),
+        consumptionApi.getAll({
+          ...filters,
+          start_date: sevenDaysAgo,
+          max_points: CHART_MAX_POINTS,
+        }),
       ]);
+      const summaryData: EnergySummary = widgets.summary;
+      const impactData: EnvironmentalImpact = widgets.impact;
+      const costData: EnergyCost = widgets.cost;
+      const dailyConsumptionResponse = widgets.dailyConsumption;
+      const dailyGenerationResponse = widgets.dailyGeneration;
 
       setSummary(summaryData);
+      setImpact(impactData);
+      setCost(costData);
 
       if (dailyConsumptionResponse) {
         setConsumptionBySource(dailyConsumptionResponse.by_source || {});
@@ -204,16 +223,14 @@ const Dashboard = () => {
       )}
 
       {/* Environmental Impact Card */}
-      {summary &&
-        (summary.total_generation > 0 ||
-          Object.keys(generationBySource).length > 0) && (
-          <EnvironmentalImpactCard
-            summary={summary}
-            generationBySource={generationBySource}
-            isLoading={isLoading}
-            className="mt-6"
-          />
-        )}
+      {impact && impact.total_generation > 0 && (
+        <EnvironmentalImpactCard
+          impact={impact}
+          cost={cost}
+          isLoading={isLoading}
+          className="mt-6"
+        />
+      )}
 
       {summary && <EnergySummaryCard summary={summary} isLoading={isLoading} />}
 
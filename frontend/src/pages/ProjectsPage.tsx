@@ -1,7 +1,7 @@
 import { useState, useEffect } from "react";
 import { Link } from "react-router-dom";
 import { projectsApi } from "../services/api";
-import { Project } from "../types";
+import { Project, ProjectStats } from "../types";
 
 const ProjectsPage = () => {
   const [projects, setProjects] = useState<Project[]>([]);
@@ -27,7 +27,8 @@ const ProjectsPage = () => {
     setError(null);
 
     try {
-      const data = await projectsApi.getAll();
+      // Card statistics come with the listing, not one request per card
+      const data = await projectsApi.getAll({ include_stats: true });
       setProjects(data || []);
     } catch (error) {
       console.error("Error loading projects:", error);
@@ -57,6 +58,17 @@ const ProjectsPage = () => {
     }
   };
 
+  const sumValues = (values: Record<string, number> = {}) =>
+    Object.values(values).reduce((sum, value) => sum + value, 0);
+
+  // Latest of the project's last consumption and generation readings
+  const lastReading = (stats?: ProjectStats | null) => {
+    const times = [stats?.last_consumption_at, stats?.last_generation_at]
+      .filter((time): time is string => Boolean(time))
+      .sort();
+    return times.length > 0 ? times[times.length - 1] : null;
+  };
+
   // Reset the form fields
   const resetForm = () => {
     setNewProjectName("");
@@ -224,6 +236,31 @@ const ProjectsPage = () => {
                       {project.description}
                     </p>
                   )}
+                  {project.stats && (
+                    <div
+                      className="mt-3 grid grid-cols-2 gap-2 text-sm"
+                      style={{ color: "var(--color-text-light)" }}
+                    >
+                      <span>
+                        Used (30d):{" "}
+                        {sumValues(project.stats.consumption_30d).toFixed(0)} kWh
+                      </span>
+                      <span>
+                        Generated (30d):{" "}
+                        {sumValues(project.stats.generation_30d).toFixed(0)} kWh
+                      </span>
+                      <span>
+                        Used (24h):{" "}
+                        {sumValues(project.stats.consumption_24h).toFixed(0)} kWh
+                      </span>
+                      <span>
+                        Efficiency:{" "}
+                        {project.stats.avg_efficiency_30d != null
+                          ? `${project.stats.avg_efficiency_30d.toFixed(1)}%`
+                          : "—"}
+                      </span>
+                    </div>
+                  )}
                 </div>
                 <div
                   className="mt-4 pt-4"
@@ -233,7 +270,13 @@ const ProjectsPage = () => {
                     className="text-sm"
                     style={{ color: "var(--color-text-light)" }}
                   >
-                    Created: {new Date(project.created_at).toLocaleDateString()}
+                    {lastReading(project.stats)
+                      ? `Last reading: ${new Date(
+                          lastReading(project.stats) as string
+                        ).toLocaleString()}`
+                      : `Created: ${new Date(
+                          project.created_at
+                        ).toLocaleDateString()}`}
                   </span>
                 </div>
               </div>
@@ -1,6 +1,13 @@
 import axios from "axios";
 import queryString from "query-string";
-import { EnergyFilter, EnergySummary } from "../types";
+import {
+  DashboardResponse,
+  DashboardWidget,
+  EnergyCost,
+  EnergyFilter,
+  EnergySummary,
+  EnvironmentalImpact,
+} from "../types";
 
 // Get API URL from environment variables
 let API_BASE_URL =
@@ -93,8 +100,8 @@ export const authApi = {
 
 // Projects API
 export const projectsApi = {
-  getAll: async () => {
-    const response = await api.get("/projects");
+  getAll: async (params?: { include_stats?: boolean }) => {
+    const response = await api.get("/projects", { params });
     return response.data;
   },
 
@@ -113,6 +120,9 @@ export const projectsApi = {
   },
 };
 
+// Charts draw at most this many raw readings, the server downsamples the rest
+export const CHART_MAX_POINTS = 2000;
+
 // Energy Consumption API
 export const consumptionApi = {
   getAll: async (filters?: EnergyFilter) => {
@@ -173,6 +183,45 @@ export const insightsApi = {
     });
     return response.data;
   },
+
+  getEnvironmentalImpact: async (
+    startDate?: string,
+    endDate?: string,
+    projectId?: number
+  ) => {
+    const response = await api.get<EnvironmentalImpact>(
+      "/insights/environmental-impact",
+      {
+        params: {
+          start_date: startDate,
+          end_date: endDate,
+          project_id: projectId,
+        },
+      }
+    );
+    return response.data;
+  },
+
+  getCost: async (startDate?: string, endDate?: string, projectId?: number) => {
+    const response = await api.get<EnergyCost>("/insights/cost", {
+      params: {
+        start_date: startDate,
+        end_date: endDate,
+        project_id: projectId,
+      },
+    });
+    return response.data;
+  },
+};
+
+// Dashboard API: several widgets in one request, sharing one scan of the readings
+export const dashboardApi = {
+  get: async (widgets: DashboardWidget[]) => {
+    const response = await api.post<DashboardResponse>("/dashboard", {
+      widgets,
+    });
+    return response.data.widgets;
+  },
 };
 
 export default api;
@@ -24,6 +24,18 @@ export interface Project {
   user_id: number;
   created_at: string;
   updated_at?: string;
+  // Present when listed with include_stats
+  stats?: ProjectStats | null;
+}
+
+export interface ProjectStats {
+  last_consumption_at?: string;
+  last_generation_at?: string;
+  consumption_24h: Record<string, number>;
+  consumption_30d: Record<string, number>;
+  generation_24h: Record<string, number>;
+  generation_30d: Record<string, number>;
+  avg_efficiency_30d?: number;
 }
 
 // Energy data types
@@ -74,6 +86,40 @@ export interface EnergySummary {
   project_id?: number;
 }
 
+export interface EnvironmentalImpact {
+  start_date: string;
+  end_date: string;
+  project_id?: number;
+  total_consumption: number;
+  total_generation: number;
+  renewable_generation: number;
+  renewable_percentage: number;
+  co2_avoided_kg: number;
+  avg_grid_intensity: number;
+  trees_equivalent: number;
+  car_km_equivalent: number;
+  co2_avoided_by_project: Record<string, number>;
+}
+
+export interface EnergyCost {
+  start_date: string;
+  end_date: string;
+  project_id?: number;
+  currency?: string;
+  consumption_kwh: number;
+  generation_kwh: number;
+  import_kwh: number;
+  export_kwh: number;
+  energy_cost: number;
+  export_credit: number;
+  fixed_charges: number;
+  total_cost: number;
+  baseline_cost: number;
+  savings: number;
+  by_project: Record<string, { total_cost: number; savings: number }>;
+  daily?: { date: string; total_cost: number; savings: number }[];
+}
+
 export interface DailyAggregateData {
   date: string;
   value_kwh: number;
@@ -93,6 +139,34 @@ export interface AggregatedEnergyData {
   avg_efficiency?: number;
 }
 
+// Composite dashboard: each widget names the endpoint it stands for
+export type DashboardWidgetType =
+  | "summary"
+  | "consumption_daily"
+  | "consumption_weekly"
+  | "generation_daily"
+  | "generation_weekly"
+  | "environmental_impact"
+  | "cost"
+  | "projects";
+
+export interface DashboardWidget {
+  id: string;
+  type: DashboardWidgetType;
+  start_date?: string;
+  end_date?: string;
+  project_id?: number;
+  source_type?: EnergySourceType[];
+  fill?: "none" | "ffill" | "linear" | "profile";
+  include_daily?: boolean;
+  include_stats?: boolean;
+}
+
+export interface DashboardResponse {
+  // Widget id -> the response of the widget's endpoint
+  widgets: Record<string, any>;
+}
+
 export interface InsightRecommendation {
   type: "reduction" | "shift" | "optimization" | "general";
   title: string;
@@ -119,6 +193,9 @@ export interface DateRangeFilter {
 export interface EnergyFilter extends DateRangeFilter {
   source_type?: EnergySourceType[];
   project_id?: number;
+  // Downsample raw readings on the server to about this many points
+  max_points?: number;
+  downsample?: "lttb" | "minmax";
 }
 
 // Alert types